@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
 from typing import Any, List, Optional, Dict
 from datetime import datetime
 import uuid
@@ -8,9 +9,22 @@ import json
 from fastapi.responses import StreamingResponse
 
 from app.api.deps import get_current_user
-from app.schemas.ai import AIChatRequest, AIChatResponse, ChatResponse
+from app.core.ai_config import get_ai_settings
+from app.db.database import get_async_session_factory
+from app.models.conversation import SENDER_ASSISTANT, SENDER_USER
+from app.schemas.ai import AIChatRequest, AIChatResponse, ChatResponse, UserContextOut
 from app.services.ai import generate_ai_response
 from app.services.ai.ai_service import openrouter_service
+from app.services.ai.conversations import (
+    AI_CONVERSATION_SUMMARY_JOB,
+    ConversationStore,
+    ConversationWindow,
+    summary_dedupe_key,
+)
+from app.services.ai.json_stream import IncrementalJSONExtractor
+from app.services.ai.rate_limiter import RateLimitExceeded
+from app.services.ai.user_context import UserContextSnapshot, get_user_context, resolve_user_context
+from app.services.jobs import job_queue
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -18,26 +32,74 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["ai"])
 
+def _user_id(current_user: Any) -> Optional[str]:
+    return str(current_user.id) if current_user is not None else None
+
+def _goal_task_result(task: asyncio.Task) -> Optional[Dict[str, Any]]:
+    # Resultado de la detección en paralelo (None si se canceló o falló)
+    if task.cancelled() or task.exception() is not None:
+        return None
+    return task.result()
+
+async def _conversation_window(conversation_id: str, current_user: Any, message: str) -> ConversationWindow:
+    # Guarda el mensaje del usuario y devuelve el historial acotado para el prompt
+    async with get_async_session_factory()() as db:
+        store = ConversationStore(db)
+        conversation = await store.get_conversation(_user_id(current_user), conversation_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail="Conversación no encontrada")
+        await store.add_message(conversation, SENDER_USER, message)
+        return await store.load_window(conversation)
+
+async def _save_conversation_reply(conversation_id: str, current_user: Any, window: ConversationWindow,
+                                   reply: str) -> None:
+    async with get_async_session_factory()() as db:
+        store = ConversationStore(db)
+        conversation = await store.get_conversation(_user_id(current_user), conversation_id)
+        if conversation is None:
+            return
+        await store.add_message(conversation, SENDER_ASSISTANT, reply)
+    
+    # Los mensajes que salen de la ventana se resumen en segundo plano, por lotes
+    if len(window.overflow) >= get_ai_settings().AI_CONVERSATION_SUMMARY_BATCH:
+        await job_queue.enqueue(
+            AI_CONVERSATION_SUMMARY_JOB,
+            {"conversation_id": conversation_id, "user_id": _user_id(current_user)},
+            user_id=_user_id(current_user),
+            dedupe_key=summary_dedupe_key(conversation_id)
+        )
+
 # Modelo de datos para las solicitudes
 class OpenRouterChatRequest(BaseModel):
     message: str
-    model: str = "qwen/qwq-32b:online"
+    # Sin modelo explícito decide la ruta "chat" de AI_MODEL_ROUTES
+    model: Optional[str] = None
+    # Detectar metas en el mensaje en paralelo con el chat (en lugar de buscarlas en la respuesta)
+    detect_goal: bool = False
+    # Conversación persistida: el prompt incluye su historial y se guardan los mensajes
+    conversation_id: Optional[str] = None
 
 class UserDataRequest(BaseModel):
     """Datos del usuario para análisis y generación de planes"""
-    user_data: Dict[str, Any]
+    # Sin user_data se usa el contexto del servidor (GET /ai/context), opcionalmente por su ID
+    user_data: Optional[Dict[str, Any]] = None
+    context_id: Optional[str] = None
     
-class PersonalizedPlanRequest(BaseModel):
+class PersonalizedPlanRequest(UserDataRequest):
     """Datos para solicitar un plan personalizado"""
-    user_data: Dict[str, Any]
     goal_type: str
     preferences: Optional[Dict[str, Any]] = None
 
-class LearningAdaptationRequest(BaseModel):
+class LearningAdaptationRequest(UserDataRequest):
     """Datos para solicitar adaptaciones de aprendizaje"""
-    user_data: Dict[str, Any]
     interaction_history: List[Dict[str, Any]]
 
+async def _server_context(request: UserDataRequest, current_user: Any) -> Optional[UserContextSnapshot]:
+    # Contexto precalculado, salvo que el cliente envíe sus propios datos
+    if request.user_data is not None:
+        return None
+    return await resolve_user_context(_user_id(current_user), request.context_id)
+
 @router.post("/openrouter-chat", response_model=ChatResponse)
 async def openrouter_chat(
     request: OpenRouterChatRequest, 
@@ -47,18 +109,38 @@ async def openrouter_chat(
     Genera una respuesta de chat utilizando OpenRouter
     """
     try:
-        messages = [
-            {"role": "user", "content": request.message}
-        ]
+        window = None
+        if request.conversation_id:
+            window = await _conversation_window(request.conversation_id, current_user, request.message)
+            messages = window.to_prompt()
+        else:
+            messages = [
+                {"role": "user", "content": request.message}
+            ]
         
-        # Generar respuesta
-        response_text = await openrouter_service.generate_chat_response(
-            messages=messages,
-            model=request.model
-        )
+        if request.detect_goal:
+            # Chat y detección de metas en paralelo: una sola espera para el cliente
+            response_text, goal_metadata = await openrouter_service.generate_chat_with_goal_detection(
+                messages=messages,
+                message=request.message,
+                user_id=_user_id(current_user),
+                model=request.model
+            )
+        else:
+            # Generar respuesta (con historial persistido un fallo debe propagarse,
+            # no guardarse como respuesta)
+            response_text = await openrouter_service.generate_chat_response(
+                messages=messages,
+                model=request.model,
+                user_id=_user_id(current_user),
+                raise_errors=window is not None
+            )
+            
+            # Verificar si hay una meta en la respuesta
+            goal_metadata = openrouter_service._extract_goal_metadata(response_text)
         
-        # Verificar si hay una meta en la respuesta
-        goal_metadata = openrouter_service._extract_goal_metadata(response_text)
+        if window is not None:
+            await _save_conversation_reply(request.conversation_id, current_user, window, response_text)
         has_goal = goal_metadata is not None and goal_metadata.get("has_goal", False)
         
         return {
@@ -66,6 +148,10 @@ async def openrouter_chat(
             "has_goal": has_goal,
             "goal_metadata": goal_metadata.get("goal") if has_goal else None
         }
+    except HTTPException:
+        raise
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error en openrouter_chat: {str(e)}")
         raise HTTPException(
@@ -82,47 +168,101 @@ async def openrouter_chat_stream(
     Genera una respuesta de chat en streaming utilizando OpenRouter
     """
     try:
-        messages = [
-            {"role": "user", "content": request.message}
-        ]
+        window = None
+        if request.conversation_id:
+            window = await _conversation_window(request.conversation_id, current_user, request.message)
+            messages = window.to_prompt()
+        else:
+            messages = [
+                {"role": "user", "content": request.message}
+            ]
+        
+        # La detección de metas arranca a la vez que el stream del chat
+        goal_task = asyncio.create_task(
+            openrouter_service.detect_goal_from_message(request.message, user_id=_user_id(current_user))
+        ) if request.detect_goal else None
         
         # Generar respuesta en streaming
-        stream_generator = await openrouter_service.generate_chat_response(
-            messages=messages,
-            model=request.model,
-            stream=True
-        )
+        try:
+            stream_generator = await openrouter_service.generate_chat_response(
+                messages=messages,
+                model=request.model,
+                stream=True,
+                user_id=_user_id(current_user)
+            )
+        except BaseException:
+            if goal_task is not None:
+                goal_task.cancel()
+            raise
         
         async def generate():
+            nonlocal goal_task
+            # Sin detección en paralelo, el JSON de la meta se busca en el texto a medida que llega
+            extractor = IncrementalJSONExtractor() if goal_task is None else None
+            goal_sent = False
+            # Trozos de la respuesta, para guardarla en la conversación al terminar
+            reply_parts = [] if window is not None else None
             try:
-                response_buffer = ""
                 async for chunk in stream_generator:
                     if chunk.is_complete:
+                        if chunk.text and goal_task is not None:
+                            # El stream terminó con error: se descarta la detección
+                            goal_task.cancel()
+                            goal_task = None
+                        if not chunk.text and reply_parts:
+                            await _save_conversation_reply(
+                                request.conversation_id, current_user, window, "".join(reply_parts)
+                            )
+                        if goal_task is not None and not goal_sent:
+                            await asyncio.wait({goal_task})
+                            goal_metadata = _goal_task_result(goal_task)
+                            if goal_metadata and goal_metadata.get("has_goal", False):
+                                yield f"data: {json.dumps({'goal_metadata': goal_metadata})}\n\n"
                         # Evento final
                         yield f"data: [DONE]\n\n"
                         break
                     
-                    # Acumular texto para análisis posterior
-                    response_buffer += chunk.text
-                    
                     # Enviar chunk
                     yield f"data: {json.dumps({'text': chunk.text})}\n\n"
-                
-                # Analizar si hay una meta después de completar
-                if response_buffer:
-                    goal_metadata = openrouter_service._extract_goal_metadata(response_buffer)
-                    if goal_metadata and goal_metadata.get("has_goal", False):
-                        # Enviar metadatos de la meta como evento separado
-                        yield f"data: {json.dumps({'goal_metadata': goal_metadata})}\n\n"
+                    if reply_parts is not None:
+                        reply_parts.append(chunk.text)
+                    
+                    # Enviar la meta en cuanto se conoce, sin esperar al final del stream
+                    if goal_sent:
+                        continue
+                    if extractor is not None:
+                        candidates = [
+                            openrouter_service._goal_metadata_from_data(data)
+                            for data in extractor.feed(chunk.text)
+                        ]
+                    elif goal_task.done():
+                        candidates = [_goal_task_result(goal_task)]
+                    else:
+                        candidates = []
+                    for goal_metadata in candidates:
+                        if goal_metadata and goal_metadata.get("has_goal", False):
+                            yield f"data: {json.dumps({'goal_metadata': goal_metadata})}\n\n"
+                            goal_sent = True
+                            break
+                    if goal_task is not None and goal_task.done():
+                        goal_sent = True
             except Exception as e:
                 logger.error(f"Error en stream generator: {str(e)}")
                 yield f"data: {json.dumps({'error': str(e)})}\n\n"
                 yield f"data: [DONE]\n\n"
+            finally:
+                # Si el chat falla o el cliente se desconecta, la detección ya no hace falta
+                if goal_task is not None and not goal_task.done():
+                    goal_task.cancel()
         
         return StreamingResponse(
             generate(), 
             media_type="text/event-stream"
         )
+    except HTTPException:
+        raise
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error en openrouter_chat_stream: {str(e)}")
         raise HTTPException(
@@ -139,8 +279,10 @@ async def detect_goal(
     Detecta si un mensaje contiene una meta
     """
     try:
-        goal_data = await openrouter_service.detect_goal_from_message(message)
+        goal_data = await openrouter_service.detect_goal_from_message(message, user_id=_user_id(current_user))
         return goal_data or {"has_goal": False}
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error detectando meta: {str(e)}")
         raise HTTPException(
@@ -157,8 +299,10 @@ async def generate_goal_plan(
     Genera un plan detallado para una meta
     """
     try:
-        plan = await openrouter_service.generate_goal_plan(goal_metadata)
+        plan = await openrouter_service.generate_goal_plan(goal_metadata, user_id=_user_id(current_user))
         return plan
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error generando plan: {str(e)}")
         raise HTTPException(
@@ -166,6 +310,25 @@ async def generate_goal_plan(
             detail=f"Error generando plan: {str(e)}"
         )
 
+@router.get("/context", response_model=UserContextOut)
+async def read_user_context(
+    refresh: bool = False,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    Contexto precalculado del usuario (tareas, hábitos, metas y finanzas).
+    Su `context_id` sustituye a `user_data` en los endpoints de planificación.
+    """
+    try:
+        context = await get_user_context(_user_id(current_user), refresh=refresh)
+        return context.describe()
+    except Exception as e:
+        logger.error(f"Error obteniendo el contexto del usuario: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error obteniendo el contexto del usuario: {str(e)}"
+        )
+
 @router.post("/generate-personalized-plan", response_model=Dict[str, Any])
 async def generate_personalized_plan(
     request: PersonalizedPlanRequest,
@@ -175,12 +338,17 @@ async def generate_personalized_plan(
     Genera un plan personalizado basado en datos históricos del usuario
     """
     try:
+        context = await _server_context(request, current_user)
         plan = await openrouter_service.generate_personalized_plan(
-            user_data=request.user_data,
+            user_data=request.user_data if context is None else context.to_user_data(),
             goal_type=request.goal_type,
-            preferences=request.preferences
+            preferences=request.preferences,
+            user_id=_user_id(current_user),
+            analyses=None if context is None else context.analyses()
         )
         return plan
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error generando plan personalizado: {str(e)}")
         raise HTTPException(
@@ -197,8 +365,14 @@ async def analyze_patterns(
     Analiza patrones avanzados en los datos históricos del usuario
     """
     try:
-        analysis = await openrouter_service.analyze_patterns(request.user_data)
+        context = await _server_context(request, current_user)
+        analysis = await openrouter_service.analyze_patterns(
+            request.user_data if context is None else context.to_user_data(),
+            user_id=_user_id(current_user)
+        )
         return analysis
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error analizando patrones: {str(e)}")
         raise HTTPException(
@@ -215,11 +389,15 @@ async def learning_adaptation(
     Genera adaptaciones basadas en aprendizaje continuo
     """
     try:
+        context = await _server_context(request, current_user)
         adaptation = await openrouter_service.generate_learning_adaptation(
-            user_data=request.user_data,
-            interaction_history=request.interaction_history
+            user_data=request.user_data if context is None else context.to_user_data(),
+            interaction_history=request.interaction_history,
+            user_id=_user_id(current_user)
         )
         return adaptation
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"Error generando adaptación de aprendizaje: {str(e)}")
         raise HTTPException(
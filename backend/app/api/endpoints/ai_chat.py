@@ -1,9 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Dict, Any
-from uuid import uuid4
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import Any, Optional
+from uuid import UUID
 
 from app.api.deps import get_current_user
-from app.schemas.ai import MessageRole, ChatMessage as AIChatMessage, ChatResponse as AIChatResponse
+from app.db.database import get_async_session_factory
+from app.schemas.ai import (
+    ChatMessage as AIChatMessage,
+    ChatResponse as AIChatResponse,
+    ConversationBase,
+    ConversationMessagePage,
+    ConversationOut,
+    ConversationPage,
+)
+from app.services.ai.conversations import ConversationStore
 
 router = APIRouter()
 
@@ -29,30 +38,66 @@ async def chat_with_ai(
             detail=f"Error al procesar la solicitud: {str(e)}"
         )
 
-@router.get("/conversations", response_model=List[Dict[str, Any]])
+def _store_user_id(current_user: Any) -> UUID:
+    try:
+        return UUID(str(current_user.id))
+    except (AttributeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Usuario no válido para conversaciones")
+
+@router.post("/conversations", response_model=ConversationOut, status_code=status.HTTP_201_CREATED)
+async def create_conversation(
+    conversation_in: ConversationBase,
+    current_user=Depends(get_current_user)
+):
+    """
+    Crea una conversación vacía.
+    """
+    async with get_async_session_factory()() as db:
+        conversation = await ConversationStore(db).create_conversation(
+            _store_user_id(current_user), conversation_in.title
+        )
+        return conversation
+
+@router.get("/conversations", response_model=ConversationPage)
 async def get_conversations(
     current_user=Depends(get_current_user),
-    skip: int = 0,
-    limit: int = 10
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
 ):
     """
-    Obtiene el historial de conversaciones del usuario.
+    Obtiene el historial de conversaciones del usuario, de la más reciente a la
+    más antigua. Para la página siguiente se envía el `next_cursor` recibido.
     """
-    # Aquí iría la lógica para obtener las conversaciones desde Supabase
-    # Por ahora, devolvemos una lista vacía
-    return []
+    async with get_async_session_factory()() as db:
+        try:
+            conversations, next_cursor = await ConversationStore(db).list_conversations(
+                _store_user_id(current_user), limit=limit, cursor=cursor
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return {"items": conversations, "next_cursor": next_cursor}
 
-@router.get("/conversations/{conversation_id}", response_model=List[Dict[str, Any]])
+@router.get("/conversations/{conversation_id}", response_model=ConversationMessagePage)
 async def get_conversation_messages(
     conversation_id: str,
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200)
 ):
     """
-    Obtiene los mensajes de una conversación específica.
+    Obtiene los mensajes de una conversación específica: sin cursor, los
+    últimos `limit`; con `next_cursor`, los anteriores.
     """
-    # Aquí iría la lógica para obtener los mensajes desde Supabase
-    # Por ahora, devolvemos una lista vacía
-    return []
+    async with get_async_session_factory()() as db:
+        store = ConversationStore(db)
+        conversation = await store.get_conversation(_store_user_id(current_user), conversation_id)
+        if conversation is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversación no encontrada")
+        try:
+            messages, next_cursor = await store.list_messages(conversation, limit=limit, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return {"items": messages, "next_cursor": next_cursor}
 
 @router.delete("/conversations/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_conversation(
@@ -62,5 +107,9 @@ async def delete_conversation(
     """
     Elimina una conversación específica.
     """
-    # Aquí iría la lógica para eliminar la conversación en Supabase
-    pass 
\ No newline at end of file
+    async with get_async_session_factory()() as db:
+        store = ConversationStore(db)
+        conversation = await store.get_conversation(_store_user_id(current_user), conversation_id)
+        if conversation is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversación no encontrada")
+        await store.delete_conversation(conversation)
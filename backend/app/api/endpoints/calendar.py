@@ -1,11 +1,13 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
 from uuid import UUID
 import json
+import logging
 
 from app.api.deps import get_current_active_user, get_db
 from app.models.users import User
@@ -14,13 +16,45 @@ from app.schemas.calendar import (
     CalendarEventCreate, 
     CalendarEventUpdate, 
     CalendarEventResponse,
+    CalendarImportResponse,
     CalendarSyncRequest,
     CalendarSyncResponse,
-    GoogleCredentials
+    FreeBusyResponse,
+    GoogleCredentials,
+    TaskScheduleRequest,
+    TaskScheduleResponse
 )
 from app.services.calendar.google_calendar import GoogleCalendarService
+from app.services.calendar.cache import invalidate_user_calendar
+from app.services.calendar.feed import (
+    FEED_MEDIA_TYPE,
+    etag_matches,
+    feed_token,
+    get_cached_feed,
+    load_feed_state,
+    stream_feed,
+    verify_feed_token,
+)
+from app.services.calendar.free_busy import get_free_busy
+from app.services.calendar.ics_import import IcsImporter
+from app.services.calendar.progress import (
+    SupabaseSyncLogStore,
+    SyncProgress,
+    stream_sync_progress,
+    sync_progress_broker
+)
+from app.services.calendar.reconciliation import SYNC_STATUS_DELETED
+from app.services.calendar.task_scheduler import schedule_tasks
+from app.services.calendar.recurrence import load_events_in_window, merge_events_in_window, invalidate_event
 from app.services.calendar.sync_service import CalendarSyncService
+from app.services.calendar.watch import ChannelNotification, WatchChannelManager, handle_notification
+from app.services.jobs import job_queue
+from app.services.jobs.handlers import CALENDAR_SYNC_JOB, calendar_sync_dedupe_key
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import get_async_session_factory, get_supabase_client
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -33,17 +67,76 @@ async def get_calendar_events(
 ):
     """
     Obtiene los eventos de calendario del usuario actual dentro del rango de fechas especificado.
+    Los eventos recurrentes se expanden en sus ocurrencias dentro del rango.
     """
-    stmt = select(CalendarEvent).where(
-        CalendarEvent.user_id == current_user.id,
-        CalendarEvent.end_time >= start_date,
-        CalendarEvent.start_time <= end_date
-    ).order_by(CalendarEvent.start_time)
+    events = await load_events_in_window(db, current_user.id, start_date, end_date)
     
-    result = await db.execute(stmt)
-    events = result.scalars().all()
+    return merge_events_in_window(events, start_date, end_date)
+
+@router.get("/free-busy", response_model=FreeBusyResponse)
+async def get_free_busy_slots(
+    from_: datetime = Query(..., alias="from", description="Inicio del rango"),
+    to: datetime = Query(..., description="Fin del rango"),
+    min_duration: int = Query(30, ge=0, description="Duración mínima de los huecos libres, en minutos"),
+    include_all_day: bool = Query(False, description="Contar los eventos de todo el día como ocupados"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Obtiene los intervalos ocupados y los huecos libres del usuario en el rango indicado.
+    """
+    if to <= from_:
+        raise HTTPException(status_code=400, detail="El fin del rango debe ser posterior al inicio")
     
-    return events
+    return await get_free_busy(
+        db,
+        current_user.id,
+        from_,
+        to,
+        timedelta(minutes=min_duration),
+        include_all_day
+    )
+
+@router.post("/schedule-tasks", response_model=TaskScheduleResponse)
+async def schedule_open_tasks(
+    schedule_request: TaskScheduleRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Planifica las tareas abiertas del usuario en sus huecos libres del calendario
+    y guarda el plan como eventos vinculados a cada tarea.
+    """
+    start_date = schedule_request.start_date or datetime.utcnow()
+    end_date = schedule_request.end_date or start_date + timedelta(days=30)
+    if end_date <= start_date:
+        raise HTTPException(status_code=400, detail="El fin del rango debe ser posterior al inicio")
+    
+    try:
+        supabase = get_supabase_client()
+        query = supabase.table("tasks") \
+            .select("*") \
+            .eq("user_id", str(current_user.id)) \
+            .eq("is_deleted", False) \
+            .neq("status", "completed")
+        if schedule_request.task_ids:
+            query = query.in_("id", schedule_request.task_ids)
+        task_rows = query.execute().data or []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener tareas: {str(e)}")
+    
+    return await schedule_tasks(
+        db,
+        current_user.id,
+        task_rows,
+        start_date,
+        end_date,
+        workday_start_hour=schedule_request.workday_start_hour,
+        workday_end_hour=schedule_request.workday_end_hour,
+        include_weekends=schedule_request.include_weekends,
+        utc_offset_minutes=schedule_request.utc_offset_minutes,
+        dry_run=schedule_request.dry_run
+    )
 
 @router.post("/events", response_model=CalendarEventResponse)
 async def create_calendar_event(
@@ -73,9 +166,52 @@ async def create_calendar_event(
     db.add(db_event)
     await db.commit()
     await db.refresh(db_event)
+    invalidate_user_calendar(current_user.id)
     
     return db_event
 
+@router.post("/import", response_model=CalendarImportResponse)
+async def import_calendar_events(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Importa los eventos de un archivo .ics (exportación de Google Calendar,
+    Outlook, Apple...). Las reglas RRULE se conservan y los UID que ya se
+    importaron antes se omiten. Devuelve los contadores y el rendimiento en
+    milisegundos por cada mil eventos.
+    """
+    async def read_chunks():
+        total = 0
+        while True:
+            chunk = await file.read(64 * 1024)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > settings.ICS_IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="El archivo ICS es demasiado grande")
+            yield chunk
+    
+    try:
+        result = await IcsImporter(db, current_user.id).run(read_chunks())
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error importando archivo ICS: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Error importando el archivo ICS: {str(e)}")
+    
+    return CalendarImportResponse(
+        events_parsed=result.events_parsed,
+        events_imported=result.events_imported,
+        duplicates=result.duplicates,
+        skipped=result.skipped,
+        error_count=result.error_count,
+        errors=result.errors,
+        elapsed_seconds=round(result.elapsed_seconds, 3),
+        ms_per_thousand_events=result.ms_per_thousand_events
+    )
+
 @router.get("/events/{event_id}", response_model=CalendarEventResponse)
 async def get_calendar_event(
     event_id: UUID,
@@ -87,7 +223,8 @@ async def get_calendar_event(
     """
     stmt = select(CalendarEvent).where(
         CalendarEvent.id == event_id,
-        CalendarEvent.user_id == current_user.id
+        CalendarEvent.user_id == current_user.id,
+        CalendarEvent.sync_status.is_distinct_from(SYNC_STATUS_DELETED)
     )
     
     result = await db.execute(stmt)
@@ -110,7 +247,8 @@ async def update_calendar_event(
     """
     stmt = select(CalendarEvent).where(
         CalendarEvent.id == event_id,
-        CalendarEvent.user_id == current_user.id
+        CalendarEvent.user_id == current_user.id,
+        CalendarEvent.sync_status.is_distinct_from(SYNC_STATUS_DELETED)
     )
     
     result = await db.execute(stmt)
@@ -135,6 +273,8 @@ async def update_calendar_event(
     
     await db.commit()
     await db.refresh(db_event)
+    invalidate_event(db_event.id)
+    invalidate_user_calendar(current_user.id)
     
     return db_event
 
@@ -149,7 +289,8 @@ async def delete_calendar_event(
     """
     stmt = select(CalendarEvent).where(
         CalendarEvent.id == event_id,
-        CalendarEvent.user_id == current_user.id
+        CalendarEvent.user_id == current_user.id,
+        CalendarEvent.sync_status.is_distinct_from(SYNC_STATUS_DELETED)
     )
     
     result = await db.execute(stmt)
@@ -158,18 +299,22 @@ async def delete_calendar_event(
     if not db_event:
         raise HTTPException(status_code=404, detail="Evento no encontrado")
     
-    # Si el evento está sincronizado con Google y tiene un ID de Google,
-    # se podría eliminar también de Google aquí o marcarlo para eliminación en la próxima sincronización
-    
-    await db.delete(db_event)
+    # Si el evento existe en Google se deja un tombstone: la próxima sincronización
+    # lo borra en Google y después lo elimina de la base de datos
+    if db_event.google_event_id:
+        db_event.sync_status = SYNC_STATUS_DELETED
+        db.add(db_event)
+    else:
+        await db.delete(db_event)
     await db.commit()
+    invalidate_event(event_id)
+    invalidate_user_calendar(current_user.id)
     
     return None
 
 @router.post("/sync", response_model=CalendarSyncResponse)
 async def sync_calendar(
     sync_request: CalendarSyncRequest,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -184,26 +329,50 @@ async def sync_calendar(
         )
     
     try:
-        # Inicializar el servicio de Google Calendar con las credenciales del usuario
-        google_service = GoogleCalendarService(current_user.google_credentials)
-        
-        # Inicializar el servicio de sincronización
-        sync_service = CalendarSyncService(db, google_service, current_user.id)
-        
-        # Si la solicitud es para sincronización en segundo plano
+        # Si la solicitud es para sincronización en segundo plano, solo se encola:
+        # el proceso web no ejecuta la sincronización
         if sync_request.background:
-            background_tasks.add_task(
-                sync_service.sync_events,
-                sync_request.start_date,
-                sync_request.end_date,
-                sync_request.direction
+            # Registro de la sincronización: el worker publica en él su progreso
+            # (GET /sync/stream/{sync_log_id})
+            sync_log_id = None
+            try:
+                sync_log_id = await SupabaseSyncLogStore().create(str(current_user.id), sync_request.sync_type)
+            except Exception as e:
+                logger.warning(f"No se pudo crear el registro de sincronización: {str(e)}")
+            
+            job_id = await job_queue.enqueue(
+                CALENDAR_SYNC_JOB,
+                {
+                    "user_id": str(current_user.id),
+                    "start_date": sync_request.start_date.isoformat(),
+                    "end_date": sync_request.end_date.isoformat(),
+                    "direction": sync_request.direction,
+                    "sync_log_id": sync_log_id
+                },
+                user_id=str(current_user.id),
+                dedupe_key=calendar_sync_dedupe_key(
+                    current_user.id,
+                    sync_request.start_date,
+                    sync_request.end_date,
+                    sync_request.direction
+                )
             )
             
             return CalendarSyncResponse(
                 success=True,
-                message="Sincronización iniciada en segundo plano"
+                message="Sincronización encolada",
+                sync_log_id=sync_log_id,
+                job_id=job_id
             )
         else:
+            # Inicializar el servicio de Google Calendar con las credenciales del usuario
+            google_service = GoogleCalendarService(current_user.google_credentials)
+            
+            # Inicializar el servicio de sincronización
+            # Con DATABASE_URL las fases pull y push usan sesiones propias y se ejecutan en paralelo
+            session_factory = get_async_session_factory() if settings.DATABASE_URL else None
+            sync_service = CalendarSyncService(db, google_service, current_user.id, session_factory=session_factory)
+            
             # Sincronización síncrona
             result = await sync_service.sync_events(
                 sync_request.start_date,
@@ -218,6 +387,158 @@ async def sync_calendar(
             detail=f"Error durante la sincronización: {str(e)}"
         )
 
+@router.get("/sync/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_sync_job_status(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Obtiene el estado de una sincronización encolada.
+    """
+    job = await job_queue.get_job(job_id, user_id=str(current_user.id))
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo de sincronización no encontrado")
+    
+    return job
+
+@router.get("/sync/status/{sync_log_id}", response_model=Dict[str, Any])
+async def get_sync_status(
+    sync_log_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Obtiene el progreso de una sincronización en segundo plano. Se sirve desde
+    memoria si el progreso llega a este proceso (worker embebido o LISTEN de
+    Postgres); es preferible el stream SSE.
+    """
+    progress = sync_progress_broker.latest(sync_log_id)
+    if progress is not None and progress.user_id == str(current_user.id):
+        return progress.to_dict()
+    
+    row = await SupabaseSyncLogStore().get(sync_log_id, str(current_user.id))
+    if not row:
+        raise HTTPException(status_code=404, detail="Registro de sincronización no encontrado")
+    
+    return SyncProgress.from_log_row(row).to_dict()
+
+@router.get("/sync/stream/{sync_log_id}")
+async def stream_sync_status(
+    sync_log_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Stream SSE (text/event-stream) con el progreso de una sincronización en
+    segundo plano: eventos "progress" con los contadores hasta que termina.
+    """
+    user_id = str(current_user.id)
+    progress = sync_progress_broker.latest(sync_log_id)
+    if progress is None:
+        if not await SupabaseSyncLogStore().get(sync_log_id, user_id):
+            raise HTTPException(status_code=404, detail="Registro de sincronización no encontrado")
+    elif progress.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Registro de sincronización no encontrado")
+    
+    return StreamingResponse(
+        stream_sync_progress(sync_log_id, user_id, is_disconnected=request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/webhook/google", status_code=200)
+async def google_calendar_webhook(request: Request):
+    """
+    Receptor de las notificaciones push de Google Calendar (events.watch).
+    Se valida el token del canal y las ráfagas de cada usuario se agrupan en
+    una sola sincronización encolada. Responde sin esperar a la sincronización.
+    """
+    notification = ChannelNotification.from_headers(request.headers)
+    status = handle_notification(notification)
+    if status == "invalid":
+        raise HTTPException(status_code=403, detail="Canal de notificaciones no válido")
+    
+    return Response(status_code=200)
+
+@router.post("/watch", response_model=Dict[str, Any])
+async def start_calendar_watch(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Activa las notificaciones push de Google Calendar para el usuario: los
+    cambios en Google disparan una sincronización en lugar de esperar al
+    siguiente ciclo de sincronización automática.
+    """
+    if not current_user.google_credentials:
+        raise HTTPException(
+            status_code=400, 
+            detail="No hay credenciales de Google Calendar disponibles. Por favor, conecte su cuenta."
+        )
+    
+    try:
+        channel = await WatchChannelManager().open_channel(current_user)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error activando las notificaciones de Google Calendar: {str(e)}"
+        )
+    
+    return {"channel_id": channel.id, "expiration": channel.expiration}
+
+@router.delete("/watch", response_model=Dict[str, Any])
+async def stop_calendar_watch(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Desactiva las notificaciones push de Google Calendar del usuario.
+    """
+    closed = await WatchChannelManager().close_user_channels(current_user)
+    return {"channels_closed": closed}
+
+@router.get("/feed", response_model=Dict[str, Any])
+async def get_calendar_feed_url(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    URL de suscripción iCalendar del usuario (para Google Calendar, Outlook, Apple...)
+    """
+    token = feed_token(current_user.id)
+    return {"url": f"{settings.BACKEND_URL}/api/v1/calendar/feed/{token}.ics"}
+
+@router.get("/feed/{token}.ics")
+async def get_calendar_feed(token: str, request: Request):
+    """
+    Feed iCalendar (ICS) con los eventos del usuario y sus tareas con fecha
+    límite. Los clientes suscritos lo consultan cada pocos minutos: con
+    If-None-Match se responde 304 si no ha cambiado nada, y el documento
+    generado se guarda en caché hasta la siguiente escritura.
+    """
+    user_id = verify_feed_token(token)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Feed no encontrado")
+    
+    cached = get_cached_feed(user_id)
+    if cached is not None:
+        etag, tasks = cached.etag, None
+    else:
+        etag, tasks, generation = await load_feed_state(get_async_session_factory(), user_id)
+    
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.inc("calendar_ics_feed_requests_total", labels={"result": "not_modified"})
+        return Response(status_code=304, headers=headers)
+    
+    if cached is not None:
+        metrics.inc("calendar_ics_feed_requests_total", labels={"result": "cached"})
+        return Response(content=cached.body, media_type=FEED_MEDIA_TYPE, headers=headers)
+    
+    metrics.inc("calendar_ics_feed_requests_total", labels={"result": "rendered"})
+    return StreamingResponse(
+        stream_feed(get_async_session_factory(), user_id, etag, tasks, generation),
+        media_type=FEED_MEDIA_TYPE,
+        headers=headers
+    )
+
 @router.post("/connect/google", status_code=200)
 async def connect_google_calendar(
     credentials: GoogleCredentials,
@@ -7,6 +7,7 @@ from app.services.auth import get_current_user
 from app.schemas.user import User
 from app.schemas.finance import Transaction, TransactionCreate, TransactionUpdate, FinancialGoal, FinancialGoalCreate, FinancialGoalUpdate
 from app.db.database import get_supabase_client
+from app.services.ai.user_context import SOURCE_FINANCE, invalidate_user_context
 
 router = APIRouter()
 
@@ -75,6 +76,7 @@ async def create_transaction(
                 detail="Error al crear la transacción"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_FINANCE)
         return Transaction(**response.data[0])
     except Exception as e:
         raise HTTPException(
@@ -157,6 +159,7 @@ async def update_transaction(
                 detail="Error al actualizar la transacción"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_FINANCE)
         return Transaction(**update_response.data[0])
     except HTTPException:
         raise
@@ -209,6 +212,7 @@ async def delete_transaction(
                 detail="Error al eliminar la transacción"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_FINANCE)
         return Transaction(**delete_response.data[0])
     except HTTPException:
         raise
@@ -279,6 +283,7 @@ async def create_financial_goal(
                 detail="Error al crear la meta financiera"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_FINANCE)
         return FinancialGoal(**response.data[0])
     except Exception as e:
         raise HTTPException(
@@ -328,6 +333,7 @@ async def update_financial_goal(
                 detail="Error al actualizar la meta financiera"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_FINANCE)
         return FinancialGoal(**update_response.data[0])
     except HTTPException:
         raise
@@ -380,6 +386,7 @@ async def delete_financial_goal(
                 detail="Error al eliminar la meta financiera"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_FINANCE)
         return FinancialGoal(**delete_response.data[0])
     except HTTPException:
         raise
@@ -11,6 +11,7 @@ from app.schemas.user import User
 from app.schemas.habits import Habit, HabitCreate, HabitUpdate, HabitLog, HabitLogCreate
 # from app.schemas.habit import Habit, HabitCreate, HabitUpdate, HabitLog, HabitLogCreate
 from app.db.database import get_supabase_client
+from app.services.ai.user_context import SOURCE_HABITS, invalidate_user_context
 
 router = APIRouter()
 
@@ -127,6 +128,7 @@ async def create_habit(
                 detail="Error al crear el hábito: No se recibieron datos"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_HABITS)
         return Habit(**response.data[0])
     except Exception as e:
         # Loggear el error detallado
@@ -214,6 +216,7 @@ async def update_habit(
                 detail="Error al actualizar el hábito"
             )
         
+        invalidate_user_context(current_user.id, SOURCE_HABITS)
         return Habit(**update_response.data[0])
     except HTTPException:
         raise
@@ -269,6 +272,8 @@ async def delete_habit(
         
         logger.info(f"Hábito {habit_id} eliminado correctamente")
         
+        invalidate_user_context(current_user.id, SOURCE_HABITS)
+        
         # Devolver el hábito eliminado
         return Habit(**get_response.data[0])
     except HTTPException:
@@ -429,6 +434,7 @@ async def create_habit_log(
         # Opcional: Actualizar manualmente el hábito si es necesario
         # Esto se puede hacer si decidimos deshabilitar el trigger
         
+        invalidate_user_context(current_user.id, SOURCE_HABITS)
         return HabitLog(**response.data[0])
     except HTTPException:
         raise
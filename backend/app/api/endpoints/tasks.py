@@ -7,6 +7,8 @@ from app.services.auth import get_current_user
 from app.schemas.user import User
 from app.schemas.task import Task, TaskCreate, TaskUpdate
 from app.db.database import get_supabase_client
+from app.services.ai.user_context import SOURCE_TASKS, invalidate_user_context
+from app.services.calendar.cache import invalidate_user_calendar
 
 router = APIRouter()
 
@@ -87,6 +89,9 @@ async def create_task(
                 detail="Error al crear la tarea"
             )
         
+        # Las tareas con fecha límite forman parte del feed de calendario
+        invalidate_user_calendar(current_user.id)
+        invalidate_user_context(current_user.id, SOURCE_TASKS)
         return response.data[0]
     except Exception as e:
         raise HTTPException(
@@ -165,6 +170,8 @@ async def update_task(
             .eq("id", task_id) \
             .execute()
         
+        invalidate_user_calendar(current_user.id)
+        invalidate_user_context(current_user.id, SOURCE_TASKS)
         return response.data[0]
     except Exception as e:
         raise HTTPException(
@@ -206,6 +213,8 @@ async def delete_task(
             .eq("id", task_id) \
             .execute()
         
+        invalidate_user_calendar(current_user.id)
+        invalidate_user_context(current_user.id, SOURCE_TASKS)
         return response.data[0]
     except Exception as e:
         raise HTTPException(
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import os
 from functools import lru_cache
 
@@ -14,6 +14,25 @@ class AISettings(BaseSettings):
     OPENROUTER_DEFAULT_MODEL: str = "qwen/qwq-32b:online"
     OPENROUTER_REFERER: str = "https://task-manager.app"  # Dominio de la aplicación
 
+    # Modelos por funcionalidad, en orden de preferencia: si uno falla (error del
+    # proveedor, modelo no disponible, timeout) se prueba el siguiente, y
+    # OPENROUTER_DEFAULT_MODEL queda siempre como último recurso. Las
+    # funcionalidades que no aparecen (chat y planificación) usan
+    # OPENROUTER_DEFAULT_MODEL seguido de la ruta "default".
+    AI_MODEL_ROUTES: Dict[str, List[str]] = {
+        "default": ["meta-llama/llama-3.3-70b-instruct"],
+        # Clasificación y extracción: modelos pequeños de baja latencia
+        "goal_detection": ["meta-llama/llama-3.1-8b-instruct", "mistralai/mistral-small-3.1-24b-instruct"],
+        "conversation_summary": ["meta-llama/llama-3.1-8b-instruct", "mistralai/mistral-small-3.1-24b-instruct"],
+        # Sugerencias en segundo plano: modelo mediano y rápido antes que OPENROUTER_DEFAULT_MODEL
+        "suggestion": ["meta-llama/llama-3.3-70b-instruct", "mistralai/mistral-small-3.1-24b-instruct"],
+    }
+    AI_MODEL_MAX_ATTEMPTS: int = 3       # Modelos de la ruta que se prueban como máximo
+    # Timeout por intento en las rutas rápidas (el resto usa REQUEST_TIMEOUT_SECONDS)
+    AI_ROUTE_TIMEOUT_SECONDS: Dict[str, float] = {"goal_detection": 10.0, "conversation_summary": 20.0}
+    # Pedir a OpenRouter el coste de cada llamada (usage.cost) para las métricas
+    AI_USAGE_ACCOUNTING: bool = True
+
     # Configuración para tokens máximos en diferentes contextos
     MAX_TOKENS_RESPONSE: int = 800
     MAX_TOKENS_GOAL_DETECTION: int = 500
@@ -30,9 +49,74 @@ class AISettings(BaseSettings):
     TEMPERATURE_PATTERN_ANALYSIS: float = 0.3   # Más determinista para análisis
     TEMPERATURE_LEARNING_ADAPTATION: float = 0.6  # Más creativo para adaptación
 
-    # Parámetros para control de frecuencia/limitaciones
-    MAX_REQUESTS_PER_MINUTE: int = 10    # Limitar solicitudes a la API
+    # Parámetros para control de frecuencia/limitaciones. Los modelos de pago de
+    # OpenRouter no tienen un límite fijo por minuto (solo los ":free", 20/min),
+    # así que el límite global protege el crédito y se ajusta a la cuenta.
+    # Con un turno de chat cada ~15 s por usuario activo (4 de chat + 4 de
+    # detección de metas por minuto), 120/min dan para ~15 usuarios a la vez.
+    MAX_REQUESTS_PER_MINUTE: int = int(os.getenv("AI_MAX_REQUESTS_PER_MINUTE", "120"))
+    AI_RATE_LIMIT_BURST: int = int(os.getenv("AI_RATE_LIMIT_BURST", "20"))  # Peticiones seguidas antes de aplicar el ritmo
+    # Cupo de cada usuario dentro del límite global: un turno de chat cada 5 s
+    AI_USER_REQUESTS_PER_MINUTE: int = int(os.getenv("AI_USER_REQUESTS_PER_MINUTE", "12"))
+    AI_USER_RATE_LIMIT_BURST: int = int(os.getenv("AI_USER_RATE_LIMIT_BURST", "4"))
+    # Funcionalidades con cupo por usuario propio (peticiones/min, ráfaga): la
+    # detección de metas que acompaña a cada mensaje no gasta el cupo del chat
+    AI_USER_FEATURE_BUDGETS: Dict[str, Tuple[float, float]] = {
+        "goal_detection": (12, 4),
+    }
+    AI_RATE_LIMIT_MAX_QUEUE: int = 50    # Peticiones en espera por carril de prioridad
+    # Espera máxima en cola por carril antes de rechazar la petición
+    AI_RATE_LIMIT_MAX_WAIT_SECONDS: Dict[str, float] = {"interactive": 20.0, "background": 300.0}
     REQUEST_TIMEOUT_SECONDS: int = 30    # Timeout para solicitudes
+
+    # Caché de respuestas para llamadas repetibles (misma entrada, misma respuesta)
+    AI_RESPONSE_CACHE_ENABLED: bool = os.getenv("AI_RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    AI_RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    # TTL por funcionalidad; las que no aparecen no se cachean
+    AI_RESPONSE_CACHE_TTL_SECONDS: Dict[str, int] = {
+        "goal_detection": 24 * 3600,
+        "goal_plan": 24 * 3600,
+        "pattern_analysis": 6 * 3600,
+    }
+    # Backend compartido entre procesos: "" (solo memoria) o "sql" (tabla ai_response_cache en DATABASE_URL)
+    AI_RESPONSE_CACHE_SHARED_BACKEND: str = os.getenv("AI_RESPONSE_CACHE_SHARED_BACKEND", "")
+
+    # Filtro local delante de la detección de metas: los mensajes que claramente
+    # no contienen una meta no llegan al LLM
+    AI_GOAL_GATE_ENABLED: bool = os.getenv("AI_GOAL_GATE_ENABLED", "true").lower() == "true"
+    # Probabilidad mínima de meta para consultar al LLM con los pesos por defecto, que
+    # solo descartan saludos y preguntas (recall: scripts/train_goal_gate.py --check)
+    AI_GOAL_GATE_THRESHOLD: float = 0.15
+    # Pesos entrenados con scripts/train_goal_gate.py (incluyen su propio umbral)
+    AI_GOAL_GATE_MODEL_PATH: str = os.getenv("AI_GOAL_GATE_MODEL_PATH", "")
+    AI_GOAL_GATE_SHADOW_RATE: float = 0.02    # Descartados que se consultan igualmente para estimar el recall
+    AI_GOAL_GATE_LOG_INTERACTIONS: bool = True  # Guardar las detecciones en ai_interactions (datos de entrenamiento)
+
+    # Presupuesto de tokens del prompt (sistema + usuario) por funcionalidad
+    AI_PROMPT_TOKEN_BUDGETS: Dict[str, int] = {
+        "default": 4000,
+        "goal_plan": 2000,
+        "personalized_plan": 4000,
+        "pattern_analysis": 6000,
+        "learning_adaptation": 6000,
+    }
+
+    # Historial de conversaciones: ventana de últimos turnos + resumen de los anteriores
+    AI_CONVERSATION_WINDOW_TURNS: int = 6        # Turnos (usuario + asistente) recientes en el prompt
+    AI_CONVERSATION_HISTORY_TOKENS: int = 2000   # Presupuesto de tokens de la ventana
+    AI_CONVERSATION_SUMMARY_BATCH: int = 6       # Mensajes fuera de la ventana antes de actualizar el resumen
+    MAX_TOKENS_CONVERSATION_SUMMARY: int = 300
+    TEMPERATURE_CONVERSATION_SUMMARY: float = 0.2
+
+    # Contexto precalculado por usuario (tareas, hábitos, metas, finanzas) para los endpoints de planificación
+    AI_USER_CONTEXT_CACHE_SIZE: int = 1000
+    AI_USER_CONTEXT_TTL_SECONDS: int = 900      # Cubre las escrituras hechas desde otros procesos
+    AI_USER_CONTEXT_HISTORY_DAYS: int = 90      # Periodo que se lee y analiza de cada fuente
+    AI_USER_CONTEXT_MAX_RECORDS: int = 100      # Registros recientes por fuente que van al prompt
+
+    # Sugerencias en segundo plano (app/services/ai/suggestions.py)
+    AI_SUGGESTION_MAX_CONCURRENCY: int = int(os.getenv("AI_SUGGESTION_MAX_CONCURRENCY", "8"))  # Llamadas al LLM a la vez por proceso
+    AI_SUGGESTION_STATUS_BATCH_SECONDS: float = 0.05   # Espera para agrupar las marcas "processing" en un solo UPDATE
     
     class Config:
         env_file = ".env"
@@ -49,6 +133,13 @@ Puedes ayudar a los usuarios con una variedad de tareas, especialmente la gesti
 productividad. Basa tus respuestas en las mejores prácticas de productividad y gestión personal.
 """
 
+CONVERSATION_SUMMARY_PROMPT = """Mantienes el resumen de una conversación entre un usuario y su asistente personal.
+Recibirás el resumen actual (puede estar vacío) y los mensajes nuevos que ya no caben en el historial.
+Devuelve el resumen actualizado, en español y en tercera persona, con los datos que el asistente necesita
+para continuar: metas y preferencias del usuario, decisiones tomadas, compromisos y preguntas pendientes.
+Sé conciso (máximo 200 palabras) y responde solo con el texto del resumen.
+"""
+
 GOAL_DETECTION_PROMPT = """Analiza el siguiente mensaje de un usuario y determina si contiene una meta o intención específica. 
 Una meta debe tener un objetivo claro, medible y preferiblemente un plazo específico.
 
@@ -62,7 +62,84 @@ class Settings(BaseSettings):
     # Google
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "")
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
-    
+
+    # Token (Bearer) de GET /metrics; vacío: el endpoint no se sirve
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+    # Cola de trabajos en segundo plano (sincronizaciones, sugerencias de IA)
+    # Si no se indica, se usa DATABASE_URL (Postgres); también acepta SQLite
+    JOB_QUEUE_DATABASE_URL: Optional[str] = os.getenv("JOB_QUEUE_DATABASE_URL")
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+    JOB_WORKER_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_DELAY_SECONDS: float = 5.0
+    JOB_RETRY_MAX_DELAY_SECONDS: float = 600.0
+    JOB_HEARTBEAT_INTERVAL_SECONDS: float = 30.0  # Cada cuánto renueva el worker el bloqueo del trabajo en curso
+    JOB_LOCK_TIMEOUT_SECONDS: int = 180  # Trabajos "running" sin latido durante más tiempo se consideran abandonados
+    # Ejecutar el pool de workers dentro del proceso web (solo recomendado en desarrollo)
+    JOB_WORKER_EMBEDDED: bool = os.getenv("JOB_WORKER_EMBEDDED", "false").lower() == "true"
+
+    # Cuota de la API de Google Calendar compartida por todos los procesos de sincronización
+    GOOGLE_CALENDAR_QUOTA_PER_MINUTE: int = int(os.getenv("GOOGLE_CALENDAR_QUOTA_PER_MINUTE", "600"))
+    GOOGLE_CALENDAR_QUOTA_BURST: int = 10
+    # Procesos de workers que sincronizan desde la cola: se reparten la cuota que deja el orquestador
+    GOOGLE_CALENDAR_QUOTA_WORKER_PROCESSES: int = int(os.getenv("GOOGLE_CALENDAR_QUOTA_WORKER_PROCESSES", "1"))
+    # Sincronización de un usuario que ya se está sincronizando en otro worker: se reintenta tras esta espera
+    CALENDAR_SYNC_BUSY_RETRY_SECONDS: float = 30.0
+
+    # Expansiones de eventos recurrentes cacheadas (por evento y rango)
+    CALENDAR_RECURRENCE_CACHE_SIZE: int = 4096
+    # Free/busy cacheado por usuario; se invalida con las escrituras de calendario
+    # y el TTL cubre las sincronizaciones hechas en otros procesos (workers)
+    FREE_BUSY_CACHE_SIZE: int = 2048
+    FREE_BUSY_CACHE_TTL_SECONDS: int = 60
+
+    # Planificador automático de tareas en huecos libres del calendario
+    SCHEDULER_TIME_BUDGET_MS: float = 100.0
+    SCHEDULER_DEFAULT_TASK_MINUTES: int = 60  # Si la tarea no tiene estimated_hours
+    SCHEDULER_MIN_BLOCK_MINUTES: int = 30
+    SCHEDULER_PRIORITY_SLACK_HOURS: int = 24  # Adelanto de la fecha límite por punto de prioridad
+    SCHEDULER_WORKDAY_START_HOUR: int = 9
+    SCHEDULER_WORKDAY_END_HOUR: int = 18
+
+    # Orquestador de sincronización automática (sync_type="auto")
+    AUTO_SYNC_CONCURRENCY: int = int(os.getenv("AUTO_SYNC_CONCURRENCY", "8"))
+    AUTO_SYNC_SCAN_INTERVAL_SECONDS: float = 60.0
+    AUTO_SYNC_ACTIVE_INTERVAL_MINUTES: int = 15  # Usuarios con actividad reciente
+    AUTO_SYNC_IDLE_INTERVAL_MINUTES: int = 360
+    AUTO_SYNC_ACTIVE_WINDOW_HOURS: int = 24
+    AUTO_SYNC_WINDOW_PAST_DAYS: int = 7
+    AUTO_SYNC_WINDOW_FUTURE_DAYS: int = 60
+    AUTO_SYNC_QUOTA_UTILIZATION: float = 0.9  # El resto es para las sincronizaciones de la cola (/sync, push)
+    AUTO_SYNC_QUOTA_BACKOFF_SECONDS: float = 60.0
+    # Usuarios con canal de notificaciones push: solo una sincronización de respaldo
+    AUTO_SYNC_PUSH_INTERVAL_HOURS: int = 24
+
+    # Notificaciones push de Google Calendar (events.watch)
+    # Por defecto {BACKEND_URL}/api/v1/calendar/webhook/google (Google exige HTTPS)
+    GOOGLE_CALENDAR_WEBHOOK_URL: str = os.getenv("GOOGLE_CALENDAR_WEBHOOK_URL", "")
+    GOOGLE_WATCH_CHANNEL_TTL_SECONDS: int = 7 * 24 * 3600  # Máximo que concede Google
+    GOOGLE_WATCH_RENEW_BEFORE_HOURS: int = 24
+    GOOGLE_WATCH_RENEW_INTERVAL_SECONDS: float = 3600.0
+    GOOGLE_WATCH_DEBOUNCE_SECONDS: float = 10.0  # Ventana para agrupar ráfagas de notificaciones
+
+    # Feed iCalendar de suscripción (GET /calendar/feed/{token}.ics)
+    # Se invalida con las escrituras; el TTL cubre las tareas editadas desde el frontend
+    ICS_FEED_CACHE_SIZE: int = 256
+    ICS_FEED_CACHE_TTL_SECONDS: int = 300
+    ICS_FEED_BATCH_SIZE: int = 200  # Eventos por lote del cursor y por trozo de la respuesta
+
+    # Importación de archivos ICS (POST /calendar/import)
+    ICS_IMPORT_CHUNK_SIZE: int = 500  # Filas por sentencia INSERT
+    ICS_IMPORT_MAX_BYTES: int = 20 * 1024 * 1024
+
+    # Progreso de sincronizaciones en segundo plano (stream SSE)
+    SYNC_PROGRESS_WRITE_INTERVAL_SECONDS: float = 2.0  # Escrituras en calendar_sync_logs
+    SYNC_PROGRESS_POLL_INTERVAL_SECONDS: float = 3.0  # Lectura de respaldo si no llega progreso (sin Postgres)
+    # Con Postgres el progreso llega por LISTEN/NOTIFY; la tabla solo se relee por si se perdió alguno
+    SYNC_PROGRESS_NOTIFY_POLL_INTERVAL_SECONDS: float = 30.0
+    SYNC_PROGRESS_KEEPALIVE_SECONDS: float = 15.0
+
     class Config:
         case_sensitive = True
         env_file = ".env"
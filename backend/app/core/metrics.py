@@ -0,0 +1,123 @@
+import threading
+import time
+from bisect import insort
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+
+class Histogram:
+    """
+    Histograma simple en memoria con una ventana acotada de muestras
+    para calcular percentiles sin crecer indefinidamente.
+    """
+
+    def __init__(self, max_samples: int = 1024):
+        self.max_samples = max_samples
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._samples: deque = deque()
+        self._sorted: List[float] = []
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        # Ventana deslizante: descartar la muestra más antigua
+        if len(self._samples) >= self.max_samples:
+            oldest = self._samples.popleft()
+            self._sorted.remove(oldest)
+        self._samples.append(value)
+        insort(self._sorted, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._sorted:
+            return None
+        index = min(len(self._sorted) - 1, int(round(q * (len(self._sorted) - 1))))
+        return self._sorted[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "avg": (self.total / self.count) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso (contadores, gauges e histogramas).
+    Los nombres pueden incluir etiquetas en la forma "nombre{clave=valor}".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Optional[Dict[str, Any]] = None) -> str:
+        if not labels:
+            return name
+        rendered = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+        return f"{name}{{{rendered}}}"
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def counter_value(self, name: str, labels: Optional[Dict[str, Any]] = None) -> float:
+        return self._counters.get(self._key(name, labels), 0.0)
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[Dict[str, Any]] = None):
+        """
+        Mide la duración (en segundos) del bloque y la registra en un histograma
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {k: h.snapshot() for k, h in self._histograms.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+# Instancia global de métricas
+metrics = MetricsRegistry()
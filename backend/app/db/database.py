@@ -1,9 +1,42 @@
+from functools import lru_cache
+from typing import Optional
 from supabase import create_client
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _to_async_url(url: str) -> str:
+    """
+    Adapta una URL de base de datos al driver asíncrono correspondiente
+    """
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+@lru_cache()
+def get_async_engine(url: Optional[str] = None) -> AsyncEngine:
+    """
+    Crea (una sola vez por URL) el engine asíncrono de SQLAlchemy
+    """
+    database_url = url or settings.DATABASE_URL
+    if not database_url:
+        raise ValueError("Se requiere DATABASE_URL para usar la base de datos SQLAlchemy")
+    return create_async_engine(_to_async_url(database_url), pool_pre_ping=True)
+
+@lru_cache()
+def get_async_session_factory(url: Optional[str] = None) -> async_sessionmaker:
+    """
+    Devuelve la fábrica de sesiones asíncronas para procesos fuera de una petición HTTP
+    (workers, orquestadores)
+    """
+    return async_sessionmaker(get_async_engine(url), expire_on_commit=False)
+
 def get_supabase_client():
     """
     Crea y devuelve un cliente de Supabase
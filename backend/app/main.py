@@ -1,12 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
+import asyncio
+import hmac
 import logging
 import os
+from typing import Optional
 from dotenv import load_dotenv
 from app.api.router import api_router
 from app.core.config import settings
+from app.core.metrics import metrics
 
 # Cargar variables de entorno
 load_dotenv()
@@ -42,6 +46,17 @@ app.add_middleware(
 async def health_check():
     return {"status": "ok"}
 
+# Métricas del proceso (colas, latencias): incluyen datos por usuario, así que
+# solo se sirven con METRICS_TOKEN (Authorization: Bearer <token>)
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+    if not authorization or not hmac.compare_digest(authorization.encode(), expected):
+        raise HTTPException(status_code=401, detail="Token de métricas no válido")
+    return metrics.snapshot()
+
 # Ruta raíz
 @app.get("/")
 async def root():
@@ -56,6 +71,44 @@ async def global_exception_handler(request, exc):
         content={"detail": "Se ha producido un error interno en el servidor"},
     )
 
+# Pool de workers embebido (solo si se habilita explícitamente; en producción
+# los workers corren aparte con `python -m app.services.jobs.worker`)
+@app.on_event("startup")
+async def start_embedded_workers():
+    if settings.JOB_WORKER_EMBEDDED:
+        from app.services.jobs.worker import JobWorkerPool
+        app.state.job_worker_pool = JobWorkerPool()
+        await app.state.job_worker_pool.start()
+
+@app.on_event("shutdown")
+async def stop_embedded_workers():
+    pool = getattr(app.state, "job_worker_pool", None)
+    if pool:
+        await pool.stop()
+
+# Progreso de las sincronizaciones de workers en otros procesos (LISTEN/NOTIFY de Postgres)
+@app.on_event("startup")
+async def start_sync_progress_listener():
+    from app.services.calendar.progress import sync_progress_relay
+    if sync_progress_relay.enabled:
+        app.state.sync_progress_stop = asyncio.Event()
+        app.state.sync_progress_listener = asyncio.create_task(
+            sync_progress_relay.run(stop_event=app.state.sync_progress_stop)
+        )
+
+@app.on_event("shutdown")
+async def stop_sync_progress_listener():
+    listener = getattr(app.state, "sync_progress_listener", None)
+    if listener:
+        app.state.sync_progress_stop.set()
+        await listener
+
+# Las notificaciones push de Google aún agrupándose se encolan antes de salir
+@app.on_event("shutdown")
+async def flush_calendar_notifications():
+    from app.services.calendar.watch import notification_debouncer
+    await notification_debouncer.flush_all()
+
 # Verificar si estamos en modo desarrollo
 if os.environ.get("ENV", "development") == "development":
     print("Ejecutando en modo desarrollo")
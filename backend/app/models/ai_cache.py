@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, DateTime, Text, Index
+from sqlalchemy.sql import func
+
+from app.db.base_class import Base
+
+class AIResponseCacheEntry(Base):
+    """Respuesta de OpenRouter cacheada, compartida entre procesos."""
+
+    __tablename__ = "ai_response_cache"
+
+    # Hash SHA-256 de (modelo, mensajes, temperatura, max_tokens)
+    key = Column(String(64), primary_key=True)
+    feature = Column(String(50), nullable=False)
+    response = Column(Text, nullable=False)  # JSON serializado
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_ai_response_cache_expires_at", "expires_at"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, Index, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 import uuid
@@ -24,14 +24,17 @@ class CalendarEvent(Base):
     color = Column(String(50), nullable=True)
     
     # Información de recurrencia
-    recurrence_rule = Column(String(255), nullable=True)
+    recurrence_rule = Column(Text, nullable=True)  # Las RRULE con UNTIL/BYDAY largos superan 255
     is_recurring = Column(Boolean, default=False)
     
     # Información de integración con Google Calendar
     google_event_id = Column(String(255), nullable=True, unique=True)
-    sync_status = Column(String(50), default="local")  # local, synced, modified
+    sync_status = Column(String(50), default="local")  # local, synced, modified, deleted
     last_synced_at = Column(DateTime, nullable=True)
     
+    # UID del VEVENT de origen (importaciones ICS), para no duplicar eventos
+    ical_uid = Column(String(255), nullable=True)
+    
     # Relaciones con otras entidades (opcional)
     related_id = Column(UUID(as_uuid=True), nullable=True)
     related_type = Column(String(50), nullable=True)  # task, project, etc.
@@ -40,5 +43,40 @@ class CalendarEvent(Base):
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
     
+    __table_args__ = (
+        Index("ix_calendar_events_user_ical_uid", "user_id", "ical_uid"),
+    )
+    
+    def __repr__(self):
+        return f"<CalendarEvent {self.title} ({self.start_time})>" 
+
+class GoogleWatchChannel(Base):
+    """Canal de notificaciones push (events.watch) de Google Calendar."""
+
+    __tablename__ = "google_watch_channels"
+
+    # ID del canal que generamos al abrirlo (Google lo devuelve en X-Goog-Channel-ID)
+    id = Column(String(64), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    calendar_id = Column(String(255), nullable=False, default="primary")
+    # ID del recurso vigilado, necesario para cerrar el canal
+    resource_id = Column(String(255), nullable=True)
+    expiration = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<GoogleWatchChannel {self.id} ({self.user_id})>"
+
+
+class GoogleSyncToken(Base):
+    """Último nextSyncToken de Google Calendar por usuario (sincronización incremental)."""
+
+    __tablename__ = "google_sync_tokens"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    calendar_id = Column(String(255), nullable=False, default="primary")
+    sync_token = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
     def __repr__(self):
-        return f"<CalendarEvent {self.title} ({self.start_time})>" 
\ No newline at end of file
+        return f"<GoogleSyncToken {self.user_id} ({self.calendar_id})>"
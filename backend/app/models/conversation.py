@@ -0,0 +1,55 @@
+from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, Index, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+import uuid
+
+from app.db.base_class import Base
+
+# Remitentes permitidos por la tabla messages
+SENDER_USER = "user"
+SENDER_ASSISTANT = "assistant"
+
+
+class Conversation(Base):
+    """Conversación con el asistente de IA (tabla `conversations` de Supabase)."""
+
+    __tablename__ = "conversations"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Referencia a auth.users en Supabase
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    title = Column(String, nullable=False)
+    is_archived = Column(Boolean, default=False)
+
+    # Resumen de los mensajes que ya no entran en la ventana del prompt, y
+    # clave (created_at, id) del último mensaje incluido en él
+    summary = Column(Text, nullable=True)
+    summary_until_at = Column(DateTime(timezone=True), nullable=True)
+    summary_until_id = Column(UUID(as_uuid=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_conversations_user_updated", "user_id", "updated_at", "id"),
+    )
+
+
+class ConversationMessage(Base):
+    """Mensaje de una conversación (tabla `messages` de Supabase)."""
+
+    __tablename__ = "messages"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    conversation_id = Column(
+        UUID(as_uuid=True), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False
+    )
+    content = Column(Text, nullable=False)
+    sender = Column(String, nullable=False)  # user, assistant
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    tokens_used = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # Paginación por clave (created_at, id) dentro de una conversación
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
@@ -0,0 +1,49 @@
+from sqlalchemy import Column, String, DateTime, Integer, Text, Index, text
+from sqlalchemy.sql import func
+import uuid
+
+from app.db.base_class import Base
+
+class BackgroundJob(Base):
+    """Modelo para trabajos en segundo plano persistidos (cola durable)."""
+
+    __tablename__ = "background_jobs"
+
+    # Se usa String para el ID para que la tabla funcione tanto en Postgres como en SQLite
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    job_type = Column(String(100), nullable=False)
+    user_id = Column(String(36), nullable=True)
+    payload = Column(Text, nullable=False, default="{}")  # JSON serializado
+
+    # Clave de deduplicación: solo puede existir un trabajo pendiente por clave
+    dedupe_key = Column(String(255), nullable=True)
+
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    last_error = Column(Text, nullable=True)
+
+    # Planificación y bloqueo
+    run_at = Column(DateTime, nullable=False, default=func.now())
+    locked_at = Column(DateTime, nullable=True)
+    locked_by = Column(String(100), nullable=True)
+
+    # Metadatos
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_background_jobs_status_run_at", "status", "run_at"),
+        Index("ix_background_jobs_user_id", "user_id"),
+        Index(
+            "uq_background_jobs_pending_dedupe",
+            "dedupe_key",
+            unique=True,
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<BackgroundJob {self.job_type} ({self.status})>"
@@ -52,6 +52,36 @@ class ConversationInDB(ConversationBase):
 class Conversation(ConversationInDB):
     messages: List[Message] = []
 
+# Conversaciones persistidas (tablas conversations y messages)
+class ConversationOut(BaseModel):
+    id: UUID
+    title: str
+    is_archived: bool = False
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ConversationPage(BaseModel):
+    items: List[ConversationOut]
+    next_cursor: Optional[str] = None  # Cursor para la página siguiente (None si no hay más)
+
+class ConversationMessageOut(BaseModel):
+    id: UUID
+    conversation_id: UUID
+    content: str
+    sender: str  # user, assistant
+    created_at: Optional[datetime] = None
+    tokens_used: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class ConversationMessagePage(BaseModel):
+    items: List[ConversationMessageOut]  # En orden cronológico
+    next_cursor: Optional[str] = None  # Cursor para los mensajes anteriores
+
 class AIChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
@@ -161,9 +191,8 @@ class StreamingResponse(BaseModel):
     """
     Respuesta para streaming de chat
     """
-    content: str
-    is_error: bool = False
-    response_type: str = "content"  # content, goal_metadata, error
+    text: str
+    is_complete: bool = False  # Último trozo del stream (con texto si terminó por error)
 
 class GoalDetectionRequest(BaseModel):
     """
@@ -175,4 +204,17 @@ class GoalPlanRequest(BaseModel):
     """
     Solicitud para generar un plan de meta
     """
-    goal_metadata: Dict[str, Any] 
\ No newline at end of file
+    goal_metadata: Dict[str, Any] 
+# Contexto precalculado del usuario para los endpoints de planificación
+class UserContextSectionOut(BaseModel):
+    records: int  # Registros recientes que se envían al modelo
+    built_at: datetime
+    analysis: Dict[str, Any]
+
+class UserContextOut(BaseModel):
+    """
+    Contexto del usuario; su `context_id` puede enviarse en lugar de `user_data`
+    """
+    context_id: str
+    built_at: datetime
+    sections: Dict[str, UserContextSectionOut]
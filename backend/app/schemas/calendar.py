@@ -43,6 +43,8 @@ class CalendarEventResponse(CalendarEventBase):
     sync_status: str = "local"
     is_recurring: bool = False
     last_synced_at: Optional[datetime] = None
+    # Solo en ocurrencias expandidas de un evento recurrente: ID de la serie
+    recurring_event_id: Optional[UUID] = None
     created_at: datetime
     updated_at: datetime
     
@@ -61,7 +63,62 @@ class CalendarSyncResponse(BaseModel):
     success: bool
     message: str
     sync_log_id: Optional[str] = None
+    job_id: Optional[str] = None
     events_created: Optional[int] = None
     events_updated: Optional[int] = None 
     events_deleted: Optional[int] = None
-    errors: Optional[List[str]] = None 
\ No newline at end of file
+    errors: Optional[List[str]] = None 
+
+# Importación de archivos ICS
+class CalendarImportResponse(BaseModel):
+    events_parsed: int
+    events_imported: int
+    duplicates: int
+    skipped: int
+    error_count: int
+    errors: List[str] = []
+    elapsed_seconds: float
+    ms_per_thousand_events: Optional[float] = None
+
+# Esquemas para disponibilidad (free/busy)
+class TimeInterval(BaseModel):
+    start: datetime
+    end: datetime
+
+class FreeBusyResponse(BaseModel):
+    range_start: datetime = Field(..., alias="from")
+    range_end: datetime = Field(..., alias="to")
+    busy: List[TimeInterval]
+    free: List[TimeInterval]
+    
+    class Config:
+        populate_by_name = True
+
+
+# Esquemas para la planificación automática de tareas
+class TaskScheduleRequest(BaseModel):
+    start_date: Optional[datetime] = None  # Por defecto, ahora
+    end_date: Optional[datetime] = None  # Por defecto, 30 días después del inicio
+    task_ids: Optional[List[str]] = None  # Por defecto, todas las tareas abiertas
+    workday_start_hour: Optional[int] = Field(None, ge=0, le=23)
+    workday_end_hour: Optional[int] = Field(None, ge=1, le=24)
+    include_weekends: bool = False
+    utc_offset_minutes: int = 0
+    dry_run: bool = False
+
+class ScheduledTaskBlock(BaseModel):
+    task_id: str
+    title: str
+    start: datetime
+    end: datetime
+    late: bool = False
+
+class UnscheduledTask(BaseModel):
+    task_id: str
+    title: str
+    reason: str
+
+class TaskScheduleResponse(BaseModel):
+    scheduled: List[ScheduledTaskBlock]
+    unscheduled: List[UnscheduledTask]
+    elapsed_ms: float
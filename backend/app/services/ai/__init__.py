@@ -6,6 +6,7 @@ import aiohttp
 import json
 import os
 from app.core.ai_config import ai_settings
+from app.services.ai.rate_limiter import Priority, RateLimitExceeded, ai_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +14,9 @@ async def generate_ai_response(messages: List[Dict[str, Any]],
                               model: str = None,
                               temperature: float = 0.7,
                               max_tokens: int = 800,
-                              system_prompt: str = None) -> str:
+                              system_prompt: str = None,
+                              user_id: Optional[str] = None,
+                              priority: Priority = Priority.INTERACTIVE) -> str:
     """
     Genera una respuesta utilizando el modelo de OpenRouter
     
@@ -23,6 +26,8 @@ async def generate_ai_response(messages: List[Dict[str, Any]],
         temperature: Temperatura para la generación (creatividad)
         max_tokens: Número máximo de tokens a generar
         system_prompt: Prompt del sistema (opcional)
+        user_id: Usuario que origina la llamada (para su cupo en el limitador)
+        priority: Carril de prioridad en el limitador
         
     Returns:
         Texto de la respuesta generada
@@ -61,6 +66,9 @@ async def generate_ai_response(messages: List[Dict[str, Any]],
             "Content-Type": "application/json"
         }
         
+        # Esperar turno en el limitador compartido con OpenRouterService
+        await ai_rate_limiter.acquire(user_id, priority)
+        
         # Realizar la solicitud
         async with aiohttp.ClientSession() as session:
             async with session.post(
@@ -83,6 +91,9 @@ async def generate_ai_response(messages: List[Dict[str, Any]],
                     logger.error(f"Respuesta incompleta: {result}")
                     return "Error: No se pudo generar una respuesta"
                 
+    except RateLimitExceeded as e:
+        logger.warning(f"Petición de IA rechazada por el limitador: {str(e)}")
+        return f"Error: {str(e)}"
     except Exception as e:
         logger.error(f"Error al generar respuesta: {str(e)}")
         return f"Error al generar respuesta: {str(e)}" 
\ No newline at end of file
@@ -2,9 +2,9 @@ import json
 import logging
 import aiohttp
 import asyncio
-from typing import Dict, List, Any, Optional, AsyncGenerator
-from datetime import datetime
+from typing import Dict, List, Any, Optional, AsyncGenerator, Set, Tuple
 import os
+import time
 from pydantic import BaseModel
 
 from app.core.ai_config import (
@@ -12,11 +12,27 @@ from app.core.ai_config import (
     GOAL_DETECTION_PROMPT,
     GOAL_PLAN_PROMPT,
     CHAT_SYSTEM_PROMPT,
+    CONVERSATION_SUMMARY_PROMPT,
     PERSONALIZED_PLAN_PROMPT,
     PATTERN_ANALYSIS_PROMPT,
     LEARNING_ADAPTATION_PROMPT
 )
 from app.schemas.ai import ChatMessage, MessageRole, StreamingResponse
+from app.services.ai import analytics
+from app.services.ai.goal_gate import GateDecision, GoalGate, log_goal_detection
+from app.services.ai.model_router import (
+    ModelRequestError,
+    attempt_payload,
+    model_route,
+    record_attempt,
+    record_fallback,
+    record_first_token,
+    route_timeout,
+)
+from app.services.ai.rate_limiter import AIRateLimiter, Priority, RateLimitExceeded, ai_rate_limiter
+from app.services.ai.prompt_builder import PromptBuilder
+from app.services.ai.response_cache import AIResponseCache, build_response_cache
+from app.services.ai.sse import DONE as SSE_DONE, SSEParser, delta_content, parse_json as parse_sse_json
 from app.schemas.goal import GoalMetadata
 
 # Configuración del logger
@@ -26,32 +42,38 @@ class OpenRouterService:
     """
     Servicio para interactuar con la API de OpenRouter
     """
-    def __init__(self):
+    def __init__(self, response_cache: Optional[AIResponseCache] = None,
+                 rate_limiter: Optional[AIRateLimiter] = None,
+                 goal_gate: Optional[GoalGate] = None):
         """
         Inicializa el servicio con la configuración desde variables de entorno
+        
+        Args:
+            response_cache: Caché de respuestas (por defecto la configurada en AI_RESPONSE_CACHE_*)
+            rate_limiter: Limitador de peticiones (por defecto el compartido del proceso)
+            goal_gate: Filtro previo a la detección de metas (por defecto el de AI_GOAL_GATE_*)
         """
         self.api_key = get_ai_settings().OPENROUTER_API_KEY
         self.base_url = get_ai_settings().OPENROUTER_BASE_URL
         self.model = get_ai_settings().OPENROUTER_DEFAULT_MODEL
         self.referer = get_ai_settings().OPENROUTER_REFERER
+        self.response_cache = response_cache if response_cache is not None else build_response_cache()
+        self.rate_limiter = rate_limiter or ai_rate_limiter
+        self.goal_gate = goal_gate if goal_gate is not None or not get_ai_settings().AI_GOAL_GATE_ENABLED \
+            else GoalGate()
+        self._shadow_tasks: Set[asyncio.Task] = set()
         
         # Verificar configuración
         if not self.api_key:
             logger.warning("OpenRouter API key no configurada. El servicio de IA no funcionará correctamente.")
             
-    async def _send_request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    def _model_for(self, feature: str) -> str:
         """
-        Envía una solicitud a la API de OpenRouter
-        
-        Args:
-            payload: Datos para la solicitud
-            
-        Returns:
-            Respuesta de la API
+        Modelo preferido de la ruta de una funcionalidad (AI_MODEL_ROUTES)
         """
-        if not self.api_key:
-            raise ValueError("OpenRouter API key no configurada")
-            
+        return model_route(feature)[0]
+    
+    def _headers(self, stream: bool = False) -> Dict[str, str]:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "HTTP-Referer": self.referer,
@@ -59,34 +81,112 @@ class OpenRouterService:
             "X-Title": "SoulDream AI",
             "OpenRouter-Providers": "Groq,Fireworks"
         }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        return headers
+            
+    async def _send_request(self, payload: Dict[str, Any], feature: Optional[str] = None,
+                            user_id: Optional[str] = None,
+                            priority: Priority = Priority.INTERACTIVE) -> Dict[str, Any]:
+        """
+        Envía una solicitud a la API de OpenRouter (ver _send_request_with_source)
+        """
+        response, _ = await self._send_request_with_source(payload, feature, user_id, priority)
+        return response
+    
+    async def _send_request_with_source(self, payload: Dict[str, Any], feature: Optional[str] = None,
+                                        user_id: Optional[str] = None,
+                                        priority: Priority = Priority.INTERACTIVE) -> Tuple[Dict[str, Any], bool]:
+        """
+        Envía una solicitud a la API de OpenRouter. Si el modelo falla, se
+        reintenta con el siguiente de la ruta de la funcionalidad.
+        
+        Args:
+            payload: Datos para la solicitud (su `model` es el preferido)
+            feature: Funcionalidad que hace la llamada: decide la ruta de modelos
+                y, si tiene TTL de caché, las peticiones idénticas se responden desde la caché
+            user_id: Usuario que origina la llamada (para su cupo en el limitador)
+            priority: Carril de prioridad en el limitador
+            
+        Returns:
+            Tuple (respuesta de la API, si salió de la caché en lugar del LLM)
+            
+        Raises:
+            RateLimitExceeded: Si no se obtiene turno en el limitador
+            ModelRequestError: Si fallan todos los modelos de la ruta
+        """
+        if not self.api_key:
+            raise ValueError("OpenRouter API key no configurada")
+        
+        cache = self.response_cache if self.response_cache is not None \
+            and self.response_cache.is_cacheable(feature) else None
+        if cache is not None:
+            cached = await cache.get(feature, payload)
+            if cached is not None:
+                return cached, True
         
+        # Las respuestas cacheadas no consumen cupo; los modelos de respaldo
+        # forman parte de la misma petición
+        await self.rate_limiter.acquire(user_id, priority, feature)
+        
+        models = model_route(feature, payload.get("model"))
         async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=headers,
-                    timeout=get_ai_settings().REQUEST_TIMEOUT_SECONDS
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Error en OpenRouter API: Status {response.status}, {error_text}")
-                        raise Exception(f"Error en OpenRouter API: {response.status}")
-                    
-                    return await response.json()
-            except aiohttp.ClientError as e:
-                logger.error(f"Error de conexión con OpenRouter: {str(e)}")
-                raise
-            except Exception as e:
-                logger.error(f"Error inesperado con OpenRouter: {str(e)}")
-                raise
+            for index, model in enumerate(models):
+                started = time.perf_counter()
+                try:
+                    result = await self._post_completion(session, attempt_payload(payload, model), feature)
+                except ModelRequestError as e:
+                    record_attempt(feature, model, started, "error")
+                    if not e.retryable or index == len(models) - 1:
+                        raise
+                    record_fallback(feature, model, e)
+                    continue
+                
+                record_attempt(feature, model, started, "ok", result.get("usage"))
+                if cache is not None and result.get("choices"):
+                    await cache.set(feature, payload, result)
+                return result, False
+    
+    async def _post_completion(self, session: aiohttp.ClientSession, payload: Dict[str, Any],
+                               feature: Optional[str]) -> Dict[str, Any]:
+        """
+        Una petición sin streaming a un modelo
+
+        Raises:
+            ModelRequestError: Si el modelo responde con error o no responde a tiempo
+        """
+        try:
+            async with session.post(
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self._headers(),
+                timeout=route_timeout(feature)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Error en OpenRouter API ({payload['model']}): Status {response.status}, {error_text}")
+                    raise ModelRequestError(f"Error en OpenRouter API: {response.status}", response.status)
+                
+                result = await response.json()
+                # El proveedor puede fallar con status 200 y un objeto de error
+                if "error" in result and not result.get("choices"):
+                    logger.error(f"Error del proveedor en OpenRouter ({payload['model']}): {result['error']}")
+                    raise ModelRequestError(f"Error en OpenRouter API: {result['error']}")
+                return result
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error de conexión con OpenRouter ({payload['model']}): {str(e) or type(e).__name__}")
+            raise ModelRequestError(f"Error de conexión con OpenRouter: {str(e) or type(e).__name__}")
                 
-    async def _stream_request(self, payload: Dict[str, Any]) -> AsyncGenerator[StreamingResponse, None]:
+    async def _stream_request(self, payload: Dict[str, Any],
+                              feature: Optional[str] = "chat") -> AsyncGenerator[StreamingResponse, None]:
         """
-        Envía una solicitud en streaming a la API de OpenRouter
+        Envía una solicitud en streaming a la API de OpenRouter (el turno en el
+        limitador lo pide quien crea el generador, antes de empezar a iterar).
+        Mientras no haya llegado texto, un fallo pasa al siguiente modelo de la ruta.
         
         Args:
-            payload: Datos para la solicitud
+            payload: Datos para la solicitud (su `model` es el preferido)
+            feature: Funcionalidad que hace la llamada (ruta de modelos)
             
         Yields:
             Partes de la respuesta a medida que llegan
@@ -97,67 +197,125 @@ class OpenRouterService:
         # Asegurar que la solicitud sea en streaming
         payload["stream"] = True
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "HTTP-Referer": self.referer,
-            "Content-Type": "application/json",
-            "Accept": "text/event-stream",
-            "X-Title": "SoulDream AI",
-            "OpenRouter-Providers": "Groq,Fireworks"
-        }
-        
+        models = model_route(feature, payload.get("model"))
         async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=headers,
-                    timeout=get_ai_settings().REQUEST_TIMEOUT_SECONDS
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Error en OpenRouter API streaming: Status {response.status}, {error_text}")
+            for index, model in enumerate(models):
+                started = time.perf_counter()
+                try:
+                    async for chunk in self._stream_model(session, attempt_payload(payload, model), feature, started):
+                        yield chunk
+                    return
+                except ModelRequestError as e:
+                    record_attempt(feature, model, started, "error")
+                    if not e.retryable or index == len(models) - 1:
                         yield StreamingResponse(
-                            text=f"Error en la generación de respuesta: {response.status}",
+                            text=f"Error en la generación de respuesta: {e.status or e}",
                             is_complete=True
                         )
                         return
-                    
-                    buffer = ""
-                    async for line in response.content:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            line = line[6:]  # Eliminar el prefijo 'data: '
-                            
-                            # Comprobar si es el final del stream
-                            if line.strip() == "[DONE]":
-                                yield StreamingResponse(text="", is_complete=True)
-                                break
-                                
-                            try:
-                                data = json.loads(line)
-                                if "choices" in data and len(data["choices"]) > 0:
-                                    delta = data["choices"][0].get("delta", {})
-                                    if "content" in delta:
-                                        content = delta["content"]
-                                        buffer += content
-                                        yield StreamingResponse(text=content, is_complete=False)
-                            except json.JSONDecodeError:
-                                logger.warning(f"Error decodificando JSON de streaming: {line}")
-            
-            except aiohttp.ClientError as e:
-                logger.error(f"Error de conexión con OpenRouter streaming: {str(e)}")
-                yield StreamingResponse(
-                    text=f"Error de conexión: {str(e)}",
-                    is_complete=True
-                )
-            except Exception as e:
-                logger.error(f"Error inesperado con OpenRouter streaming: {str(e)}")
-                yield StreamingResponse(
-                    text=f"Error inesperado: {str(e)}",
-                    is_complete=True
-                )
+                    record_fallback(feature, model, e)
+                except Exception as e:
+                    logger.error(f"Error inesperado con OpenRouter streaming: {str(e)}")
+                    record_attempt(feature, model, started, "error")
+                    yield StreamingResponse(
+                        text=f"Error inesperado: {str(e)}",
+                        is_complete=True
+                    )
+                    return
+    
+    async def _stream_model(self, session: aiohttp.ClientSession, payload: Dict[str, Any],
+                            feature: Optional[str], started: float) -> AsyncGenerator[StreamingResponse, None]:
+        """
+        Stream de un modelo concreto
+
+        Raises:
+            ModelRequestError: Si falla antes de enviar texto (se puede probar otro modelo)
+        """
+        model = payload["model"]
+        has_content = False
+        usage = None
+        try:
+            async with session.post(
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self._headers(stream=True),
+                timeout=route_timeout(feature)
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Error en OpenRouter API streaming ({model}): Status {response.status}, {error_text}")
+                    raise ModelRequestError(f"Error en OpenRouter API: {response.status}", response.status)
+                
+                parser = SSEParser()
+                async for raw in response.content.iter_any():
+                    for data in parser.feed(raw):
+                        # Comprobar si es el final del stream
+                        if data == SSE_DONE:
+                            record_attempt(feature, model, started, "ok", usage)
+                            yield StreamingResponse(text="", is_complete=True)
+                            return
+                        
+                        chunk = parse_sse_json(data)
+                        if isinstance(chunk, dict) and "error" in chunk:
+                            logger.error(f"Error en OpenRouter durante el streaming ({model}): {chunk['error']}")
+                            if not has_content:
+                                raise ModelRequestError(f"Error en OpenRouter API: {chunk['error']}")
+                            record_attempt(feature, model, started, "error", usage)
+                            yield StreamingResponse(
+                                text="Error en la generación de respuesta",
+                                is_complete=True
+                            )
+                            return
+                        if isinstance(chunk, dict) and chunk.get("usage"):
+                            usage = chunk["usage"]
+                        content = delta_content(chunk)
+                        if content:
+                            if not has_content:
+                                record_first_token(feature, model, started)
+                                has_content = True
+                            yield StreamingResponse(text=content, is_complete=False)
                 
+                # El stream se cerró sin [DONE]: se procesa el último evento pendiente
+                for data in parser.flush():
+                    content = delta_content(parse_sse_json(data)) if data != SSE_DONE else None
+                    if content:
+                        has_content = True
+                        yield StreamingResponse(text=content, is_complete=False)
+                if not has_content:
+                    raise ModelRequestError("Stream de OpenRouter vacío")
+                record_attempt(feature, model, started, "ok", usage)
+                yield StreamingResponse(text="", is_complete=True)
+        
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error de conexión con OpenRouter streaming ({model}): {str(e) or type(e).__name__}")
+            if not has_content:
+                raise ModelRequestError(f"Error de conexión: {str(e) or type(e).__name__}")
+            record_attempt(feature, model, started, "error", usage)
+            yield StreamingResponse(
+                text=f"Error de conexión: {str(e) or type(e).__name__}",
+                is_complete=True
+            )
+
+    @staticmethod
+    def _goal_metadata_from_data(data: Any) -> Optional[Dict[str, Any]]:
+        """
+        Interpreta un objeto JSON de la respuesta como metadatos de meta
+        
+        Args:
+            data: Objeto JSON ya decodificado
+            
+        Returns:
+            Metadatos de la meta si el objeto la describe
+        """
+        # Verificar si contiene información de una meta
+        if not isinstance(data, dict):
+            return None
+        if "has_goal" in data:
+            return data
+        elif "goal" in data:
+            return {"has_goal": True, "goal": data["goal"]}
+        return None
+        
     def _extract_goal_metadata(self, text: str) -> Optional[Dict[str, Any]]:
         """
         Extrae metadatos de metas a partir del texto de la respuesta
@@ -176,12 +334,7 @@ class OpenRouterService:
             if start_idx >= 0 and end_idx > start_idx:
                 json_text = text[start_idx:end_idx+1]
                 data = json.loads(json_text)
-                
-                # Verificar si contiene información de una meta
-                if "has_goal" in data:
-                    return data
-                elif "goal" in data:
-                    return {"has_goal": True, "goal": data["goal"]}
+                return self._goal_metadata_from_data(data)
                 
             return None
         except (json.JSONDecodeError, ValueError) as e:
@@ -196,7 +349,10 @@ class OpenRouterService:
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
-        stream: bool = False
+        stream: bool = False,
+        user_id: Optional[str] = None,
+        model: Optional[str] = None,
+        raise_errors: bool = False
     ) -> Any:
         """
         Genera una respuesta del chatbot usando OpenRouter
@@ -206,46 +362,140 @@ class OpenRouterService:
             temperature: Temperatura para la generación (creatividad)
             max_tokens: Número máximo de tokens a generar
             stream: Si la respuesta debe ser en streaming
+            user_id: Usuario que origina la llamada
+            model: Modelo a utilizar (por defecto el de la ruta "chat"; el resto de la ruta queda de respaldo)
+            raise_errors: Propagar los fallos en lugar de devolverlos como texto de la respuesta
             
         Returns:
             Texto de la respuesta o generador de streaming
+            
+        Raises:
+            RateLimitExceeded: Si se supera el límite de peticiones
+            Exception: Si la petición falla y raise_errors es True
         """
-        # Usar valores por defecto si no se especifican
-        temperature = temperature if temperature is not None else get_ai_settings().TEMPERATURE_CHAT
-        max_tokens = max_tokens if max_tokens is not None else get_ai_settings().MAX_TOKENS_RESPONSE
-        
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": stream
-        }
+        payload = self._chat_payload(messages, temperature, max_tokens, stream, model)
         
         try:
             if stream:
-                return self._stream_request(payload)
+                await self.rate_limiter.acquire(user_id, Priority.INTERACTIVE)
+                return self._stream_request(payload, feature="chat")
             else:
-                response = await self._send_request(payload)
-                if "choices" in response and len(response["choices"]) > 0:
-                    return response["choices"][0]["message"]["content"]
-                else:
-                    logger.error(f"Respuesta inválida: {response}")
-                    return "Error: No se pudo generar una respuesta válida"
+                return await self._complete_chat(payload, user_id)
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error generando respuesta: {str(e)}")
+            if raise_errors:
+                raise
             return f"Error al generar respuesta: {str(e)}"
+    
+    def _chat_payload(self, messages: List[Dict[str, str]], temperature: Optional[float],
+                      max_tokens: Optional[int], stream: bool, model: Optional[str]) -> Dict[str, Any]:
+        # Usar valores por defecto si no se especifican
+        return {
+            "model": model or self._model_for("chat"),
+            "messages": messages,
+            "temperature": temperature if temperature is not None else get_ai_settings().TEMPERATURE_CHAT,
+            "max_tokens": max_tokens if max_tokens is not None else get_ai_settings().MAX_TOKENS_RESPONSE,
+            "stream": stream
+        }
+    
+    async def _complete_chat(self, payload: Dict[str, Any], user_id: Optional[str]) -> str:
+        """
+        Ejecuta una petición de chat sin streaming
+        
+        Raises:
+            ValueError: Si la API no devuelve ninguna respuesta
+        """
+        response = await self._send_request(payload, feature="chat", user_id=user_id)
+        if "choices" in response and len(response["choices"]) > 0:
+            return response["choices"][0]["message"]["content"]
+        logger.error(f"Respuesta inválida: {response}")
+        raise ValueError("No se pudo generar una respuesta válida")
+    
+    async def generate_chat_with_goal_detection(
+        self,
+        messages: List[Dict[str, str]],
+        message: str,
+        user_id: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Genera la respuesta del chat y detecta metas en el mensaje a la vez: las
+        dos peticiones salen en paralelo, así que la latencia es la de la más
+        lenta y no la suma de ambas. Si el chat falla, se cancela la detección.
+        
+        Args:
+            messages: Conversación a enviar al chat
+            message: Mensaje del usuario en el que buscar metas
+            user_id: Usuario que origina la llamada
+            model: Modelo del chat (por defecto el configurado)
+            
+        Returns:
+            Tuple (texto de la respuesta, metadata de la meta o None)
             
-    async def detect_goal_from_message(self, message: str) -> Optional[Dict[str, Any]]:
+        Raises:
+            RateLimitExceeded: Si se supera el límite de peticiones
+            Exception: Si falla la petición de chat
+        """
+        async def detect_goal() -> Optional[Dict[str, Any]]:
+            # La detección es accesoria: sin turno en el limitador, el chat sigue sin ella
+            try:
+                return await self.detect_goal_from_message(message, user_id=user_id)
+            except RateLimitExceeded:
+                logger.warning("Detección de metas omitida por el limitador de peticiones")
+                return None
+        
+        payload = self._chat_payload(messages, None, None, False, model)
+        chat_task = asyncio.create_task(self._complete_chat(payload, user_id))
+        goal_task = asyncio.create_task(detect_goal())
+        try:
+            return tuple(await asyncio.gather(chat_task, goal_task))
+        except BaseException:
+            # gather no cancela la otra tarea cuando una falla
+            chat_task.cancel()
+            goal_task.cancel()
+            raise
+            
+    async def detect_goal_from_message(self, message: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
-        Detecta si un mensaje contiene una meta
+        Detecta si un mensaje contiene una meta. El filtro local (GoalGate)
+        responde sin llamar al LLM cuando el mensaje claramente no la contiene.
         
         Args:
             message: Mensaje del usuario
+            user_id: Usuario que origina la llamada
             
         Returns:
             Metadata de la meta si se detecta una
         """
+        decision = self.goal_gate.decide(message) if self.goal_gate is not None else None
+        if decision is not None and not decision.query:
+            if decision.shadow:
+                # Muestra de descartados que se consulta igualmente, sin esperar, para estimar el recall
+                task = asyncio.create_task(self._shadow_goal_detection(message, user_id, decision))
+                self._shadow_tasks.add(task)
+                task.add_done_callback(self._shadow_tasks.discard)
+            return {"has_goal": False}
+        
+        data = await self._query_goal_detection(message, user_id)
+        if decision is not None and data is not None:
+            self.goal_gate.record_outcome(decision, bool(data.get("has_goal")))
+        return data
+    
+    async def _shadow_goal_detection(self, message: str, user_id: Optional[str], decision: GateDecision) -> None:
+        try:
+            data = await self._query_goal_detection(message, user_id, Priority.BACKGROUND)
+        except RateLimitExceeded:
+            return
+        if data is not None:
+            self.goal_gate.record_outcome(decision, bool(data.get("has_goal")))
+    
+    async def _query_goal_detection(self, message: str, user_id: Optional[str] = None,
+                                    priority: Priority = Priority.INTERACTIVE) -> Optional[Dict[str, Any]]:
+        """
+        Detección de metas con el LLM
+        """
         try:
             # Preparar el prompt para detección de metas
             messages = [
@@ -255,7 +505,7 @@ class OpenRouterService:
             
             # Configuración específica para detección de metas
             payload = {
-                "model": self.model,
+                "model": self._model_for("goal_detection"),
                 "messages": messages,
                 "temperature": get_ai_settings().TEMPERATURE_GOAL_DETECTION,
                 "max_tokens": get_ai_settings().MAX_TOKENS_GOAL_DETECTION,
@@ -263,7 +513,10 @@ class OpenRouterService:
             }
             
             # Enviar solicitud
-            response = await self._send_request(payload)
+            response, from_cache = await self._send_request_with_source(
+                payload, feature="goal_detection", user_id=user_id, priority=priority
+            )
+            usage = response.get("usage") or {}
             
             if "choices" in response and len(response["choices"]) > 0:
                 response_text = response["choices"][0]["message"]["content"]
@@ -281,10 +534,13 @@ class OpenRouterService:
                         if "has_goal" in data:
                             if data["has_goal"] and "goal" in data:
                                 logger.info(f"Meta detectada: {data['goal']['title']}")
-                                return data
                             else:
                                 logger.info("No se detectó ninguna meta")
-                                return {"has_goal": False}
+                                data = {"has_goal": False}
+                            # Solo las respuestas reales del LLM: un acierto de caché duplicaría el ejemplo
+                            if not from_cache:
+                                log_goal_detection(user_id, message, data, response.get("model"), usage.get("total_tokens"))
+                            return data
                     
                     logger.warning("No se pudo encontrar un JSON válido en la respuesta")
                     return None
@@ -294,16 +550,19 @@ class OpenRouterService:
             else:
                 logger.error(f"Respuesta inválida de la API: {response}")
                 return None
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error detectando meta: {str(e)}")
             return None
             
-    async def generate_goal_plan(self, goal_metadata: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_goal_plan(self, goal_metadata: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Genera un plan detallado para una meta
         
         Args:
             goal_metadata: Metadatos de la meta
+            user_id: Usuario que origina la llamada
             
         Returns:
             Plan detallado con pasos a seguir
@@ -326,14 +585,15 @@ class OpenRouterService:
             Prioridad: {goal.get('priority', 'media')}
             """
             
-            messages = [
-                {"role": "system", "content": GOAL_PLAN_PROMPT},
-                {"role": "user", "content": f"Genera un plan detallado para esta meta: {goal_description}"}
-            ]
+            messages = (
+                PromptBuilder("goal_plan", system_prompt=GOAL_PLAN_PROMPT)
+                .add_text("", goal_description, priority=0, required=True)
+                .messages("Genera un plan detallado para esta meta:")
+            )
             
             # Configuración específica para planificación
             payload = {
-                "model": self.model,
+                "model": self._model_for("goal_plan"),
                 "messages": messages,
                 "temperature": get_ai_settings().TEMPERATURE_GOAL_PLAN,
                 "max_tokens": get_ai_settings().MAX_TOKENS_GOAL_PLAN,
@@ -341,7 +601,7 @@ class OpenRouterService:
             }
             
             # Enviar solicitud
-            response = await self._send_request(payload)
+            response = await self._send_request(payload, feature="goal_plan", user_id=user_id)
             
             if "choices" in response and len(response["choices"]) > 0:
                 response_text = response["choices"][0]["message"]["content"]
@@ -368,10 +628,53 @@ class OpenRouterService:
             else:
                 logger.error(f"Respuesta inválida de la API: {response}")
                 return {"error": "No se pudo generar el plan"}
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error generando plan: {str(e)}")
             return {"error": f"Error generando plan: {str(e)}"}
     
+    async def summarize_conversation(
+        self,
+        summary: Optional[str],
+        messages: List[Dict[str, str]],
+        user_id: Optional[str] = None
+    ) -> str:
+        """
+        Actualiza el resumen de una conversación con mensajes que ya no caben
+        en el historial del prompt (carril de segundo plano del limitador)
+        
+        Args:
+            summary: Resumen actual (None si aún no hay)
+            messages: Mensajes nuevos a incorporar, en orden cronológico
+            user_id: Usuario propietario de la conversación
+            
+        Returns:
+            Resumen actualizado
+            
+        Raises:
+            RateLimitExceeded: Si no se obtiene turno en el limitador
+            ValueError: Si la API no devuelve ningún resumen
+        """
+        transcript = "\n".join(
+            f"{'Usuario' if message['role'] == 'user' else 'Asistente'}: {message['content']}"
+            for message in messages
+        )
+        payload = {
+            "model": self._model_for("conversation_summary"),
+            "messages": [
+                {"role": "system", "content": CONVERSATION_SUMMARY_PROMPT},
+                {"role": "user", "content": f"Resumen actual:\n{summary or '(vacío)'}\n\nMensajes nuevos:\n{transcript}"}
+            ],
+            "temperature": get_ai_settings().TEMPERATURE_CONVERSATION_SUMMARY,
+            "max_tokens": get_ai_settings().MAX_TOKENS_CONVERSATION_SUMMARY,
+            "stream": False
+        }
+        response = await self._send_request(payload, feature="conversation_summary", user_id=user_id, priority=Priority.BACKGROUND)
+        if response.get("choices"):
+            return response["choices"][0]["message"]["content"].strip()
+        raise ValueError("No se pudo generar el resumen de la conversación")
+        
     def _format_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """
         Formatea los mensajes para la API de OpenRouter
@@ -395,7 +698,9 @@ class OpenRouterService:
     async def generate_personalized_plan(self, 
                                         user_data: Dict[str, Any], 
                                         goal_type: str, 
-                                        preferences: Dict[str, Any] = None) -> Dict[str, Any]:
+                                        preferences: Dict[str, Any] = None,
+                                        user_id: Optional[str] = None,
+                                        analyses: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Genera un plan personalizado basado en datos históricos del usuario y sus preferencias
         
@@ -403,22 +708,31 @@ class OpenRouterService:
             user_data: Datos históricos del usuario (tareas, hábitos, metas)
             goal_type: Tipo de meta para la que se generará el plan
             preferences: Preferencias específicas del usuario
+            user_id: Usuario que origina la llamada
+            analyses: Análisis ya calculados (contexto precalculado del usuario);
+                si se indican, no se recalculan a partir de user_data
             
         Returns:
             Plan personalizado adaptado al usuario
         """
         try:
-            # Preparar análisis de los datos históricos
-            task_history = user_data.get("tasks", [])
-            habit_history = user_data.get("habits", [])
-            goal_history = user_data.get("goals", [])
-            
-            # Analizar patrones de comportamiento
-            completion_patterns = self._analyze_completion_patterns(task_history)
-            habit_consistency = self._analyze_habit_consistency(habit_history)
-            success_factors = self._analyze_goal_success_factors(goal_history)
+            if analyses is not None:
+                completion_patterns = analyses["completion_patterns"]
+                habit_consistency = analyses["habit_consistency"]
+                success_factors = analyses["success_factors"]
+            else:
+                # Preparar análisis de los datos históricos
+                task_history = user_data.get("tasks", [])
+                habit_history = user_data.get("habits", [])
+                goal_history = user_data.get("goals", [])
+                
+                # Analizar patrones de comportamiento
+                completion_patterns = self._analyze_completion_patterns(task_history)
+                habit_consistency = self._analyze_habit_consistency(habit_history)
+                success_factors = self._analyze_goal_success_factors(goal_history)
             
             # Considerar preferencias del usuario
+            preferences = preferences or {}
             user_preferences = {
                 "preferred_time_blocks": preferences.get("preferred_time_blocks", []),
                 "difficulty_preference": preferences.get("difficulty_preference", "balanced"),
@@ -426,35 +740,20 @@ class OpenRouterService:
                 "learning_style": preferences.get("learning_style", "balanced")
             }
             
-            # Construir contexto para la IA
-            context = f"""
-            # Análisis de usuario para generación de plan personalizado
-            
-            ## Tipo de meta
-            {goal_type}
-            
-            ## Patrones de cumplimiento de tareas
-            {json.dumps(completion_patterns, indent=2)}
-            
-            ## Consistencia de hábitos
-            {json.dumps(habit_consistency, indent=2)}
-            
-            ## Factores de éxito en metas previas
-            {json.dumps(success_factors, indent=2)}
-            
-            ## Preferencias del usuario
-            {json.dumps(user_preferences, indent=2)}
-            """
-            
-            # Preparar mensaje para la IA
-            messages = [
-                {"role": "system", "content": PERSONALIZED_PLAN_PROMPT},
-                {"role": "user", "content": context}
-            ]
+            # Construir contexto para la IA dentro del presupuesto de tokens
+            messages = (
+                PromptBuilder("personalized_plan", system_prompt=PERSONALIZED_PLAN_PROMPT)
+                .add_text("Tipo de meta", goal_type, priority=0, required=True)
+                .add_json("Preferencias del usuario", user_preferences, priority=1, required=True)
+                .add_json("Factores de éxito en metas previas", success_factors, priority=2)
+                .add_json("Patrones de cumplimiento de tareas", completion_patterns, priority=3)
+                .add_json("Consistencia de hábitos", habit_consistency, priority=3)
+                .messages("# Análisis de usuario para generación de plan personalizado")
+            )
             
             # Configuración específica para planificación personalizada
             payload = {
-                "model": self.model,
+                "model": self._model_for("personalized_plan"),
                 "messages": messages,
                 "temperature": get_ai_settings().TEMPERATURE_PERSONALIZED_PLAN,
                 "max_tokens": get_ai_settings().MAX_TOKENS_PERSONALIZED_PLAN,
@@ -462,7 +761,7 @@ class OpenRouterService:
             }
             
             # Enviar solicitud
-            response = await self._send_request(payload)
+            response = await self._send_request(payload, feature="personalized_plan", user_id=user_id)
             
             if "choices" in response and len(response["choices"]) > 0:
                 response_text = response["choices"][0]["message"]["content"]
@@ -488,6 +787,8 @@ class OpenRouterService:
             else:
                 logger.error(f"Respuesta inválida de la API: {response}")
                 return {"error": "No se pudo generar el plan personalizado"}
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error generando plan personalizado: {str(e)}")
             return {"error": f"Error generando plan personalizado: {str(e)}"}
@@ -502,55 +803,7 @@ class OpenRouterService:
         Returns:
             Análisis de patrones de completitud
         """
-        if not task_history:
-            return {"no_data": True}
-            
-        total_tasks = len(task_history)
-        completed_tasks = sum(1 for task in task_history if task.get("completed", False))
-        completion_rate = (completed_tasks / total_tasks) if total_tasks > 0 else 0
-        
-        # Análisis por días de la semana
-        days_analysis = {
-            "monday": {"total": 0, "completed": 0},
-            "tuesday": {"total": 0, "completed": 0},
-            "wednesday": {"total": 0, "completed": 0},
-            "thursday": {"total": 0, "completed": 0},
-            "friday": {"total": 0, "completed": 0},
-            "saturday": {"total": 0, "completed": 0},
-            "sunday": {"total": 0, "completed": 0}
-        }
-        
-        for task in task_history:
-            if "due_date" in task:
-                try:
-                    due_date = datetime.fromisoformat(task["due_date"].replace("Z", "+00:00"))
-                    day_name = due_date.strftime("%A").lower()
-                    if day_name in days_analysis:
-                        days_analysis[day_name]["total"] += 1
-                        if task.get("completed", False):
-                            days_analysis[day_name]["completed"] += 1
-                except (ValueError, TypeError):
-                    pass
-        
-        # Calcular tasa de completitud por día
-        for day, counts in days_analysis.items():
-            if counts["total"] > 0:
-                counts["completion_rate"] = counts["completed"] / counts["total"]
-            else:
-                counts["completion_rate"] = 0
-        
-        # Encontrar mejor día y peor día
-        best_day = max(days_analysis.items(), key=lambda x: x[1].get("completion_rate", 0))
-        worst_day = min(days_analysis.items(), key=lambda x: x[1].get("completion_rate", 0) if x[1].get("total", 0) > 0 else 1)
-        
-        return {
-            "overall_completion_rate": completion_rate,
-            "total_tasks": total_tasks,
-            "completed_tasks": completed_tasks,
-            "days_analysis": days_analysis,
-            "best_day": best_day[0],
-            "worst_day": worst_day[0]
-        }
+        return analytics.completion_patterns(task_history)
         
     def _analyze_habit_consistency(self, habit_history: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -562,55 +815,7 @@ class OpenRouterService:
         Returns:
             Análisis de consistencia
         """
-        if not habit_history:
-            return {"no_data": True}
-            
-        habits_analysis = {}
-        
-        # Agrupar registros por hábito
-        for habit_log in habit_history:
-            habit_id = habit_log.get("habit_id", "unknown")
-            if habit_id not in habits_analysis:
-                habits_analysis[habit_id] = {
-                    "name": habit_log.get("habit_name", "Hábito desconocido"),
-                    "total_logs": 0,
-                    "completed_logs": 0,
-                    "streak": habit_log.get("current_streak", 0),
-                    "best_streak": habit_log.get("best_streak", 0)
-                }
-            
-            habits_analysis[habit_id]["total_logs"] += 1
-            if habit_log.get("completed", False):
-                habits_analysis[habit_id]["completed_logs"] += 1
-        
-        # Calcular consistencia por hábito
-        for habit_id, analysis in habits_analysis.items():
-            if analysis["total_logs"] > 0:
-                analysis["consistency_rate"] = analysis["completed_logs"] / analysis["total_logs"]
-            else:
-                analysis["consistency_rate"] = 0
-        
-        # Identificar hábitos más y menos consistentes
-        if habits_analysis:
-            most_consistent = max(habits_analysis.items(), key=lambda x: x[1].get("consistency_rate", 0))
-            least_consistent = min(habits_analysis.items(), key=lambda x: x[1].get("consistency_rate", 0))
-            
-            return {
-                "habits_count": len(habits_analysis),
-                "habits_details": habits_analysis,
-                "most_consistent_habit": {
-                    "id": most_consistent[0],
-                    "name": most_consistent[1]["name"],
-                    "consistency_rate": most_consistent[1]["consistency_rate"]
-                },
-                "least_consistent_habit": {
-                    "id": least_consistent[0],
-                    "name": least_consistent[1]["name"],
-                    "consistency_rate": least_consistent[1]["consistency_rate"]
-                }
-            }
-        else:
-            return {"no_data": True}
+        return analytics.habit_consistency(habit_history)
     
     def _analyze_goal_success_factors(self, goal_history: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -622,73 +827,29 @@ class OpenRouterService:
         Returns:
             Análisis de factores de éxito
         """
-        if not goal_history:
-            return {"no_data": True}
-            
-        total_goals = len(goal_history)
-        completed_goals = sum(1 for goal in goal_history if goal.get("status", "") == "completed")
-        success_rate = (completed_goals / total_goals) if total_goals > 0 else 0
-        
-        # Análisis por tipo de meta
-        types_analysis = {}
-        for goal in goal_history:
-            goal_type = goal.get("type", "unknown")
-            
-            if goal_type not in types_analysis:
-                types_analysis[goal_type] = {"total": 0, "completed": 0}
-            
-            types_analysis[goal_type]["total"] += 1
-            if goal.get("status", "") == "completed":
-                types_analysis[goal_type]["completed"] += 1
-        
-        # Calcular tasa de éxito por tipo
-        for goal_type, counts in types_analysis.items():
-            if counts["total"] > 0:
-                counts["success_rate"] = counts["completed"] / counts["total"]
-            else:
-                counts["success_rate"] = 0
-        
-        # Identificar tipos más y menos exitosos
-        if types_analysis:
-            most_successful = max(types_analysis.items(), key=lambda x: x[1].get("success_rate", 0))
-            least_successful = min(types_analysis.items(), key=lambda x: x[1].get("success_rate", 0) 
-                                 if x[1].get("total", 0) > 0 else 1)
-        else:
-            most_successful = ("unknown", {"success_rate": 0})
-            least_successful = ("unknown", {"success_rate": 0})
-        
-        return {
-            "overall_success_rate": success_rate,
-            "total_goals": total_goals,
-            "completed_goals": completed_goals,
-            "types_analysis": types_analysis,
-            "most_successful_type": most_successful[0],
-            "least_successful_type": least_successful[0]
-        }
+        return analytics.goal_success_factors(goal_history)
 
-    async def _analyze_patterns(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_patterns(self, user_data: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Analiza patrones avanzados en los datos históricos del usuario
         
         Args:
             user_data: Datos históricos del usuario
+            user_id: Usuario que origina la llamada
             
         Returns:
             Análisis de patrones
         """
         try:
-            # Preparar los datos para el análisis
-            data_context = json.dumps(user_data, indent=2)
-            
-            # Preparar mensaje para la IA
-            messages = [
-                {"role": "system", "content": PATTERN_ANALYSIS_PROMPT},
-                {"role": "user", "content": f"Analiza los siguientes datos de usuario para identificar patrones:\n\n{data_context}"}
-            ]
+            # Una sección por tipo de dato (tareas, hábitos, metas...), recortables por igual
+            builder = PromptBuilder("pattern_analysis", system_prompt=PATTERN_ANALYSIS_PROMPT)
+            for key, value in user_data.items():
+                builder.add_json(key, value, priority=1)
+            messages = builder.messages("Analiza los siguientes datos de usuario para identificar patrones:")
             
             # Configuración específica para análisis de patrones
             payload = {
-                "model": self.model,
+                "model": self._model_for("pattern_analysis"),
                 "messages": messages,
                 "temperature": get_ai_settings().TEMPERATURE_PATTERN_ANALYSIS,
                 "max_tokens": get_ai_settings().MAX_TOKENS_PATTERN_ANALYSIS,
@@ -696,7 +857,7 @@ class OpenRouterService:
             }
             
             # Enviar solicitud
-            response = await self._send_request(payload)
+            response = await self._send_request(payload, feature="pattern_analysis", user_id=user_id)
             
             if "choices" in response and len(response["choices"]) > 0:
                 response_text = response["choices"][0]["message"]["content"]
@@ -722,53 +883,51 @@ class OpenRouterService:
             else:
                 logger.error(f"Respuesta inválida de la API: {response}")
                 return {"error": "No se pudo generar el análisis de patrones"}
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error en análisis de patrones: {str(e)}")
             return {"error": f"Error en análisis de patrones: {str(e)}"}
     
-    async def analyze_patterns(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def analyze_patterns(self, user_data: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Interfaz pública para analizar patrones avanzados
         
         Args:
             user_data: Datos históricos del usuario
+            user_id: Usuario que origina la llamada
             
         Returns:
             Análisis de patrones
         """
-        return await self._analyze_patterns(user_data)
+        return await self._analyze_patterns(user_data, user_id=user_id)
     
     async def generate_learning_adaptation(self, 
                                          user_data: Dict[str, Any], 
-                                         interaction_history: List[Dict[str, Any]]) -> Dict[str, Any]:
+                                         interaction_history: List[Dict[str, Any]],
+                                         user_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Genera adaptaciones basadas en aprendizaje continuo sobre las interacciones del usuario
         
         Args:
             user_data: Datos históricos del usuario
             interaction_history: Historial de interacciones y respuestas a recomendaciones previas
+            user_id: Usuario que origina la llamada
             
         Returns:
             Modelo adaptativo personalizado
         """
         try:
-            # Preparar los datos para el análisis
-            context_data = {
-                "user_data": user_data,
-                "interaction_history": interaction_history
-            }
-            
-            data_context = json.dumps(context_data, indent=2)
-            
-            # Preparar mensaje para la IA
-            messages = [
-                {"role": "system", "content": LEARNING_ADAPTATION_PROMPT},
-                {"role": "user", "content": f"Analiza estos datos de interacciones de usuario para generar adaptaciones:\n\n{data_context}"}
-            ]
+            # El historial de interacciones es la base de la adaptación: se recorta el último
+            builder = PromptBuilder("learning_adaptation", system_prompt=LEARNING_ADAPTATION_PROMPT)
+            builder.add_json("interaction_history", interaction_history, priority=1, required=True)
+            for key, value in user_data.items():
+                builder.add_json(f"user_data.{key}", value, priority=2)
+            messages = builder.messages("Analiza estos datos de interacciones de usuario para generar adaptaciones:")
             
             # Configuración específica para adaptación de aprendizaje
             payload = {
-                "model": self.model,
+                "model": self._model_for("learning_adaptation"),
                 "messages": messages,
                 "temperature": get_ai_settings().TEMPERATURE_LEARNING_ADAPTATION,
                 "max_tokens": get_ai_settings().MAX_TOKENS_LEARNING_ADAPTATION,
@@ -776,7 +935,7 @@ class OpenRouterService:
             }
             
             # Enviar solicitud
-            response = await self._send_request(payload)
+            response = await self._send_request(payload, feature="learning_adaptation", user_id=user_id)
             
             if "choices" in response and len(response["choices"]) > 0:
                 response_text = response["choices"][0]["message"]["content"]
@@ -802,6 +961,8 @@ class OpenRouterService:
             else:
                 logger.error(f"Respuesta inválida de la API: {response}")
                 return {"error": "No se pudo generar la adaptación de aprendizaje"}
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Error generando adaptación de aprendizaje: {str(e)}")
             return {"error": f"Error generando adaptación de aprendizaje: {str(e)}"}
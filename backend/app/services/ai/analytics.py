@@ -0,0 +1,316 @@
+from datetime import date
+from typing import Any, Dict, Hashable, List, Mapping, Sequence, Tuple
+
+try:
+    # Conteos vectorizados si NumPy está instalado; si no, se cuenta en Python
+    import numpy as np
+except ImportError:
+    np = None
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+_ISO_DATE_LENGTH = 10  # "YYYY-MM-DD": el día de la semana sale de la parte de fecha
+
+
+# --- Fechas -----------------------------------------------------------------
+
+def _weekday_py(value: Any) -> int:
+    if not isinstance(value, str):
+        return -1
+    try:
+        return date.fromisoformat(value[:_ISO_DATE_LENGTH]).weekday()
+    except ValueError:
+        return -1
+
+
+def _weekdays(values: List[Any]):
+    """
+    Día de la semana (0 = lunes) de cada fecha ISO, o -1 si falta o no es
+    válida. Con NumPy las fechas se convierten de una vez a datetime64[D].
+    """
+    if np is None:
+        return [_weekday_py(value) for value in values]
+    strings = [value if isinstance(value, str) else "" for value in values]
+    # S10 se queda con la parte de fecha (la zona horaria no cambia el día local)
+    try:
+        dates = np.array(strings, dtype=f"S{_ISO_DATE_LENGTH}")
+    except UnicodeEncodeError:
+        # Una fecha ISO solo tiene caracteres ASCII
+        dates = np.array([value if value.isascii() else "" for value in strings], dtype=f"S{_ISO_DATE_LENGTH}")
+
+    # YYYY-MM-DD se lee por dígitos en lugar de con astype("datetime64"): así
+    # las fechas inválidas quedan marcadas sin que falle la conversión entera
+    chars = dates.view(np.uint8).reshape(-1, _ISO_DATE_LENGTH).astype(np.int32) - ord("0")
+    digits = chars[:, [0, 1, 2, 3, 5, 6, 8, 9]]
+    dash = ord("-") - ord("0")
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1) & (chars[:, 4] == dash) & (chars[:, 7] == dash)
+    year = chars[:, 0] * 1000 + chars[:, 1] * 100 + chars[:, 2] * 10 + chars[:, 3]
+    month = chars[:, 5] * 10 + chars[:, 6]
+    day = chars[:, 8] * 10 + chars[:, 9]
+    valid &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1)
+
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype(np.int64).astype("datetime64[M]")
+    month_start = months.astype("datetime64[D]")
+    month_length = ((months + 1).astype("datetime64[D]") - month_start).astype(np.int64)
+    valid &= day <= month_length
+    days = month_start.astype(np.int64) + day - 1
+    # El 1970-01-01 fue jueves (3)
+    return np.where(valid, (days + 3) % 7, -1)
+
+
+# --- Conteos por grupo --------------------------------------------------------
+
+def _codes(codes):
+    return codes if np is None else np.asarray(codes, dtype=np.int64)
+
+
+def _count(codes, size: int, flags=None) -> List[int]:
+    # Número de filas (o de filas con flag) por código
+    if np is None:
+        counts = [0] * size
+        for index, code in enumerate(codes):
+            if flags is None or flags[index]:
+                counts[code] += 1
+        return counts
+    if flags is not None:
+        codes = codes[np.asarray(flags, dtype=bool)]
+    return np.bincount(codes, minlength=size).tolist()
+
+
+def _factorize(keys: List[Hashable]) -> Tuple[Any, int]:
+    """
+    Código de cada clave, asignados en orden de primera aparición
+
+    Returns:
+        Tuple (código por fila, número de claves distintas)
+    """
+    index: Dict[Hashable, int] = {}
+    codes = [index.setdefault(key, len(index)) for key in keys]
+    return _codes(codes), len(index)
+
+
+def _first_rows(codes, size: int) -> List[int]:
+    # Fila de la primera aparición de cada código
+    if np is None:
+        firsts = [-1] * size
+        for row, code in enumerate(codes):
+            if firsts[code] < 0:
+                firsts[code] = row
+        return firsts
+    firsts = np.empty(size, dtype=np.int64)
+    # En asignaciones repetidas gana la última: recorriendo al revés, la primera fila
+    firsts[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+    return firsts.tolist()
+
+
+def _flatten(histories: Mapping[Any, Sequence[Dict[str, Any]]]) -> Tuple[List[Any], Any, List[Dict[str, Any]]]:
+    """
+    Une los historiales de varios usuarios
+
+    Returns:
+        Tuple (usuarios, índice del usuario de cada fila, filas)
+    """
+    users = list(histories)
+    lengths = [len(histories[user] or []) for user in users]
+    rows: List[Dict[str, Any]] = []
+    for user in users:
+        rows.extend(histories[user] or [])
+    if np is None:
+        groups = [group for group, length in enumerate(lengths) for _ in range(length)]
+    else:
+        groups = np.repeat(np.arange(len(users), dtype=np.int64), lengths)
+    return users, groups, rows
+
+
+def _group_keys(users: List[Any], groups, values: List[Any]) -> List[Hashable]:
+    # Con un solo usuario la clave es el propio valor (evita crear tuplas)
+    if len(users) == 1:
+        return values
+    return list(zip(groups.tolist() if np is not None else groups, values))
+
+
+def _rate(part: int, total: int) -> Any:
+    return part / total if total > 0 else 0
+
+
+# --- Completitud de tareas ------------------------------------------------------
+
+def _completion_result(total: int, completed: int, day_totals: List[int], day_completed: List[int]) -> Dict[str, Any]:
+    days_analysis = {
+        day: {"total": day_totals[i], "completed": day_completed[i], "completion_rate": _rate(day_completed[i], day_totals[i])}
+        for i, day in enumerate(WEEKDAYS)
+    }
+    best_day = max(days_analysis.items(), key=lambda x: x[1].get("completion_rate", 0))
+    worst_day = min(days_analysis.items(), key=lambda x: x[1].get("completion_rate", 0) if x[1].get("total", 0) > 0 else 1)
+    return {
+        "overall_completion_rate": (completed / total) if total > 0 else 0,
+        "total_tasks": total,
+        "completed_tasks": completed,
+        "days_analysis": days_analysis,
+        "best_day": best_day[0],
+        "worst_day": worst_day[0]
+    }
+
+
+def completion_patterns_batch(histories: Mapping[Any, Sequence[Dict[str, Any]]]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Patrones de completitud de tareas de varios usuarios en una sola pasada
+
+    Args:
+        histories: Historial de tareas por usuario (`completed`, `due_date` ISO)
+
+    Returns:
+        Análisis por usuario, con el mismo formato que completion_patterns
+    """
+    users, groups, rows = _flatten(histories)
+    completed = [bool(task.get("completed", False)) for task in rows]
+    weekdays = _weekdays([task.get("due_date") for task in rows])
+
+    if np is not None:
+        completed = np.asarray(completed, dtype=bool)
+
+    size = len(users)
+    totals = _count(groups, size)
+    completed_totals = _count(groups, size, completed)
+    # Código combinado usuario × día de la semana, solo para tareas con fecha válida
+    if np is None:
+        dated = [weekday >= 0 for weekday in weekdays]
+        day_codes = [group * 7 + max(weekday, 0) for group, weekday in zip(groups, weekdays)]
+        dated_completed = [d and c for d, c in zip(dated, completed)]
+    else:
+        dated = weekdays >= 0
+        day_codes = groups * 7 + np.maximum(weekdays, 0)
+        dated_completed = dated & completed
+    day_totals = _count(day_codes, size * 7, dated)
+    day_completed = _count(day_codes, size * 7, dated_completed)
+
+    return {
+        user: _completion_result(
+            totals[group], completed_totals[group],
+            day_totals[group * 7:group * 7 + 7], day_completed[group * 7:group * 7 + 7]
+        ) if totals[group] else {"no_data": True}
+        for group, user in enumerate(users)
+    }
+
+
+def completion_patterns(task_history: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Analiza patrones en la completitud de tareas: tasa global y por día de la semana
+    """
+    if not task_history:
+        return {"no_data": True}
+    return completion_patterns_batch({None: task_history})[None]
+
+
+# --- Consistencia de hábitos ------------------------------------------------------
+
+def habit_consistency_batch(histories: Mapping[Any, Sequence[Dict[str, Any]]]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Consistencia de hábitos de varios usuarios en una sola pasada
+
+    Args:
+        histories: Registros de hábitos por usuario (`habit_id`, `completed`, ...)
+    """
+    users, groups, rows = _flatten(histories)
+    habit_ids = [log.get("habit_id", "unknown") for log in rows]
+    codes, size = _factorize(_group_keys(users, groups, habit_ids))
+    totals = _count(codes, size)
+    completed = _count(codes, size, [bool(log.get("completed", False)) for log in rows])
+
+    habits_by_group: List[Dict[Any, Dict[str, Any]]] = [{} for _ in users]
+    for code, row in enumerate(_first_rows(codes, size)):
+        first = rows[row]
+        habits_by_group[int(groups[row])][habit_ids[row]] = {
+            "name": first.get("habit_name", "Hábito desconocido"),
+            "total_logs": totals[code],
+            "completed_logs": completed[code],
+            "streak": first.get("current_streak", 0),
+            "best_streak": first.get("best_streak", 0),
+            "consistency_rate": _rate(completed[code], totals[code]),
+        }
+
+    results = {}
+    for user, habits_analysis in zip(users, habits_by_group):
+        if not habits_analysis:
+            results[user] = {"no_data": True}
+            continue
+        most_consistent = max(habits_analysis.items(), key=lambda x: x[1].get("consistency_rate", 0))
+        least_consistent = min(habits_analysis.items(), key=lambda x: x[1].get("consistency_rate", 0))
+        results[user] = {
+            "habits_count": len(habits_analysis),
+            "habits_details": habits_analysis,
+            "most_consistent_habit": {
+                "id": most_consistent[0],
+                "name": most_consistent[1]["name"],
+                "consistency_rate": most_consistent[1]["consistency_rate"]
+            },
+            "least_consistent_habit": {
+                "id": least_consistent[0],
+                "name": least_consistent[1]["name"],
+                "consistency_rate": least_consistent[1]["consistency_rate"]
+            }
+        }
+    return results
+
+
+def habit_consistency(habit_history: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Analiza la consistencia de cada hábito (registros completados / registros)
+    """
+    if not habit_history:
+        return {"no_data": True}
+    return habit_consistency_batch({None: habit_history})[None]
+
+
+# --- Éxito de metas ----------------------------------------------------------------
+
+def goal_success_factors_batch(histories: Mapping[Any, Sequence[Dict[str, Any]]]) -> Dict[Any, Dict[str, Any]]:
+    """
+    Factores de éxito en metas previas de varios usuarios en una sola pasada
+
+    Args:
+        histories: Metas por usuario (`status`, `type`)
+    """
+    users, groups, rows = _flatten(histories)
+    completed_flags = [goal.get("status", "") == "completed" for goal in rows]
+    goal_types = [goal.get("type", "unknown") for goal in rows]
+    codes, size = _factorize(_group_keys(users, groups, goal_types))
+    type_totals = _count(codes, size)
+    type_completed = _count(codes, size, completed_flags)
+    totals = _count(groups, len(users))
+    completed = _count(groups, len(users), completed_flags)
+
+    types_by_group: List[Dict[Any, Dict[str, Any]]] = [{} for _ in users]
+    for code, row in enumerate(_first_rows(codes, size)):
+        types_by_group[int(groups[row])][goal_types[row]] = {
+            "total": type_totals[code],
+            "completed": type_completed[code],
+            "success_rate": _rate(type_completed[code], type_totals[code]),
+        }
+
+    results = {}
+    for group, (user, types_analysis) in enumerate(zip(users, types_by_group)):
+        if not types_analysis:
+            results[user] = {"no_data": True}
+            continue
+        most_successful = max(types_analysis.items(), key=lambda x: x[1].get("success_rate", 0))
+        least_successful = min(types_analysis.items(), key=lambda x: x[1].get("success_rate", 0)
+                               if x[1].get("total", 0) > 0 else 1)
+        results[user] = {
+            "overall_success_rate": (completed[group] / totals[group]) if totals[group] > 0 else 0,
+            "total_goals": totals[group],
+            "completed_goals": completed[group],
+            "types_analysis": types_analysis,
+            "most_successful_type": most_successful[0],
+            "least_successful_type": least_successful[0]
+        }
+    return results
+
+
+def goal_success_factors(goal_history: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Analiza la tasa de éxito de las metas, global y por tipo
+    """
+    if not goal_history:
+        return {"no_data": True}
+    return goal_success_factors_batch({None: goal_history})[None]
@@ -0,0 +1,309 @@
+import base64
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.ai_config import CHAT_SYSTEM_PROMPT, get_ai_settings
+from app.core.metrics import metrics
+from app.models.conversation import SENDER_USER, Conversation, ConversationMessage
+from app.services.ai.prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tipo de trabajo que actualiza el resumen de una conversación
+AI_CONVERSATION_SUMMARY_JOB = "ai_conversation_summary"
+
+
+def encode_cursor(created_at: datetime, item_id: Any) -> str:
+    """
+    Cursor opaco de paginación: posición (fecha, id) del último elemento devuelto
+    """
+    raw = f"{created_at.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(item_id)
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+
+def _as_uuid(value: Any) -> UUID:
+    return value if isinstance(value, UUID) else UUID(str(value))
+
+
+@dataclass
+class ConversationWindow:
+    """Historial que se envía al modelo: resumen + últimos mensajes."""
+
+    summary: Optional[str]
+    messages: List[ConversationMessage]  # En orden cronológico
+    # Mensajes anteriores a la ventana que aún no están en el resumen
+    overflow: List[ConversationMessage] = field(default_factory=list)
+    tokens: int = 0
+
+    def to_prompt(self, system_prompt: str = CHAT_SYSTEM_PROMPT) -> List[Dict[str, str]]:
+        system = system_prompt
+        if self.summary:
+            system += f"\nResumen de la conversación hasta ahora:\n{self.summary}\n"
+        prompt = [{"role": "system", "content": system}]
+        prompt.extend(
+            {"role": "user" if message.sender == SENDER_USER else "assistant", "content": message.content}
+            for message in self.messages
+        )
+        return prompt
+
+
+def build_window(
+    summary: Optional[str],
+    newest_first: List[ConversationMessage],
+    max_turns: int,
+    token_budget: int,
+) -> ConversationWindow:
+    """
+    Elige los mensajes más recientes que caben en `max_turns` turnos y en el
+    presupuesto de tokens (el último mensaje siempre entra)
+
+    Args:
+        summary: Resumen actual de la conversación
+        newest_first: Mensajes aún no resumidos, del más reciente al más antiguo
+        max_turns: Turnos (usuario + asistente) como máximo
+        token_budget: Tokens como máximo para el resumen y los mensajes
+    """
+    tokens = count_tokens(summary) if summary else 0
+    included = []
+    for index, message in enumerate(newest_first):
+        message_tokens = count_tokens(message.content)
+        if included and (len(included) >= max_turns * 2 or tokens + message_tokens > token_budget):
+            overflow = list(reversed(newest_first[index:]))
+            break
+        included.append(message)
+        tokens += message_tokens
+    else:
+        overflow = []
+    return ConversationWindow(summary, list(reversed(included)), overflow, tokens)
+
+
+class ConversationStore:
+    """
+    Acceso a las conversaciones y mensajes de un usuario. Los listados se
+    paginan por clave (fecha, id) en lugar de OFFSET, así que el coste de cada
+    página no crece con el historial.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_conversation(self, user_id: Any, title: Optional[str] = None) -> Conversation:
+        conversation = Conversation(user_id=_as_uuid(user_id), title=title or "Nueva conversación")
+        self.db.add(conversation)
+        await self.db.commit()
+        await self.db.refresh(conversation)
+        return conversation
+
+    async def get_conversation(self, user_id: Any, conversation_id: Any) -> Optional[Conversation]:
+        """
+        Conversación del usuario (None si no existe o es de otro usuario)
+        """
+        try:
+            conversation_uuid, user_uuid = _as_uuid(conversation_id), _as_uuid(user_id)
+        except ValueError:
+            return None
+        conversation = await self.db.get(Conversation, conversation_uuid)
+        if conversation is None or conversation.user_id != user_uuid:
+            return None
+        return conversation
+
+    async def list_conversations(
+        self, user_id: Any, limit: int = 20, cursor: Optional[str] = None
+    ) -> Tuple[List[Conversation], Optional[str]]:
+        """
+        Conversaciones del usuario, de la actualizada más recientemente a la más antigua
+
+        Returns:
+            Tuple (conversaciones de la página, cursor de la siguiente o None)
+        """
+        query = select(Conversation).where(Conversation.user_id == _as_uuid(user_id))
+        if cursor:
+            updated_at, conversation_id = decode_cursor(cursor)
+            query = query.where(or_(
+                Conversation.updated_at < updated_at,
+                and_(Conversation.updated_at == updated_at, Conversation.id < conversation_id),
+            ))
+        query = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+        rows = list((await self.db.execute(query)).scalars())
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id)
+        return rows, next_cursor
+
+    async def list_messages(
+        self, conversation: Conversation, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[ConversationMessage], Optional[str]]:
+        """
+        Página de mensajes hacia atrás en el tiempo: sin cursor, los últimos
+        `limit`; con el cursor devuelto, los anteriores
+
+        Returns:
+            Tuple (mensajes en orden cronológico, cursor de la página anterior o None)
+        """
+        query = select(ConversationMessage).where(ConversationMessage.conversation_id == conversation.id)
+        if cursor:
+            created_at, message_id = decode_cursor(cursor)
+            query = query.where(_before(created_at, message_id))
+        query = query.order_by(ConversationMessage.created_at.desc(), ConversationMessage.id.desc()).limit(limit + 1)
+        rows = list((await self.db.execute(query)).scalars())
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+        rows.reverse()
+        return rows, next_cursor
+
+    async def add_message(
+        self, conversation: Conversation, sender: str, content: str, tokens_used: Optional[int] = None
+    ) -> ConversationMessage:
+        message = ConversationMessage(
+            conversation_id=conversation.id,
+            sender=sender,
+            content=content,
+            tokens_used=tokens_used if tokens_used is not None else count_tokens(content),
+            created_at=datetime.now(timezone.utc),
+        )
+        self.db.add(message)
+        # En Postgres lo hace también un trigger; se fija aquí para el resto de bases
+        conversation.updated_at = message.created_at
+        await self.db.commit()
+        return message
+
+    async def delete_conversation(self, conversation: Conversation) -> None:
+        await self.db.execute(delete(ConversationMessage).where(ConversationMessage.conversation_id == conversation.id))
+        await self.db.delete(conversation)
+        await self.db.commit()
+
+    async def load_window(
+        self,
+        conversation: Conversation,
+        max_turns: Optional[int] = None,
+        token_budget: Optional[int] = None,
+    ) -> ConversationWindow:
+        """
+        Historial acotado para el prompt: el resumen guardado y los mensajes
+        más recientes que caben en la ventana. Solo se leen los mensajes
+        posteriores al resumen, y como mucho una ventana más un lote de resumen.
+        """
+        ai_settings = get_ai_settings()
+        max_turns = max_turns or ai_settings.AI_CONVERSATION_WINDOW_TURNS
+        token_budget = token_budget or ai_settings.AI_CONVERSATION_HISTORY_TOKENS
+
+        query = select(ConversationMessage).where(ConversationMessage.conversation_id == conversation.id)
+        if conversation.summary_until_at is not None:
+            query = query.where(~_before(conversation.summary_until_at, conversation.summary_until_id, inclusive=True))
+        query = query.order_by(
+            ConversationMessage.created_at.desc(), ConversationMessage.id.desc()
+        ).limit(max_turns * 2 + ai_settings.AI_CONVERSATION_SUMMARY_BATCH)
+        newest_first = list((await self.db.execute(query)).scalars())
+
+        window = build_window(conversation.summary, newest_first, max_turns, token_budget)
+        metrics.observe("ai_prompt_tokens", window.tokens, labels={"feature": "chat"})
+        return window
+
+    async def load_unsummarized(
+        self, conversation: Conversation, until: ConversationMessage, limit: int
+    ) -> List[ConversationMessage]:
+        """
+        Mensajes aún no resumidos anteriores a `until`, del más antiguo al más reciente
+        """
+        query = select(ConversationMessage).where(
+            ConversationMessage.conversation_id == conversation.id,
+            _before(until.created_at, until.id),
+        )
+        if conversation.summary_until_at is not None:
+            query = query.where(~_before(conversation.summary_until_at, conversation.summary_until_id, inclusive=True))
+        query = query.order_by(ConversationMessage.created_at, ConversationMessage.id).limit(limit)
+        return list((await self.db.execute(query)).scalars())
+
+    async def apply_summary(self, conversation: Conversation, summary: str, last: ConversationMessage) -> None:
+        """
+        Guarda el resumen que ya incluye todos los mensajes hasta `last`
+        """
+        conversation.summary = summary
+        conversation.summary_until_at = last.created_at
+        conversation.summary_until_id = last.id
+        await self.db.commit()
+
+
+def _before(created_at: datetime, message_id: UUID, inclusive: bool = False):
+    # Condición (created_at, id) < (created_at, message_id) en orden de paginación
+    tie = ConversationMessage.id <= message_id if inclusive else ConversationMessage.id < message_id
+    return or_(
+        ConversationMessage.created_at < created_at,
+        and_(ConversationMessage.created_at == created_at, tie),
+    )
+
+
+async def summarize_overflow(
+    store: ConversationStore,
+    conversation: Conversation,
+    summarizer,
+    user_id: Optional[str] = None,
+) -> bool:
+    """
+    Incorpora al resumen los mensajes que han salido de la ventana, si ya
+    son al menos AI_CONVERSATION_SUMMARY_BATCH
+
+    Args:
+        store: Almacén de conversaciones
+        conversation: Conversación a resumir
+        summarizer: Servicio con `summarize_conversation(summary, messages, user_id)`
+        user_id: Usuario propietario (para su cupo en el limitador)
+
+    Returns:
+        True si se actualizó el resumen
+    """
+    batch = get_ai_settings().AI_CONVERSATION_SUMMARY_BATCH
+    window = await store.load_window(conversation)
+    if len(window.overflow) < batch:
+        return False
+
+    # La lectura de la ventana está acotada: si el resumen va atrasado, los
+    # mensajes pendientes se recorren desde el último resumido, por tramos
+    while True:
+        pending = await store.load_unsummarized(conversation, window.messages[0], limit=batch * 4)
+        if not pending:
+            break
+        summary = await summarizer.summarize_conversation(
+            conversation.summary,
+            [
+                {"role": "user" if message.sender == SENDER_USER else "assistant", "content": message.content}
+                for message in pending
+            ],
+            user_id=user_id,
+        )
+        await store.apply_summary(conversation, summary, pending[-1])
+        metrics.inc("ai_conversation_summaries_total")
+        logger.info(f"Resumen de la conversación {conversation.id} actualizado ({len(pending)} mensajes)")
+        if len(pending) < batch * 4:
+            break
+    return True
+
+
+def summary_dedupe_key(conversation_id: Any) -> str:
+    """
+    Clave de deduplicación: un solo resumen pendiente por conversación
+    """
+    return f"{AI_CONVERSATION_SUMMARY_JOB}:{conversation_id}"
+
@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import random
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from app.services.ai.response_cache import response_cache_key
+
+logger = logging.getLogger(__name__)
+
+FILLER_WORDS = [
+    "vamos", "a", "organizar", "tu", "semana", "con", "pasos", "pequeños", "y", "constantes",
+    "la", "meta", "se", "divide", "en", "tareas", "diarias", "que", "puedes", "revisar",
+]
+
+
+def default_responder(payload: Dict[str, Any], tokens: int) -> str:
+    """
+    Texto de respuesta simulado: repite el último mensaje del usuario y lo
+    completa con palabras de relleno hasta `tokens` palabras
+    """
+    messages = payload.get("messages") or []
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    words = [f"Respuesta simulada a: {str(last_user)[:80]}."]
+    rng = random.Random(response_cache_key(payload))
+    words.extend(rng.choice(FILLER_WORDS) for _ in range(max(tokens - 1, 0)))
+    return " ".join(words)
+
+
+class Cassette:
+    """
+    Sesiones grabadas contra OpenRouter, en JSONL: una línea por petición con la
+    clave de la petición (modelo, mensajes, temperatura, max_tokens), el status y
+    los trozos de la respuesta tal como llegaron, con su instante relativo.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._replayed: Dict[str, int] = {}
+
+    def load(self) -> "Cassette":
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry["key"], []).append(entry)
+        return self
+
+    def record(self, payload: Dict[str, Any], status: int, chunks: List[tuple]) -> None:
+        entry = {
+            "key": response_cache_key(payload),
+            "stream": bool(payload.get("stream")),
+            "status": status,
+            "chunks": [[round(offset, 4), base64.b64encode(data).decode("ascii")] for offset, data in chunks],
+        }
+        self.entries.setdefault(entry["key"], []).append(entry)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def next_entry(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Respuesta grabada para una petición; si se grabó varias veces se
+        devuelven en orden y después se repite la última
+        """
+        key = response_cache_key(payload)
+        entries = self.entries.get(key)
+        if not entries:
+            return None
+        index = self._replayed.get(key, 0)
+        self._replayed[key] = index + 1
+        return entries[min(index, len(entries) - 1)]
+
+
+class FakeOpenRouterServer:
+    """
+    Servidor local compatible con la API de chat completions de OpenRouter /
+    OpenAI para pruebas de carga y benchmarks sin red.
+
+    Modos:
+    - fake: genera respuestas con la latencia, el ritmo de tokens y la tasa de
+      errores configurados.
+    - record: reenvía cada petición a `upstream_url` y graba la respuesta en el
+      cassette.
+    - replay: responde con lo grabado en el cassette, respetando los tiempos
+      originales escalados por `replay_speed`.
+
+    Basta con apuntar OPENROUTER_BASE_URL a `server.base_url`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 250.0,
+        latency_jitter_ms: float = 100.0,
+        tokens_per_second: float = 50.0,
+        response_tokens: int = 120,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        stream_error_rate: float = 0.0,
+        responder: Optional[Callable[[Dict[str, Any], int], str]] = None,
+        cassette: Optional[Cassette] = None,
+        mode: str = "fake",
+        upstream_url: str = "https://openrouter.ai/api/v1",
+        replay_speed: float = 1.0,
+        seed: Optional[int] = None,
+    ):
+        if mode not in ("fake", "record", "replay"):
+            raise ValueError(f"Modo desconocido: {mode}")
+        if mode != "fake" and cassette is None:
+            raise ValueError(f"El modo {mode} necesita un cassette")
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_error_rate = stream_error_rate
+        self.responder = responder or default_responder
+        self.cassette = cassette
+        self.mode = mode
+        self.upstream_url = upstream_url.rstrip("/")
+        self.replay_speed = replay_speed
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.total_requests = 0
+        self.stream_requests = 0
+        self.errors_injected = 0
+        self.replay_misses = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/api/v1"
+
+    async def start(self) -> "FakeOpenRouterServer":
+        app = web.Application()
+        app.router.add_post("/api/v1/chat/completions", self._handle_chat)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Puerto real si se pidió uno libre (port=0)
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"OpenRouter simulado ({self.mode}) escuchando en {self.base_url}")
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeOpenRouterServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    def _latency(self) -> float:
+        jitter = self._random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+        return max(self.latency_ms + jitter, 0.0) / 1000.0
+
+    async def _handle_chat(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.total_requests += 1
+        if payload.get("stream"):
+            self.stream_requests += 1
+
+        if self.mode == "record":
+            return await self._proxy_and_record(request, payload)
+        if self.mode == "replay":
+            return await self._replay(request, payload)
+
+        await asyncio.sleep(self._latency())
+        if self._random.random() < self.error_rate:
+            self.errors_injected += 1
+            return web.json_response(
+                {"error": {"code": self.error_status, "message": "Error simulado"}},
+                status=self.error_status,
+            )
+
+        text = self.responder(payload, min(self.response_tokens, payload.get("max_tokens") or self.response_tokens))
+        if payload.get("stream"):
+            return await self._stream_text(request, payload, text)
+        return web.json_response(self._completion(payload, text))
+
+    def _completion(self, payload: Dict[str, Any], text: str) -> Dict[str, Any]:
+        tokens = len(text.split())
+        return {
+            "id": f"gen-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake/model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+        }
+
+    async def _stream_text(self, request: web.Request, payload: Dict[str, Any], text: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+
+        generation_id = f"gen-{uuid.uuid4().hex}"
+        model = payload.get("model", "fake/model")
+        tokens = text.split(" ")
+        fail_at = self._random.randrange(len(tokens)) if self._random.random() < self.stream_error_rate else None
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+        for index, token in enumerate(tokens):
+            if index == fail_at:
+                self.errors_injected += 1
+                error = {"error": {"code": 502, "message": "Error simulado del proveedor"}}
+                await response.write(b"data: " + json.dumps(error).encode("utf-8") + b"\n\n")
+                return response
+            chunk = {
+                "id": generation_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token if index == 0 else " " + token},
+                             "finish_reason": None}],
+            }
+            await response.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            if interval:
+                await asyncio.sleep(interval)
+
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _proxy_and_record(self, request: web.Request, payload: Dict[str, Any]) -> web.StreamResponse:
+        headers = {
+            name: value for name, value in request.headers.items()
+            if name.lower() in ("authorization", "http-referer", "x-title", "accept", "openrouter-providers")
+        }
+        chunks = []
+        started = time.monotonic()
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.upstream_url}/chat/completions", json=payload, headers=headers) as upstream:
+                response = web.StreamResponse(
+                    status=upstream.status,
+                    headers={"Content-Type": upstream.headers.get("Content-Type", "application/json")},
+                )
+                await response.prepare(request)
+                async for data in upstream.content.iter_any():
+                    chunks.append((time.monotonic() - started, data))
+                    await response.write(data)
+                await response.write_eof()
+        self.cassette.record(payload, upstream.status, chunks)
+        return response
+
+    async def _replay(self, request: web.Request, payload: Dict[str, Any]) -> web.StreamResponse:
+        entry = self.cassette.next_entry(payload)
+        if entry is None:
+            self.replay_misses += 1
+            logger.warning("Petición sin respuesta grabada en el cassette")
+            return web.json_response({"error": {"code": 404, "message": "Petición no grabada"}}, status=404)
+
+        response = web.StreamResponse(
+            status=entry["status"],
+            headers={"Content-Type": "text/event-stream" if entry["stream"] else "application/json"},
+        )
+        await response.prepare(request)
+        started = time.monotonic()
+        for offset, data in entry["chunks"]:
+            delay = offset / self.replay_speed - (time.monotonic() - started) if self.replay_speed > 0 else 0
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await response.write(base64.b64decode(data))
+        await response.write_eof()
+        return response
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 3)
+
+
+async def run_load_test(
+    requests: int = 200,
+    concurrency: int = 20,
+    stream: bool = True,
+    server: Optional[FakeOpenRouterServer] = None,
+) -> Dict[str, Any]:
+    """
+    Lanza peticiones de chat concurrentes con OpenRouterService contra el
+    servidor simulado y devuelve un resumen de latencias (sin límite de cuota)
+    """
+    from app.services.ai.ai_service import OpenRouterService
+    from app.services.ai.rate_limiter import AIRateLimiter
+
+    own_server = server is None
+    server = server or FakeOpenRouterServer()
+    if own_server:
+        await server.start()
+
+    service = OpenRouterService(
+        rate_limiter=AIRateLimiter(requests_per_minute=10 ** 9, burst=10 ** 9, user_requests_per_minute=10 ** 9),
+    )
+    service.base_url = server.base_url
+    service.api_key = service.api_key or "fake-key"
+    # Cada petición debe llegar al servidor
+    service.response_cache = None
+
+    semaphore = asyncio.Semaphore(concurrency)
+    first_token: List[float] = []
+    totals: List[float] = []
+    errors = 0
+
+    async def one(index: int) -> None:
+        nonlocal errors
+        messages = [{"role": "user", "content": f"Petición de carga {index}"}]
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if stream:
+                    generator = await service.generate_chat_response(messages=messages, stream=True)
+                    received = False
+                    async for chunk in generator:
+                        if chunk.is_complete:
+                            if chunk.text:
+                                # Último trozo con texto: el stream terminó con error
+                                errors += 1
+                                return
+                            break
+                        if not received:
+                            first_token.append(time.perf_counter() - started)
+                            received = True
+                else:
+                    await service.generate_chat_response(messages, raise_errors=True)
+            except Exception:
+                errors += 1
+                return
+            totals.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+    if own_server:
+        await server.stop()
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "stream": stream,
+        "duration_seconds": round(elapsed, 2),
+        "requests_per_second": round(requests / elapsed, 1),
+        "errors": errors,
+        "first_token_p50_seconds": _percentile(first_token, 0.5),
+        "first_token_p95_seconds": _percentile(first_token, 0.95),
+        "total_p50_seconds": _percentile(totals, 0.5),
+        "total_p95_seconds": _percentile(totals, 0.95),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor OpenRouter simulado para pruebas de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=250.0)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de peticiones que fallan")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--stream-error-rate", type=float, default=0.0,
+                        help="Fracción de streams que se cortan con un evento de error")
+    parser.add_argument("--record", metavar="CASSETTE", help="Reenviar a --upstream y grabar las respuestas")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Responder con las respuestas grabadas")
+    parser.add_argument("--upstream", default="https://openrouter.ai/api/v1")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="0 = sin esperas")
+    parser.add_argument("--load-test", action="store_true", help="Ejecutar una prueba de carga y salir")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.record:
+        mode, cassette = "record", Cassette(args.record)
+    elif args.replay:
+        mode, cassette = "replay", Cassette(args.replay).load()
+    else:
+        mode, cassette = "fake", None
+
+    server = FakeOpenRouterServer(
+        host=args.host,
+        port=0 if args.load_test else args.port,
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stream_error_rate=args.stream_error_rate,
+        cassette=cassette,
+        mode=mode,
+        upstream_url=args.upstream,
+        replay_speed=args.replay_speed,
+        seed=args.seed,
+    )
+    async with server:
+        if args.load_test:
+            result = await run_load_test(args.requests, args.concurrency, not args.no_stream, server=server)
+            print(json.dumps(result, indent=2))
+            return
+        print(f"OPENROUTER_BASE_URL={server.base_url}")
+        while True:
+            await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,401 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.ai_config import get_ai_settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rasgos del mensaje (ya normalizado: minúsculas y sin tildes)
+_INTENT = re.compile(
+    r"\b(quiero|quisiera|voy a|vamos a|me gustaria|mi (objetivo|meta|proposito|reto)|"
+    r"tengo (que|como objetivo)|necesito|planeo|pienso|me propongo|estoy decidid[oa]|"
+    r"i want|i'd like|i would like|my goal|i plan|i need to|i'm going to|i will|i'll)\b"
+)
+_GOAL_VERB = re.compile(
+    r"\b(ahorr\w*|aprend\w*|correr|bajar|perder|adelgaz\w*|ganar|leer|termin\w*|conseguir|"
+    r"lograr|mejorar|empezar|comenzar|dejar de|estudi\w*|entrenar|meditar|pagar|invertir|"
+    r"viajar|comprar|save|learn|lose|run|read|finish|start|quit|study|train|pay off|invest|buy)\b"
+)
+_TIMEFRAME = re.compile(
+    r"\b(para (el|la|fin|finales|final)|antes de|en (los |las )?(proxim[oa]s )?\d+ (dias|semanas|meses|anos)|"
+    r"este (ano|mes|verano|invierno)|el (proximo|siguiente) (ano|mes|verano)|cada (dia|semana|mes)|"
+    r"al (dia|mes|ano)|diari\w*|semanal\w*|by (the )?(end|next)|within|this (year|month|summer)|"
+    r"next (year|month|week|summer)|every (day|week|month)|daily|weekly)\b"
+)
+_QUANTITY = re.compile(
+    r"\d|[$€]|\b(kilos?|kg|km|kilometros|euros?|dolares|libros?|horas?|minutos|pasos|pounds|miles|books|hours)\b"
+)
+_QUESTION = re.compile(
+    r"^\s*¿|\?\s*$|^\s*(que|cual|como|cuando|donde|quien|cuanto|puedes|podrias|"
+    r"what|how|when|where|who|which|can you|could you)\b"
+)
+_SMALLTALK = re.compile(
+    r"^(hola|buenas|buenos dias|buenas (tardes|noches)|gracias|muchas gracias|ok|okay|vale|perfecto|"
+    r"genial|de acuerdo|si|no|adios|hasta luego|jaja\w*|hi|hello|hey|thanks|thank you|thx|bye|cool|"
+    r"great|yes|nope?)( \w+)?$"
+)
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+# Rasgos por expresiones regulares (los pesos de las palabras se aprenden al entrenar)
+_PATTERN_FEATURES = {
+    "re:intent": _INTENT,
+    "re:goal_verb": _GOAL_VERB,
+    "re:timeframe": _TIMEFRAME,
+    "re:quantity": _QUANTITY,
+    "re:question": _QUESTION,
+}
+
+# Pesos iniciales (sin entrenar): un mensaje sin ningún rasgo queda en 0.5 y se
+# consulta; solo los saludos y las preguntas sin rasgos de meta caen por debajo
+# del umbral. Así el filtro por defecto solo descarta lo que claramente no es
+# una meta; para ahorrar más hay que entrenar los pesos (AI_GOAL_GATE_MODEL_PATH)
+DEFAULT_WEIGHTS = {
+    "re:intent": 4.0,
+    "re:goal_verb": 4.0,
+    "re:timeframe": 3.0,
+    "re:quantity": 1.0,
+    "re:question": -5.0,
+    "re:smalltalk": -8.0,
+}
+DEFAULT_BIAS = 0.0
+
+# Ejemplos etiquetados (mensaje, contiene meta) con los que se comprueba el
+# recall de los pesos por defecto: scripts/train_goal_gate.py --check
+REFERENCE_EXAMPLES: List[Tuple[str, bool]] = [
+    ("Quiero ahorrar $5000 para fin de año", True),
+    ("Necesito aprender programación en Python en los próximos 3 meses", True),
+    ("Mi objetivo es correr un maratón el próximo verano", True),
+    ("Hacer ejercicio 3 veces por semana", True),
+    ("Aprender guitarra", True),
+    ("Dejar de fumar", True),
+    ("Estoy pensando en cambiar de trabajo", True),
+    ("Leer 20 libros este año", True),
+    ("Bajar 5 kilos antes de la boda", True),
+    ("Me propongo meditar cada día", True),
+    ("Voy a estudiar inglés una hora al día", True),
+    ("Este mes quiero pagar la tarjeta de crédito", True),
+    ("Empezar a ir al gimnasio", True),
+    ("Terminar la tesis en junio", True),
+    ("¿Me ayudas a ahorrar 200 euros al mes?", True),
+    ("¿Cómo puedo perder 10 kilos para el verano?", True),
+    ("Me gustaría viajar a Japón el próximo año", True),
+    ("Conseguir un ascenso", True),
+    ("Montar mi propio negocio", True),
+    ("I want to run a half marathon by next spring", True),
+    ("Learn Spanish this year", True),
+    ("Hola", False),
+    ("Buenos días", False),
+    ("Gracias", False),
+    ("Muchas gracias", False),
+    ("Vale", False),
+    ("Perfecto", False),
+    ("Adiós", False),
+    ("jajaja", False),
+    ("¿Qué hora es?", False),
+    ("¿Qué tengo hoy en el calendario?", False),
+    ("¿Cuándo es mi próxima reunión?", False),
+    ("¿Quién eres?", False),
+    ("¿Puedes resumir mis tareas de la semana?", False),
+    ("¿Cuál es la capital de Francia?", False),
+    ("Hi", False),
+    ("Thanks", False),
+    ("What time is it?", False),
+]
+
+
+def normalize(message: str) -> str:
+    """
+    Minúsculas y sin tildes, para que los patrones no dependan de la ortografía
+    """
+    text = unicodedata.normalize("NFKD", message.lower())
+    return "".join(char for char in text if not unicodedata.combining(char)).strip()
+
+
+def goal_features(message: str) -> Dict[str, float]:
+    """
+    Rasgos binarios de un mensaje: patrones (intención, verbo de meta, plazo,
+    cantidad, pregunta, saludo) y las palabras que contiene ("w:<palabra>")
+    """
+    text = normalize(message)
+    words = _WORDS.findall(text)
+    features = {name: 1.0 for name, pattern in _PATTERN_FEATURES.items() if pattern.search(text)}
+    if _SMALLTALK.match(" ".join(words)):
+        features["re:smalltalk"] = 1.0
+    if len(words) <= 3:
+        features["re:short"] = 1.0
+    for word in words:
+        features[f"w:{word}"] = 1.0
+    return features
+
+
+def _sigmoid(value: float) -> float:
+    if value < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+@dataclass
+class GoalGateModel:
+    """
+    Modelo lineal (regresión logística) sobre los rasgos de goal_features. Los
+    mensajes con probabilidad por debajo de `threshold` no se envían al LLM.
+    """
+    weights: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_WEIGHTS))
+    bias: float = DEFAULT_BIAS
+    threshold: float = 0.15
+
+    def probability(self, message: str) -> float:
+        features = goal_features(message)
+        return _sigmoid(self.bias + sum(self.weights.get(name, 0.0) * value for name, value in features.items()))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"weights": self.weights, "bias": self.bias, "threshold": self.threshold}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GoalGateModel":
+        return cls(weights=dict(data["weights"]), bias=float(data["bias"]), threshold=float(data["threshold"]))
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path: str) -> "GoalGateModel":
+        with open(path, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+
+def evaluate(model: GoalGateModel, examples: Iterable[Tuple[str, bool]],
+             threshold: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Precisión, recall y fracción de llamadas ahorradas del filtro sobre ejemplos
+    etiquetados. El positivo es "se consulta al LLM": el recall es la fracción
+    de metas que llegan al LLM y la precisión la de consultas que eran metas.
+    """
+    threshold = model.threshold if threshold is None else threshold
+    tp = fp = fn = tn = 0
+    for message, has_goal in examples:
+        query = model.probability(message) >= threshold
+        if query and has_goal:
+            tp += 1
+        elif query:
+            fp += 1
+        elif has_goal:
+            fn += 1
+        else:
+            tn += 1
+    total = tp + fp + fn + tn
+    return {
+        "examples": total,
+        "precision": tp / (tp + fp) if tp + fp else None,
+        "recall": tp / (tp + fn) if tp + fn else None,
+        "skip_rate": (fn + tn) / total if total else None,
+    }
+
+
+def _pick_threshold(model: GoalGateModel, examples: List[Tuple[str, bool]], target_recall: float) -> float:
+    # El umbral más alto que mantiene el recall objetivo (cuantas más llamadas se ahorren, mejor)
+    goals = sorted((model.probability(message) for message, has_goal in examples if has_goal), reverse=True)
+    if not goals:
+        return model.threshold
+    needed = max(1, math.ceil(target_recall * len(goals)))
+    return goals[needed - 1]
+
+
+def split_examples(examples: Iterable[Tuple[str, bool]], validation_fraction: float = 0.2,
+                   seed: int = 0) -> Tuple[List[Tuple[str, bool]], List[Tuple[str, bool]]]:
+    """
+    Reparte los ejemplos al azar en entrenamiento y validación
+    """
+    examples = list(examples)
+    random.Random(seed).shuffle(examples)
+    split = int(len(examples) * (1 - validation_fraction))
+    return examples[:split], examples[split:]
+
+
+def train(training: List[Tuple[str, bool]], validation: Optional[List[Tuple[str, bool]]] = None,
+          target_recall: float = 0.98, epochs: int = 20, learning_rate: float = 0.1, l2: float = 1e-4,
+          max_vocabulary: int = 2000, seed: int = 0) -> GoalGateModel:
+    """
+    Entrena el modelo con descenso de gradiente estocástico, partiendo de los
+    pesos iniciales, y elige el umbral que mantiene `target_recall` en los
+    ejemplos de validación
+
+    Args:
+        training: Pares (mensaje, contiene meta)
+        validation: Ejemplos para elegir el umbral (por defecto los de entrenamiento)
+        target_recall: Fracción de metas que deben seguir llegando al LLM
+        max_vocabulary: Palabras más frecuentes que se usan como rasgos
+    """
+    rng = random.Random(seed)
+
+    counts: Dict[str, int] = {}
+    encoded = []
+    for message, has_goal in training:
+        features = goal_features(message)
+        encoded.append((features, 1.0 if has_goal else 0.0))
+        for name in features:
+            if name.startswith("w:"):
+                counts[name] = counts.get(name, 0) + 1
+    vocabulary: Set[str] = set(sorted(counts, key=lambda name: (-counts[name], name))[:max_vocabulary])
+
+    model = GoalGateModel()
+    weights = model.weights
+    for epoch in range(epochs):
+        rng.shuffle(encoded)
+        rate = learning_rate / (1 + epoch)
+        for features, label in encoded:
+            names = [name for name in features if not name.startswith("w:") or name in vocabulary]
+            error = _sigmoid(model.bias + sum(weights.get(name, 0.0) for name in names)) - label
+            model.bias -= rate * error
+            for name in names:
+                weights[name] = weights.get(name, 0.0) - rate * (error + l2 * weights.get(name, 0.0))
+
+    model.weights = {name: round(weight, 6) for name, weight in weights.items() if abs(weight) > 1e-6}
+    model.threshold = _pick_threshold(model, validation or training, target_recall)
+    return model
+
+
+def labelled_interactions(rows: Iterable[Dict[str, Any]]) -> List[Tuple[str, bool]]:
+    """
+    Ejemplos de entrenamiento a partir de filas de `ai_interactions`: solo las
+    de detección de metas, cuya respuesta es el JSON con `has_goal`
+    """
+    examples = []
+    for row in rows:
+        try:
+            response = json.loads(row.get("response") or "")
+        except (TypeError, ValueError):
+            continue
+        if isinstance(response, dict) and "has_goal" in response and row.get("query"):
+            examples.append((row["query"], bool(response["has_goal"])))
+    return examples
+
+
+@dataclass
+class GateDecision:
+    probability: float
+    query: bool          # Se consulta al LLM
+    shadow: bool = False  # Descartado, pero se consulta igualmente en segundo plano para medir el recall
+
+
+class GoalGate:
+    """
+    Filtro local delante de la detección de metas: los mensajes que claramente
+    no contienen una meta ("gracias", "¿qué tengo hoy?") se responden sin llamar
+    al LLM y solo los dudosos llegan a él.
+
+    Mide su precisión con las respuestas del LLM a los mensajes que deja pasar y
+    estima el recall consultando igualmente una muestra de los descartados
+    (AI_GOAL_GATE_SHADOW_RATE).
+    """
+
+    def __init__(self, model: Optional[GoalGateModel] = None, shadow_rate: Optional[float] = None,
+                 seed: Optional[int] = None):
+        ai_settings = get_ai_settings()
+        self.model = model or self._load_model()
+        self.shadow_rate = ai_settings.AI_GOAL_GATE_SHADOW_RATE if shadow_rate is None else shadow_rate
+        self._random = random.Random(seed)
+        self._counts = {"checked": 0, "skipped": 0, "shadowed": 0, "tp": 0, "fp": 0, "fn": 0, "tn": 0}
+
+    @staticmethod
+    def _load_model() -> GoalGateModel:
+        ai_settings = get_ai_settings()
+        path = ai_settings.AI_GOAL_GATE_MODEL_PATH
+        if path:
+            try:
+                return GoalGateModel.load(path)
+            except Exception as e:
+                logger.warning(f"No se pudo cargar el modelo del filtro de metas ({path}): {str(e)}")
+        return GoalGateModel(threshold=ai_settings.AI_GOAL_GATE_THRESHOLD)
+
+    def decide(self, message: str) -> GateDecision:
+        probability = self.model.probability(message)
+        query = probability >= self.model.threshold
+        shadow = not query and self._random.random() < self.shadow_rate
+        self._counts["checked"] += 1
+        if not query:
+            self._counts["skipped"] += 1
+        if shadow:
+            self._counts["shadowed"] += 1
+        metrics.inc("ai_goal_gate_decisions_total", labels={"decision": "llm" if query else "skip"})
+        metrics.observe("ai_goal_gate_probability", probability)
+        self._publish()
+        return GateDecision(probability, query, shadow)
+
+    def record_outcome(self, decision: GateDecision, has_goal: bool) -> None:
+        """
+        Anota la respuesta del LLM a un mensaje que pasó por el filtro
+        """
+        if decision.query:
+            outcome = "tp" if has_goal else "fp"
+        else:
+            outcome = "fn" if has_goal else "tn"
+            if has_goal:
+                logger.info(f"El filtro de metas descartó una meta (probabilidad {decision.probability:.3f})")
+        self._counts[outcome] += 1
+        metrics.inc("ai_goal_gate_outcomes_total", labels={"outcome": outcome})
+        self._publish()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Precisión, recall estimado y fracción de llamadas ahorradas desde el arranque
+        """
+        counts = self._counts
+        # Cada descartado consultado representa skipped / shadowed descartados
+        shadowed = counts["fn"] + counts["tn"]
+        missed = counts["fn"] * counts["skipped"] / shadowed if shadowed else 0.0
+        queried = counts["tp"] + counts["fp"]
+        return {
+            **counts,
+            "precision": counts["tp"] / queried if queried else None,
+            "recall": counts["tp"] / (counts["tp"] + missed) if counts["tp"] + missed else None,
+            "skip_rate": counts["skipped"] / counts["checked"] if counts["checked"] else 0.0,
+        }
+
+    def _publish(self) -> None:
+        for name, value in self.stats().items():
+            if name in ("precision", "recall", "skip_rate") and value is not None:
+                metrics.set_gauge(f"ai_goal_gate_{name}", value)
+
+
+_pending_logs: Set[asyncio.Task] = set()
+
+
+def log_goal_detection(user_id: Optional[str], message: str, result: Dict[str, Any],
+                       model: Optional[str], tokens: Optional[int]) -> None:
+    """
+    Guarda en segundo plano una detección del LLM en `ai_interactions`, de donde
+    scripts/train_goal_gate.py saca los ejemplos de entrenamiento
+    """
+    if not user_id or not get_ai_settings().AI_GOAL_GATE_LOG_INTERACTIONS:
+        return
+
+    row = {
+        "user_id": user_id,
+        "query": message,
+        "response": json.dumps(result, ensure_ascii=False),
+        "model_used": model or "",
+        "tokens_used": tokens,
+        "context": "goals" if result.get("has_goal") else "general",
+    }
+
+    async def insert() -> None:
+        try:
+            from app.db.database import get_supabase_admin_client
+            client = get_supabase_admin_client()
+            await asyncio.to_thread(lambda: client.table("ai_interactions").insert(row).execute())
+        except Exception as e:
+            logger.warning(f"No se pudo registrar la detección de metas: {str(e)}")
+
+    task = asyncio.create_task(insert())
+    _pending_logs.add(task)
+    task.add_done_callback(_pending_logs.discard)
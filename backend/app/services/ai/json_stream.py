@@ -0,0 +1,113 @@
+import json
+import logging
+import re
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Caracteres que cambian el estado del tokenizador dentro de un objeto
+_SIGNIFICANT = re.compile(r'[{}"\\]')
+
+
+class IncrementalJSONExtractor:
+    """
+    Detecta objetos JSON de primer nivel dentro de un texto que llega por
+    trozos (respuestas en streaming). Cada carácter se examina una sola vez y
+    solo se guarda el objeto en curso, como lista de fragmentos; en cuanto se
+    cierra su última llave se decodifica y se devuelve.
+
+    Las llaves dentro de cadenas JSON no cuentan, y el texto fuera de los
+    objetos se ignora. Un objeto que supera `max_object_chars` se descarta.
+    """
+
+    def __init__(self, max_object_chars: int = 64 * 1024):
+        self.max_object_chars = max_object_chars
+        self._parts: List[str] = []
+        self._size = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def in_object(self) -> bool:
+        return self._depth > 0
+
+    def _begin(self) -> None:
+        self._parts = []
+        self._size = 0
+        self._depth = 1
+        self._in_string = False
+        self._escape = False
+
+    def _finish(self) -> Optional[Any]:
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        try:
+            return json.loads(text)
+        except (json.JSONDecodeError, ValueError):
+            # Llaves en texto libre (p. ej. "{nombre}"): no era JSON
+            logger.debug(f"Fragmento entre llaves que no es JSON: {text[:80]}")
+            return None
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Procesa un trozo de texto
+
+        Returns:
+            Objetos JSON completados en este trozo
+        """
+        found = []
+        pos = 0
+        # Inicio, en este trozo, del fragmento del objeto en curso
+        segment_start: Optional[int] = 0 if self._depth else None
+
+        while pos < len(text):
+            if self._depth == 0:
+                start = text.find("{", pos)
+                if start < 0:
+                    break
+                self._begin()
+                segment_start = start
+                pos = start + 1
+                continue
+
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+
+            match = _SIGNIFICANT.search(text, pos)
+            if match is None:
+                break
+            char = match.group()
+            pos = match.end()
+
+            if char == "\\":
+                if self._in_string:
+                    self._escape = True
+            elif char == '"':
+                self._in_string = not self._in_string
+            elif self._in_string:
+                continue
+            elif char == "{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[segment_start:pos])
+                    segment_start = None
+                    data = self._finish()
+                    if data is not None:
+                        found.append(data)
+
+        if self._depth and segment_start is not None:
+            fragment = text[segment_start:]
+            self._parts.append(fragment)
+            self._size += len(fragment)
+            if self._size > self.max_object_chars:
+                logger.warning("Objeto JSON demasiado grande en el stream; se descarta")
+                self._parts = []
+                self._size = 0
+                self._depth = 0
+        return found
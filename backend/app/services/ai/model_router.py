@@ -0,0 +1,110 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.ai_config import get_ai_settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errores que se repetirían con cualquier modelo (API key inválida, sin crédito, prohibido)
+_NON_RETRYABLE_STATUSES = {401, 402, 403}
+
+
+class ModelRequestError(Exception):
+    """
+    Fallo de una petición a un modelo concreto (status HTTP, timeout o error
+    del proveedor); si es recuperable se prueba el siguiente modelo de la ruta
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        return self.status not in _NON_RETRYABLE_STATUSES
+
+
+def model_route(feature: Optional[str] = None, preferred: Optional[str] = None) -> List[str]:
+    """
+    Modelos a probar para una funcionalidad, en orden: la ruta configurada en
+    AI_MODEL_ROUTES (o OPENROUTER_DEFAULT_MODEL + la ruta "default") y, como
+    último recurso, OPENROUTER_DEFAULT_MODEL. Acotada a AI_MODEL_MAX_ATTEMPTS.
+
+    Args:
+        feature: Funcionalidad que hace la llamada
+        preferred: Modelo pedido explícitamente; va primero y la ruta queda de respaldo
+    """
+    ai_settings = get_ai_settings()
+    routes = ai_settings.AI_MODEL_ROUTES
+    if feature in routes and feature != "default":
+        chain = list(routes[feature])
+    else:
+        chain = [ai_settings.OPENROUTER_DEFAULT_MODEL] + list(routes.get("default", []))
+    chain.append(ai_settings.OPENROUTER_DEFAULT_MODEL)
+    if preferred:
+        chain.insert(0, preferred)
+    # Sin duplicados, conservando el orden
+    return list(dict.fromkeys(chain))[:max(1, ai_settings.AI_MODEL_MAX_ATTEMPTS)]
+
+
+def route_timeout(feature: Optional[str] = None) -> float:
+    """
+    Timeout de cada intento: más corto en las rutas de baja latencia, para
+    pasar antes al siguiente modelo
+    """
+    ai_settings = get_ai_settings()
+    return ai_settings.AI_ROUTE_TIMEOUT_SECONDS.get(feature or "", ai_settings.REQUEST_TIMEOUT_SECONDS)
+
+
+def attempt_payload(payload: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """
+    Payload de un intento con `model`; pide a OpenRouter el coste en `usage`
+    si AI_USAGE_ACCOUNTING está activo
+    """
+    body = dict(payload, model=model)
+    if get_ai_settings().AI_USAGE_ACCOUNTING:
+        body["usage"] = {"include": True}
+    return body
+
+
+def _route_labels(feature: Optional[str], model: str) -> Dict[str, str]:
+    return {"feature": feature or "default", "model": model}
+
+
+def record_attempt(feature: Optional[str], model: str, started: float, outcome: str,
+                   usage: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Publica latencia, tokens y coste de un intento
+
+    Args:
+        feature: Funcionalidad
+        model: Modelo usado
+        started: Instante de inicio (time.perf_counter())
+        outcome: "ok" o "error"
+        usage: Campo `usage` de la respuesta (tokens y, con contabilidad activa, coste)
+    """
+    labels = _route_labels(feature, model)
+    elapsed = time.perf_counter() - started
+    metrics.observe("ai_model_request_seconds", elapsed, labels={**labels, "outcome": outcome})
+    metrics.inc("ai_model_requests_total", labels={**labels, "outcome": outcome})
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            metrics.inc("ai_model_tokens_total", tokens, labels={**labels, "kind": kind})
+    cost = usage.get("cost")
+    if cost:
+        metrics.inc("ai_model_cost_usd_total", float(cost), labels=labels)
+
+
+def record_first_token(feature: Optional[str], model: str, started: float) -> None:
+    metrics.observe("ai_model_first_token_seconds", time.perf_counter() - started,
+                    labels=_route_labels(feature, model))
+
+
+def record_fallback(feature: Optional[str], model: str, error: Exception) -> None:
+    metrics.inc("ai_model_fallbacks_total", labels=_route_labels(feature, model))
+    logger.warning(f"Modelo {model} falló para {feature or 'default'} ({error}); se prueba el siguiente de la ruta")
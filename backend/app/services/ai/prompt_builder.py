@@ -0,0 +1,215 @@
+import json
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.core.ai_config import get_ai_settings
+from app.core.metrics import metrics
+
+try:
+    # Tokenizador exacto si está instalado; si no, se usa la estimación local
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+logger = logging.getLogger(__name__)
+
+# Palabras, signos y saltos de línea o sangrías (que los tokenizadores también cuentan)
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]|\n|\s{2,}", re.UNICODE)
+
+_TRUNCATED = " …[recortado]"
+
+# Campos de texto corto que se agregan como recuento al resumir listas de registros
+_MAX_CATEGORY_VALUES = 12
+
+
+def count_tokens(text: str) -> int:
+    """
+    Cuenta los tokens de un texto sin llamar a la API: con tiktoken si está
+    disponible y, si no, con una estimación por palabras (una palabra larga
+    cuenta como varios tokens) y signos de puntuación
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN_PIECES.findall(text))
+
+
+def compact_json(data: Any) -> str:
+    """
+    JSON sin espacios ni sangría (la sangría de indent=2 puede duplicar los tokens)
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def summarize_records(items: List[Any]) -> Dict[str, Any]:
+    """
+    Resumen de una lista de registros omitidos del prompt: cuántos son y, para
+    los campos categóricos (estado, prioridad...), el recuento de cada valor
+    """
+    summary: Dict[str, Any] = {"omitidos": len(items)}
+    counters: Dict[str, Counter] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for key, value in item.items():
+            if isinstance(value, bool) or (isinstance(value, str) and len(value) <= 32):
+                counters.setdefault(key, Counter())[str(value)] += 1
+    for key, counter in counters.items():
+        # Solo campos con pocos valores distintos (no títulos ni IDs)
+        if 1 < len(counter) <= _MAX_CATEGORY_VALUES or (len(counter) == 1 and len(items) > 1):
+            summary[key] = dict(counter.most_common())
+    return summary
+
+
+def _cap_lists(data: Any, cap: int) -> Any:
+    # Deja como mucho `cap` elementos (los más recientes, al final) en cada lista
+    if isinstance(data, dict):
+        return {key: _cap_lists(value, cap) for key, value in data.items()}
+    if isinstance(data, list):
+        if len(data) <= cap:
+            return [_cap_lists(item, cap) for item in data]
+        kept = [_cap_lists(item, cap) for item in data[len(data) - cap:]] if cap else []
+        return kept + [{"resumen_anteriores": summarize_records(data[:len(data) - cap])}]
+    return data
+
+
+def _longest_list(data: Any) -> int:
+    if isinstance(data, dict):
+        return max((_longest_list(value) for value in data.values()), default=0)
+    if isinstance(data, list):
+        return max([len(data)] + [_longest_list(item) for item in data])
+    return 0
+
+
+def _truncate_text(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    max_tokens -= count_tokens(_TRUNCATED)
+    # Recorte proporcional, ajustado hasta que quepa
+    end = int(len(text) * max(max_tokens, 0) / tokens)
+    while end > 0 and count_tokens(text[:end]) > max_tokens:
+        end = int(end * 0.9)
+    return text[:end] + _TRUNCATED if end > 0 else ""
+
+
+@dataclass
+class PromptSection:
+    title: str
+    content: str
+    priority: int  # Menor número = más importante (se recorta al final)
+    required: bool = False
+    data: Any = None  # Datos JSON originales, para recortar listas en lugar de texto
+    tokens: int = 0
+    trimmed: bool = False
+
+
+class PromptBuilder:
+    """
+    Ensambla el prompt de una funcionalidad dentro de su presupuesto de tokens
+    (AI_PROMPT_TOKEN_BUDGETS). Las secciones JSON se serializan compactas; si el
+    total no cabe, se recortan empezando por las de menor prioridad: las listas
+    conservan los elementos más recientes y el resto se resume con recuentos,
+    y el texto se corta. Las secciones no obligatorias pueden quedar fuera.
+    """
+
+    def __init__(self, feature: str, budget: Optional[int] = None, system_prompt: str = ""):
+        self.feature = feature
+        self.budget = budget or get_ai_settings().AI_PROMPT_TOKEN_BUDGETS.get(
+            feature, get_ai_settings().AI_PROMPT_TOKEN_BUDGETS["default"]
+        )
+        self.system_prompt = system_prompt
+        self.sections: List[PromptSection] = []
+
+    def add_text(self, title: str, text: str, priority: int = 1, required: bool = False) -> "PromptBuilder":
+        self.sections.append(PromptSection(title, text.strip(), priority, required))
+        return self
+
+    def add_json(self, title: str, data: Any, priority: int = 1, required: bool = False) -> "PromptBuilder":
+        self.sections.append(PromptSection(title, compact_json(data), priority, required, data=data))
+        return self
+
+    def _render_section(self, section: PromptSection) -> str:
+        return f"## {section.title}\n{section.content}" if section.title else section.content
+
+    def _fit(self, section: PromptSection, max_tokens: int) -> None:
+        if section.data is not None:
+            # Búsqueda binaria del mayor número de elementos por lista que cabe
+            low, high = 0, _longest_list(section.data)
+            best = None
+            while low <= high:
+                cap = (low + high) // 2
+                content = compact_json(_cap_lists(section.data, cap))
+                if count_tokens(content) <= max_tokens:
+                    best, low = content, cap + 1
+                else:
+                    high = cap - 1
+            section.content = best if best is not None else _truncate_text(section.content, max_tokens)
+        else:
+            section.content = _truncate_text(section.content, max_tokens)
+        section.tokens = count_tokens(self._render_section(section))
+        section.trimmed = True
+
+    def build(self, instruction: str = "") -> str:
+        """
+        Devuelve el contenido del mensaje del usuario ajustado al presupuesto
+
+        Args:
+            instruction: Texto inicial del mensaje (siempre se incluye)
+        """
+        fixed = count_tokens(self.system_prompt) + count_tokens(instruction)
+        for section in self.sections:
+            section.tokens = count_tokens(self._render_section(section))
+        total = fixed + sum(section.tokens for section in self.sections)
+
+        if total > self.budget:
+            # Se recorta por grupos de prioridad, empezando por el menos importante
+            for priority in sorted({section.priority for section in self.sections}, reverse=True):
+                excess = total - self.budget
+                if excess <= 0:
+                    break
+                group = [section for section in self.sections if section.priority == priority]
+                available = sum(section.tokens for section in group) - excess
+                # Reparto equitativo del espacio disponible: las secciones pequeñas
+                # se quedan enteras y el resto se ajusta a partes iguales
+                remaining = len(group)
+                for section in sorted(group, key=lambda s: s.tokens):
+                    share = max(available, 0) // remaining
+                    remaining -= 1
+                    before = section.tokens
+                    if section.tokens > share:
+                        header = count_tokens(self._render_section(PromptSection(section.title, "", 0)))
+                        if share - header <= 0 and not section.required:
+                            section.content = ""
+                            section.tokens = 0
+                            section.trimmed = True
+                        else:
+                            self._fit(section, max(share - header, 1))
+                    available -= section.tokens
+                    total += section.tokens - before
+
+            trimmed = [section.title for section in self.sections if section.trimmed]
+            metrics.inc("ai_prompt_trimmed_total", labels={"feature": self.feature})
+            logger.info(f"Prompt de {self.feature} recortado al presupuesto de {self.budget} tokens: {trimmed}")
+
+        parts = [instruction] if instruction else []
+        parts.extend(self._render_section(section) for section in self.sections if section.content)
+        prompt = "\n\n".join(parts)
+        metrics.observe("ai_prompt_tokens", fixed + sum(s.tokens for s in self.sections), labels={"feature": self.feature})
+        return prompt
+
+    def messages(self, instruction: str = "") -> List[Dict[str, str]]:
+        """
+        Mensajes system + user listos para el payload
+        """
+        content = self.build(instruction)
+        messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        messages.append({"role": "user", "content": content})
+        return messages
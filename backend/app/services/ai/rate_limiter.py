@@ -0,0 +1,192 @@
+import asyncio
+import bisect
+import itertools
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+from app.core.ai_config import get_ai_settings
+from app.core.metrics import metrics
+from app.utils.cache import LRUCache
+from app.utils.rate_limit import AsyncTokenBucket
+
+
+# Cupo por usuario de las funcionalidades sin uno propio en AI_USER_FEATURE_BUDGETS
+_DEFAULT_BUDGET = "default"
+
+
+class Priority(IntEnum):
+    """Carriles de prioridad: un número menor se atiende antes."""
+
+    INTERACTIVE = 0  # Chat y peticiones con un usuario esperando
+    BACKGROUND = 1  # Sugerencias y trabajos en segundo plano
+
+
+class RateLimitExceeded(Exception):
+    """La petición no obtuvo turno: cola llena o espera máxima superada."""
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    user_id: Optional[str] = field(compare=False)
+    budget: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class AIRateLimiter:
+    """
+    Limitador de las llamadas a OpenRouter: un token bucket global
+    (MAX_REQUESTS_PER_MINUTE) y uno por usuario (AI_USER_REQUESTS_PER_MINUTE).
+    Las funcionalidades de AI_USER_FEATURE_BUDGETS tienen un bucket por
+    usuario aparte, pero siguen contando en el global.
+
+    Las peticiones que no pueden salir en el momento esperan en una cola
+    ordenada por prioridad y orden de llegada; un despachador concede cada
+    token global a la primera petición cuyo usuario aún tenga cupo, de modo
+    que un usuario limitado no bloquea a los demás. Cada carril tiene un
+    tamaño máximo de cola y una espera máxima.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        burst: Optional[float] = None,
+        user_requests_per_minute: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        max_wait_seconds: Optional[Dict[str, float]] = None,
+        feature_budgets: Optional[Dict[str, Tuple[float, float]]] = None,
+    ):
+        ai_settings = get_ai_settings()
+        self.global_bucket = AsyncTokenBucket.per_minute(
+            requests_per_minute or ai_settings.MAX_REQUESTS_PER_MINUTE,
+            burst or ai_settings.AI_RATE_LIMIT_BURST
+        )
+        self.user_requests_per_minute = user_requests_per_minute or ai_settings.AI_USER_REQUESTS_PER_MINUTE
+        self.user_burst = ai_settings.AI_USER_RATE_LIMIT_BURST
+        self.feature_budgets = feature_budgets if feature_budgets is not None \
+            else ai_settings.AI_USER_FEATURE_BUDGETS
+        self.max_queue = max_queue or ai_settings.AI_RATE_LIMIT_MAX_QUEUE
+        self.max_wait_seconds = max_wait_seconds or ai_settings.AI_RATE_LIMIT_MAX_WAIT_SECONDS
+        # Buckets por usuario; los inactivos se descartan (un bucket nuevo empieza lleno)
+        self._user_buckets = LRUCache(maxsize=10000, ttl=3600)
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _budget(self, feature: Optional[str]) -> str:
+        return feature if feature in self.feature_budgets else _DEFAULT_BUDGET
+
+    def _user_bucket(self, user_id: Optional[str], budget: str = _DEFAULT_BUDGET) -> Optional[AsyncTokenBucket]:
+        if user_id is None:
+            return None
+        key = (user_id, budget)
+        bucket = self._user_buckets.get(key)
+        if bucket is None:
+            if budget == _DEFAULT_BUDGET:
+                bucket = AsyncTokenBucket.per_minute(self.user_requests_per_minute, self.user_burst)
+            else:
+                bucket = AsyncTokenBucket.per_minute(*self.feature_budgets[budget])
+            self._user_buckets.set(key, bucket)
+        return bucket
+
+    def queue_depth(self, priority: Optional[Priority] = None) -> int:
+        return sum(1 for waiter in self._waiters if priority is None or waiter.priority == priority)
+
+    def _try_grant(self, user_id: Optional[str], budget: str = _DEFAULT_BUDGET) -> bool:
+        # Se consume de los dos buckets solo si ambos tienen token
+        user_bucket = self._user_bucket(user_id, budget)
+        if self.global_bucket.available < 1 or (user_bucket is not None and user_bucket.available < 1):
+            return False
+        self.global_bucket.try_acquire()
+        if user_bucket is not None:
+            user_bucket.try_acquire()
+        return True
+
+    async def acquire(self, user_id: Optional[str] = None, priority: Priority = Priority.INTERACTIVE,
+                      feature: Optional[str] = None) -> float:
+        """
+        Espera turno para una llamada a la API
+
+        Args:
+            user_id: Usuario que origina la llamada (None = solo límite global)
+            priority: Carril de prioridad
+            feature: Funcionalidad que llama; decide el cupo por usuario que se gasta
+
+        Returns:
+            Segundos de espera en cola
+
+        Raises:
+            RateLimitExceeded: Si la cola del carril está llena o se supera la espera máxima
+        """
+        lane = priority.name.lower()
+        user_key = str(user_id) if user_id is not None else None
+        budget = self._budget(feature)
+
+        if not self._waiters and self._try_grant(user_key, budget):
+            metrics.observe("ai_rate_limit_queue_seconds", 0.0, labels={"priority": lane})
+            return 0.0
+
+        if self.queue_depth(priority) >= self.max_queue:
+            metrics.inc("ai_rate_limit_rejected_total", labels={"priority": lane, "reason": "queue_full"})
+            raise RateLimitExceeded("Demasiadas peticiones de IA en cola. Inténtalo de nuevo en unos segundos.")
+
+        waiter = _Waiter(int(priority), next(self._seq), user_key, budget, asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, waiter)
+        metrics.set_gauge("ai_rate_limit_queue_depth", self.queue_depth(priority), labels={"priority": lane})
+        self._ensure_dispatcher()
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait_seconds.get(lane))
+        except asyncio.TimeoutError:
+            # El despachador pudo conceder el turno justo al vencer la espera
+            if not waiter.future.done() or waiter.future.cancelled():
+                metrics.inc("ai_rate_limit_rejected_total", labels={"priority": lane, "reason": "timeout"})
+                raise RateLimitExceeded("El servicio de IA está saturado. Inténtalo de nuevo más tarde.")
+        finally:
+            if not waiter.future.done():
+                waiter.future.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            metrics.set_gauge("ai_rate_limit_queue_depth", self.queue_depth(priority), labels={"priority": lane})
+
+        waited = time.monotonic() - start
+        metrics.observe("ai_rate_limit_queue_seconds", waited, labels={"priority": lane})
+        return waited
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            granted = False
+            if self.global_bucket.available >= 1:
+                for waiter in list(self._waiters):
+                    if waiter.future.done():
+                        self._waiters.remove(waiter)
+                        continue
+                    if self._try_grant(waiter.user_id, waiter.budget):
+                        self._waiters.remove(waiter)
+                        waiter.future.set_result(None)
+                        granted = True
+                        break
+            if granted:
+                continue
+
+            # Esperar al próximo token global o al primer usuario en cola que recupere cupo
+            delay = self.global_bucket.time_until_available()
+            if delay == 0:
+                user_delays = [
+                    self._user_bucket(waiter.user_id, waiter.budget).time_until_available()
+                    for waiter in self._waiters if waiter.user_id is not None
+                ]
+                delay = min(user_delays, default=0.0)
+            await asyncio.sleep(max(delay, 0.005))
+
+
+# Instancia global compartida por todas las llamadas a OpenRouter del proceso
+ai_rate_limiter = AIRateLimiter()
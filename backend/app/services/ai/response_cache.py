@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.ai_config import get_ai_settings
+from app.core.metrics import metrics
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def response_cache_key(payload: Dict[str, Any]) -> str:
+    """
+    Clave de caché de una petición: hash de (modelo, mensajes, temperatura, max_tokens)
+    """
+    material = json.dumps(
+        [payload.get("model"), payload.get("messages"), payload.get("temperature"), payload.get("max_tokens")],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCacheBackend:
+    """Almacén de respuestas; las implementaciones deciden dónde se guardan."""
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def set(self, key: str, feature: str, response: Dict[str, Any], ttl: float) -> None:
+        raise NotImplementedError
+
+
+class MemoryResponseCacheBackend(ResponseCacheBackend):
+    """Caché LRU en memoria del proceso."""
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self._cache = LRUCache(maxsize=maxsize or get_ai_settings().AI_RESPONSE_CACHE_MAX_ENTRIES)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, feature: str, response: Dict[str, Any], ttl: float) -> None:
+        self._cache.set(key, response, ttl)
+
+
+class SqlResponseCacheBackend(ResponseCacheBackend):
+    """
+    Caché compartida por todos los procesos en la tabla `ai_response_cache`
+    (Postgres o SQLite)
+    """
+
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None):
+        self._session_factory = session_factory
+
+    @property
+    def session_factory(self) -> async_sessionmaker:
+        # Se crea bajo demanda para no abrir conexiones al importar el módulo
+        if self._session_factory is None:
+            from app.db.database import get_async_session_factory
+            self._session_factory = get_async_session_factory()
+        return self._session_factory
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        from app.models.ai_cache import AIResponseCacheEntry
+
+        async with self.session_factory() as db:
+            entry = await db.get(AIResponseCacheEntry, key)
+        if entry is None or entry.expires_at <= datetime.utcnow():
+            return None
+        return json.loads(entry.response)
+
+    async def set(self, key: str, feature: str, response: Dict[str, Any], ttl: float) -> None:
+        from app.models.ai_cache import AIResponseCacheEntry
+
+        async with self.session_factory() as db:
+            await db.merge(AIResponseCacheEntry(
+                key=key,
+                feature=feature,
+                response=json.dumps(response),
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+            ))
+            await db.commit()
+
+    async def purge_expired(self) -> int:
+        """
+        Elimina las entradas caducadas
+
+        Returns:
+            Número de entradas eliminadas
+        """
+        from app.models.ai_cache import AIResponseCacheEntry
+
+        async with self.session_factory() as db:
+            result = await db.execute(
+                delete(AIResponseCacheEntry).where(AIResponseCacheEntry.expires_at <= datetime.utcnow())
+            )
+            await db.commit()
+        return result.rowcount or 0
+
+
+class AIResponseCache:
+    """
+    Caché de respuestas de OpenRouter por funcionalidad. Primero se consulta la
+    memoria del proceso y después, si está configurado, el backend compartido
+    (sus aciertos se copian a memoria). Solo se cachean las funcionalidades con
+    TTL en AI_RESPONSE_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self, local: Optional[ResponseCacheBackend] = None,
+                 shared: Optional[ResponseCacheBackend] = None,
+                 ttls: Optional[Dict[str, int]] = None):
+        self.local = local or MemoryResponseCacheBackend()
+        self.shared = shared
+        self.ttls = ttls if ttls is not None else get_ai_settings().AI_RESPONSE_CACHE_TTL_SECONDS
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    def is_cacheable(self, feature: Optional[str]) -> bool:
+        return bool(feature) and self.ttls.get(feature, 0) > 0
+
+    def _record(self, feature: str, hit: bool, tier: str = "local") -> None:
+        counts = self._hits if hit else self._misses
+        counts[feature] = counts.get(feature, 0) + 1
+        if hit:
+            metrics.inc("ai_response_cache_hits_total", labels={"feature": feature, "tier": tier})
+        else:
+            metrics.inc("ai_response_cache_misses_total", labels={"feature": feature})
+        metrics.set_gauge("ai_response_cache_hit_rate", self.hit_rate(feature), labels={"feature": feature})
+
+    def hit_rate(self, feature: str) -> float:
+        hits = self._hits.get(feature, 0)
+        total = hits + self._misses.get(feature, 0)
+        return hits / total if total else 0.0
+
+    async def get(self, feature: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Busca la respuesta cacheada de una petición
+        """
+        key = response_cache_key(payload)
+        response = await self.local.get(key)
+        if response is not None:
+            self._record(feature, True)
+            return response
+
+        if self.shared is not None:
+            try:
+                response = await self.shared.get(key)
+            except Exception as e:
+                # La caché compartida no debe impedir la llamada a la API
+                logger.warning(f"Error leyendo la caché compartida de IA: {str(e)}")
+                response = None
+            if response is not None:
+                await self.local.set(key, feature, response, self.ttls[feature])
+                self._record(feature, True, "shared")
+                return response
+
+        self._record(feature, False)
+        return None
+
+    async def set(self, feature: str, payload: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """
+        Guarda la respuesta de una petición con el TTL de su funcionalidad
+        """
+        key = response_cache_key(payload)
+        ttl = self.ttls[feature]
+        await self.local.set(key, feature, response, ttl)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, feature, response, ttl)
+            except Exception as e:
+                logger.warning(f"Error escribiendo en la caché compartida de IA: {str(e)}")
+
+
+def build_response_cache() -> Optional[AIResponseCache]:
+    """
+    Crea la caché según la configuración (None si está desactivada)
+    """
+    ai_settings = get_ai_settings()
+    if not ai_settings.AI_RESPONSE_CACHE_ENABLED:
+        return None
+    shared = None
+    if ai_settings.AI_RESPONSE_CACHE_SHARED_BACKEND == "sql":
+        shared = SqlResponseCacheBackend()
+    elif ai_settings.AI_RESPONSE_CACHE_SHARED_BACKEND:
+        logger.warning(
+            f"Backend de caché de IA desconocido: {ai_settings.AI_RESPONSE_CACHE_SHARED_BACKEND}. Se usa solo memoria."
+        )
+    return AIResponseCache(shared=shared)
@@ -0,0 +1,135 @@
+import json
+import logging
+from typing import Any, List, Optional
+
+try:
+    # Decodificador JSON más rápido si está instalado; acepta bytes directamente
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+DONE = b"[DONE]"
+
+_FRAME_END = b"\n\n"
+
+
+class SSEParser:
+    """
+    Parser incremental de Server-Sent Events sobre bytes.
+
+    Los trozos leídos de la red se acumulan en un único bytearray y solo se
+    procesan los eventos completos (separados por una línea en blanco), de
+    modo que un `data:` partido entre dos lecturas, o un carácter UTF-8 partido
+    por la mitad, se completa con la lectura siguiente. Las líneas de
+    comentario (`: OPENROUTER PROCESSING`) y los keep-alive se descartan, y los
+    campos distintos de `data` se ignoran.
+    """
+
+    def __init__(self, max_event_bytes: int = 1024 * 1024):
+        self.max_event_bytes = max_event_bytes
+        self._buffer = bytearray()
+        # Posición desde la que buscar el próximo separador (evita reexaminar el buffer)
+        self._scan_from = 0
+        self._pending_cr = False
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        Procesa un trozo leído del stream
+
+        Returns:
+            Contenido `data` de cada evento completado en este trozo
+
+        Raises:
+            ValueError: Si un evento supera `max_event_bytes` sin terminar
+        """
+        if self._pending_cr:
+            chunk = b"\r" + chunk
+            self._pending_cr = False
+        if b"\r" in chunk:
+            # Un \r final puede ser la mitad de un \r\n: se espera a la siguiente lectura
+            if chunk.endswith(b"\r"):
+                chunk = chunk[:-1]
+                self._pending_cr = True
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start = 0
+        while True:
+            end = buffer.find(_FRAME_END, max(start, self._scan_from))
+            if end < 0:
+                break
+            data = _parse_frame(bytes(buffer[start:end]))
+            if data is not None:
+                events.append(data)
+            start = end + 2
+            self._scan_from = start
+
+        if start:
+            del buffer[:start]
+        # El separador puede empezar en el último byte ya examinado
+        self._scan_from = max(0, len(buffer) - 1)
+        if len(buffer) > self.max_event_bytes:
+            self._buffer = bytearray()
+            self._scan_from = 0
+            raise ValueError("Evento SSE demasiado grande")
+        return events
+
+    def flush(self) -> List[bytes]:
+        """
+        Procesa lo que quede en el buffer al cerrarse el stream (último evento
+        sin línea en blanco final)
+        """
+        remaining = bytes(self._buffer)
+        self._buffer = bytearray()
+        self._scan_from = 0
+        self._pending_cr = False
+        data = _parse_frame(remaining.rstrip(b"\r\n")) if remaining.strip() else None
+        return [data] if data is not None else []
+
+
+def _parse_frame(frame: bytes) -> Optional[bytes]:
+    data_lines = []
+    for line in frame.split(b"\n"):
+        # Línea vacía o comentario (keep-alive)
+        if not line or line[0] == 0x3A:
+            continue
+        field, _, value = line.partition(b":")
+        if field != b"data":
+            continue
+        if value[:1] == b" ":
+            value = value[1:]
+        data_lines.append(value)
+    if not data_lines:
+        return None
+    return data_lines[0] if len(data_lines) == 1 else b"\n".join(data_lines)
+
+
+def parse_json(data: bytes) -> Optional[Any]:
+    """
+    Decodifica el `data` de un evento (None si no es JSON válido)
+    """
+    try:
+        return _loads(data)
+    except ValueError:
+        logger.warning(f"Evento de streaming con JSON inválido: {data[:200]!r}")
+        return None
+
+
+def delta_content(chunk: Any) -> Optional[str]:
+    """
+    Extrae el texto incremental de un evento de chat completions ya decodificado
+
+    Returns:
+        Texto del delta, o None si el evento no trae contenido
+    """
+    if not isinstance(chunk, dict):
+        return None
+    choices = chunk.get("choices")
+    if not choices:
+        return None
+    return (choices[0].get("delta") or {}).get("content") or None
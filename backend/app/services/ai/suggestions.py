@@ -0,0 +1,454 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, Any, Optional
+import uuid
+
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+
+from app.core.ai_config import get_ai_settings
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import get_supabase_client
+from app.services.ai.model_router import (
+    ModelRequestError,
+    model_route,
+    record_attempt,
+    record_fallback,
+    route_timeout,
+)
+from app.services.ai.rate_limiter import Priority, RateLimitExceeded, ai_rate_limiter
+from app.services.jobs.queue import PermanentJobError
+
+logger = logging.getLogger(__name__)
+
+class SuggestionType(str, Enum):
+    TASK_IMPROVEMENT = "task_improvement"
+    GOAL_PLANNING = "goal_planning"
+    TIME_ESTIMATION = "time_estimation"
+    PRIORITY_RECOMMENDATION = "priority_recommendation"
+    SUBTASK_GENERATION = "subtask_generation"
+    COMPREHENSIVE = "comprehensive"
+
+_client: Optional[AsyncOpenAI] = None
+_supabase = None
+_slots: Optional[asyncio.Semaphore] = None
+_status_batcher: Optional["SuggestionStatusBatcher"] = None
+
+
+def get_suggestion_client(api_key: str) -> AsyncOpenAI:
+    """
+    Cliente de OpenRouter compartido por todas las sugerencias del proceso
+    (reutiliza su pool de conexiones en lugar de abrir uno por sugerencia)
+    """
+    global _client
+    if _client is None or _client.api_key != api_key:
+        _client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+            # Los reintentos los hacen la ruta de modelos y la cola de trabajos
+            max_retries=0,
+            default_headers={
+                "HTTP-Referer": "https://souldream-ai.com",
+                "X-Title": "SoulDream AI",
+                "OpenRouter-Providers": "Groq,Fireworks"
+            }
+        )
+    return _client
+
+
+async def _complete_with_fallback(client: AsyncOpenAI, prompt: str) -> str:
+    """
+    Pide la sugerencia a los modelos de la ruta "suggestion" en orden: si uno
+    falla (error del proveedor, modelo no disponible, timeout) se prueba el
+    siguiente, como en OpenRouterService._send_request
+
+    Raises:
+        ModelRequestError: Si fallan todos los modelos, o con un error no recuperable
+    """
+    feature = "suggestion"
+    extra_body = {"usage": {"include": True}} if get_ai_settings().AI_USAGE_ACCOUNTING else None
+    models = model_route(feature)
+    for index, model in enumerate(models):
+        started = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                timeout=route_timeout(feature),
+                extra_body=extra_body
+            )
+            if not response.choices or not response.choices[0].message.content:
+                raise ModelRequestError(f"Respuesta vacía de {model}")
+        except (APIStatusError, APIConnectionError, ModelRequestError) as e:
+            error = e if isinstance(e, ModelRequestError) else ModelRequestError(
+                f"Error en OpenRouter API: {str(e)}", getattr(e, "status_code", None)
+            )
+            record_attempt(feature, model, started, "error")
+            if not error.retryable or index == len(models) - 1:
+                raise error
+            record_fallback(feature, model, error)
+            continue
+
+        record_attempt(feature, model, started, "ok", response.usage.model_dump() if response.usage else None)
+        return response.choices[0].message.content
+
+
+def _get_supabase():
+    global _supabase
+    if _supabase is None:
+        _supabase = get_supabase_client()
+    return _supabase
+
+
+def _get_slots() -> asyncio.Semaphore:
+    # Sugerencias que llaman al LLM a la vez en este proceso
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(get_ai_settings().AI_SUGGESTION_MAX_CONCURRENCY)
+    return _slots
+
+
+async def _execute(query):
+    # El cliente de Supabase es síncrono: fuera del event loop para no bloquear las demás sugerencias
+    return await asyncio.to_thread(query.execute)
+
+
+class SuggestionStatusBatcher:
+    """
+    Agrupa el paso a "processing" de las sugerencias que empiezan a la vez en
+    un solo UPDATE ... WHERE id IN (...)
+    """
+
+    def __init__(self, supabase, delay: Optional[float] = None):
+        self.supabase = supabase
+        self.delay = get_ai_settings().AI_SUGGESTION_STATUS_BATCH_SECONDS if delay is None else delay
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def mark_processing(self, suggestion_id: str) -> asyncio.Future:
+        """
+        Encola la marca; el futuro se resuelve cuando está escrita (hay que
+        esperarlo antes de escribir el estado final para no sobrescribirlo)
+        """
+        future = self._pending.get(suggestion_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[suggestion_id] = future
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        return future
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(self.delay)
+        pending, self._pending, self._flush_task = self._pending, {}, None
+        try:
+            await _execute(
+                self.supabase.table("ai_suggestions").update({"status": "processing"}).in_("id", list(pending))
+            )
+            metrics.observe("ai_suggestion_status_batch_size", len(pending))
+        except Exception as e:
+            logger.warning(f"No se pudo marcar {len(pending)} sugerencias como processing: {str(e)}")
+        for future in pending.values():
+            if not future.done():
+                future.set_result(None)
+
+
+def _get_status_batcher(supabase) -> SuggestionStatusBatcher:
+    global _status_batcher
+    if _status_batcher is None or _status_batcher.supabase is not supabase:
+        _status_batcher = SuggestionStatusBatcher(supabase)
+    return _status_batcher
+
+
+async def generate_suggestion_background(
+    suggestion_id: str,
+    entity_type: str,
+    entity_id: str,
+    suggestion_type: str,
+    additional_context: Optional[Dict[str, Any]],
+    user_id: str
+):
+    """
+    Genera una sugerencia de IA en segundo plano
+
+    Raises:
+        PermanentJobError: Si la sugerencia no se puede generar (sin API key,
+            entidad inexistente); queda en "failed"
+        Exception: Cualquier otro error (timeouts, 5xx, limitador); la sugerencia
+            vuelve a "pending" y la cola reintenta el trabajo
+    """
+    supabase = _get_supabase()
+    suggestions = supabase.table("ai_suggestions")
+    processing = None
+    
+    async def fail(content: str) -> None:
+        await _execute(suggestions.update({"status": "failed", "content": content}).eq("id", suggestion_id))
+    
+    try:
+        # Verificar si tenemos la API key disponible
+        api_key = os.getenv("OPENROUTER_API_KEY", settings.OPENROUTER_API_KEY)
+        if not api_key:
+            logger.error("API key not available, cannot generate suggestion")
+            await fail("El servicio de IA no está disponible en este momento. Por favor, intente más tarde.")
+            raise PermanentJobError("OpenRouter API key no configurada")
+        
+        # Obtener la entidad (si no existe, la sugerencia pasa directamente a "failed")
+        if entity_type == "task":
+            task_response = await _execute(supabase.table("tasks").select("*").eq("id", entity_id))
+            if not task_response.data:
+                logger.error(f"Task {entity_id} not found")
+                await fail("Task not found")
+                raise PermanentJobError(f"Task {entity_id} not found")
+            
+            entity = task_response.data[0]
+            prompt = generate_task_prompt(entity, suggestion_type, additional_context)
+        elif entity_type == "goal":
+            goal_response = await _execute(supabase.table("goals").select("*").eq("id", entity_id))
+            if not goal_response.data:
+                logger.error(f"Goal {entity_id} not found")
+                await fail("Goal not found")
+                raise PermanentJobError(f"Goal {entity_id} not found")
+            
+            entity = goal_response.data[0]
+            prompt = generate_goal_prompt(entity, suggestion_type, additional_context)
+        else:
+            await fail("Unsupported entity type")
+            raise PermanentJobError(f"Unsupported entity type: {entity_type}")
+        
+        # La marca "processing" se escribe agrupada con las de otras sugerencias,
+        # mientras esta espera su turno y la respuesta del LLM
+        processing = _get_status_batcher(supabase).mark_processing(suggestion_id)
+        
+        async with _get_slots():
+            # Las sugerencias van por el carril de baja prioridad: el chat interactivo pasa antes
+            await ai_rate_limiter.acquire(user_id, Priority.BACKGROUND)
+            
+            started = time.perf_counter()
+            try:
+                content = await _complete_with_fallback(get_suggestion_client(api_key), prompt)
+            except ModelRequestError as e:
+                if e.retryable:
+                    raise
+                # API key inválida o sin crédito: reintentar no cambiaría nada
+                await processing
+                await fail("El servicio de IA no está disponible en este momento. Por favor, intente más tarde.")
+                raise PermanentJobError(str(e))
+            metrics.observe("ai_suggestion_llm_seconds", time.perf_counter() - started)
+        
+        # Actualizar la sugerencia con la respuesta
+        await processing
+        await _execute(suggestions.update({
+            "content": content,
+            "status": "completed",
+            "completed_at": datetime.utcnow().isoformat()
+        }).eq("id", suggestion_id))
+        
+        # Si es generación de subtareas, intentar parsear y crear las subtareas
+        if suggestion_type == SuggestionType.SUBTASK_GENERATION and entity_type == "task":
+            try:
+                await asyncio.to_thread(create_subtasks_from_suggestion, content, entity_id, user_id, supabase)
+            except Exception as e:
+                logger.error(f"Error creating subtasks: {str(e)}")
+        
+        # Si es planificación de metas, intentar parsear y crear los pasos
+        if suggestion_type == SuggestionType.GOAL_PLANNING and entity_type == "goal":
+            try:
+                await asyncio.to_thread(create_goal_steps_from_suggestion, content, entity_id, user_id, supabase)
+            except Exception as e:
+                logger.error(f"Error creating goal steps: {str(e)}")
+        
+    except PermanentJobError:
+        raise
+    except Exception as e:
+        # Errores transitorios (limitador, timeouts, 5xx): la cola de trabajos lo
+        # reintentará más tarde; "failed" solo cuando se agoten los intentos
+        if not isinstance(e, RateLimitExceeded):
+            logger.error(f"Error generating suggestion: {str(e)}")
+        if processing is not None:
+            await processing
+        await _execute(suggestions.update({"status": "pending"}).eq("id", suggestion_id))
+        raise
+
+
+async def mark_suggestion_failed(suggestion_id: str, error: Exception) -> None:
+    """
+    Deja la sugerencia en "failed" cuando la cola ya no va a reintentarla
+    """
+    await _execute(_get_supabase().table("ai_suggestions").update({
+        "status": "failed",
+        "content": f"Error: {str(error)}"
+    }).eq("id", suggestion_id))
+
+def generate_task_prompt(task: Dict[str, Any], suggestion_type: str, additional_context: Optional[Dict[str, Any]]) -> str:
+    """Genera un prompt para una tarea basado en el tipo de sugerencia"""
+    base_prompt = f"""
+    Analiza esta tarea y proporciona sugerencias útiles:
+    
+    Título: {task.get('title', 'No disponible')}
+    Descripción: {task.get('description', 'No hay descripción')}
+    Prioridad: {task.get('priority', 'No especificada')}
+    Fecha límite: {task.get('due_date', 'No especificada')}
+    Tiempo estimado: {task.get('estimated_hours', 'No especificado')} horas
+    """
+    
+    if additional_context:
+        base_prompt += f"\nContexto adicional: {json.dumps(additional_context, ensure_ascii=False)}\n"
+    
+    if suggestion_type == SuggestionType.TASK_IMPROVEMENT:
+        base_prompt += """
+        Por favor, proporciona sugerencias para mejorar esta tarea:
+        1. Cómo hacer la descripción más clara y accionable
+        2. Posibles obstáculos y cómo superarlos
+        3. Recursos que podrían ser útiles
+        """
+    elif suggestion_type == SuggestionType.TIME_ESTIMATION:
+        base_prompt += """
+        Por favor, proporciona una estimación de tiempo detallada:
+        1. Tiempo mínimo, promedio y máximo necesario
+        2. Factores que podrían afectar la duración
+        3. Sugerencias para completar la tarea más eficientemente
+        """
+    elif suggestion_type == SuggestionType.PRIORITY_RECOMMENDATION:
+        base_prompt += """
+        Por favor, analiza la prioridad de esta tarea:
+        1. ¿Es adecuada la prioridad actual?
+        2. Factores a considerar para priorizar
+        3. Impacto de esta tarea en otras responsabilidades
+        """
+    elif suggestion_type == SuggestionType.SUBTASK_GENERATION:
+        base_prompt += """
+        Por favor, divide esta tarea en subtareas accionables:
+        1. Lista de 3-7 subtareas específicas
+        2. Orden lógico de ejecución
+        3. Dependencias entre subtareas
+        
+        Formato JSON:
+        ```json
+        [
+          {
+            "title": "Título de la subtarea 1",
+            "description": "Descripción detallada",
+            "estimated_hours": 1.5
+          },
+          ...
+        ]
+        ```
+        """
+    else:  # Comprehensive
+        base_prompt += """
+        Por favor, proporciona un análisis completo:
+        1. Posibles subtareas (3-5)
+        2. Sugerencias de mejora
+        3. Estimación de tiempo realista
+        4. Prioridad recomendada
+        5. Recursos útiles
+        """
+    
+    return base_prompt
+
+def generate_goal_prompt(goal: Dict[str, Any], suggestion_type: str, additional_context: Optional[Dict[str, Any]]) -> str:
+    """Genera un prompt para una meta basado en el tipo de sugerencia"""
+    base_prompt = f"""
+    Analiza esta meta y proporciona sugerencias útiles:
+    
+    Título: {goal.get('title', 'No disponible')}
+    Descripción: {goal.get('description', 'No hay descripción')}
+    Área: {goal.get('area', 'No especificada')}
+    Tipo: {goal.get('type', 'No especificado')}
+    Fecha objetivo: {goal.get('target_date', 'No especificada')}
+    Prioridad: {goal.get('priority', 'No especificada')}
+    """
+    
+    if additional_context:
+        base_prompt += f"\nContexto adicional: {json.dumps(additional_context, ensure_ascii=False)}\n"
+    
+    if suggestion_type == SuggestionType.GOAL_PLANNING:
+        base_prompt += """
+        Por favor, crea un plan detallado para alcanzar esta meta:
+        1. Lista de 5-8 pasos específicos y accionables
+        2. Orden lógico de ejecución
+        3. Tiempo estimado para cada paso
+        
+        Formato JSON:
+        ```json
+        [
+          {
+            "title": "Título del paso 1",
+            "description": "Descripción detallada",
+            "estimated_days": 7
+          },
+          ...
+        ]
+        ```
+        """
+    else:  # Comprehensive
+        base_prompt += """
+        Por favor, proporciona un análisis completo:
+        1. Evaluación de la claridad y especificidad de la meta
+        2. Posibles obstáculos y cómo superarlos
+        3. Recursos y habilidades necesarios
+        4. Pasos recomendados (3-5)
+        5. Métricas para medir el progreso
+        """
+    
+    return base_prompt
+
+def create_subtasks_from_suggestion(suggestion_content: str, parent_task_id: str, user_id: str, supabase):
+    """Crea subtareas a partir del contenido de una sugerencia"""
+    # Extraer el JSON de la respuesta
+    json_str = suggestion_content.split("```json")[1].split("```")[0].strip()
+    subtasks_data = json.loads(json_str)
+    
+    subtasks = []
+    for i, subtask_data in enumerate(subtasks_data):
+        subtasks.append({
+            "id": str(uuid.uuid4()),
+            "title": subtask_data["title"],
+            "description": subtask_data.get("description", ""),
+            "status": "TODO",
+            "priority": "MEDIUM",
+            "estimated_hours": subtask_data.get("estimated_hours"),
+            "parent_task_id": parent_task_id,
+            "user_id": user_id,
+            "order_index": i,
+            "created_at": datetime.now().isoformat()
+        })
+    
+    # Una sola inserción de varias filas
+    if subtasks:
+        supabase.table("tasks").insert(subtasks).execute()
+
+def create_goal_steps_from_suggestion(suggestion_content: str, goal_id: str, user_id: str, supabase):
+    """Crea pasos de meta a partir del contenido de una sugerencia"""
+    # Extraer el JSON de la respuesta
+    json_str = suggestion_content.split("```json")[1].split("```")[0].strip()
+    steps_data = json.loads(json_str)
+    
+    steps = []
+    for i, step_data in enumerate(steps_data):
+        # Calcular fecha estimada basada en días estimados
+        due_date = None
+        if "estimated_days" in step_data:
+            due_date = (datetime.utcnow() + timedelta(days=step_data["estimated_days"])).isoformat()
+        
+        steps.append({
+            "id": str(uuid.uuid4()),
+            "goal_id": goal_id,
+            "title": step_data["title"],
+            "description": step_data.get("description", ""),
+            "order_index": i,
+            "status": "pending",
+            "due_date": due_date,
+            "ai_generated": True,
+            "created_at": datetime.now().isoformat()
+        })
+    
+    # Una sola inserción de varias filas
+    if steps:
+        supabase.table("goal_steps").insert(steps).execute()
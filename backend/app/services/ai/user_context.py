@@ -0,0 +1,372 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.ai_config import get_ai_settings
+from app.core.metrics import metrics
+from app.services.ai.ai_service import openrouter_service
+from app.services.ai.prompt_builder import compact_json
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Fuentes del contexto; cada escritura invalida solo la suya
+SOURCE_TASKS = "tasks"
+SOURCE_HABITS = "habits"  # hábitos y sus registros (habit_logs)
+SOURCE_GOALS = "goals"
+SOURCE_FINANCE = "finance"  # transacciones y metas financieras
+SOURCES = (SOURCE_TASKS, SOURCE_HABITS, SOURCE_GOALS, SOURCE_FINANCE)
+
+TASK_CONTEXT_FIELDS = "title,status,priority,due_date,created_at,updated_at"
+HABIT_CONTEXT_FIELDS = "id,title,frequency,specific_days,category,current_streak,best_streak,created_at"
+GOAL_CONTEXT_FIELDS = "title,status,type,area,priority,progress_percentage,target_date,updated_at"
+TRANSACTION_CONTEXT_FIELDS = "type,amount,category,date"
+FINANCE_GOAL_CONTEXT_FIELDS = "name,target_amount,current_amount,deadline,category"
+
+
+@dataclass
+class ContextSection:
+    """Datos de una fuente: registros compactos para el prompt y su análisis."""
+
+    records: List[Dict[str, Any]]
+    analysis: Dict[str, Any]
+    built_at: float
+    digest: str = ""
+
+    def __post_init__(self):
+        if not self.digest:
+            self.digest = hashlib.sha256(
+                compact_json({"records": self.records, "analysis": self.analysis}).encode("utf-8")
+            ).hexdigest()
+
+
+@dataclass
+class UserContextSnapshot:
+    """
+    Contexto precalculado de un usuario para los endpoints de planificación.
+    El `context_id` depende solo del contenido: mientras no cambien los datos,
+    el prompt (y su entrada en la caché de respuestas) es el mismo.
+    """
+
+    user_id: str
+    sections: Dict[str, ContextSection]
+    built_at: float = field(default_factory=time.time)
+
+    @property
+    def context_id(self) -> str:
+        state = "|".join(f"{name}:{self.sections[name].digest}" for name in sorted(self.sections))
+        return hashlib.sha256(f"{self.user_id}|{state}".encode("utf-8")).hexdigest()[:24]
+
+    def analyses(self) -> Dict[str, Any]:
+        """
+        Análisis ya calculados, con los nombres que usa generate_personalized_plan
+        """
+        return {
+            "completion_patterns": self.sections[SOURCE_TASKS].analysis,
+            "habit_consistency": self.sections[SOURCE_HABITS].analysis,
+            "success_factors": self.sections[SOURCE_GOALS].analysis,
+        }
+
+    def to_user_data(self) -> Dict[str, Any]:
+        """
+        Datos del usuario en el formato de `user_data` de los endpoints de IA:
+        por fuente, su análisis y los registros más recientes
+        """
+        return {
+            name: {"analysis": section.analysis, "records": section.records}
+            for name, section in self.sections.items()
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "context_id": self.context_id,
+            "built_at": datetime.fromtimestamp(self.built_at, timezone.utc),
+            "sections": {
+                name: {
+                    "records": len(section.records),
+                    "built_at": datetime.fromtimestamp(section.built_at, timezone.utc),
+                    "analysis": section.analysis,
+                }
+                for name, section in self.sections.items()
+            },
+        }
+
+
+# Último contexto de cada usuario; las escrituras marcan sus fuentes como
+# pendientes y el TTL cubre los cambios hechos desde otros procesos
+_contexts = LRUCache(
+    maxsize=get_ai_settings().AI_USER_CONTEXT_CACHE_SIZE,
+    ttl=get_ai_settings().AI_USER_CONTEXT_TTL_SECONDS,
+    name="ai_user_context"
+)
+# Contextos por "usuario:context_id", para resolver el ID que devolvió GET /ai/context
+_contexts_by_id = LRUCache(
+    maxsize=get_ai_settings().AI_USER_CONTEXT_CACHE_SIZE * 2,
+    ttl=get_ai_settings().AI_USER_CONTEXT_TTL_SECONDS,
+)
+# Fuentes que han cambiado desde que se construyó el contexto cacheado
+_dirty_sources: Dict[str, Set[str]] = {}
+# Generación por usuario: un contexto construido durante una invalidación no se cachea
+_generations: Dict[str, int] = {}
+
+
+def invalidate_user_context(user_id: Any, *sources: str) -> None:
+    """
+    Marca como desactualizadas las fuentes indicadas (todas si no se indica
+    ninguna). El siguiente acceso solo vuelve a leer y analizar esas fuentes.
+    """
+    user_key = str(user_id)
+    _dirty_sources.setdefault(user_key, set()).update(sources or SOURCES)
+    _generations[user_key] = _generations.get(user_key, 0) + 1
+
+
+def _since(days: int) -> date:
+    return datetime.now(timezone.utc).date() - timedelta(days=days)
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).date()
+    except ValueError:
+        try:
+            return date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return None
+
+
+def _expected_periods(habit: Dict[str, Any], start: date, today: date) -> List[tuple]:
+    # Periodos en los que el hábito debía cumplirse: días (diario o días
+    # concretos, 0 = lunes), semanas ISO o meses
+    frequency = habit.get("frequency") or "daily"
+    specific_days = habit.get("specific_days") or []
+    days = [start + timedelta(days=offset) for offset in range((today - start).days + 1)]
+    if specific_days and frequency in ("weekly", "custom"):
+        return [("day", day) for day in days if day.weekday() in specific_days]
+    if frequency == "weekly":
+        return sorted({("week", day.isocalendar()[:2]) for day in days})
+    if frequency == "monthly":
+        return sorted({("month", (day.year, day.month)) for day in days})
+    return [("day", day) for day in days]
+
+
+def _period_of(kind: str, day: date) -> tuple:
+    if kind == "week":
+        return ("week", day.isocalendar()[:2])
+    if kind == "month":
+        return ("month", (day.year, day.month))
+    return ("day", day)
+
+
+def habit_history(habits: List[Dict[str, Any]], logs: List[Dict[str, Any]],
+                  since: date, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Historial de hábitos en el formato de `_analyze_habit_consistency`: un
+    registro por periodo esperado, completado si hay algún log en él
+    """
+    today = today or datetime.now(timezone.utc).date()
+    logged: Dict[str, Set[date]] = {}
+    for log in logs:
+        day = _parse_date(log.get("completed_date"))
+        if day is not None:
+            logged.setdefault(str(log.get("habit_id")), set()).add(day)
+
+    history = []
+    for habit in habits:
+        habit_id = str(habit.get("id"))
+        created = _parse_date(habit.get("created_at")) or since
+        periods = _expected_periods(habit, max(since, created), today)
+        done = {_period_of(periods[0][0], day) for day in logged.get(habit_id, ())} if periods else set()
+        history.extend(
+            {
+                "habit_id": habit_id,
+                "habit_name": habit.get("title"),
+                "completed": period in done,
+                "current_streak": habit.get("current_streak", 0),
+                "best_streak": habit.get("best_streak", 0),
+            }
+            for period in periods
+        )
+    return history
+
+
+def analyze_finance(transactions: List[Dict[str, Any]], goals: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Resumen financiero del periodo: ingresos, gastos, ahorro y progreso de metas
+    """
+    if not transactions and not goals:
+        return {"no_data": True}
+    income = sum(float(t.get("amount") or 0) for t in transactions if t.get("type") == "income")
+    expenses = sum(float(t.get("amount") or 0) for t in transactions if t.get("type") == "expense")
+    by_category: Dict[str, float] = {}
+    for transaction in transactions:
+        if transaction.get("type") == "expense":
+            category = transaction.get("category") or "other"
+            by_category[category] = by_category.get(category, 0) + float(transaction.get("amount") or 0)
+    top_categories = sorted(by_category.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        "income": round(income, 2),
+        "expenses": round(expenses, 2),
+        "savings_rate": round((income - expenses) / income, 3) if income > 0 else None,
+        "top_expense_categories": {category: round(amount, 2) for category, amount in top_categories},
+        "goals": [
+            {
+                "name": goal.get("name"),
+                "progress": round(float(goal.get("current_amount") or 0) / float(goal["target_amount"]), 3)
+                if goal.get("target_amount") else None,
+                "deadline": goal.get("deadline"),
+            }
+            for goal in goals
+        ],
+    }
+
+
+class UserContextLoader:
+    """
+    Lee y analiza cada fuente del contexto desde Supabase (con el cliente de
+    servicio, como el resto de tareas internas)
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            from app.db.database import get_supabase_admin_client
+            client = get_supabase_admin_client()
+        self.client = client
+        ai_settings = get_ai_settings()
+        self.since = _since(ai_settings.AI_USER_CONTEXT_HISTORY_DAYS)
+        self.max_records = ai_settings.AI_USER_CONTEXT_MAX_RECORDS
+
+    async def _select(self, build_query) -> List[Dict[str, Any]]:
+        response = await asyncio.to_thread(lambda: build_query(self.client).execute())
+        return response.data or []
+
+    async def load(self, user_id: str, source: str) -> ContextSection:
+        started = time.perf_counter()
+        section = await getattr(self, f"_load_{source}")(user_id)
+        metrics.observe("ai_user_context_build_seconds", time.perf_counter() - started, labels={"source": source})
+        return section
+
+    async def _load_tasks(self, user_id: str) -> ContextSection:
+        tasks = await self._select(
+            lambda client: client.table("tasks").select(TASK_CONTEXT_FIELDS)
+            .eq("user_id", user_id)
+            .eq("is_deleted", False)
+            .gte("updated_at", self.since.isoformat())
+            .order("updated_at", desc=True)
+        )
+        history = []
+        for task in tasks:
+            item = {"completed": task.get("status") == "completed"}
+            # El análisis solo agrupa por día las tareas con fecha límite
+            if task.get("due_date"):
+                item["due_date"] = str(task["due_date"])
+            history.append(item)
+        records = [
+            {key: task.get(key) for key in ("title", "status", "priority", "due_date")}
+            for task in reversed(tasks[:self.max_records])
+        ]
+        return ContextSection(records, openrouter_service._analyze_completion_patterns(history), time.time())
+
+    async def _load_habits(self, user_id: str) -> ContextSection:
+        habits = await self._select(
+            lambda client: client.table("habits").select(HABIT_CONTEXT_FIELDS)
+            .eq("user_id", user_id)
+            .eq("is_active", True)
+        )
+        logs = []
+        if habits:
+            logs = await self._select(
+                lambda client: client.table("habit_logs").select("habit_id,completed_date")
+                .in_("habit_id", [habit["id"] for habit in habits])
+                .gte("completed_date", self.since.isoformat())
+            )
+        analysis = openrouter_service._analyze_habit_consistency(habit_history(habits, logs, self.since))
+        records = [
+            {key: habit.get(key) for key in ("title", "frequency", "category", "current_streak", "best_streak")}
+            for habit in habits[:self.max_records]
+        ]
+        return ContextSection(records, analysis, time.time())
+
+    async def _load_goals(self, user_id: str) -> ContextSection:
+        try:
+            goals = await self._select(
+                lambda client: client.table("goals").select(GOAL_CONTEXT_FIELDS)
+                .eq("user_id", user_id)
+                .order("updated_at", desc=True)
+            )
+        except Exception as e:
+            # Las metas aún no se guardan en todas las instalaciones
+            logger.warning(f"No se pudieron leer las metas del usuario {user_id}: {str(e)}")
+            goals = []
+        records = [
+            {key: goal.get(key) for key in ("title", "status", "type", "area", "progress_percentage", "target_date")}
+            for goal in reversed(goals[:self.max_records])
+        ]
+        return ContextSection(records, openrouter_service._analyze_goal_success_factors(goals), time.time())
+
+    async def _load_finance(self, user_id: str) -> ContextSection:
+        transactions, goals = await asyncio.gather(
+            self._select(
+                lambda client: client.table("transactions").select(TRANSACTION_CONTEXT_FIELDS)
+                .eq("user_id", user_id)
+                .gte("date", self.since.isoformat())
+                .order("date", desc=True)
+            ),
+            self._select(
+                lambda client: client.table("finance_goals").select(FINANCE_GOAL_CONTEXT_FIELDS)
+                .eq("user_id", user_id)
+            ),
+        )
+        records = list(reversed(transactions[:self.max_records]))
+        return ContextSection(records, analyze_finance(transactions, goals), time.time())
+
+
+async def get_user_context(user_id: Any, refresh: bool = False, loader: Optional[UserContextLoader] = None
+                           ) -> UserContextSnapshot:
+    """
+    Contexto actual del usuario. Si está en caché, solo se reconstruyen las
+    fuentes marcadas por `invalidate_user_context`; el resto se reutiliza.
+
+    Args:
+        user_id: Usuario
+        refresh: Reconstruir todas las fuentes
+        loader: Lector de fuentes (por defecto, Supabase)
+    """
+    user_key = str(user_id)
+    cached: Optional[UserContextSnapshot] = None if refresh else _contexts.get(user_key)
+    dirty = set(_dirty_sources.get(user_key, ())) if cached is not None else set(SOURCES)
+    if cached is not None and not dirty:
+        return cached
+
+    generation = _generations.get(user_key, 0)
+    loader = loader or UserContextLoader()
+    rebuilt = await asyncio.gather(*(loader.load(user_key, source) for source in sorted(dirty)))
+    sections = dict(cached.sections) if cached is not None else {}
+    sections.update(zip(sorted(dirty), rebuilt))
+    snapshot = UserContextSnapshot(user_key, sections)
+
+    metrics.inc("ai_user_context_builds_total", labels={"kind": "partial" if cached is not None else "full"})
+    # Si hubo escrituras mientras se leía, el contexto se devuelve pero sigue pendiente
+    if _generations.get(user_key, 0) == generation:
+        _dirty_sources.pop(user_key, None)
+        _contexts.set(user_key, snapshot)
+    _contexts_by_id.set(f"{user_key}:{snapshot.context_id}", snapshot)
+    return snapshot
+
+
+async def resolve_user_context(user_id: Any, context_id: Optional[str] = None) -> UserContextSnapshot:
+    """
+    Contexto referenciado por `context_id` (el que vio el cliente); si ya no
+    está en memoria o no se indica, el contexto actual
+    """
+    if context_id:
+        snapshot = _contexts_by_id.get(f"{user_id}:{context_id}")
+        if snapshot is not None:
+            return snapshot
+        logger.info(f"Contexto {context_id} no disponible para el usuario {user_id}; se usa el actual")
+    return await get_user_context(user_id)
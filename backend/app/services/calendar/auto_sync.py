@@ -0,0 +1,561 @@
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import signal
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.calendar import CalendarEvent
+from app.schemas.calendar import CalendarSyncResponse
+from app.services.calendar.sync_guard import SyncInProgressError, user_sync_lock
+from app.services.calendar.sync_service import CalendarSyncService
+from app.services.calendar.watch import users_with_active_channel
+from app.utils.rate_limit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CALENDAR_PROVIDER = "google_calendar"
+
+# Marcadores con los que Google (y el fake) informan de cuota agotada
+_QUOTA_ERROR_MARKERS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "HttpError 429")
+
+
+@dataclass
+class SyncCandidate:
+    """Usuario con integración de Google Calendar candidato a sincronizarse."""
+
+    user_id: str
+    credentials: Optional[str] = None
+    last_synced_at: Optional[datetime] = None
+    last_active_at: Optional[datetime] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    # Tiene un canal de notificaciones push vigente: Google avisa de los cambios
+    push_enabled: bool = False
+
+    def is_active(self, now: datetime, active_window: timedelta) -> bool:
+        return self.last_active_at is not None and now - self.last_active_at <= active_window
+
+    def staleness(self, now: datetime, interval: timedelta) -> float:
+        """
+        Antigüedad de la última sincronización relativa a su intervalo
+        (>= 1 significa que ya le toca; nunca sincronizado = infinito)
+        """
+        if self.last_synced_at is None:
+            return float("inf")
+        return (now - self.last_synced_at).total_seconds() / max(interval.total_seconds(), 1.0)
+
+
+SyncRunner = Callable[[SyncCandidate, Optional[AsyncTokenBucket]], Awaitable[CalendarSyncResponse]]
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    # El resto del módulo de calendario trabaja con UTC sin zona
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def is_quota_error(result: CalendarSyncResponse) -> bool:
+    """
+    Indica si la sincronización falló (total o parcialmente) por cuota de Google
+    """
+    messages = list(result.errors or []) + [result.message or ""]
+    return any(marker in message for message in messages for marker in _QUOTA_ERROR_MARKERS)
+
+
+class SupabaseIntegrationSource:
+    """
+    Origen de candidatos: filas de `user_integrations` con proveedor Google Calendar.
+    La actividad se deduce de la última modificación local de eventos.
+    """
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from app.db.database import get_supabase_admin_client
+            self._client = get_supabase_admin_client()
+        return self._client
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.db.database import get_async_session_factory
+            self._session_factory = get_async_session_factory()
+        return self._session_factory
+
+    async def load_candidates(self) -> List[SyncCandidate]:
+        response = await asyncio.to_thread(
+            lambda: self.client.table("user_integrations")
+            .select("user_id, credentials, metadata")
+            .eq("provider", GOOGLE_CALENDAR_PROVIDER)
+            .execute()
+        )
+
+        candidates = []
+        for row in response.data or []:
+            metadata = row.get("metadata") or {}
+            credentials = row.get("credentials")
+            candidates.append(SyncCandidate(
+                user_id=str(row["user_id"]),
+                credentials=json.dumps(credentials) if isinstance(credentials, dict) else credentials,
+                last_synced_at=_parse_timestamp(metadata.get("last_auto_sync_at")),
+                metadata=metadata,
+            ))
+
+        if candidates:
+            user_ids = [c.user_id for c in candidates]
+            activity = await self._load_activity(user_ids)
+            push_enabled = await self._load_push_enabled(user_ids)
+            for candidate in candidates:
+                candidate.last_active_at = activity.get(candidate.user_id)
+                candidate.push_enabled = candidate.user_id in push_enabled
+        return candidates
+
+    async def _load_push_enabled(self, user_ids: List[str]) -> Set[str]:
+        try:
+            return await users_with_active_channel(self.session_factory, user_ids)
+        except Exception as e:
+            logger.warning(f"No se pudieron cargar los canales de notificaciones: {str(e)}")
+            return set()
+
+    async def _load_activity(self, user_ids: List[str]) -> Dict[str, datetime]:
+        # Última modificación de eventos locales por usuario, en una sola consulta
+        stmt = select(CalendarEvent.user_id, func.max(CalendarEvent.updated_at)).where(
+            CalendarEvent.user_id.in_([UUID(user_id) for user_id in user_ids])
+        ).group_by(CalendarEvent.user_id)
+        try:
+            async with self.session_factory() as db:
+                result = await db.execute(stmt)
+                return {str(user_id): updated_at for user_id, updated_at in result.all()}
+        except Exception as e:
+            logger.warning(f"No se pudo calcular la actividad de los usuarios: {str(e)}")
+            return {}
+
+    async def record_sync(self, candidate: SyncCandidate, result: CalendarSyncResponse,
+                          started_at: datetime, completed_at: datetime) -> None:
+        status = "failed" if not result.success else ("partial" if result.errors else "success")
+        log_row = {
+            "user_id": candidate.user_id,
+            "sync_type": "auto",
+            "status": status,
+            "started_at": started_at.isoformat(),
+            "completed_at": completed_at.isoformat(),
+            "events_created": result.events_created,
+            "events_updated": result.events_updated,
+            "events_deleted": result.events_deleted,
+            "error_message": None if status == "success" else result.message,
+            "error_details": {"errors": result.errors} if result.errors else None,
+        }
+
+        def _write():
+            self.client.table("calendar_sync_logs").insert(log_row).execute()
+            if status != "failed" and not is_quota_error(result):
+                metadata = {**candidate.metadata, "last_auto_sync_at": completed_at.isoformat()}
+                self.client.table("user_integrations").update({"metadata": metadata}).eq(
+                    "user_id", candidate.user_id
+                ).eq("provider", GOOGLE_CALENDAR_PROVIDER).execute()
+                candidate.metadata = metadata
+
+        await asyncio.to_thread(_write)
+
+
+class CalendarSyncRunner:
+    """Ejecuta la sincronización de un candidato con CalendarSyncService."""
+
+    def __init__(self, session_factory=None, google_service_factory: Optional[Callable[[SyncCandidate], Any]] = None,
+                 past_days: Optional[int] = None, future_days: Optional[int] = None):
+        self._session_factory = session_factory
+        self.google_service_factory = google_service_factory or self._default_google_service
+        self.past_days = past_days if past_days is not None else settings.AUTO_SYNC_WINDOW_PAST_DAYS
+        self.future_days = future_days if future_days is not None else settings.AUTO_SYNC_WINDOW_FUTURE_DAYS
+
+    @staticmethod
+    def _default_google_service(candidate: SyncCandidate):
+        from app.services.calendar.google_calendar import GoogleCalendarService
+        return GoogleCalendarService(candidate.credentials)
+
+    async def __call__(self, candidate: SyncCandidate,
+                       rate_limiter: Optional[AsyncTokenBucket]) -> CalendarSyncResponse:
+        if self._session_factory is None:
+            from app.db.database import get_async_session_factory
+            self._session_factory = get_async_session_factory()
+
+        # Excluye las sincronizaciones del mismo usuario en los workers de la cola
+        async with user_sync_lock(candidate.user_id):
+            google_service = await asyncio.to_thread(self.google_service_factory, candidate)
+            now = datetime.utcnow()
+            async with self._session_factory() as db:
+                sync_service = CalendarSyncService(
+                    db, google_service, UUID(candidate.user_id),
+                    rate_limiter=rate_limiter, session_factory=self._session_factory
+                )
+                return await sync_service.sync_events(
+                    now - timedelta(days=self.past_days),
+                    now + timedelta(days=self.future_days),
+                    "bidirectional"
+                )
+
+
+class AutoSyncOrchestrator:
+    """
+    Planifica las sincronizaciones automáticas de todos los usuarios.
+
+    Cada pasada ordena a los usuarios pendientes por antigüedad de su última
+    sincronización relativa a su intervalo (más corto si han tenido actividad
+    reciente) y los reparte en un pool de workers asíncronos. Todas las llamadas
+    a Google del orquestador comparten un token bucket con AUTO_SYNC_QUOTA_UTILIZATION
+    de la cuota del proyecto; el resto es para los workers de la cola (ver
+    sync_guard.job_quota_limiter). Cada usuario tiene como mucho una sincronización
+    en curso, también frente a los workers (user_sync_lock).
+    """
+
+    def __init__(
+        self,
+        source,
+        sync_runner: SyncRunner,
+        rate_limiter: Optional[AsyncTokenBucket] = None,
+        concurrency: Optional[int] = None,
+        scan_interval: Optional[float] = None,
+        active_interval: Optional[timedelta] = None,
+        idle_interval: Optional[timedelta] = None,
+        active_window: Optional[timedelta] = None,
+        quota_backoff: Optional[float] = None,
+    ):
+        self.source = source
+        self.sync_runner = sync_runner
+        self.rate_limiter = rate_limiter or AsyncTokenBucket.per_minute(
+            settings.GOOGLE_CALENDAR_QUOTA_PER_MINUTE * settings.AUTO_SYNC_QUOTA_UTILIZATION,
+            settings.GOOGLE_CALENDAR_QUOTA_BURST
+        )
+        self.concurrency = concurrency or settings.AUTO_SYNC_CONCURRENCY
+        self.scan_interval = scan_interval or settings.AUTO_SYNC_SCAN_INTERVAL_SECONDS
+        self.active_interval = active_interval or timedelta(minutes=settings.AUTO_SYNC_ACTIVE_INTERVAL_MINUTES)
+        self.idle_interval = idle_interval or timedelta(minutes=settings.AUTO_SYNC_IDLE_INTERVAL_MINUTES)
+        self.push_interval = timedelta(hours=settings.AUTO_SYNC_PUSH_INTERVAL_HOURS)
+        self.active_window = active_window or timedelta(hours=settings.AUTO_SYNC_ACTIVE_WINDOW_HOURS)
+        self.quota_backoff = quota_backoff or settings.AUTO_SYNC_QUOTA_BACKOFF_SECONDS
+
+        self._queue: List = []
+        self._queue_ready = asyncio.Condition()
+        self._counter = itertools.count()
+        # Usuarios encolados o sincronizándose: límite de concurrencia 1 por usuario
+        self._scheduled: Set[str] = set()
+        self._not_before: Dict[str, float] = {}
+        self._stopping = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def interval_for(self, candidate: SyncCandidate, now: datetime) -> timedelta:
+        if candidate.push_enabled:
+            return self.push_interval
+        return self.active_interval if candidate.is_active(now, self.active_window) else self.idle_interval
+
+    def priority(self, candidate: SyncCandidate, now: datetime) -> float:
+        """
+        Prioridad de un candidato (mayor = antes); los usuarios activos pesan el doble
+        """
+        staleness = candidate.staleness(now, self.interval_for(candidate, now))
+        return staleness * (2.0 if candidate.is_active(now, self.active_window) else 1.0)
+
+    async def schedule(self, candidates: List[SyncCandidate]) -> int:
+        """
+        Encola los candidatos a los que les toca sincronizar
+
+        Returns:
+            Número de usuarios encolados en esta pasada
+        """
+        now = datetime.utcnow()
+        monotonic_now = time.monotonic()
+        enqueued = 0
+
+        async with self._queue_ready:
+            for candidate in candidates:
+                if candidate.user_id in self._scheduled:
+                    continue
+                if self._not_before.get(candidate.user_id, 0.0) > monotonic_now:
+                    continue
+                priority = self.priority(candidate, now)
+                if priority < 1.0:
+                    continue
+                self._scheduled.add(candidate.user_id)
+                heapq.heappush(self._queue, (-priority, next(self._counter), candidate))
+                enqueued += 1
+
+            metrics.set_gauge("auto_sync_backlog", len(self._queue))
+            if enqueued:
+                self._queue_ready.notify(enqueued)
+        return enqueued
+
+    async def start(self) -> None:
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._worker_loop(index)) for index in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._scan_loop()))
+        logger.info(f"Orquestador de auto-sync iniciado ({self.concurrency} workers, "
+                    f"{self.rate_limiter.rate * 60:.0f} llamadas/min a Google)")
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        async with self._queue_ready:
+            self._queue_ready.notify_all()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Orquestador de auto-sync detenido")
+
+    async def run_forever(self) -> None:
+        await self.start()
+        await self._stopping.wait()
+        await self.stop()
+
+    def request_stop(self) -> None:
+        self._stopping.set()
+
+    async def _scan_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                candidates = await self.source.load_candidates()
+                enqueued = await self.schedule(candidates)
+                metrics.set_gauge("auto_sync_candidates", len(candidates))
+                if enqueued:
+                    logger.info(f"Auto-sync: {enqueued} usuarios encolados de {len(candidates)}")
+            except Exception as e:
+                logger.error(f"Error planificando auto-sync: {str(e)}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.scan_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _next_candidate(self) -> Optional[SyncCandidate]:
+        async with self._queue_ready:
+            while not self._queue and not self._stopping.is_set():
+                await self._queue_ready.wait()
+            if self._stopping.is_set():
+                return None
+            _, _, candidate = heapq.heappop(self._queue)
+            metrics.set_gauge("auto_sync_backlog", len(self._queue))
+            return candidate
+
+    async def _worker_loop(self, index: int) -> None:
+        while True:
+            candidate = await self._next_candidate()
+            if candidate is None:
+                return
+            try:
+                await self._run(candidate)
+            finally:
+                self._scheduled.discard(candidate.user_id)
+
+    async def _run(self, candidate: SyncCandidate) -> None:
+        now = datetime.utcnow()
+        if candidate.last_synced_at is not None:
+            metrics.observe("auto_sync_staleness_seconds", (now - candidate.last_synced_at).total_seconds())
+
+        start = time.perf_counter()
+        try:
+            result = await self.sync_runner(candidate, self.rate_limiter)
+        except SyncInProgressError:
+            # Ya se está sincronizando desde la cola (/sync, push): se vuelve a mirar en la próxima pasada
+            metrics.inc("auto_sync_skipped_total", labels={"reason": "in_progress"})
+            return
+        except Exception as e:
+            logger.error(f"Error en auto-sync del usuario {candidate.user_id}: {str(e)}")
+            result = CalendarSyncResponse(success=False, message=str(e), errors=[str(e)])
+        completed_at = datetime.utcnow()
+        metrics.observe("auto_sync_run_seconds", time.perf_counter() - start)
+
+        quota_exceeded = is_quota_error(result)
+        if quota_exceeded:
+            # Google ha rechazado por cuota: el usuario espera antes de reintentar
+            metrics.inc("auto_sync_quota_errors_total")
+            self._not_before[candidate.user_id] = time.monotonic() + self.quota_backoff * random.uniform(1.0, 1.5)
+        else:
+            self._not_before.pop(candidate.user_id, None)
+
+        status = "failed" if not result.success else ("partial" if result.errors else "success")
+        metrics.inc("auto_sync_runs_total", labels={"status": status})
+
+        if status != "failed" and not quota_exceeded:
+            candidate.last_synced_at = completed_at
+        try:
+            await self.source.record_sync(candidate, result, now, completed_at)
+        except Exception as e:
+            logger.error(f"No se pudo registrar el auto-sync del usuario {candidate.user_id}: {str(e)}")
+
+
+# --- Modo simulación -------------------------------------------------------
+
+class SimulatedIntegrationSource:
+    """Origen de candidatos en memoria para el modo simulación."""
+
+    def __init__(self, candidates: List[SyncCandidate], backend, activity_rate: float = 0.05):
+        self.candidates = candidates
+        self.backend = backend
+        self.activity_rate = activity_rate
+        self.sync_counts: Dict[str, int] = {}
+
+    async def load_candidates(self) -> List[SyncCandidate]:
+        # Una fracción de usuarios "usa" su calendario entre pasadas
+        now = datetime.utcnow()
+        for candidate in self.candidates:
+            if random.random() < self.activity_rate:
+                candidate.last_active_at = now
+                self.backend.mutate_user(candidate.user_id)
+        return list(self.candidates)
+
+    async def record_sync(self, candidate: SyncCandidate, result: CalendarSyncResponse,
+                          started_at: datetime, completed_at: datetime) -> None:
+        if result.success:
+            self.sync_counts[candidate.user_id] = self.sync_counts.get(candidate.user_id, 0) + 1
+
+
+async def run_simulation(
+    users: int = 200,
+    events_per_user: int = 20,
+    duration: float = 60.0,
+    quota_per_minute: int = 600,
+    latency_ms: float = 120.0,
+    concurrency: Optional[int] = None,
+    active_interval: float = 30.0,
+    idle_interval: float = 120.0,
+    seed: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Ejecuta el orquestador contra una API de Google simulada y una base de datos
+    SQLite en memoria, y devuelve un resumen de la prueba de carga.
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import StaticPool
+
+    from app.models.users import User
+    from app.services.calendar.fake_google import FakeGoogleCalendarBackend
+
+    random.seed(seed)
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: CalendarEvent.metadata.create_all(
+            sync_conn, tables=[User.__table__, CalendarEvent.__table__]
+        ))
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    backend = FakeGoogleCalendarBackend(quota_per_minute=quota_per_minute, latency_ms=latency_ms, seed=seed)
+    now = datetime.utcnow()
+    candidates = []
+    for _ in range(users):
+        user_id = str(UUID(int=random.getrandbits(128), version=4))
+        backend.seed_user(user_id, events_per_user, now - timedelta(days=3))
+        candidates.append(SyncCandidate(
+            user_id=user_id,
+            last_synced_at=None if random.random() < 0.5 else now - timedelta(seconds=random.uniform(0, idle_interval)),
+            last_active_at=now if random.random() < 0.2 else None,
+        ))
+
+    source = SimulatedIntegrationSource(candidates, backend)
+    runner = CalendarSyncRunner(
+        session_factory=session_factory,
+        google_service_factory=lambda candidate: backend.service_for(candidate.user_id),
+        past_days=7,
+        future_days=30,
+    )
+    orchestrator = AutoSyncOrchestrator(
+        source,
+        runner,
+        rate_limiter=AsyncTokenBucket.per_minute(
+            quota_per_minute * settings.AUTO_SYNC_QUOTA_UTILIZATION, settings.GOOGLE_CALENDAR_QUOTA_BURST
+        ),
+        concurrency=concurrency,
+        scan_interval=2.0,
+        active_interval=timedelta(seconds=active_interval),
+        idle_interval=timedelta(seconds=idle_interval),
+        quota_backoff=5.0,
+    )
+
+    started = time.perf_counter()
+    await orchestrator.start()
+    await asyncio.sleep(duration)
+    await orchestrator.stop()
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+
+    run_stats = metrics.snapshot()["histograms"].get("auto_sync_run_seconds", {})
+    completed = sum(source.sync_counts.values())
+    return {
+        "users": users,
+        "duration_seconds": round(elapsed, 1),
+        "syncs_completed": completed,
+        "users_synced": len(source.sync_counts),
+        "syncs_per_minute": round(completed / elapsed * 60, 1),
+        "google_calls": backend.total_calls,
+        "google_calls_per_minute": round(backend.total_calls / elapsed * 60, 1),
+        "peak_calls_in_window": backend.peak_calls_per_minute,
+        "quota_limit_per_minute": quota_per_minute,
+        "quota_errors": backend.quota_errors,
+        "sync_p50_seconds": run_stats.get("p50"),
+        "sync_p95_seconds": run_stats.get("p95"),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Orquestador de sincronización automática de Google Calendar")
+    parser.add_argument("--simulate", action="store_true", help="Prueba de carga contra una API de Google simulada")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--events", type=int, default=20, help="Eventos por usuario simulado")
+    parser.add_argument("--duration", type=float, default=60.0, help="Duración de la simulación en segundos")
+    parser.add_argument("--quota", type=int, default=settings.GOOGLE_CALENDAR_QUOTA_PER_MINUTE,
+                        help="Cuota simulada de llamadas por minuto")
+    parser.add_argument("--latency-ms", type=float, default=120.0)
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    if args.simulate:
+        report = await run_simulation(
+            users=args.users,
+            events_per_user=args.events,
+            duration=args.duration,
+            quota_per_minute=args.quota,
+            latency_ms=args.latency_ms,
+            concurrency=args.concurrency,
+            seed=args.seed,
+        )
+        print(json.dumps(report, indent=2))
+        return
+
+    orchestrator = AutoSyncOrchestrator(SupabaseIntegrationSource(), CalendarSyncRunner())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, orchestrator.request_stop)
+        except NotImplementedError:
+            # Windows no soporta add_signal_handler
+            pass
+
+    await orchestrator.run_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,29 @@
+import logging
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Funciones que descartan datos derivados del calendario de un usuario
+_invalidation_hooks: List[Callable[[str], None]] = []
+
+
+def register_invalidation_hook(hook: Callable[[str], None]) -> Callable[[str], None]:
+    """
+    Registra una función a la que se avisa cuando cambia el calendario de un usuario.
+    Puede usarse como decorador.
+    """
+    _invalidation_hooks.append(hook)
+    return hook
+
+
+def invalidate_user_calendar(user_id: Any) -> None:
+    """
+    Notifica a todas las cachés que el calendario del usuario ha cambiado
+    (escrituras de eventos, sincronizaciones)
+    """
+    user_key = str(user_id)
+    for hook in _invalidation_hooks:
+        try:
+            hook(user_key)
+        except Exception as e:
+            logger.error(f"Error invalidando la caché de calendario del usuario {user_key}: {str(e)}")
@@ -0,0 +1,346 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.schemas.calendar import CalendarEventCreate, CalendarEventUpdate
+from app.services.calendar.google_events import SyncTokenExpiredError
+
+
+class FakeQuotaExceededError(Exception):
+    """Error equivalente al 403 rateLimitExceeded de Google Calendar."""
+
+    status_code = 403
+
+    def __init__(self):
+        super().__init__("<HttpError 403: rateLimitExceeded (simulado)>")
+
+
+class FakeGoogleCalendarBackend:
+    """
+    API de Google Calendar simulada en memoria para pruebas de carga.
+    Reproduce la latencia de red y la cuota por minuto del proyecto.
+    """
+
+    def __init__(
+        self,
+        quota_per_minute: int = 600,
+        latency_ms: float = 120.0,
+        latency_jitter_ms: float = 60.0,
+        seed: Optional[int] = None
+    ):
+        self.quota_per_minute = quota_per_minute
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._events: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.total_calls = 0
+        self.quota_errors = 0
+        self.peak_calls_per_minute = 0
+        # Canales de notificaciones (events.watch) y notificaciones pendientes de enviar
+        self._channels: Dict[str, Dict[str, Any]] = {}
+        self.pending_notifications: List[Dict[str, Any]] = []
+        # Número de cambio global: los syncToken son el último número visto
+        self._sequence = 0
+        self.min_sync_token = 0
+
+    def touch(self, event: Dict[str, Any]) -> None:
+        """
+        Marca un evento como cambiado (campo `updated` y número de cambio)
+        """
+        with self._lock:
+            self._sequence += 1
+            event["_sequence"] = self._sequence
+        event["updated"] = datetime.utcnow().isoformat() + "Z"
+
+    def expire_sync_tokens(self) -> None:
+        """
+        Invalida los syncToken emitidos hasta ahora (Google responde 410)
+        """
+        self.min_sync_token = self._sequence + 1
+
+    def seed_user(self, user_key: str, events: int, start: datetime, days: int = 30) -> None:
+        """
+        Crea eventos aleatorios para un usuario simulado
+        """
+        user_events = self._events.setdefault(user_key, {})
+        for _ in range(events):
+            event_start = start + timedelta(
+                days=self._random.randrange(days),
+                hours=self._random.randrange(8, 19)
+            )
+            event_id = uuid.uuid4().hex
+            user_events[event_id] = {
+                "id": event_id,
+                "summary": f"Evento simulado {event_id[:6]}",
+                "start": {"dateTime": event_start.isoformat()},
+                "end": {"dateTime": (event_start + timedelta(minutes=self._random.choice([30, 60, 90]))).isoformat()},
+            }
+            self.touch(user_events[event_id])
+
+    def mutate_user(self, user_key: str, changes: int = 1) -> None:
+        """
+        Modifica eventos existentes para simular actividad del usuario en Google
+        """
+        user_events = self._events.get(user_key) or {}
+        for event_id in self._random.sample(list(user_events), min(changes, len(user_events))):
+            user_events[event_id]["summary"] += "*"
+            self.touch(user_events[event_id])
+            self.notify_change(user_key)
+
+    def notify_change(self, user_key: str, resource_state: str = "exists") -> None:
+        """
+        Genera una notificación por cada canal abierto del usuario, como hace
+        Google con cada cambio en el calendario vigilado
+        """
+        with self._lock:
+            for channel_id, channel in self._channels.items():
+                if channel["user_key"] != user_key:
+                    continue
+                channel["message_number"] += 1
+                self.pending_notifications.append({
+                    "address": channel["address"],
+                    "headers": {
+                        "X-Goog-Channel-ID": channel_id,
+                        "X-Goog-Channel-Token": channel["token"],
+                        "X-Goog-Resource-ID": channel["resource_id"],
+                        "X-Goog-Resource-State": resource_state,
+                        "X-Goog-Message-Number": str(channel["message_number"]),
+                    },
+                })
+
+    def _request(self) -> None:
+        # Aplica la cuota (ventana deslizante de 60 s) y la latencia simulada
+        with self._lock:
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] > 60.0:
+                self._calls.popleft()
+            self.total_calls += 1
+            if len(self._calls) >= self.quota_per_minute:
+                self.quota_errors += 1
+                raise FakeQuotaExceededError()
+            self._calls.append(now)
+            self.peak_calls_per_minute = max(self.peak_calls_per_minute, len(self._calls))
+            latency = self.latency_ms + self._random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+
+        time.sleep(max(0.0, latency) / 1000.0)
+
+    def open_channel(self, user_key: str, channel_id: str, token: str, address: str, ttl_seconds: int) -> Dict[str, Any]:
+        resource_id = uuid.uuid4().hex
+        with self._lock:
+            self._channels[channel_id] = {
+                "user_key": user_key,
+                "token": token,
+                "address": address,
+                "resource_id": resource_id,
+                "message_number": 0,
+            }
+        # Google confirma el canal con una notificación "sync"
+        self.notify_change(user_key, resource_state="sync")
+        expiration = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        return {"id": channel_id, "resourceId": resource_id, "expiration": str(int(expiration.timestamp() * 1000))}
+
+    def close_channel(self, channel_id: str) -> None:
+        with self._lock:
+            self._channels.pop(channel_id, None)
+
+    def take_notifications(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            notifications, self.pending_notifications = self.pending_notifications, []
+        return notifications
+
+    def service_for(self, user_key: str) -> "FakeGoogleCalendarService":
+        return FakeGoogleCalendarService(self, user_key)
+
+
+class FakeGoogleCalendarService:
+    """Sustituto de GoogleCalendarService respaldado por FakeGoogleCalendarBackend."""
+
+    def __init__(self, backend: FakeGoogleCalendarBackend, user_key: str):
+        self.backend = backend
+        self.user_key = user_key
+        self.calendar_id = "primary"
+        self.page_size = 250
+
+    @property
+    def _events(self) -> Dict[str, Dict[str, Any]]:
+        return self.backend._events.setdefault(self.user_key, {})
+
+    def _get_live(self, google_event_id: str) -> Dict[str, Any]:
+        existing = self._events.get(google_event_id)
+        if existing is None or existing.get("status") == "cancelled":
+            raise KeyError(f"Evento {google_event_id} no encontrado")
+        return existing
+
+    def list_events_page(self, start_time: datetime, end_time: datetime,
+                         page_token: Optional[str] = None,
+                         show_deleted: bool = False,
+                         sync_token: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
+        # El token de página es "desplazamiento:número de cambio al empezar el
+        # listado"; como en Google, los extremos son exclusivos, los borrados
+        # quedan "cancelled" y con syncToken se listan los cambios sin rango
+        self.backend._request()
+        offset, snapshot = (int(part) for part in (page_token or f"0:{self.backend._sequence}").split(":"))
+        if sync_token:
+            since = int(sync_token)
+            if since < self.backend.min_sync_token:
+                raise SyncTokenExpiredError(f"<HttpError 410: syncToken {sync_token} caducado (simulado)>")
+            items = sorted(
+                (event for event in self._events.values() if since < event.get("_sequence", 0) <= snapshot),
+                key=lambda event: event["_sequence"]
+            )
+        else:
+            start_iso, end_iso = start_time.isoformat(), end_time.isoformat()
+            items = sorted(
+                (
+                    event for event in self._events.values()
+                    if event["end"]["dateTime"] > start_iso and event["start"]["dateTime"] < end_iso
+                    and (show_deleted or event.get("status") != "cancelled")
+                ),
+                key=lambda event: event["start"]["dateTime"]
+            )
+        next_offset = offset + self.page_size
+        if next_offset < len(items):
+            return items[offset:next_offset], f"{next_offset}:{snapshot}", None
+        return items[offset:next_offset], None, str(snapshot)
+
+    def get_events(self, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+        events, page_token = [], None
+        while True:
+            items, page_token, _ = self.list_events_page(start_time, end_time, page_token)
+            events.extend(items)
+            if not page_token:
+                return events
+
+    def create_event(self, event: CalendarEventCreate) -> Dict[str, Any]:
+        self.backend._request()
+        event_id = uuid.uuid4().hex
+        self._events[event_id] = {
+            "id": event_id,
+            "summary": event.title,
+            "description": event.description or "",
+            "start": {"dateTime": event.start_time.isoformat()},
+            "end": {"dateTime": event.end_time.isoformat()},
+        }
+        self.backend.touch(self._events[event_id])
+        self.backend.notify_change(self.user_key)
+        return self._events[event_id]
+
+    def update_event(self, google_event_id: str, event: CalendarEventUpdate) -> Dict[str, Any]:
+        # Igual que el cliente real: GET + PUT
+        self.backend._request()
+        existing = self._get_live(google_event_id)
+        self.backend._request()
+        if event.title is not None:
+            existing["summary"] = event.title
+        if event.start_time is not None:
+            existing["start"] = {"dateTime": event.start_time.isoformat()}
+        if event.end_time is not None:
+            existing["end"] = {"dateTime": event.end_time.isoformat()}
+        self.backend.touch(existing)
+        self.backend.notify_change(self.user_key)
+        return existing
+
+    def delete_event(self, google_event_id: str) -> bool:
+        self.backend._request()
+        existing = self._events.get(google_event_id)
+        if existing is not None and existing.get("status") != "cancelled":
+            existing["status"] = "cancelled"
+            self.backend.touch(existing)
+            self.backend.notify_change(self.user_key)
+        return True
+
+    def watch_events(self, channel_id: str, token: str, address: str, ttl_seconds: int) -> Dict[str, Any]:
+        self.backend._request()
+        return self.backend.open_channel(self.user_key, channel_id, token, address, ttl_seconds)
+
+    def stop_channel(self, channel_id: str, resource_id: str) -> bool:
+        self.backend._request()
+        self.backend.close_channel(channel_id)
+        return True
+
+    def _batch(self, keys, operation) -> Dict[str, Any]:
+        # Igual que Google: cada petición del lote cuenta para la cuota
+        results = {}
+        for key in keys:
+            try:
+                results[key] = operation(key)
+            except Exception as e:
+                results[key] = e
+        return results
+
+    def batch_create_events(self, events: Dict[str, CalendarEventUpdate]) -> Dict[str, Any]:
+        return self._batch(events, lambda key: self.create_event(events[key]))
+
+    def batch_update_events(self, events: Dict[str, CalendarEventUpdate]) -> Dict[str, Any]:
+        def patch(google_event_id):
+            self.backend._request()
+            existing = self._get_live(google_event_id)
+            event = events[google_event_id]
+            if event.title is not None:
+                existing["summary"] = event.title
+            if event.start_time is not None:
+                existing["start"] = {"dateTime": event.start_time.isoformat()}
+            if event.end_time is not None:
+                existing["end"] = {"dateTime": event.end_time.isoformat()}
+            self.backend.touch(existing)
+            self.backend.notify_change(self.user_key)
+            return existing
+        return self._batch(events, patch)
+
+    def batch_delete_events(self, google_event_ids: List[str]) -> Dict[str, Any]:
+        return self._batch(google_event_ids, lambda google_event_id: self.delete_event(google_event_id) and {})
+
+
+class FakeWatchNotifier:
+    """
+    Envía al webhook las notificaciones push generadas por el backend simulado,
+    como haría Google. `post(url, headers)` permite entregarlas sin red (p. ej.
+    con un cliente ASGI); por defecto se usa aiohttp.
+    """
+
+    def __init__(self, backend: FakeGoogleCalendarBackend,
+                 post: Optional[Callable[[str, Dict[str, str]], Awaitable[int]]] = None):
+        self.backend = backend
+        self.post = post or self._post_http
+        self.delivered = 0
+        self.rejected = 0
+
+    @staticmethod
+    async def _post_http(url: str, headers: Dict[str, str]) -> int:
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, headers=headers) as response:
+                return response.status
+
+    async def deliver(self) -> int:
+        """
+        Entrega las notificaciones pendientes
+
+        Returns:
+            Número de notificaciones entregadas
+        """
+        notifications = self.backend.take_notifications()
+        for notification in notifications:
+            status = await self.post(notification["address"], notification["headers"])
+            if status >= 400:
+                self.rejected += 1
+            else:
+                self.delivered += 1
+        return len(notifications)
+
+    async def run(self, interval: float = 0.5, stop_event: Optional[asyncio.Event] = None) -> None:
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            await self.deliver()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import hmac
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.calendar import CalendarEvent
+from app.services.calendar.cache import register_invalidation_hook
+from app.services.calendar.ical import iter_calendar
+from app.services.calendar.reconciliation import SYNC_STATUS_DELETED
+from app.utils.cache import LRUCache
+
+FEED_MEDIA_TYPE = "text/calendar; charset=utf-8"
+TASK_FEED_FIELDS = "id,title,description,due_date,status,updated_at"
+
+
+@dataclass
+class RenderedFeed:
+    """Feed ICS ya generado, con el ETag del estado del que sale."""
+
+    etag: str
+    body: bytes
+
+
+# Feeds generados por usuario; se invalidan con las escrituras de calendario y
+# tareas, y el TTL cubre los cambios hechos desde otros procesos
+_feed_cache = LRUCache(
+    maxsize=settings.ICS_FEED_CACHE_SIZE,
+    ttl=settings.ICS_FEED_CACHE_TTL_SECONDS,
+    name="calendar_ics_feed"
+)
+# Generación por usuario: un render que empezó antes de una invalidación no se cachea
+_feed_generations: Dict[str, int] = {}
+
+
+@register_invalidation_hook
+def _invalidate_feed(user_id: str) -> None:
+    _feed_cache.delete(user_id)
+    _feed_generations[user_id] = _feed_generations.get(user_id, 0) + 1
+
+
+def _feed_signature(user_id: str) -> str:
+    digest = hmac.new(settings.SECRET_KEY.encode(), f"ics-feed:{user_id}".encode(), hashlib.sha256)
+    return digest.hexdigest()[:32]
+
+
+def feed_token(user_id: Any) -> str:
+    """
+    Token de la URL de suscripción del usuario: su ID firmado con SECRET_KEY
+    """
+    user_key = str(user_id)
+    return f"{user_key}_{_feed_signature(user_key)}"
+
+
+def verify_feed_token(token: str) -> Optional[str]:
+    """
+    Comprueba un token de feed
+
+    Returns:
+        ID del usuario, o None si el token no es válido
+    """
+    user_id, _, signature = token.rpartition("_")
+    if not user_id or not hmac.compare_digest(signature, _feed_signature(user_id)):
+        return None
+    return user_id
+
+
+def compute_etag(user_id: str, events_max_updated: Any, events_count: int, tasks: List[Dict[str, Any]]) -> str:
+    """
+    ETag fuerte del feed: cambia con cualquier alta, modificación o baja de
+    eventos o tareas del usuario
+    """
+    tasks_max_updated = max((str(task.get("updated_at") or "") for task in tasks), default="")
+    state = f"{user_id}|{events_max_updated}|{events_count}|{tasks_max_updated}|{len(tasks)}"
+    return '"' + hashlib.sha256(state.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evalúa la cabecera If-None-Match (comparación débil, como indica RFC 9110)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+async def load_feed_tasks(user_id: str, client=None) -> List[Dict[str, Any]]:
+    """
+    Tareas pendientes del usuario con fecha límite
+    """
+    if client is None:
+        from app.db.database import get_supabase_admin_client
+        client = get_supabase_admin_client()
+    response = await asyncio.to_thread(
+        lambda: client.table("tasks").select(TASK_FEED_FIELDS)
+        .eq("user_id", user_id)
+        .eq("is_deleted", False)
+        .neq("status", "completed")
+        .not_.is_("due_date", "null")
+        .execute()
+    )
+    return response.data or []
+
+
+def _feed_events_filter(user_id: str):
+    return (
+        CalendarEvent.user_id == UUID(user_id),
+        CalendarEvent.sync_status.is_distinct_from(SYNC_STATUS_DELETED),
+    )
+
+
+async def load_feed_state(session_factory: async_sessionmaker, user_id: str,
+                          tasks_client=None) -> Tuple[str, List[Dict[str, Any]], int]:
+    """
+    Calcula el ETag actual del feed con una consulta agregada (sin leer los eventos)
+
+    Returns:
+        Tuple (etag, tareas del feed, generación de la caché antes de las lecturas)
+    """
+    # Se toma antes de leer: si una escritura llega entre el cálculo del ETag y
+    # el render, el documento no se cachea bajo un ETag que ya no le corresponde
+    generation = _feed_generations.get(user_id, 0)
+    stmt = select(func.max(CalendarEvent.updated_at), func.count()).where(*_feed_events_filter(user_id))
+    async with session_factory() as session:
+        events_max_updated, events_count = (await session.execute(stmt)).one()
+    tasks = await load_feed_tasks(user_id, tasks_client)
+    return compute_etag(user_id, events_max_updated, events_count, tasks), tasks, generation
+
+
+def get_cached_feed(user_id: str) -> Optional[RenderedFeed]:
+    return _feed_cache.get(user_id)
+
+
+async def stream_feed(session_factory: async_sessionmaker, user_id: str, etag: str,
+                      tasks: List[Dict[str, Any]], generation: int) -> AsyncIterator[bytes]:
+    """
+    Genera el feed ICS leyendo los eventos por lotes del cursor. Al terminar,
+    guarda el documento en la caché con su ETag si no ha habido escrituras
+    desde `generation` (la de load_feed_state).
+    """
+    started = time.perf_counter()
+    chunks: List[bytes] = []
+    stmt = (
+        select(CalendarEvent)
+        .where(*_feed_events_filter(user_id))
+        .order_by(CalendarEvent.start_time)
+        .execution_options(yield_per=settings.ICS_FEED_BATCH_SIZE)
+    )
+
+    async with session_factory() as session:
+        events = await session.stream_scalars(stmt)
+        async for text in iter_calendar(events, tasks, chunk_size=settings.ICS_FEED_BATCH_SIZE):
+            chunk = text.encode("utf-8")
+            chunks.append(chunk)
+            yield chunk
+
+    metrics.observe("calendar_ics_feed_render_seconds", time.perf_counter() - started)
+    if _feed_generations.get(user_id, 0) == generation:
+        _feed_cache.set(user_id, RenderedFeed(etag=etag, body=b"".join(chunks)))
@@ -0,0 +1,140 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.calendar import CalendarEvent
+from app.services.calendar.cache import register_invalidation_hook
+from app.services.calendar.recurrence import load_events_in_window, merge_events_in_window, to_naive_utc
+from app.utils.cache import LRUCache
+
+Interval = Tuple[datetime, datetime]
+
+# Resultados de free/busy por (usuario, rango, duración mínima, todo el día)
+_free_busy_cache = LRUCache(
+    maxsize=settings.FREE_BUSY_CACHE_SIZE,
+    ttl=settings.FREE_BUSY_CACHE_TTL_SECONDS,
+    name="calendar_free_busy"
+)
+
+
+@register_invalidation_hook
+def _invalidate_free_busy(user_id: str) -> None:
+    _free_busy_cache.delete_where(lambda key: key[0] == user_id)
+
+
+class IntervalIndex:
+    """
+    Índice de intervalos ocupados: se ordenan y fusionan una vez (O(n log n))
+    y las consultas de solape se resuelven con búsqueda binaria.
+    """
+
+    def __init__(self, intervals: Iterable[Interval]):
+        self.busy: List[Interval] = self._merge(intervals)
+        self._starts = [start for start, _ in self.busy]
+        self._ends = [end for _, end in self.busy]
+
+    @staticmethod
+    def _merge(intervals: Iterable[Interval]) -> List[Interval]:
+        merged: List[List[datetime]] = []
+        for start, end in sorted(interval for interval in intervals if interval[1] > interval[0]):
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        return [(start, end) for start, end in merged]
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        """
+        Indica si [start, end) no se solapa con ningún intervalo ocupado
+        """
+        # Primer intervalo que termina después de `start`
+        index = bisect_right(self._ends, start)
+        return index == len(self.busy) or self._starts[index] >= end
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Interval]:
+        """
+        Intervalos ocupados que se solapan con [start, end)
+        """
+        first = bisect_right(self._ends, start)
+        last = bisect_left(self._starts, end)
+        return self.busy[first:last]
+
+    def free_slots(self, window_start: datetime, window_end: datetime,
+                   min_duration: timedelta = timedelta(0)) -> List[Interval]:
+        """
+        Huecos libres dentro de la ventana con al menos `min_duration`
+        """
+        slots = []
+        cursor = window_start
+        for busy_start, busy_end in self.overlapping(window_start, window_end):
+            if busy_start > cursor and busy_start - cursor >= min_duration:
+                slots.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if window_end > cursor and window_end - cursor >= min_duration:
+            slots.append((cursor, window_end))
+        return slots
+
+
+def _event_interval(item: Union[CalendarEvent, Dict[str, Any]]) -> Tuple[Interval, bool]:
+    if isinstance(item, dict):
+        return (item["start_time"], item["end_time"]), bool(item.get("is_all_day"))
+    return (item.start_time, item.end_time), bool(item.is_all_day)
+
+
+def build_interval_index(events: Iterable[CalendarEvent], window_start: datetime, window_end: datetime,
+                         include_all_day: bool = False) -> IntervalIndex:
+    """
+    Construye el índice de ocupación de una ventana a partir de los eventos del
+    usuario, expandiendo los recurrentes
+    """
+    intervals = []
+    for item in merge_events_in_window(events, window_start, window_end):
+        interval, is_all_day = _event_interval(item)
+        if is_all_day and not include_all_day:
+            continue
+        intervals.append(interval)
+    return IntervalIndex(intervals)
+
+
+async def get_free_busy(db: AsyncSession, user_id: Any, window_start: datetime, window_end: datetime,
+                        min_duration: timedelta, include_all_day: bool = False) -> Dict[str, Any]:
+    """
+    Calcula los intervalos ocupados y los huecos libres de un usuario en una ventana.
+    El resultado se cachea por usuario y se invalida con las escrituras de calendario.
+
+    Args:
+        db: Sesión de base de datos async
+        user_id: ID del usuario
+        window_start: Inicio de la ventana
+        window_end: Fin de la ventana
+        min_duration: Duración mínima de los huecos libres
+        include_all_day: Si los eventos de todo el día cuentan como ocupados
+
+    Returns:
+        Diccionario con "from", "to", "busy" y "free"
+    """
+    window_start, window_end = to_naive_utc(window_start), to_naive_utc(window_end)
+    key = (str(user_id), window_start, window_end, min_duration, include_all_day)
+    cached = _free_busy_cache.get(key)
+    if cached is not None:
+        return cached
+
+    events = await load_events_in_window(db, user_id, window_start, window_end)
+    index = build_interval_index(events, window_start, window_end, include_all_day)
+    # Los intervalos ocupados se recortan a la ventana
+    busy = [
+        {"start": max(start, window_start), "end": min(end, window_end)}
+        for start, end in index.overlapping(window_start, window_end)
+    ]
+    result = {
+        "from": window_start,
+        "to": window_end,
+        "busy": busy,
+        "free": [{"start": start, "end": end} for start, end in index.free_slots(window_start, window_end, min_duration)],
+    }
+    _free_busy_cache.set(key, result)
+    return result
@@ -1,13 +1,18 @@
 from datetime import datetime, timedelta
 import json
 import logging
-from typing import List, Optional, Dict, Any
+import threading
+from typing import List, Optional, Dict, Any, Tuple
 
+import httplib2
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 
 from app.models.calendar import CalendarEvent
+from app.services.calendar.google_events import SyncTokenExpiredError
 from app.schemas.calendar import CalendarEventCreate, CalendarEventUpdate
 
 logger = logging.getLogger(__name__)
@@ -16,6 +21,8 @@ class GoogleCalendarService:
     """Servicio para interactuar con la API de Google Calendar."""
     
     SCOPES = ['https://www.googleapis.com/auth/calendar']
+    BATCH_SIZE = 50  # Máximo recomendado por Google para peticiones batch
+    PAGE_SIZE = 250  # Eventos por página de events().list (máximo 2500)
     
     def __init__(self, credentials_json: str):
         """
@@ -36,37 +43,106 @@ class GoogleCalendarService:
                 expiry=datetime.fromtimestamp(credentials_dict.get('expires_at', 0))
             )
             
-            self.service = build('calendar', 'v3', credentials=self.credentials)
+            # httplib2.Http no es thread-safe y la sincronización llama a Google
+            # desde varios hilos a la vez (fases pull y push): cada petición usa
+            # la conexión propia del hilo que la ejecuta
+            self._thread_local = threading.local()
+            self.service = build('calendar', 'v3', credentials=self.credentials,
+                                 requestBuilder=self._build_request)
             self.calendar_id = 'primary'  # Por defecto, usar el calendario primario del usuario
         except Exception as e:
             logger.error(f"Error inicializando el servicio de Google Calendar: {str(e)}")
             raise
     
-    def get_events(self, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+    def _thread_http(self) -> AuthorizedHttp:
+        """
+        Conexión HTTP autorizada del hilo actual (se crea la primera vez)
+        """
+        http = getattr(self._thread_local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+            self._thread_local.http = http
+        return http
+    
+    def _build_request(self, http, *args, **kwargs) -> HttpRequest:
+        # requestBuilder de googleapiclient: ignora la conexión compartida del servicio
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+    
+    def list_events_page(self, start_time: datetime, end_time: datetime,
+                         page_token: Optional[str] = None,
+                         show_deleted: bool = False,
+                         sync_token: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
         """
-        Obtiene eventos de Google Calendar en el rango de tiempo especificado.
+        Obtiene una página de eventos de Google Calendar en el rango especificado
+        (ambos extremos exclusivos: termina después de `start_time` y empieza
+        antes de `end_time`).
         
         Args:
             start_time: Fecha y hora de inicio
             end_time: Fecha y hora de fin
+            page_token: Token de la página (None para la primera)
+            show_deleted: Incluir los eventos borrados (con status "cancelled")
+            sync_token: nextSyncToken de un listado anterior: solo se listan los
+                cambios desde entonces y se ignora el rango (Google no admite
+                timeMin/timeMax ni orderBy junto a syncToken)
             
         Returns:
-            Lista de eventos de Google Calendar
+            Tuple con (eventos de la página, token de la siguiente página o None,
+            nextSyncToken o None; solo viene en la última página)
+            
+        Raises:
+            SyncTokenExpiredError: Si Google ya no acepta `sync_token` (410)
         """
-        try:
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
+        params = {
+            'calendarId': self.calendar_id,
+            'singleEvents': True,
+            'maxResults': self.PAGE_SIZE,
+            'pageToken': page_token,
+            'showDeleted': show_deleted,
+        }
+        if sync_token:
+            params['syncToken'] = sync_token
+        else:
+            params.update(
                 timeMin=start_time.isoformat() + 'Z',
                 timeMax=end_time.isoformat() + 'Z',
-                singleEvents=True,
                 orderBy='startTime'
-            ).execute()
+            )
+        try:
+            events_result = self.service.events().list(**params).execute()
             
-            return events_result.get('items', [])
+            return (
+                events_result.get('items', []),
+                events_result.get('nextPageToken'),
+                events_result.get('nextSyncToken')
+            )
         except HttpError as error:
+            if sync_token and error.resp.status == 410:
+                raise SyncTokenExpiredError(str(error)) from error
             logger.error(f"Error obteniendo eventos de Google Calendar: {error}")
             raise
     
+    def get_events(self, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+        """
+        Obtiene todos los eventos de Google Calendar en el rango de tiempo especificado,
+        recorriendo todas las páginas. Para rangos grandes es preferible
+        `iter_event_pages`, que no carga todas las páginas a la vez.
+        
+        Args:
+            start_time: Fecha y hora de inicio
+            end_time: Fecha y hora de fin
+            
+        Returns:
+            Lista de eventos de Google Calendar
+        """
+        events = []
+        page_token = None
+        while True:
+            items, page_token, _ = self.list_events_page(start_time, end_time, page_token)
+            events.extend(items)
+            if not page_token:
+                return events
+    
     def create_event(self, event: CalendarEventCreate) -> Dict[str, Any]:
         """
         Crea un evento en Google Calendar.
@@ -178,6 +254,160 @@ class GoogleCalendarService:
             logger.error(f"Error eliminando evento de Google Calendar: {error}")
             raise
     
+    def _build_patch_body(self, event: CalendarEventUpdate) -> Dict[str, Any]:
+        """
+        Construye el cuerpo de un PATCH con solo los campos proporcionados.
+        
+        Args:
+            event: Datos del evento (los campos None no se envían)
+            
+        Returns:
+            Cuerpo para events().patch / events().insert
+        """
+        body = {}
+        if event.title is not None:
+            body['summary'] = event.title
+        if event.description is not None:
+            body['description'] = event.description
+        if event.start_time is not None and event.is_all_day is not None:
+            body['start'] = self._format_datetime(event.start_time, event.is_all_day)
+        if event.end_time is not None and event.is_all_day is not None:
+            body['end'] = self._format_datetime(event.end_time, event.is_all_day)
+        if event.location is not None:
+            body['location'] = event.location
+        if event.color is not None:
+            body['colorId'] = self._get_color_id(event.color)
+        if event.recurrence_rule is not None:
+            body['recurrence'] = [f'RRULE:{event.recurrence_rule}'] if event.recurrence_rule else []
+        return body
+    
+    def _execute_batch(self, requests: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ejecuta peticiones en lotes de BATCH_SIZE (una sola petición HTTP por lote).
+        
+        Args:
+            requests: Peticiones indexadas por una clave del llamante
+            
+        Returns:
+            Respuesta o excepción de cada petición, por clave
+        """
+        results: Dict[str, Any] = {}
+        
+        def callback(request_id, response, exception):
+            results[request_id] = exception if exception is not None else (response or {})
+        
+        items = list(requests.items())
+        for offset in range(0, len(items), self.BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for key, request in items[offset:offset + self.BATCH_SIZE]:
+                batch.add(request, request_id=key)
+            batch.execute()
+        
+        return results
+    
+    def batch_create_events(self, events: Dict[str, CalendarEventUpdate]) -> Dict[str, Any]:
+        """
+        Crea varios eventos en Google Calendar mediante peticiones batch.
+        
+        Args:
+            events: Eventos a crear, por clave del llamante (p. ej. el ID local)
+            
+        Returns:
+            Evento creado o excepción, por clave
+        """
+        return self._execute_batch({
+            key: self.service.events().insert(calendarId=self.calendar_id, body=self._build_patch_body(event))
+            for key, event in events.items()
+        })
+    
+    def batch_update_events(self, events: Dict[str, CalendarEventUpdate]) -> Dict[str, Any]:
+        """
+        Actualiza varios eventos (PATCH, sin leerlos antes) mediante peticiones batch.
+        
+        Args:
+            events: Cambios por ID de evento de Google
+            
+        Returns:
+            Evento actualizado o excepción, por ID de Google
+        """
+        return self._execute_batch({
+            google_event_id: self.service.events().patch(
+                calendarId=self.calendar_id,
+                eventId=google_event_id,
+                body=self._build_patch_body(event)
+            )
+            for google_event_id, event in events.items()
+        })
+    
+    def batch_delete_events(self, google_event_ids: List[str]) -> Dict[str, Any]:
+        """
+        Elimina varios eventos mediante peticiones batch. Los eventos que ya no
+        existen en Google (404/410) se consideran eliminados.
+        
+        Args:
+            google_event_ids: IDs de eventos de Google
+            
+        Returns:
+            {} o excepción, por ID de Google
+        """
+        results = self._execute_batch({
+            google_event_id: self.service.events().delete(calendarId=self.calendar_id, eventId=google_event_id)
+            for google_event_id in google_event_ids
+        })
+        for google_event_id, result in results.items():
+            if isinstance(result, HttpError) and result.resp.status in (404, 410):
+                results[google_event_id] = {}
+        return results
+    
+    def watch_events(self, channel_id: str, token: str, address: str, ttl_seconds: int) -> Dict[str, Any]:
+        """
+        Abre un canal de notificaciones push (events.watch) sobre el calendario.
+        
+        Args:
+            channel_id: ID único del canal
+            token: Token que Google reenvía en cada notificación (X-Goog-Channel-Token)
+            address: URL HTTPS del webhook
+            ttl_seconds: Duración solicitada del canal
+            
+        Returns:
+            Canal creado (incluye resourceId y expiration en milisegundos)
+        """
+        try:
+            return self.service.events().watch(
+                calendarId=self.calendar_id,
+                body={
+                    'id': channel_id,
+                    'type': 'web_hook',
+                    'address': address,
+                    'token': token,
+                    'params': {'ttl': str(ttl_seconds)}
+                }
+            ).execute()
+        except HttpError as error:
+            logger.error(f"Error abriendo canal de notificaciones de Google Calendar: {error}")
+            raise
+    
+    def stop_channel(self, channel_id: str, resource_id: str) -> bool:
+        """
+        Cierra un canal de notificaciones push. Un canal que ya no existe
+        (404) se considera cerrado.
+        
+        Args:
+            channel_id: ID del canal
+            resource_id: ID del recurso vigilado
+            
+        Returns:
+            True si el canal queda cerrado
+        """
+        try:
+            self.service.channels().stop(body={'id': channel_id, 'resourceId': resource_id}).execute()
+            return True
+        except HttpError as error:
+            if error.resp.status == 404:
+                return True
+            logger.error(f"Error cerrando canal de notificaciones de Google Calendar: {error}")
+            raise
+    
     def _format_datetime(self, dt: datetime, is_all_day: bool) -> Dict[str, str]:
         """
         Formatea una fecha/hora para la API de Google Calendar.
@@ -0,0 +1,165 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.metrics import metrics
+from app.services.calendar.reconciliation import parse_google_updated
+from app.services.calendar.recurrence import to_naive_utc
+
+# Mapeo de IDs de color de Google a colores de la aplicación
+GOOGLE_COLOR_MAPPING = {
+    '1': 'blue',
+    '2': 'green',
+    '3': 'purple',
+    '4': 'red',
+    '5': 'yellow',
+    '6': 'orange',
+    '7': 'turquoise',
+    '8': 'gray',
+    '9': 'bold blue',
+    '10': 'bold green',
+    '11': 'bold red'
+}
+
+# Página de la lista de Google: (items, nextPageToken, nextSyncToken)
+EventPage = Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]
+
+
+class SyncTokenExpiredError(Exception):
+    """El syncToken ya no es válido (410 Gone): hay que volver a listar la ventana completa."""
+
+
+def map_google_color_id(color_id: Optional[str]) -> Optional[str]:
+    """
+    Mapea un ID de color de Google Calendar a un color de la aplicación
+    """
+    if not color_id:
+        return None
+    return GOOGLE_COLOR_MAPPING.get(color_id, 'blue')
+
+
+def parse_google_datetime(google_event: Dict[str, Any]) -> Tuple[Optional[datetime], Optional[datetime], bool]:
+    """
+    Extrae las fechas de un evento de Google.
+
+    Returns:
+        Tuple (start_time, end_time, is_all_day); las fechas son None si el
+        evento no las trae (instancias canceladas)
+    """
+    start_info = google_event.get('start') or {}
+    end_info = google_event.get('end') or {}
+
+    # Para eventos de todo el día, Google usa 'date'
+    if 'date' in start_info and 'date' in end_info:
+        start_time = datetime.fromisoformat(start_info['date'])
+        # El fin es exclusivo en Google: se resta un día y se lleva al final del día
+        end_time = datetime.fromisoformat(end_info['date']) - timedelta(days=1)
+        return start_time, end_time.replace(hour=23, minute=59, second=59), True
+
+    start_str = start_info.get('dateTime')
+    end_str = end_info.get('dateTime')
+    start_time = datetime.fromisoformat(start_str.replace('Z', '+00:00')) if start_str else None
+    end_time = datetime.fromisoformat(end_str.replace('Z', '+00:00')) if end_str else None
+    return start_time, end_time, False
+
+
+@dataclass(slots=True)
+class GoogleEventRecord:
+    """
+    Evento de Google reducido a los campos que usa la sincronización. Con
+    `__slots__` ocupa una fracción del diccionario completo de la API.
+    """
+
+    id: str
+    status: Optional[str]
+    updated: Optional[datetime]
+    recurring_event_id: Optional[str]
+    title: str
+    description: str
+    location: str
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+    is_all_day: bool
+    recurrence_rule: Optional[str]
+    color: Optional[str]
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.status == "cancelled"
+
+    @classmethod
+    def from_google(cls, item: Dict[str, Any]) -> "GoogleEventRecord":
+        """
+        Crea el registro a partir de un elemento de `events().list`
+        """
+        start_time, end_time, is_all_day = parse_google_datetime(item)
+
+        recurrence_rule = None
+        for rule in item.get('recurrence') or ():
+            if rule.startswith('RRULE:'):
+                recurrence_rule = rule[6:]  # Quitar el prefijo 'RRULE:'
+                break
+
+        return cls(
+            id=item.get('id'),
+            status=item.get('status'),
+            updated=parse_google_updated(item.get('updated')),
+            recurring_event_id=item.get('recurringEventId'),
+            title=item.get('summary', ''),
+            description=item.get('description', ''),
+            location=item.get('location', ''),
+            start_time=to_naive_utc(start_time) if start_time else None,
+            end_time=to_naive_utc(end_time) if end_time else None,
+            is_all_day=is_all_day,
+            recurrence_rule=recurrence_rule,
+            color=map_google_color_id(item.get('colorId')),
+        )
+
+
+async def iter_event_pages(
+    google_service: Any,
+    start_time: datetime,
+    end_time: datetime,
+    call: Optional[Callable[..., Awaitable[EventPage]]] = None,
+    show_deleted: bool = False,
+    sync_token: Optional[str] = None,
+    on_sync_token: Optional[Callable[[str], None]] = None,
+) -> AsyncIterator[List[GoogleEventRecord]]:
+    """
+    Recorre todas las páginas de `events().list` (siguiendo `nextPageToken`) y
+    devuelve cada página convertida en registros compactos. Solo hay una página
+    en memoria a la vez.
+    
+    Con `sync_token` solo se listan los cambios desde el listado que lo devolvió
+    (incluidos los borrados), sin límite de fechas.
+
+    Args:
+        google_service: GoogleCalendarService (o compatible con `list_events_page`)
+        start_time: Inicio del rango
+        end_time: Fin del rango
+        call: Función con la que ejecutar la petición bloqueante, p. ej. la que
+            aplica la cuota de Google (por defecto asyncio.to_thread)
+        show_deleted: Incluir los eventos borrados en Google (status "cancelled")
+        sync_token: nextSyncToken de un listado anterior (sincronización incremental)
+        on_sync_token: Recibe el nextSyncToken de la última página, si Google lo devuelve
+
+    Raises:
+        SyncTokenExpiredError: Si Google ya no acepta `sync_token`
+
+    Yields:
+        Lista de GoogleEventRecord de cada página
+    """
+    call = call or asyncio.to_thread
+    page_token = None
+    while True:
+        items, page_token, next_sync_token = await call(
+            google_service.list_events_page, start_time, end_time, page_token, show_deleted, sync_token
+        )
+        metrics.inc("google_calendar_pages_total")
+        metrics.inc("google_calendar_events_listed_total", len(items))
+        yield [GoogleEventRecord.from_google(item) for item in items if item.get('id')]
+        if not page_token:
+            if next_sync_token and on_sync_token is not None:
+                on_sync_token(next_sync_token)
+            break
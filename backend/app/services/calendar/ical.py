@@ -0,0 +1,380 @@
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from app.core.config import settings
+from app.models.calendar import CalendarEvent
+from app.services.calendar.recurrence import to_naive_utc
+
+CRLF = "\r\n"
+# Longitud máxima de línea (en octetos) antes de plegarla, según RFC 5545
+MAX_LINE_OCTETS = 75
+
+
+def _uid_domain() -> str:
+    return urlparse(settings.BACKEND_URL).hostname or "localhost"
+
+
+def escape_text(value: Optional[str]) -> str:
+    """
+    Escapa un valor TEXT de iCalendar (barras, separadores y saltos de línea)
+    """
+    if not value:
+        return ""
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+        .replace("\r", "\\n")
+    )
+
+
+def fold_line(line: str) -> str:
+    """
+    Pliega una línea de contenido en trozos de 75 octetos sin partir
+    caracteres UTF-8 multibyte
+    """
+    if len(line) <= MAX_LINE_OCTETS // 4 or len(line.encode("utf-8")) <= MAX_LINE_OCTETS:
+        return line
+    parts = []
+    current = ""
+    current_octets = 0
+    limit = MAX_LINE_OCTETS
+    for char in line:
+        char_octets = len(char.encode("utf-8"))
+        if current_octets + char_octets > limit:
+            parts.append(current)
+            current, current_octets = "", 0
+            # Las líneas de continuación empiezan con un espacio
+            limit = MAX_LINE_OCTETS - 1
+        current += char
+        current_octets += char_octets
+    parts.append(current)
+    return (CRLF + " ").join(parts)
+
+
+def format_datetime(value: datetime) -> str:
+    return to_naive_utc(value).strftime("%Y%m%dT%H%M%SZ")
+
+
+def format_date(value: Union[date, datetime]) -> str:
+    return value.strftime("%Y%m%d")
+
+
+def _content_lines(properties: Iterable[str]) -> str:
+    return "".join(fold_line(prop) + CRLF for prop in properties)
+
+
+def calendar_header(name: Optional[str] = None) -> str:
+    return _content_lines([
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:-//{escape_text(settings.PROJECT_NAME)}//ES",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(name or settings.PROJECT_NAME)}",
+    ])
+
+
+def calendar_footer() -> str:
+    return "END:VCALENDAR" + CRLF
+
+
+def event_to_vevent(event: CalendarEvent, dtstamp: datetime) -> str:
+    """
+    Convierte un evento de calendario en un VEVENT
+    """
+    properties = [
+        "BEGIN:VEVENT",
+        f"UID:{event.ical_uid or f'{event.id}@{_uid_domain()}'}",
+        f"DTSTAMP:{format_datetime(dtstamp)}",
+    ]
+    if event.is_all_day:
+        # En local el fin es el último instante del día; en iCalendar DTEND es exclusivo
+        properties.append(f"DTSTART;VALUE=DATE:{format_date(event.start_time)}")
+        properties.append(f"DTEND;VALUE=DATE:{format_date(event.end_time.date() + timedelta(days=1))}")
+    else:
+        properties.append(f"DTSTART:{format_datetime(event.start_time)}")
+        properties.append(f"DTEND:{format_datetime(event.end_time)}")
+    properties.append(f"SUMMARY:{escape_text(event.title)}")
+    if event.description:
+        properties.append(f"DESCRIPTION:{escape_text(event.description)}")
+    if event.location:
+        properties.append(f"LOCATION:{escape_text(event.location)}")
+    if event.is_recurring and event.recurrence_rule:
+        properties.append(f"RRULE:{event.recurrence_rule}")
+    if event.updated_at:
+        properties.append(f"LAST-MODIFIED:{format_datetime(event.updated_at)}")
+    properties.append("END:VEVENT")
+    return _content_lines(properties)
+
+
+def _parse_task_datetime(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return to_naive_utc(value)
+    return to_naive_utc(datetime.fromisoformat(str(value).replace("Z", "+00:00")))
+
+
+def task_to_vevent(task: Dict[str, Any], dtstamp: datetime) -> Optional[str]:
+    """
+    Convierte una tarea con fecha límite en un VEVENT de todo el día en esa fecha
+    """
+    due = _parse_task_datetime(task.get("due_date"))
+    if due is None:
+        return None
+    properties = [
+        "BEGIN:VEVENT",
+        f"UID:task-{task['id']}@{_uid_domain()}",
+        f"DTSTAMP:{format_datetime(dtstamp)}",
+        f"DTSTART;VALUE=DATE:{format_date(due)}",
+        f"DTEND;VALUE=DATE:{format_date(due.date() + timedelta(days=1))}",
+        f"SUMMARY:{escape_text('Tarea: ' + (task.get('title') or ''))}",
+    ]
+    if task.get("description"):
+        properties.append(f"DESCRIPTION:{escape_text(task['description'])}")
+    updated_at = _parse_task_datetime(task.get("updated_at"))
+    if updated_at:
+        properties.append(f"LAST-MODIFIED:{format_datetime(updated_at)}")
+    properties.append("TRANSP:TRANSPARENT")  # Una fecha límite no ocupa el día
+    properties.append("END:VEVENT")
+    return _content_lines(properties)
+
+
+async def iter_calendar(events: AsyncIterator[CalendarEvent], tasks: List[Dict[str, Any]],
+                        name: Optional[str] = None, chunk_size: int = 100) -> AsyncIterator[str]:
+    """
+    Genera el documento iCalendar por trozos de `chunk_size` VEVENTs, a medida
+    que llegan los eventos
+    """
+    dtstamp = datetime.utcnow()
+    yield calendar_header(name)
+
+    chunk: List[str] = []
+    for task in tasks:
+        vevent = task_to_vevent(task, dtstamp)
+        if vevent:
+            chunk.append(vevent)
+    async for event in events:
+        chunk.append(event_to_vevent(event, dtstamp))
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+    yield calendar_footer()
+
+
+# --- Lectura de archivos ICS ---
+
+_DURATION_RE = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+_UNESCAPES = {"n": "\n", "N": "\n", "\\": "\\", ";": ";", ",": ","}
+
+
+@dataclass
+class ContentLine:
+    """Propiedad de iCalendar: NOMBRE;PARAM=valor:VALOR"""
+
+    name: str
+    value: str
+    params: Dict[str, str] = field(default_factory=dict)
+
+
+def parse_content_line(line: str) -> ContentLine:
+    """
+    Separa nombre, parámetros y valor de una línea (ya desplegada). Los
+    parámetros entre comillas pueden contener ':' y ';'.
+    """
+    in_quotes = False
+    separators = []
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes and char == ";":
+            separators.append(index)
+        elif not in_quotes and char == ":":
+            break
+    else:
+        raise ValueError(f"Línea iCalendar sin valor: {line[:40]}")
+
+    head = line[:index]
+    value = line[index + 1:]
+    bounds = [-1] + separators + [index]
+    name = head[:bounds[1]] if separators else head
+    params = {}
+    for start, end in zip(bounds[1:-1], bounds[2:]):
+        key, _, param_value = line[start + 1:end].partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return ContentLine(name=name.upper(), value=value, params=params)
+
+
+def unescape_text(value: str) -> str:
+    """
+    Deshace el escapado de un valor TEXT
+    """
+    if "\\" not in value:
+        return value
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            result.append(_UNESCAPES.get(escaped, escaped))
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+async def iter_unfolded_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Convierte un stream de bytes en líneas de contenido desplegadas (las líneas
+    que empiezan por espacio o tabulador continúan la anterior)
+    """
+    buffer = b""
+    pending: Optional[str] = None
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            line = raw.rstrip(b"\r").decode("utf-8", errors="replace")
+            if line[:1] in (" ", "\t") and pending is not None:
+                pending += line[1:]
+                continue
+            if pending:
+                yield pending
+            pending = line
+    if buffer:
+        line = buffer.rstrip(b"\r").decode("utf-8", errors="replace")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending += line[1:]
+        else:
+            if pending:
+                yield pending
+            pending = line
+    if pending:
+        yield pending
+
+
+async def iter_vevents(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, ContentLine]]:
+    """
+    Recorre los VEVENT de un archivo ICS sin cargarlo entero en memoria. Los
+    componentes anidados (VALARM) se ignoran; de cada propiedad se conserva la
+    primera aparición.
+    """
+    properties: Optional[Dict[str, ContentLine]] = None
+    nested = 0
+    async for line in iter_unfolded_lines(chunks):
+        upper = line.upper()
+        if upper == "BEGIN:VEVENT":
+            properties, nested = {}, 0
+        elif properties is None:
+            continue
+        elif upper == "END:VEVENT":
+            yield properties
+            properties = None
+        elif upper.startswith("BEGIN:"):
+            nested += 1
+        elif upper.startswith("END:"):
+            nested -= 1
+        elif nested == 0 and line:
+            prop = parse_content_line(line)
+            properties.setdefault(prop.name, prop)
+
+
+def _zone(tzid: Optional[str]):
+    if not tzid:
+        return None
+    try:
+        return ZoneInfo(tzid)
+    except (ZoneInfoNotFoundError, ValueError):
+        # Zonas no IANA (p. ej. las de Outlook): se toma la hora como UTC
+        return timezone.utc
+
+
+def parse_ical_datetime(prop: ContentLine) -> Tuple[datetime, bool]:
+    """
+    Convierte DTSTART/DTEND a UTC sin zona horaria
+
+    Returns:
+        Tuple (fecha, es_solo_fecha)
+    """
+    value = prop.value.strip()
+    if prop.params.get("VALUE", "").upper() == "DATE" or len(value) == 8:
+        return datetime.strptime(value, "%Y%m%d"), True
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ"), False
+    parsed = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    zone = _zone(prop.params.get("TZID"))
+    if zone is not None:
+        parsed = to_naive_utc(parsed.replace(tzinfo=zone))
+    return parsed, False
+
+
+def parse_duration(value: str) -> timedelta:
+    match = _DURATION_RE.match(value.strip())
+    if not match:
+        raise ValueError(f"Duración no válida: {value}")
+    parts = {key: int(number) for key, number in match.groupdict().items() if key != "sign" and number}
+    duration = timedelta(
+        weeks=parts.get("weeks", 0), days=parts.get("days", 0), hours=parts.get("hours", 0),
+        minutes=parts.get("minutes", 0), seconds=parts.get("seconds", 0)
+    )
+    return -duration if match.group("sign") == "-" else duration
+
+
+def vevent_to_values(properties: Dict[str, ContentLine]) -> Dict[str, Any]:
+    """
+    Convierte las propiedades de un VEVENT en valores de CalendarEvent. Los
+    eventos de todo el día siguen la convención local: el fin es el último
+    instante del último día (DTEND es exclusivo en iCalendar).
+
+    Raises:
+        ValueError: Si falta DTSTART o las fechas no son válidas
+    """
+    if "DTSTART" not in properties:
+        raise ValueError("VEVENT sin DTSTART")
+    start_time, is_all_day = parse_ical_datetime(properties["DTSTART"])
+
+    if "DTEND" in properties:
+        end_time, _ = parse_ical_datetime(properties["DTEND"])
+    elif "DURATION" in properties:
+        end_time = start_time + parse_duration(properties["DURATION"].value)
+    else:
+        end_time = start_time + timedelta(days=1) if is_all_day else start_time
+
+    if is_all_day:
+        last_day = max(end_time - timedelta(days=1), start_time)
+        end_time = datetime.combine(last_day.date(), time(23, 59, 59))
+    if end_time < start_time:
+        raise ValueError("VEVENT con DTEND anterior a DTSTART")
+
+    def text(name: str, limit: Optional[int] = None) -> Optional[str]:
+        prop = properties.get(name)
+        if prop is None or not prop.value:
+            return None
+        value = unescape_text(prop.value)
+        return value[:limit] if limit else value
+
+    rrule = properties.get("RRULE")
+    uid = text("UID", 255)
+    return {
+        "title": text("SUMMARY", 255) or "(Sin título)",
+        "description": text("DESCRIPTION"),
+        "location": text("LOCATION", 255),
+        "start_time": start_time,
+        "end_time": end_time,
+        "is_all_day": is_all_day,
+        "recurrence_rule": rrule.value if rrule else None,
+        "is_recurring": rrule is not None,
+        "ical_uid": uid,
+    }
@@ -0,0 +1,158 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.calendar import CalendarEvent
+from app.services.calendar.cache import invalidate_user_calendar
+from app.services.calendar.ical import iter_vevents, vevent_to_values
+
+logger = logging.getLogger(__name__)
+
+# Máximo de errores que se devuelven al cliente (el resto solo se cuentan)
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class IcsImportResult:
+    """Resultado de una importación ICS."""
+
+    events_parsed: int = 0
+    events_imported: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+    error_count: int = 0
+    errors: List[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def ms_per_thousand_events(self) -> Optional[float]:
+        if not self.events_parsed:
+            return None
+        return round(self.elapsed_seconds * 1000 / self.events_parsed * 1000, 2)
+
+    def add_error(self, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+
+class IcsImporter:
+    """
+    Importa un archivo ICS en el calendario de un usuario: los VEVENT se leen
+    del stream, se descartan los UID repetidos (en el archivo o ya importados)
+    y se insertan en sentencias INSERT de varias filas de `chunk_size` eventos,
+    con un único commit al final.
+    """
+
+    def __init__(self, db: AsyncSession, user_id: UUID, chunk_size: Optional[int] = None):
+        self.db = db
+        self.user_id = user_id
+        self.chunk_size = chunk_size or settings.ICS_IMPORT_CHUNK_SIZE
+        self._seen_uids: Set[str] = set()
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> IcsImportResult:
+        """
+        Ejecuta la importación
+
+        Args:
+            chunks: Contenido del archivo ICS por trozos
+
+        Returns:
+            IcsImportResult con los contadores y el rendimiento
+        """
+        result = IcsImportResult()
+        started = time.perf_counter()
+        pending: List[Dict[str, Any]] = []
+
+        try:
+            async for properties in iter_vevents(chunks):
+                result.events_parsed += 1
+                # Las excepciones de una serie (RECURRENCE-ID) y los cancelados no se importan
+                if "RECURRENCE-ID" in properties or \
+                        properties.get("STATUS") and properties["STATUS"].value.upper() == "CANCELLED":
+                    result.skipped += 1
+                    continue
+                try:
+                    values = vevent_to_values(properties)
+                except ValueError as e:
+                    uid = properties["UID"].value if "UID" in properties else "sin UID"
+                    result.add_error(f"Evento {uid}: {str(e)}")
+                    continue
+
+                uid = values["ical_uid"]
+                if uid is not None:
+                    if uid in self._seen_uids:
+                        result.duplicates += 1
+                        continue
+                    self._seen_uids.add(uid)
+                pending.append(values)
+
+                if len(pending) >= self.chunk_size:
+                    result.events_imported += await self._insert_chunk(pending, result)
+                    pending = []
+
+            if pending:
+                result.events_imported += await self._insert_chunk(pending, result)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+        if result.events_imported:
+            invalidate_user_calendar(self.user_id)
+
+        result.elapsed_seconds = time.perf_counter() - started
+        metrics.inc("calendar_ics_import_events_total", result.events_imported)
+        if result.ms_per_thousand_events is not None:
+            metrics.observe("calendar_ics_import_ms_per_thousand", result.ms_per_thousand_events)
+        logger.info(
+            f"Importación ICS del usuario {self.user_id}: {result.events_imported} eventos importados, "
+            f"{result.duplicates} duplicados, {result.skipped} omitidos, {result.error_count} errores "
+            f"({result.ms_per_thousand_events} ms por cada mil eventos)"
+        )
+        return result
+
+    async def _existing_uids(self, uids: List[str]) -> Set[str]:
+        stmt = select(CalendarEvent.ical_uid).where(
+            CalendarEvent.user_id == self.user_id,
+            CalendarEvent.ical_uid.in_(uids)
+        )
+        return set((await self.db.execute(stmt)).scalars())
+
+    async def _insert_chunk(self, values: List[Dict[str, Any]], result: IcsImportResult) -> int:
+        """
+        Inserta un lote con una sola sentencia INSERT ... VALUES (...), (...)
+        omitiendo los UID que el usuario ya tiene
+        """
+        uids = [row["ical_uid"] for row in values if row["ical_uid"] is not None]
+        existing = await self._existing_uids(uids) if uids else set()
+        now = datetime.utcnow()
+        rows = [
+            {
+                "id": uuid4(),
+                "user_id": self.user_id,
+                "color": None,
+                "google_event_id": None,
+                "sync_status": "local",
+                "last_synced_at": None,
+                "related_id": None,
+                "related_type": None,
+                "created_at": now,
+                "updated_at": now,
+                **row,
+            }
+            for row in values
+            if row["ical_uid"] not in existing
+        ]
+        result.duplicates += len(values) - len(rows)
+        if rows:
+            await self.db.execute(insert(CalendarEvent).values(rows))
+        return len(rows)
@@ -0,0 +1,434 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.schemas.calendar import CalendarSyncResponse
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+SYNC_LOGS_TABLE = "calendar_sync_logs"
+
+SYNC_STATUS_RUNNING = "running"
+SYNC_STATUS_RETRYING = "retrying"  # Intento fallido; la cola lo reintentará
+FINISHED_STATUSES = {"success", "partial", "failed"}
+
+# Canal de Postgres (LISTEN/NOTIFY) por el que los workers publican el progreso
+SYNC_PROGRESS_CHANNEL = "calendar_sync_progress"
+# El payload de NOTIFY no puede pasar de 8000 bytes
+_NOTIFY_MESSAGE_MAX_CHARS = 1000
+
+
+@dataclass
+class SyncProgress:
+    """Estado de una sincronización en curso (lo que ve el cliente)."""
+
+    sync_log_id: str
+    user_id: str
+    status: str = SYNC_STATUS_RUNNING
+    events_processed: int = 0
+    events_created: int = 0
+    events_updated: int = 0
+    events_deleted: int = 0
+    errors: int = 0
+    message: Optional[str] = None
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["updated_at"] = self.updated_at.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SyncProgress":
+        """
+        Crea el estado a partir de `to_dict` (notificaciones entre procesos)
+        """
+        return cls(**{**data, "updated_at": datetime.fromisoformat(data["updated_at"])})
+
+    @classmethod
+    def from_log_row(cls, row: Dict[str, Any]) -> "SyncProgress":
+        """
+        Crea el estado a partir de una fila de `calendar_sync_logs`
+        """
+        error_details = row.get("error_details") or {}
+        return cls(
+            sync_log_id=str(row["id"]),
+            user_id=str(row["user_id"]),
+            status=row.get("status") or SYNC_STATUS_RUNNING,
+            events_processed=row.get("events_processed") or 0,
+            events_created=row.get("events_created") or 0,
+            events_updated=row.get("events_updated") or 0,
+            events_deleted=row.get("events_deleted") or 0,
+            errors=len(error_details.get("errors") or []),
+            message=row.get("error_message"),
+        )
+
+
+class SyncProgressBroker:
+    """
+    Pub/sub en proceso del progreso de las sincronizaciones. Cada suscriptor
+    tiene una cola de un elemento: si no da abasto, solo recibe el último
+    estado (al cliente le basta con el más reciente).
+    """
+
+    def __init__(self, max_tracked: int = 1024):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        # Último estado por sincronización, para quien se suscribe a mitad
+        self._latest = LRUCache(maxsize=max_tracked, ttl=3600)
+
+    def latest(self, sync_log_id: str) -> Optional[SyncProgress]:
+        return self._latest.get(sync_log_id)
+
+    def publish(self, progress: SyncProgress) -> None:
+        """
+        Publica un estado a los suscriptores de su sincronización. Los estados
+        más antiguos que el último conocido se descartan (con el worker en este
+        proceso, la notificación de Postgres llega después del estado local).
+        """
+        latest = self.latest(progress.sync_log_id)
+        if latest is not None and latest is not progress and progress.updated_at < latest.updated_at:
+            return
+        self._latest.set(progress.sync_log_id, progress)
+        for queue in self._subscribers.get(progress.sync_log_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(progress)
+        metrics.inc("calendar_sync_progress_published_total")
+
+    @asynccontextmanager
+    async def subscribe(self, sync_log_id: str) -> AsyncIterator[asyncio.Queue]:
+        """
+        Suscribe a una sincronización; la cola empieza con el último estado conocido
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        latest = self.latest(sync_log_id)
+        if latest is not None:
+            queue.put_nowait(latest)
+        self._subscribers.setdefault(sync_log_id, set()).add(queue)
+        metrics.set_gauge("calendar_sync_progress_subscribers", sum(len(s) for s in self._subscribers.values()))
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(sync_log_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[sync_log_id]
+            metrics.set_gauge("calendar_sync_progress_subscribers", sum(len(s) for s in self._subscribers.values()))
+
+
+# Instancia global del broker
+sync_progress_broker = SyncProgressBroker()
+
+
+class PostgresProgressRelay:
+    """
+    Lleva el progreso de los workers a los procesos web con LISTEN/NOTIFY de
+    Postgres, en la base de datos de la cola de trabajos: el worker hace NOTIFY
+    con cada estado y cada proceso web mantiene una sola conexión en LISTEN
+    que lo publica en su broker. Con SQLite no hace nada y los streams leen la
+    tabla de respaldo.
+    """
+
+    def __init__(self, database_url: Optional[str] = None):
+        self._database_url = database_url
+        self.listening = False
+
+    @property
+    def database_url(self) -> Optional[str]:
+        return self._database_url or settings.JOB_QUEUE_DATABASE_URL or settings.DATABASE_URL
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.database_url) and self.database_url.startswith(("postgres://", "postgresql"))
+
+    def _engine(self):
+        from app.db.database import get_async_engine
+        return get_async_engine(self.database_url)
+
+    async def notify(self, progress: SyncProgress) -> None:
+        """
+        Envía un estado a los procesos que escuchan el canal
+        """
+        if not self.enabled:
+            return
+        data = progress.to_dict()
+        if data["message"]:
+            data["message"] = data["message"][:_NOTIFY_MESSAGE_MAX_CHARS]
+        try:
+            async with self._engine().connect() as conn:
+                await conn.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": SYNC_PROGRESS_CHANNEL, "payload": json.dumps(data)}
+                )
+                await conn.commit()
+            metrics.inc("calendar_sync_progress_notifies_total")
+        except Exception as e:
+            # El progreso no debe interrumpir la sincronización
+            logger.warning(f"No se pudo notificar el progreso de la sincronización {progress.sync_log_id}: {str(e)}")
+
+    async def run(self, broker: Optional[SyncProgressBroker] = None,
+                  stop_event: Optional[asyncio.Event] = None, reconnect_delay: float = 5.0) -> None:
+        """
+        Escucha el canal y publica cada estado en `broker` hasta `stop_event`;
+        si se pierde la conexión, vuelve a conectar
+        """
+        broker = broker or sync_progress_broker
+        stop_event = stop_event or asyncio.Event()
+
+        def on_notification(connection, pid, channel, payload):
+            try:
+                broker.publish(SyncProgress.from_dict(json.loads(payload)))
+                metrics.inc("calendar_sync_progress_notifications_total")
+            except Exception as e:
+                logger.warning(f"Notificación de progreso no válida: {str(e)}")
+
+        while not stop_event.is_set():
+            try:
+                async with self._engine().connect() as conn:
+                    listener = (await conn.get_raw_connection()).driver_connection
+                    await listener.add_listener(SYNC_PROGRESS_CHANNEL, on_notification)
+                    self.listening = True
+                    try:
+                        while not stop_event.is_set() and not listener.is_closed():
+                            try:
+                                await asyncio.wait_for(stop_event.wait(), timeout=reconnect_delay)
+                            except asyncio.TimeoutError:
+                                pass
+                    finally:
+                        self.listening = False
+                        if not listener.is_closed():
+                            await listener.remove_listener(SYNC_PROGRESS_CHANNEL, on_notification)
+            except Exception as e:
+                logger.error(f"Error escuchando el progreso de las sincronizaciones: {str(e)}")
+            if not stop_event.is_set():
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=reconnect_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+
+# Instancia global del relay entre procesos
+sync_progress_relay = PostgresProgressRelay()
+
+
+class SupabaseSyncLogStore:
+    """Registros de sincronización en la tabla `calendar_sync_logs` de Supabase."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from app.db.database import get_supabase_admin_client
+            self._client = get_supabase_admin_client()
+        return self._client
+
+    async def create(self, user_id: str, sync_type: str) -> str:
+        """
+        Crea el registro de una sincronización en curso
+
+        Returns:
+            ID del registro
+        """
+        row = {
+            "user_id": str(user_id),
+            "sync_type": sync_type,
+            "status": SYNC_STATUS_RUNNING,
+            "started_at": datetime.utcnow().isoformat(),
+        }
+        response = await asyncio.to_thread(lambda: self.client.table(SYNC_LOGS_TABLE).insert(row).execute())
+        return str(response.data[0]["id"])
+
+    async def update(self, sync_log_id: str, values: Dict[str, Any]) -> None:
+        await asyncio.to_thread(
+            lambda: self.client.table(SYNC_LOGS_TABLE).update(values).eq("id", sync_log_id).execute()
+        )
+
+    async def get(self, sync_log_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        response = await asyncio.to_thread(
+            lambda: self.client.table(SYNC_LOGS_TABLE).select("*")
+            .eq("id", sync_log_id).eq("user_id", str(user_id)).limit(1).execute()
+        )
+        return response.data[0] if response.data else None
+
+
+class SyncProgressReporter:
+    """
+    Lo usa el worker de sincronización: publica cada avance en el broker y en el
+    relay de Postgres (para los procesos web) y lo escribe en `calendar_sync_logs`
+    como mucho cada SYNC_PROGRESS_WRITE_INTERVAL_SECONDS (el estado final
+    siempre se escribe).
+    """
+
+    def __init__(self, sync_log_id: str, user_id: Any, store: Optional[SupabaseSyncLogStore] = None,
+                 broker: Optional[SyncProgressBroker] = None, write_interval: Optional[float] = None,
+                 relay: Optional[PostgresProgressRelay] = None):
+        self.progress = SyncProgress(sync_log_id=str(sync_log_id), user_id=str(user_id))
+        self.store = store or SupabaseSyncLogStore()
+        self.broker = broker or sync_progress_broker
+        self.relay = relay or sync_progress_relay
+        self.write_interval = write_interval if write_interval is not None \
+            else settings.SYNC_PROGRESS_WRITE_INTERVAL_SECONDS
+        self._last_write = 0.0
+        self._error_messages = []
+
+    async def start(self) -> None:
+        await self._publish()
+        await self._write(force=True)
+
+    async def update(self, processed: int = 0, created: int = 0, updated: int = 0, deleted: int = 0,
+                     errors: Optional[list] = None) -> None:
+        """
+        Suma un avance de la sincronización
+        """
+        progress = self.progress
+        progress.events_processed += processed
+        progress.events_created += created
+        progress.events_updated += updated
+        progress.events_deleted += deleted
+        if errors:
+            progress.errors += len(errors)
+            self._error_messages.extend(errors)
+        progress.updated_at = datetime.utcnow()
+        await self._publish()
+        await self._write()
+
+    async def finish(self, result: CalendarSyncResponse) -> None:
+        """
+        Registra el resultado final de la sincronización
+        """
+        progress = self.progress
+        progress.status = "failed" if not result.success else ("partial" if result.errors else "success")
+        progress.message = result.message
+        progress.updated_at = datetime.utcnow()
+        if result.success:
+            progress.events_created = result.events_created or 0
+            progress.events_updated = result.events_updated or 0
+            progress.events_deleted = result.events_deleted or 0
+            self._error_messages = list(result.errors or [])
+        elif result.errors:
+            self._error_messages.extend(result.errors)
+        progress.errors = len(self._error_messages)
+        await self._publish()
+        await self._write(force=True)
+
+    async def retrying(self, result: CalendarSyncResponse) -> None:
+        """
+        Registra un intento fallido que la cola va a reintentar: el cliente sigue
+        esperando en lugar de recibir un fallo definitivo
+        """
+        progress = self.progress
+        progress.status = SYNC_STATUS_RETRYING
+        progress.message = result.message
+        progress.updated_at = datetime.utcnow()
+        await self._publish()
+        await self._write(force=True)
+
+    async def _publish(self) -> None:
+        # Copia: el broker guarda el estado y el reporter sigue modificando el suyo
+        progress = replace(self.progress)
+        self.broker.publish(progress)
+        await self.relay.notify(progress)
+
+    async def _write(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_write < self.write_interval:
+            return
+        self._last_write = now
+
+        progress = self.progress
+        values = {
+            "status": progress.status,
+            "events_processed": progress.events_processed,
+            "events_created": progress.events_created,
+            "events_updated": progress.events_updated,
+            "events_deleted": progress.events_deleted,
+            "error_details": {"errors": self._error_messages} if self._error_messages else None,
+        }
+        if progress.is_finished:
+            values["completed_at"] = progress.updated_at.isoformat()
+            values["error_message"] = None if progress.status == "success" else progress.message
+        try:
+            await self.store.update(progress.sync_log_id, values)
+            metrics.inc("calendar_sync_progress_writes_total")
+        except Exception as e:
+            # El progreso no debe interrumpir la sincronización
+            logger.warning(f"No se pudo guardar el progreso de la sincronización {progress.sync_log_id}: {str(e)}")
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_sync_progress(
+    sync_log_id: str,
+    user_id: str,
+    store: Optional[SupabaseSyncLogStore] = None,
+    broker: Optional[SyncProgressBroker] = None,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    relay: Optional[PostgresProgressRelay] = None,
+) -> AsyncIterator[str]:
+    """
+    Genera el stream SSE del progreso de una sincronización hasta que termina.
+
+    El progreso llega por el broker: directamente si el worker corre en este
+    proceso, o por el relay de Postgres si corre en otro. El registro de la
+    tabla solo se lee si no llega nada: al empezar (la sincronización pudo
+    terminar antes) y después cada SYNC_PROGRESS_POLL_INTERVAL_SECONDS, o cada
+    SYNC_PROGRESS_NOTIFY_POLL_INTERVAL_SECONDS mientras el relay escucha.
+    """
+    store = store or SupabaseSyncLogStore()
+    broker = broker or sync_progress_broker
+    relay = relay or sync_progress_relay
+    poll_interval = settings.SYNC_PROGRESS_POLL_INTERVAL_SECONDS
+    last_sent = None
+    last_activity = last_read = time.monotonic()
+
+    async with broker.subscribe(sync_log_id) as queue:
+        while True:
+            if is_disconnected is not None and await is_disconnected():
+                return
+            try:
+                progress = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                progress = None
+                read_interval = settings.SYNC_PROGRESS_NOTIFY_POLL_INTERVAL_SECONDS if relay.listening \
+                    else poll_interval
+                if last_sent is None or time.monotonic() - last_read >= read_interval:
+                    last_read = time.monotonic()
+                    row = await store.get(sync_log_id, user_id)
+                    if row is None:
+                        yield format_sse("error", {"detail": "Registro de sincronización no encontrado"})
+                        return
+                    progress = SyncProgress.from_log_row(row)
+                    metrics.inc("calendar_sync_progress_polls_total")
+
+            if progress is not None:
+                snapshot = progress.to_dict()
+                snapshot.pop("updated_at")
+                if snapshot != last_sent:
+                    last_sent = snapshot
+                    last_activity = time.monotonic()
+                    yield format_sse("progress", progress.to_dict())
+                if progress.is_finished:
+                    return
+
+            if time.monotonic() - last_activity >= settings.SYNC_PROGRESS_KEEPALIVE_SECONDS:
+                last_activity = time.monotonic()
+                yield ": keepalive\n\n"
@@ -0,0 +1,298 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.models.calendar import CalendarEvent
+
+if TYPE_CHECKING:
+    from app.services.calendar.google_events import GoogleEventRecord
+
+# Estados locales de sincronización
+SYNC_STATUS_LOCAL = "local"
+SYNC_STATUS_SYNCED = "synced"
+SYNC_STATUS_MODIFIED = "modified"
+SYNC_STATUS_DELETED = "deleted"  # Tombstone: borrado localmente, pendiente de borrar en Google
+
+
+@dataclass
+class ReconciliationPlan:
+    """Operaciones necesarias para igualar el calendario local y el de Google."""
+
+    # Google -> local
+    pull_creates: List["GoogleEventRecord"] = field(default_factory=list)
+    pull_updates: List[Tuple[CalendarEvent, "GoogleEventRecord"]] = field(default_factory=list)
+    local_deletes: List[CalendarEvent] = field(default_factory=list)
+    # Local -> Google
+    push_creates: List[CalendarEvent] = field(default_factory=list)
+    push_updates: List[CalendarEvent] = field(default_factory=list)
+    remote_deletes: List[CalendarEvent] = field(default_factory=list)
+    # Tombstones cuyo evento ya no existe en Google: solo hay que purgarlos
+    purged_tombstones: List[CalendarEvent] = field(default_factory=list)
+    # Eventos cambiados en ambos lados, pendientes de resolver tras las dos fases
+    conflicts: List[Tuple[CalendarEvent, "GoogleEventRecord"]] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not any((
+            self.pull_creates, self.pull_updates, self.local_deletes,
+            self.push_creates, self.push_updates, self.remote_deletes, self.purged_tombstones,
+            self.conflicts
+        ))
+
+
+def parse_google_updated(value: Optional[str]) -> Optional[datetime]:
+    """
+    Convierte el campo `updated` (RFC 3339) de Google a UTC sin zona
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _remote_changed(local_event: CalendarEvent, remote_event: "GoogleEventRecord") -> bool:
+    if local_event.last_synced_at is None or remote_event.updated is None:
+        return True
+    return remote_event.updated > local_event.last_synced_at
+
+
+def _local_wins(local_event: CalendarEvent, remote_event: "GoogleEventRecord") -> bool:
+    # Última escritura gana
+    return remote_event.updated is not None and local_event.updated_at is not None \
+        and local_event.updated_at > remote_event.updated
+
+
+def resolve_conflicts(conflicts: Iterable[Tuple[CalendarEvent, "GoogleEventRecord"]]) -> ReconciliationPlan:
+    """
+    Resuelve los eventos modificados en ambos lados (gana la última escritura)
+
+    Returns:
+        Plan con solo actualizaciones en uno u otro sentido
+    """
+    plan = ReconciliationPlan()
+    for local_event, remote_event in conflicts:
+        if _local_wins(local_event, remote_event):
+            plan.push_updates.append(local_event)
+        else:
+            plan.pull_updates.append((local_event, remote_event))
+    return plan
+
+
+def guard_conflicts(plan: ReconciliationPlan) -> ReconciliationPlan:
+    """
+    Garantiza que ninguna fila local la toquen a la vez la fase pull y la fase
+    push: los eventos presentes en ambas se retiran de las dos y se pasan a
+    `conflicts` (o se descartan si no hay evento remoto con el que compararlos).
+    """
+    pull_ids = {event.id for event, _ in plan.pull_updates} | {event.id for event in plan.local_deletes}
+    push_ids = {event.id for event in plan.push_creates} | {event.id for event in plan.push_updates} \
+        | {event.id for event in plan.remote_deletes} | {event.id for event in plan.purged_tombstones}
+    overlap = pull_ids & push_ids
+    if not overlap:
+        return plan
+
+    plan.conflicts.extend((event, remote) for event, remote in plan.pull_updates if event.id in overlap)
+    plan.pull_updates = [(event, remote) for event, remote in plan.pull_updates if event.id not in overlap]
+    plan.local_deletes = [event for event in plan.local_deletes if event.id not in overlap]
+    plan.push_creates = [event for event in plan.push_creates if event.id not in overlap]
+    plan.push_updates = [event for event in plan.push_updates if event.id not in overlap]
+    plan.remote_deletes = [event for event in plan.remote_deletes if event.id not in overlap]
+    plan.purged_tombstones = [event for event in plan.purged_tombstones if event.id not in overlap]
+    return plan
+
+
+class StreamingReconciler:
+    """
+    Reconciliación incremental: los eventos remotos llegan página a página
+    (`feed`) y solo se guardan sus IDs; al terminar (`finish`) se envían a
+    Google los tombstones que no aparecieron en la lista.
+
+    - remoto - local: eventos nuevos en Google -> crear en local
+    - remotos borrados (status "cancelled", listados con showDeleted) ->
+      borrar en local (los tombstones solo se purgan). Que un evento falte de
+      la lista no basta: puede haberse movido fuera de la ventana.
+    - remoto & local: se compara `updated` de Google con `last_synced_at`;
+      si ambos lados cambiaron gana el más reciente
+    - locales sin ID de Google -> crear en Google; tombstones -> borrar en Google
+    """
+
+    def __init__(self, local_events: Iterable[CalendarEvent], direction: str = "bidirectional",
+                 defer_conflicts: bool = False):
+        """
+        Args:
+            local_events: Eventos locales de la ventana (incluidos tombstones)
+            direction: pull, push o bidirectional
+            defer_conflicts: Dejar los eventos cambiados en ambos lados en `conflicts`
+                en lugar de resolverlos aquí
+        """
+        self.pull = direction in ("pull", "bidirectional")
+        self.push = direction in ("push", "bidirectional")
+        self.defer_conflicts = defer_conflicts
+        self._local_by_google_id: Dict[str, CalendarEvent] = {}
+        # Series creadas en local: Google las devuelve expandidas en instancias
+        # (singleEvents), que no son eventos nuevos; y la serie no se da por
+        # borrada porque su ID no aparezca en la lista
+        self._series_ids: Set[str] = set()
+        self._seen_ids: Set[str] = set()
+        self._initial = ReconciliationPlan()
+        self.add_local_events(local_events)
+
+    def initial_plan(self) -> ReconciliationPlan:
+        """
+        Operaciones que no dependen de Google: eventos locales nuevos y
+        tombstones que nunca llegaron a Google
+        """
+        plan, self._initial = self._initial, ReconciliationPlan()
+        return plan
+
+    def missing_google_ids(self, page: Iterable["GoogleEventRecord"]) -> Set[str]:
+        """
+        IDs de Google de la página (eventos y series) sin evento local cargado
+        """
+        missing = set()
+        for remote_event in page:
+            for google_id in (remote_event.id, remote_event.recurring_event_id):
+                if google_id and google_id not in self._local_by_google_id:
+                    missing.add(google_id)
+        return missing
+
+    def has_local(self, google_id: str) -> bool:
+        """
+        Si hay un evento local registrado con ese ID de Google
+        """
+        return google_id in self._local_by_google_id
+
+    def add_local_events(self, events: Iterable[CalendarEvent]) -> None:
+        """
+        Registra eventos locales: los de la ventana y los que, fuera de ella,
+        comparten ID de Google con algún evento remoto (eventos movidos, series)
+        """
+        for event in events:
+            if event.google_event_id:
+                if event.google_event_id in self._local_by_google_id:
+                    continue
+                self._local_by_google_id[event.google_event_id] = event
+                if event.is_recurring and event.sync_status != SYNC_STATUS_DELETED:
+                    self._series_ids.add(event.google_event_id)
+                    # Las series solo se sincronizan de local a Google
+                    if self.push and event.sync_status == SYNC_STATUS_MODIFIED:
+                        self._initial.push_updates.append(event)
+            elif event.sync_status == SYNC_STATUS_DELETED:
+                # Nunca llegó a Google: basta con borrarlo localmente
+                self._initial.purged_tombstones.append(event)
+            elif self.push and event.sync_status in (SYNC_STATUS_LOCAL, SYNC_STATUS_MODIFIED, None):
+                self._initial.push_creates.append(event)
+
+    def feed(self, page: Iterable["GoogleEventRecord"]) -> ReconciliationPlan:
+        """
+        Reconcilia una página de eventos remotos. Antes hay que registrar con
+        `add_local_events` los eventos locales indicados por `missing_google_ids`.
+
+        Returns:
+            Plan de la página
+        """
+        plan = self.initial_plan()
+        for remote_event in page:
+            if remote_event.recurring_event_id in self._series_ids or remote_event.id in self._series_ids:
+                continue
+            self._seen_ids.add(remote_event.id)
+
+            event = self._local_by_google_id.get(remote_event.id)
+            if remote_event.is_cancelled:
+                # Borrado en Google: el tombstone local ya no tiene nada que borrar
+                if event is not None and event.sync_status == SYNC_STATUS_DELETED:
+                    plan.purged_tombstones.append(event)
+                elif event is not None and self.pull:
+                    plan.local_deletes.append(event)
+                continue
+
+            if event is None:
+                if self.pull:
+                    plan.pull_creates.append(remote_event)
+                continue
+
+            if event.sync_status == SYNC_STATUS_DELETED:
+                if self.push:
+                    plan.remote_deletes.append(event)
+                continue
+
+            local_changed = event.sync_status in (SYNC_STATUS_MODIFIED, SYNC_STATUS_LOCAL)
+            remote_changed = _remote_changed(event, remote_event)
+
+            if local_changed and remote_changed:
+                if self.defer_conflicts and self.pull and self.push:
+                    plan.conflicts.append((event, remote_event))
+                elif _local_wins(event, remote_event):
+                    if self.push:
+                        plan.push_updates.append(event)
+                elif self.pull:
+                    plan.pull_updates.append((event, remote_event))
+            elif local_changed:
+                if self.push:
+                    plan.push_updates.append(event)
+            elif remote_changed and self.pull:
+                plan.pull_updates.append((event, remote_event))
+        return plan
+
+    def finish(self, remote_listed: bool = True) -> ReconciliationPlan:
+        """
+        Cierra la reconciliación tras la última página.
+
+        Args:
+            remote_listed: False si no se consultó la lista remota (sincronización
+                solo push): entonces solo se envían los cambios locales
+
+        Returns:
+            Plan con las operaciones restantes
+        """
+        plan = self.initial_plan()
+        for google_id, event in self._local_by_google_id.items():
+            if google_id in self._series_ids:
+                continue
+            if not remote_listed:
+                if self.push and event.sync_status == SYNC_STATUS_MODIFIED:
+                    plan.push_updates.append(event)
+                elif self.push and event.sync_status == SYNC_STATUS_DELETED:
+                    plan.remote_deletes.append(event)
+            elif google_id not in self._seen_ids and self.push and event.sync_status == SYNC_STATUS_DELETED:
+                # Puede seguir existiendo fuera de la ventana: se borra en Google
+                # (si ya no existe, el borrado se da por hecho)
+                plan.remote_deletes.append(event)
+        return plan
+
+
+def merge_plans(*plans: ReconciliationPlan) -> ReconciliationPlan:
+    """
+    Une varios planes en uno
+    """
+    merged = ReconciliationPlan()
+    for plan in plans:
+        for name in merged.__dataclass_fields__:
+            getattr(merged, name).extend(getattr(plan, name))
+    return merged
+
+
+def reconcile(local_events: Iterable[CalendarEvent], remote_events: Optional[Iterable["GoogleEventRecord"]],
+              direction: str = "bidirectional", defer_conflicts: bool = False) -> ReconciliationPlan:
+    """
+    Calcula de una vez las altas, modificaciones y bajas en cada sentido (ver
+    StreamingReconciler).
+
+    Args:
+        local_events: Eventos locales de la ventana (incluidos tombstones) más los
+            que comparten ID de Google con algún evento remoto
+        remote_events: Eventos de Google de la ventana, o None si no se consultaron
+            (sincronización solo push)
+        direction: pull, push o bidirectional
+        defer_conflicts: Dejar los eventos cambiados en ambos lados en `conflicts`
+            en lugar de resolverlos aquí
+
+    Returns:
+        Plan de reconciliación
+    """
+    reconciler = StreamingReconciler(local_events, direction, defer_conflicts)
+    if remote_events is None:
+        return reconciler.finish(remote_listed=False)
+    return merge_plans(reconciler.feed(remote_events), reconciler.finish())
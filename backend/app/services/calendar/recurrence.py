@@ -0,0 +1,255 @@
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from dateutil.rrule import rrulestr
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.config import settings
+from app.models.calendar import CalendarEvent
+from app.services.calendar.reconciliation import SYNC_STATUS_DELETED
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+# Reglas que se expanden aritméticamente, sin recorrer la serie desde DTSTART
+_FAST_PATH_KEYS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "WKST"}
+
+_EVENT_COLUMNS = [column.key for column in CalendarEvent.__table__.columns]
+
+# Expansiones por (evento, regla, inicio, duración, ventana)
+_expansion_cache = LRUCache(maxsize=settings.CALENDAR_RECURRENCE_CACHE_SIZE, name="calendar_recurrence")
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    # Las columnas de calendario guardan UTC sin zona horaria
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_rrule(rule: str) -> Dict[str, str]:
+    """
+    Convierte una regla RRULE ("FREQ=WEEKLY;BYDAY=MO,WE") en un diccionario
+    """
+    if rule.upper().startswith("RRULE:"):
+        rule = rule[6:]
+    parts = {}
+    for part in rule.strip().split(";"):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            parts[key.strip().upper()] = value.strip().upper()
+    return parts
+
+
+def _parse_until(value: str) -> datetime:
+    value = value.rstrip("Z")
+    if "T" in value:
+        return datetime.strptime(value, "%Y%m%dT%H%M%S")
+    # UNTIL con fecha: incluye todo ese día
+    return datetime.strptime(value, "%Y%m%d").replace(hour=23, minute=59, second=59)
+
+
+def _ceil_div(numerator: timedelta, denominator: timedelta) -> int:
+    return -((-numerator) // denominator)
+
+
+def _expand_daily(dtstart: datetime, interval: int, count: Optional[int], until: Optional[datetime],
+                  lower: datetime, upper: datetime) -> Iterator[datetime]:
+    step = timedelta(days=interval)
+    index = max(0, _ceil_div(lower - dtstart, step))
+    while True:
+        if count is not None and index >= count:
+            return
+        start = dtstart + index * step
+        if start > upper or (until is not None and start > until):
+            return
+        yield start
+        index += 1
+
+
+def _expand_weekly(dtstart: datetime, interval: int, count: Optional[int], until: Optional[datetime],
+                   byday: Optional[str], wkst: str, lower: datetime, upper: datetime) -> Iterator[datetime]:
+    week_start_day = WEEKDAYS.get(wkst, 0)
+    if byday:
+        days = {WEEKDAYS[day] for day in byday.split(",")}
+    else:
+        days = {dtstart.weekday()}
+
+    # Desplazamientos (en días) desde el inicio de semana, en orden
+    start_offset = (dtstart.weekday() - week_start_day) % 7
+    offsets = sorted((day - week_start_day) % 7 for day in days)
+    skipped_first_week = sum(1 for offset in offsets if offset < start_offset)
+    week_zero = dtstart - timedelta(days=start_offset)
+    period = timedelta(weeks=interval)
+
+    week = max(0, (lower - week_zero) // period)
+    while True:
+        base = week_zero + week * period
+        if base > upper:
+            return
+        for position, offset in enumerate(offsets):
+            if week == 0 and offset < start_offset:
+                continue
+            start = base + timedelta(days=offset)
+            index = week * len(offsets) + position - skipped_first_week
+            if count is not None and index >= count:
+                return
+            if (until is not None and start > until) or start > upper:
+                return
+            if start >= lower:
+                yield start
+        week += 1
+
+
+def _expand_with_dateutil(rule: str, dtstart: datetime, lower: datetime, upper: datetime) -> List[datetime]:
+    # dateutil exige que UNTIL y DTSTART coincidan en tener zona horaria
+    parts = parse_rrule(rule)
+    if "UNTIL" in parts:
+        parts["UNTIL"] = parts["UNTIL"].rstrip("Z")
+    normalized = ";".join(f"{key}={value}" for key, value in parts.items())
+    return rrulestr(normalized, dtstart=dtstart).between(lower, upper, inc=True)
+
+
+def expand_occurrences(rule: str, dtstart: datetime, duration: timedelta,
+                       window_start: datetime, window_end: datetime) -> Tuple[datetime, ...]:
+    """
+    Calcula los inicios de las ocurrencias de una serie que se solapan con la ventana.
+
+    Las reglas DAILY/WEEKLY sencillas saltan directamente a la primera ocurrencia
+    de la ventana, así que el coste depende solo del tamaño de la ventana y no de
+    la antigüedad de la serie. El resto de reglas se delegan en dateutil.
+
+    Args:
+        rule: Regla RRULE (con o sin prefijo "RRULE:")
+        dtstart: Inicio de la primera ocurrencia
+        duration: Duración de cada ocurrencia
+        window_start: Inicio de la ventana consultada
+        window_end: Fin de la ventana consultada
+
+    Returns:
+        Inicios de las ocurrencias, ordenados
+    """
+    dtstart = to_naive_utc(dtstart)
+    # Una ocurrencia se solapa si empieza antes del fin y termina después del inicio
+    lower = to_naive_utc(window_start) - duration
+    upper = to_naive_utc(window_end)
+
+    parts = parse_rrule(rule)
+    freq = parts.get("FREQ")
+    byday = parts.get("BYDAY")
+    # BYDAY con ordinal (p. ej. "1MO") no entra en el camino rápido
+    simple_byday = not byday or all(day in WEEKDAYS for day in byday.split(","))
+
+    try:
+        if set(parts) <= _FAST_PATH_KEYS and simple_byday and freq in ("DAILY", "WEEKLY"):
+            interval = max(1, int(parts.get("INTERVAL", 1)))
+            count = int(parts["COUNT"]) if "COUNT" in parts else None
+            until = _parse_until(parts["UNTIL"]) if "UNTIL" in parts else None
+            if freq == "DAILY" and not byday:
+                return tuple(_expand_daily(dtstart, interval, count, until, lower, upper))
+            if freq == "WEEKLY":
+                return tuple(_expand_weekly(dtstart, interval, count, until, byday, parts.get("WKST", "MO"),
+                                            lower, upper))
+        return tuple(_expand_with_dateutil(rule, dtstart, lower, upper))
+    except (ValueError, KeyError) as e:
+        # Regla inválida: se trata el evento como no recurrente
+        logger.warning(f"Regla de recurrencia inválida '{rule}': {str(e)}")
+        return (dtstart,) if lower <= dtstart <= upper else ()
+
+
+def cached_occurrences(event: CalendarEvent, window_start: datetime, window_end: datetime) -> Tuple[datetime, ...]:
+    """
+    Expansión de un evento recurrente para una ventana, cacheada con expulsión LRU
+    """
+    duration = event.end_time - event.start_time
+    key = (event.id, event.recurrence_rule, event.start_time, duration, window_start, window_end)
+    return _expansion_cache.get_or_set(
+        key,
+        lambda: expand_occurrences(event.recurrence_rule, event.start_time, duration, window_start, window_end)
+    )
+
+
+def invalidate_event(event_id: Any) -> None:
+    """
+    Elimina de la caché las expansiones de un evento
+    """
+    _expansion_cache.delete_where(lambda key: key[0] == event_id)
+
+
+def occurrence_to_dict(event: CalendarEvent, start: datetime, duration: timedelta) -> Dict[str, Any]:
+    """
+    Representa una ocurrencia como el evento base con las fechas desplazadas
+    """
+    occurrence = {column: getattr(event, column) for column in _EVENT_COLUMNS}
+    occurrence["start_time"] = start
+    occurrence["end_time"] = start + duration
+    occurrence["recurring_event_id"] = event.id
+    return occurrence
+
+
+def is_recurring_event(event: CalendarEvent) -> bool:
+    return bool(event.is_recurring and event.recurrence_rule)
+
+
+def event_start(item: Union[CalendarEvent, Dict[str, Any]]) -> datetime:
+    return item["start_time"] if isinstance(item, dict) else item.start_time
+
+
+def _occurrence_stream(event: CalendarEvent, window_start: datetime, window_end: datetime) -> Iterator[Dict[str, Any]]:
+    duration = event.end_time - event.start_time
+    for start in cached_occurrences(event, window_start, window_end):
+        yield occurrence_to_dict(event, start, duration)
+
+
+def merge_events_in_window(events: Iterable[CalendarEvent], window_start: datetime,
+                           window_end: datetime) -> List[Union[CalendarEvent, Dict[str, Any]]]:
+    """
+    Combina eventos simples y ocurrencias de eventos recurrentes en un único
+    listado ordenado por inicio (merge con heap de k flujos ya ordenados).
+
+    Args:
+        events: Eventos candidatos (simples que se solapan con la ventana y
+            recurrentes que empiezan antes de su fin)
+        window_start: Inicio de la ventana
+        window_end: Fin de la ventana
+
+    Returns:
+        Eventos simples (modelos) y ocurrencias (diccionarios) ordenados
+    """
+    window_start, window_end = to_naive_utc(window_start), to_naive_utc(window_end)
+    single_events = []
+    streams = []
+    for event in events:
+        if is_recurring_event(event):
+            streams.append(_occurrence_stream(event, window_start, window_end))
+        elif event.end_time >= window_start and event.start_time <= window_end:
+            single_events.append(event)
+
+    single_events.sort(key=event_start)
+    return list(heapq.merge(single_events, *streams, key=event_start))
+
+
+async def load_events_in_window(db: AsyncSession, user_id: Any, window_start: datetime,
+                                window_end: datetime) -> List[CalendarEvent]:
+    """
+    Carga los eventos simples que se solapan con la ventana y las series
+    recurrentes que empiezan antes de su fin (para expandirlas después)
+    """
+    stmt = select(CalendarEvent).where(
+        CalendarEvent.user_id == user_id,
+        # Los tombstones (borrados pendientes de propagar a Google) no se muestran
+        CalendarEvent.sync_status.is_distinct_from(SYNC_STATUS_DELETED),
+        CalendarEvent.start_time <= to_naive_utc(window_end),
+        or_(
+            CalendarEvent.end_time >= to_naive_utc(window_start),
+            and_(CalendarEvent.is_recurring.is_(True), CalendarEvent.recurrence_rule.isnot(None))
+        )
+    )
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
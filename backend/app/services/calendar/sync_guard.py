@@ -0,0 +1,91 @@
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Set
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.utils.rate_limit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class SyncInProgressError(Exception):
+    """El usuario ya tiene una sincronización de calendario en curso."""
+
+
+# Usuarios sincronizándose en este proceso (orquestador y pool embebido comparten proceso)
+_local_syncs: Set[str] = set()
+
+_job_quota_limiter: Optional[AsyncTokenBucket] = None
+
+
+def job_quota_limiter() -> AsyncTokenBucket:
+    """
+    Token bucket de cuota de Google para las sincronizaciones de la cola de
+    trabajos (/sync, notificaciones push) de este proceso.
+
+    El orquestador usa AUTO_SYNC_QUOTA_UTILIZATION de GOOGLE_CALENDAR_QUOTA_PER_MINUTE;
+    el resto se reparte entre los GOOGLE_CALENDAR_QUOTA_WORKER_PROCESSES procesos de workers.
+    """
+    global _job_quota_limiter
+    if _job_quota_limiter is None:
+        share = max(1.0 - settings.AUTO_SYNC_QUOTA_UTILIZATION, 0.0) \
+            / max(settings.GOOGLE_CALENDAR_QUOTA_WORKER_PROCESSES, 1)
+        _job_quota_limiter = AsyncTokenBucket.per_minute(
+            max(settings.GOOGLE_CALENDAR_QUOTA_PER_MINUTE * share, 1.0),
+            settings.GOOGLE_CALENDAR_QUOTA_BURST
+        )
+    return _job_quota_limiter
+
+
+def _advisory_key(user_id: str) -> int:
+    # Clave estable de 64 bits con signo para pg_try_advisory_lock
+    digest = hashlib.sha1(f"calendar_sync:{user_id}".encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@asynccontextmanager
+async def user_sync_lock(user_id: str, engine=None) -> AsyncIterator[None]:
+    """
+    Garantiza una sola sincronización por usuario a la vez, sin esperar.
+
+    Dentro del proceso basta un conjunto en memoria; con Postgres además se toma
+    un advisory lock de sesión, que excluye a los demás procesos (orquestador y
+    workers) mientras dura la sincronización.
+
+    Raises:
+        SyncInProgressError: Si el usuario ya se está sincronizando
+    """
+    user_key = str(user_id)
+    if user_key in _local_syncs:
+        raise SyncInProgressError(f"El usuario {user_key} ya tiene una sincronización en curso")
+    _local_syncs.add(user_key)
+    try:
+        if engine is None and (settings.DATABASE_URL or "").startswith(("postgres://", "postgresql")):
+            from app.db.database import get_async_engine
+            engine = get_async_engine()
+
+        if engine is None or engine.dialect.name != "postgresql":
+            yield
+            return
+
+        key = _advisory_key(user_key)
+        async with engine.connect() as conn:
+            acquired = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key})).scalar()
+            await conn.commit()
+            if not acquired:
+                raise SyncInProgressError(f"El usuario {user_key} ya tiene una sincronización en curso")
+            try:
+                yield
+            finally:
+                try:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                    await conn.commit()
+                except Exception as e:
+                    # Cerrar la conexión libera el lock igualmente
+                    logger.warning(f"No se pudo liberar el lock de sincronización de {user_key}: {str(e)}")
+                    await conn.invalidate()
+    finally:
+        _local_syncs.discard(user_key)
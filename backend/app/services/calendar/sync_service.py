@@ -1,22 +1,44 @@
+import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
-from uuid import UUID
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Callable, Union
+from uuid import UUID, uuid4
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.future import select
-from sqlalchemy import update, delete
+from sqlalchemy import update, delete, insert
 
-from app.models.calendar import CalendarEvent
+from app.core.metrics import metrics
+from app.models.calendar import CalendarEvent, GoogleSyncToken
+from app.services.calendar.cache import invalidate_user_calendar
 from app.services.calendar.google_calendar import GoogleCalendarService
-from app.schemas.calendar import CalendarEventCreate, CalendarEventUpdate, CalendarSyncResponse
+from app.services.calendar.google_events import GoogleEventRecord, SyncTokenExpiredError, iter_event_pages
+from app.services.calendar.progress import SyncProgressReporter
+from app.services.calendar.reconciliation import (
+    ReconciliationPlan,
+    StreamingReconciler,
+    SYNC_STATUS_SYNCED,
+    guard_conflicts,
+    parse_google_updated,
+    resolve_conflicts
+)
+from app.services.calendar.recurrence import to_naive_utc
+from app.utils.rate_limit import AsyncTokenBucket
+from app.schemas.calendar import CalendarEventUpdate, CalendarSyncResponse
 
 logger = logging.getLogger(__name__)
 
+# Tamaño máximo de las listas IN (...) en consultas y borrados
+LOOKUP_CHUNK_SIZE = 500
+
 class CalendarSyncService:
     """Servicio para sincronizar eventos entre la base de datos local y Google Calendar."""
     
-    def __init__(self, db_session: AsyncSession, google_service: GoogleCalendarService, user_id: UUID):
+    def __init__(self, db_session: AsyncSession, google_service: GoogleCalendarService, user_id: UUID,
+                 rate_limiter: Optional[AsyncTokenBucket] = None,
+                 session_factory: Optional[async_sessionmaker] = None,
+                 progress: Optional[SyncProgressReporter] = None):
         """
         Inicializa el servicio de sincronización.
         
@@ -24,46 +46,133 @@ class CalendarSyncService:
             db_session: Sesión de base de datos async
             google_service: Instancia del servicio de Google Calendar
             user_id: ID del usuario actual
+            rate_limiter: Token bucket compartido para respetar la cuota de Google (opcional)
+            session_factory: Fábrica de sesiones; si se indica, las fases pull y push
+                se ejecutan en paralelo, cada una con su propia sesión
+            progress: Publicador del progreso de la sincronización (opcional)
         """
         self.db = db_session
         self.google_service = google_service
         self.user_id = user_id
+        self.rate_limiter = rate_limiter
+        self.session_factory = session_factory
+        self.progress = progress
+        self._next_sync_token: Optional[str] = None
+    
+    async def _call_google(self, func: Callable, *args, cost: float = 1.0) -> Any:
+        """
+        Ejecuta una llamada al cliente (síncrono) de Google fuera del event loop,
+        consumiendo antes del limitador tantos tokens como peticiones HTTP haga.
+        """
+        if self.rate_limiter is not None:
+            # Los lotes grandes se piden en tramos que quepan en el bucket
+            waited = 0.0
+            remaining = cost
+            while remaining > 0:
+                tokens = min(remaining, self.rate_limiter.capacity)
+                waited += await self.rate_limiter.acquire(tokens)
+                remaining -= tokens
+            metrics.observe("google_api_quota_wait_seconds", waited)
+        
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(func, *args)
+        finally:
+            metrics.inc("google_api_calls_total", labels={"method": getattr(func, "__name__", "call")})
+            metrics.observe("google_api_call_seconds", time.perf_counter() - start)
+    
+    async def _call_google_batch(self, func: Callable, items: Union[Dict[str, Any], List[str]]) -> Dict[str, Any]:
+        """
+        Ejecuta una operación batch de Google por lotes; cada elemento consume un token.
+        """
+        results: Dict[str, Any] = {}
+        keys = list(items)
+        batch_size = getattr(self.google_service, "BATCH_SIZE", 50)
+        for offset in range(0, len(keys), batch_size):
+            chunk_keys = keys[offset:offset + batch_size]
+            chunk = {key: items[key] for key in chunk_keys} if isinstance(items, dict) else chunk_keys
+            results.update(await self._call_google(func, chunk, cost=len(chunk_keys)))
+        return results
     
     async def sync_events(self, start_date: datetime, end_date: datetime, 
-                          direction: str = "bidirectional") -> CalendarSyncResponse:
+                          direction: str = "bidirectional", incremental: bool = False) -> CalendarSyncResponse:
         """
         Sincroniza eventos entre la base de datos local y Google Calendar.
         
+        La lista de Google se recorre página a página: cada página se reconcilia
+        con los eventos locales y se aplica en bloque en local (fase pull),
+        mientras las operaciones para Google de esa página pasan a la fase push,
+        que las envía con peticiones batch. Así en memoria solo hay una página
+        de eventos remotos, y ambas fases avanzan a la vez cuando hay fábrica
+        de sesiones.
+        
+        Cada listado completo guarda el nextSyncToken de Google. Con `incremental`
+        la fase pull lista solo los cambios desde ese token (sin volver a
+        recorrer la ventana); si no hay token o Google lo rechaza (410), se
+        lista la ventana completa.
+        
         Args:
             start_date: Fecha de inicio para la sincronización
             end_date: Fecha de fin para la sincronización
             direction: Dirección de sincronización (pull, push, bidirectional)
+            incremental: Usar el syncToken guardado del usuario en la fase pull
             
         Returns:
             Resumen de la sincronización
         """
         try:
-            events_created = 0
-            events_updated = 0
-            events_deleted = 0
-            errors = []
+            start_date, end_date = to_naive_utc(start_date), to_naive_utc(end_date)
+            pull = direction in ["pull", "bidirectional"]
+            push = direction in ["push", "bidirectional"]
+            sync_token = await self._load_sync_token() if incremental and pull else None
+            self._next_sync_token = None
+            
+            # Solo pull: los eventos locales de cada página se cargan por su ID de Google
+            if sync_token and not push:
+                window_events = []
+            else:
+                window_events = await self._load_window_events(start_date, end_date)
+            reconciler = StreamingReconciler(window_events, direction, defer_conflicts=True)
+            conflicts: List[Tuple[CalendarEvent, GoogleEventRecord]] = []
+            push_queue: Optional[asyncio.Queue] = asyncio.Queue() if push else None
+            if push_queue is not None:
+                push_queue.put_nowait(reconciler.initial_plan())
+            
+            # Las fases pull (escrituras locales) y push (peticiones a Google) no
+            # comparten filas: se ejecutan a la vez si hay sesiones independientes
+            pull_phase = self._run_phase(
+                "pull", self._stream_pull, reconciler, start_date, end_date, pull, sync_token, push_queue, conflicts
+            )
+            if push_queue is None:
+                stats = await pull_phase
+            elif self.session_factory is not None:
+                pull_stats, push_stats = await asyncio.gather(
+                    pull_phase, self._run_phase("push", self._drain_push, push_queue)
+                )
+                stats = pull_stats + push_stats
+            else:
+                stats = await pull_phase
+                stats += await self._run_phase("push", self._drain_push, push_queue)
             
-            if direction in ["pull", "bidirectional"]:
-                pull_stats = await self._pull_from_google(start_date, end_date)
-                events_created += pull_stats[0]
-                events_updated += pull_stats[1]
-                if pull_stats[2]:
-                    errors.extend(pull_stats[2])
+            # Los eventos cambiados en ambos lados se resuelven al final
+            if conflicts:
+                metrics.inc("calendar_sync_conflicts_total", len(conflicts))
+                resolution = resolve_conflicts(conflicts)
+                if resolution.pull_updates:
+                    stats.append(await self._run_phase("conflicts", self._pull_from_google, resolution))
+                if resolution.push_updates:
+                    stats.append(await self._run_phase("conflicts", self._push_to_google, resolution))
             
-            if direction in ["push", "bidirectional"]:
-                push_stats = await self._push_to_google(start_date, end_date)
-                events_created += push_stats[0]
-                events_updated += push_stats[1]
-                if push_stats[2]:
-                    errors.extend(push_stats[2])
+            events_created = sum(phase_stats[0] for phase_stats in stats)
+            events_updated = sum(phase_stats[1] for phase_stats in stats)
+            events_deleted = sum(phase_stats[2] for phase_stats in stats)
+            errors = [error for phase_stats in stats for error in phase_stats[3]]
             
-            # Actualizar el timestamp de la última sincronización
-            await self._update_sync_timestamp(start_date, end_date)
+            # Con errores se repite el listado la próxima vez: el token se descarta
+            if self._next_sync_token and not errors:
+                await self._save_sync_token(self._next_sync_token)
+            
+            invalidate_user_calendar(self.user_id)
             
             return CalendarSyncResponse(
                 success=True,
@@ -81,219 +190,380 @@ class CalendarSyncService:
                 errors=[str(e)]
             )
     
-    async def _pull_from_google(self, start_date: datetime, end_date: datetime) -> Tuple[int, int, List[str]]:
+    async def _load_window_events(self, start_date: datetime, end_date: datetime) -> List[CalendarEvent]:
         """
-        Obtiene eventos de Google Calendar y los guarda en la base de datos local.
+        Carga los eventos locales de la ventana, incluidos los tombstones. Los
+        extremos son exclusivos, igual que timeMin/timeMax en la lista de Google.
         
         Args:
-            start_date: Fecha de inicio para los eventos
-            end_date: Fecha de fin para los eventos
+            start_date: Fecha de inicio de la ventana
+            end_date: Fecha de fin de la ventana
             
         Returns:
-            Tuple con (eventos_creados, eventos_actualizados, errores)
+            Eventos locales
+        """
+        stmt = select(CalendarEvent).where(
+            CalendarEvent.user_id == self.user_id,
+            CalendarEvent.end_time > start_date,
+            CalendarEvent.start_time < end_date
+        )
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+    
+    async def _load_sync_token(self) -> Optional[str]:
+        """
+        nextSyncToken guardado del usuario para el calendario sincronizado
+        """
+        state = await self.db.get(GoogleSyncToken, self.user_id)
+        if state is None or state.calendar_id != self.google_service.calendar_id:
+            return None
+        return state.sync_token
+    
+    async def _save_sync_token(self, sync_token: str) -> None:
+        """
+        Guarda el nextSyncToken del último listado completo
         """
-        events_created = 0
-        events_updated = 0
-        errors = []
-        
         try:
-            # Obtener eventos de Google Calendar
-            google_events = self.google_service.get_events(start_date, end_date)
-            
-            # Obtener IDs de eventos de Google que ya existen en nuestra base de datos
-            stmt = select(CalendarEvent.google_event_id).where(
+            state = await self.db.get(GoogleSyncToken, self.user_id)
+            if state is None:
+                self.db.add(GoogleSyncToken(
+                    user_id=self.user_id, calendar_id=self.google_service.calendar_id, sync_token=sync_token
+                ))
+            else:
+                state.calendar_id = self.google_service.calendar_id
+                state.sync_token = sync_token
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.warning(f"No se pudo guardar el token de sincronización del usuario {self.user_id}: {str(e)}")
+    
+    def _set_next_sync_token(self, sync_token: str) -> None:
+        self._next_sync_token = sync_token
+    
+    async def _load_missing_local_events(self, reconciler: StreamingReconciler,
+                                         page: List[GoogleEventRecord], db: AsyncSession) -> None:
+        """
+        Carga los eventos locales que, estando fuera de la ventana, comparten ID
+        de Google con algún evento remoto de la página (eventos movidos, series).
+        
+        Args:
+            reconciler: Reconciliador en el que se registran
+            page: Página de eventos de Google
+            db: Sesión de la fase pull
+        """
+        missing_ids = list(reconciler.missing_google_ids(page))
+        for offset in range(0, len(missing_ids), LOOKUP_CHUNK_SIZE):
+            stmt = select(CalendarEvent).where(
                 CalendarEvent.user_id == self.user_id,
-                CalendarEvent.google_event_id.isnot(None)
+                CalendarEvent.google_event_id.in_(missing_ids[offset:offset + LOOKUP_CHUNK_SIZE])
             )
-            result = await self.db.execute(stmt)
-            existing_google_ids = {row[0] for row in result.fetchall()}
-            
-            for google_event in google_events:
+            result = await db.execute(stmt)
+            reconciler.add_local_events(result.scalars().all())
+    
+    async def _stream_pull(self, reconciler: StreamingReconciler, start_date: datetime, end_date: datetime,
+                           fetch_remote: bool, sync_token: Optional[str], push_queue: Optional[asyncio.Queue],
+                           conflicts: List[Tuple[CalendarEvent, GoogleEventRecord]],
+                           db: AsyncSession) -> List[Tuple[int, int, int, List[str]]]:
+        """
+        Fase pull: recorre Google página a página, aplica en local los cambios de
+        cada página y pasa a `push_queue` la parte del plan que va a Google.
+        Al terminar encola None para cerrar la fase push.
+        
+        Returns:
+            Resultados de cada lote aplicado
+        """
+        stats = []
+        try:
+            if fetch_remote:
                 try:
-                    google_id = google_event.get('id')
-                    
-                    # Verificar si el evento ya existe en nuestra base de datos
-                    if google_id in existing_google_ids:
-                        # Actualizar evento existente
-                        await self._update_local_event_from_google(google_event)
-                        events_updated += 1
-                    else:
-                        # Crear nuevo evento
-                        await self._create_local_event_from_google(google_event)
-                        events_created += 1
-                except Exception as e:
-                    error_msg = f"Error procesando evento de Google {google_event.get('id', 'desconocido')}: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    
-            return events_created, events_updated, errors
-        except Exception as e:
-            error_msg = f"Error obteniendo eventos de Google Calendar: {str(e)}"
-            logger.error(error_msg)
-            errors.append(error_msg)
-            return events_created, events_updated, errors
+                    await self._pull_pages(reconciler, start_date, end_date, sync_token, push_queue, conflicts, stats, db)
+                except SyncTokenExpiredError:
+                    # Google lo rechaza en la primera página: se lista la ventana completa
+                    logger.info(f"Token de sincronización caducado para el usuario {self.user_id}")
+                    metrics.inc("calendar_sync_token_expired_total")
+                    await self._pull_pages(reconciler, start_date, end_date, None, push_queue, conflicts, stats, db)
+            
+            final_plan = guard_conflicts(reconciler.finish(remote_listed=fetch_remote))
+            if push_queue is not None:
+                push_queue.put_nowait(self._push_part(final_plan))
+            stats.append(await self._pull_from_google(final_plan, db))
+            await self._report(stats[-1])
+            return stats
+        finally:
+            if push_queue is not None:
+                push_queue.put_nowait(None)
+    
+    async def _pull_pages(self, reconciler: StreamingReconciler, start_date: datetime, end_date: datetime,
+                          sync_token: Optional[str], push_queue: Optional[asyncio.Queue],
+                          conflicts: List[Tuple[CalendarEvent, GoogleEventRecord]],
+                          stats: List[Tuple[int, int, int, List[str]]], db: AsyncSession) -> None:
+        """
+        Lista Google (la ventana, o los cambios desde `sync_token`) y aplica cada
+        página. Se piden también los borrados: solo un evento "cancelled" se
+        borra en local.
+        """
+        metrics.inc("calendar_sync_listings_total", labels={"mode": "incremental" if sync_token else "window"})
+        async for page in iter_event_pages(self.google_service, start_date, end_date, call=self._call_google,
+                                           show_deleted=True, sync_token=sync_token,
+                                           on_sync_token=self._set_next_sync_token):
+            await self._load_missing_local_events(reconciler, page, db)
+            if sync_token:
+                # Los cambios incrementales no tienen límite de fechas: los eventos
+                # nuevos fuera de la ventana no se importan
+                page = [
+                    event for event in page
+                    if event.is_cancelled or reconciler.has_local(event.id)
+                    or self._overlaps(event, start_date, end_date)
+                ]
+            page_plan = guard_conflicts(reconciler.feed(page))
+            conflicts.extend(page_plan.conflicts)
+            if push_queue is not None:
+                push_queue.put_nowait(self._push_part(page_plan))
+            stats.append(await self._pull_from_google(page_plan, db))
+            await self._report(stats[-1], processed=len(page))
+    
+    @staticmethod
+    def _overlaps(event: GoogleEventRecord, start_date: datetime, end_date: datetime) -> bool:
+        return event.start_time is not None and event.end_time is not None \
+            and event.end_time > start_date and event.start_time < end_date
+    
+    async def _drain_push(self, push_queue: asyncio.Queue, db: AsyncSession) -> List[Tuple[int, int, int, List[str]]]:
+        """
+        Fase push: envía a Google los planes que va encolando la fase pull
+        hasta recibir None. Las altas se envían al final: si se crearan mientras
+        la fase pull sigue listando, aparecerían en la lista como eventos nuevos.
+        
+        Returns:
+            Resultados de cada lote enviado
+        """
+        stats = []
+        creates = ReconciliationPlan()
+        while True:
+            plan = await push_queue.get()
+            if plan is None:
+                break
+            creates.push_creates.extend(plan.push_creates)
+            plan.push_creates = []
+            if not plan.is_empty:
+                stats.append(await self._push_to_google(plan, db))
+                await self._report(stats[-1])
+        if creates.push_creates:
+            stats.append(await self._push_to_google(creates, db))
+            await self._report(stats[-1], processed=len(creates.push_creates))
+        return stats
+    
+    async def _report(self, phase_stats: Tuple[int, int, int, List[str]], processed: int = 0) -> None:
+        # Publica el avance de un lote aplicado
+        if self.progress is not None:
+            created, updated, deleted, errors = phase_stats
+            await self.progress.update(processed, created, updated, deleted, errors)
+    
+    @staticmethod
+    def _push_part(plan: ReconciliationPlan) -> ReconciliationPlan:
+        # Solo las operaciones hacia Google: la página remota puede liberarse
+        return ReconciliationPlan(
+            push_creates=plan.push_creates,
+            push_updates=plan.push_updates,
+            remote_deletes=plan.remote_deletes,
+            purged_tombstones=plan.purged_tombstones
+        )
+    
+    async def _run_phase(self, name: str, phase: Callable, *args) -> Any:
+        """
+        Ejecuta una fase de la sincronización en su propia sesión (si hay fábrica
+        de sesiones) y mide su duración. La sesión se pasa como último argumento.
+        """
+        start = time.perf_counter()
+        try:
+            if self.session_factory is None:
+                return await phase(*args, self.db)
+            async with self.session_factory() as db:
+                return await phase(*args, db)
+        finally:
+            metrics.observe("calendar_sync_phase_seconds", time.perf_counter() - start, labels={"phase": name})
     
-    async def _push_to_google(self, start_date: datetime, end_date: datetime) -> Tuple[int, int, List[str]]:
+    async def _pull_from_google(self, plan: ReconciliationPlan, db: AsyncSession) -> Tuple[int, int, int, List[str]]:
         """
-        Envía eventos locales a Google Calendar.
+        Aplica en la base de datos local los cambios de Google del plan
+        (inserción, actualización y borrado en bloque, con un único commit).
         
         Args:
-            start_date: Fecha de inicio para los eventos
-            end_date: Fecha de fin para los eventos
+            plan: Plan de reconciliación
+            db: Sesión en la que se aplican los cambios
             
         Returns:
-            Tuple con (eventos_creados, eventos_actualizados, errores)
+            Tuple con (eventos_creados, eventos_actualizados, eventos_borrados, errores)
         """
-        events_created = 0
-        events_updated = 0
         errors = []
+        now = datetime.utcnow()
+        
+        new_rows = []
+        for google_event in plan.pull_creates:
+            try:
+                new_rows.append({
+                    "id": uuid4(),
+                    "user_id": self.user_id,
+                    "created_at": now,
+                    "updated_at": now,
+                    **self._google_to_local_values(google_event, now)
+                })
+            except Exception as e:
+                error_msg = f"Error procesando evento de Google {google_event.id}: {str(e)}"
+                logger.error(error_msg)
+                errors.append(error_msg)
+        
+        updated_rows = []
+        for local_event, google_event in plan.pull_updates:
+            try:
+                updated_rows.append({"id": local_event.id, **self._google_to_local_values(google_event, now)})
+            except Exception as e:
+                error_msg = f"Error procesando evento de Google {google_event.id}: {str(e)}"
+                logger.error(error_msg)
+                errors.append(error_msg)
+        
+        deleted_ids = [event.id for event in plan.local_deletes]
         
         try:
-            # Obtener eventos locales que deben sincronizarse con Google
-            stmt = select(CalendarEvent).where(
-                CalendarEvent.user_id == self.user_id,
-                CalendarEvent.start_time >= start_date,
-                CalendarEvent.end_time <= end_date,
-                CalendarEvent.sync_status.in_(["local", "modified"])
-            )
-            result = await self.db.execute(stmt)
-            local_events = result.scalars().all()
-            
-            for event in local_events:
-                try:
-                    # Si el evento ya tiene un ID de Google, actualizar
-                    if event.google_event_id:
-                        google_event = self._convert_local_to_google_event(event)
-                        result = self.google_service.update_event(event.google_event_id, google_event)
-                        
-                        # Actualizar estado local
-                        event.sync_status = "synced"
-                        event.last_synced_at = datetime.utcnow()
-                        self.db.add(event)
-                        await self.db.commit()
-                        
-                        events_updated += 1
-                    else:
-                        # Si no tiene ID de Google, crear nuevo
-                        google_event = self._convert_local_to_google_event(event)
-                        result = self.google_service.create_event(google_event)
-                        
-                        # Actualizar el evento local con el ID de Google
-                        event.google_event_id = result.get('id')
-                        event.sync_status = "synced"
-                        event.last_synced_at = datetime.utcnow()
-                        self.db.add(event)
-                        await self.db.commit()
-                        
-                        events_created += 1
-                except Exception as e:
-                    error_msg = f"Error sincronizando evento local {event.id} con Google: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-            
-            return events_created, events_updated, errors
+            if new_rows:
+                await db.execute(insert(CalendarEvent), new_rows)
+            if updated_rows:
+                await db.execute(update(CalendarEvent), updated_rows)
+            for offset in range(0, len(deleted_ids), LOOKUP_CHUNK_SIZE):
+                await db.execute(delete(CalendarEvent).where(
+                    CalendarEvent.id.in_(deleted_ids[offset:offset + LOOKUP_CHUNK_SIZE])
+                ))
+            await db.commit()
         except Exception as e:
-            error_msg = f"Error enviando eventos a Google Calendar: {str(e)}"
+            await db.rollback()
+            error_msg = f"Error guardando eventos de Google Calendar: {str(e)}"
             logger.error(error_msg)
-            errors.append(error_msg)
-            return events_created, events_updated, errors
+            return 0, 0, 0, errors + [error_msg]
+        
+        return len(new_rows), len(updated_rows), len(deleted_ids), errors
     
-    async def _update_local_event_from_google(self, google_event: Dict[str, Any]) -> CalendarEvent:
+    async def _push_to_google(self, plan: ReconciliationPlan, db: AsyncSession) -> Tuple[int, int, int, List[str]]:
         """
-        Actualiza un evento local con datos de Google Calendar.
+        Envía a Google los cambios locales del plan mediante peticiones batch y
+        actualiza el estado local en bloque.
         
         Args:
-            google_event: Evento de Google Calendar
+            plan: Plan de reconciliación
+            db: Sesión en la que se registra el estado local
             
         Returns:
-            Evento local actualizado
+            Tuple con (eventos_creados, eventos_actualizados, eventos_borrados, errores)
         """
-        # Buscar el evento local por el ID de Google
-        stmt = select(CalendarEvent).where(
-            CalendarEvent.user_id == self.user_id,
-            CalendarEvent.google_event_id == google_event.get('id')
-        )
-        result = await self.db.execute(stmt)
-        local_event = result.scalar_one_or_none()
+        errors = []
+        now = datetime.utcnow()
+        synced_rows = []
+        deleted_ids = [event.id for event in plan.purged_tombstones]
+        created = updated = removed = 0
         
-        if local_event:
-            # Convertir el evento de Google a formato local
-            start_time, end_time, is_all_day = self._parse_google_datetime(google_event)
-            
-            # Actualizar campos
-            local_event.title = google_event.get('summary', '')
-            local_event.description = google_event.get('description', '')
-            local_event.start_time = start_time
-            local_event.end_time = end_time
-            local_event.is_all_day = is_all_day
-            local_event.location = google_event.get('location', '')
-            local_event.color = self._map_google_color_id(google_event.get('colorId'))
-            
-            # Si hay reglas de recurrencia
-            if 'recurrence' in google_event:
-                recurrence = google_event['recurrence'][0] if google_event['recurrence'] else None
-                if recurrence and recurrence.startswith('RRULE:'):
-                    local_event.recurrence_rule = recurrence[6:]  # Quitar el prefijo 'RRULE:'
-                    local_event.is_recurring = True
-            
-            local_event.sync_status = "synced"
-            local_event.last_synced_at = datetime.utcnow()
+        try:
+            if plan.push_creates:
+                events_by_key = {str(event.id): event for event in plan.push_creates}
+                results = await self._call_google_batch(
+                    self.google_service.batch_create_events,
+                    {key: self._convert_local_to_google_event(event) for key, event in events_by_key.items()}
+                )
+                for key, result in results.items():
+                    if isinstance(result, Exception):
+                        errors.append(f"Error sincronizando evento local {key} con Google: {str(result)}")
+                        continue
+                    synced_rows.append({
+                        "id": events_by_key[key].id,
+                        "google_event_id": result.get('id'),
+                        "sync_status": SYNC_STATUS_SYNCED,
+                        "last_synced_at": self._synced_at(result, now)
+                    })
+                    created += 1
             
-            # Guardar cambios
-            self.db.add(local_event)
-            await self.db.commit()
-            await self.db.refresh(local_event)
+            if plan.push_updates:
+                events_by_google_id = {event.google_event_id: event for event in plan.push_updates}
+                results = await self._call_google_batch(
+                    self.google_service.batch_update_events,
+                    {google_id: self._convert_local_to_google_event(event) for google_id, event in events_by_google_id.items()}
+                )
+                for google_id, result in results.items():
+                    event = events_by_google_id[google_id]
+                    if isinstance(result, Exception):
+                        errors.append(f"Error sincronizando evento local {event.id} con Google: {str(result)}")
+                        continue
+                    synced_rows.append({
+                        "id": event.id,
+                        "sync_status": SYNC_STATUS_SYNCED,
+                        "last_synced_at": self._synced_at(result, now)
+                    })
+                    updated += 1
             
-            return local_event
-        else:
-            logger.warning(f"No se encontró evento local para Google ID: {google_event.get('id')}")
-            return None
+            if plan.remote_deletes:
+                events_by_google_id = {event.google_event_id: event for event in plan.remote_deletes}
+                results = await self._call_google_batch(
+                    self.google_service.batch_delete_events,
+                    list(events_by_google_id)
+                )
+                for google_id, result in results.items():
+                    event = events_by_google_id[google_id]
+                    if isinstance(result, Exception):
+                        errors.append(f"Error eliminando en Google el evento local {event.id}: {str(result)}")
+                        continue
+                    deleted_ids.append(event.id)
+                    removed += 1
+        except Exception as e:
+            error_msg = f"Error enviando eventos a Google Calendar: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+        
+        # Registrar localmente lo que sí llegó a Google, aunque el resto haya fallado
+        try:
+            if synced_rows:
+                await db.execute(update(CalendarEvent), synced_rows)
+            for offset in range(0, len(deleted_ids), LOOKUP_CHUNK_SIZE):
+                await db.execute(delete(CalendarEvent).where(
+                    CalendarEvent.id.in_(deleted_ids[offset:offset + LOOKUP_CHUNK_SIZE])
+                ))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            error_msg = f"Error actualizando el estado local tras enviar a Google: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+        
+        return created, updated, removed, errors
+    
+    def _synced_at(self, google_event: Dict[str, Any], now: datetime) -> datetime:
+        """
+        Marca de sincronización tras escribir en Google: el `updated` que devuelve
+        Google, para que nuestra propia escritura no cuente como cambio remoto.
+        """
+        remote_updated = parse_google_updated(google_event.get('updated'))
+        return max(now, remote_updated) if remote_updated else now
     
-    async def _create_local_event_from_google(self, google_event: Dict[str, Any]) -> CalendarEvent:
+    def _google_to_local_values(self, google_event: GoogleEventRecord, synced_at: datetime) -> Dict[str, Any]:
         """
-        Crea un nuevo evento local a partir de un evento de Google Calendar.
+        Convierte un evento de Google en los valores de columna del evento local.
         
         Args:
             google_event: Evento de Google Calendar
+            synced_at: Momento de la sincronización
             
         Returns:
-            Nuevo evento local creado
+            Valores para insertar o actualizar el evento local
         """
-        # Convertir el evento de Google a formato local
-        start_time, end_time, is_all_day = self._parse_google_datetime(google_event)
-        
-        # Preparar recurrencia
-        recurrence_rule = None
-        is_recurring = False
-        if 'recurrence' in google_event and google_event['recurrence']:
-            recurrence = google_event['recurrence'][0]
-            if recurrence.startswith('RRULE:'):
-                recurrence_rule = recurrence[6:]  # Quitar el prefijo 'RRULE:'
-                is_recurring = True
-        
-        # Crear nuevo evento
-        new_event = CalendarEvent(
-            user_id=self.user_id,
-            title=google_event.get('summary', ''),
-            description=google_event.get('description', ''),
-            start_time=start_time,
-            end_time=end_time,
-            is_all_day=is_all_day,
-            location=google_event.get('location', ''),
-            color=self._map_google_color_id(google_event.get('colorId')),
-            google_event_id=google_event.get('id'),
-            sync_status="synced",
-            last_synced_at=datetime.utcnow(),
-            recurrence_rule=recurrence_rule,
-            is_recurring=is_recurring
-        )
-        
-        # Guardar en base de datos
-        self.db.add(new_event)
-        await self.db.commit()
-        await self.db.refresh(new_event)
-        
-        return new_event
+        return {
+            "title": google_event.title,
+            "description": google_event.description,
+            "start_time": google_event.start_time,
+            "end_time": google_event.end_time,
+            "is_all_day": google_event.is_all_day,
+            "location": google_event.location,
+            "color": google_event.color,
+            "google_event_id": google_event.id,
+            "sync_status": SYNC_STATUS_SYNCED,
+            "last_synced_at": max(synced_at, google_event.updated) if google_event.updated else synced_at,
+            "recurrence_rule": google_event.recurrence_rule,
+            "is_recurring": google_event.recurrence_rule is not None
+        }
     
     def _convert_local_to_google_event(self, local_event: CalendarEvent) -> CalendarEventUpdate:
         """
@@ -317,92 +587,3 @@ class CalendarSyncService:
         )
         
         return event
-    
-    def _parse_google_datetime(self, google_event: Dict[str, Any]) -> Tuple[datetime, datetime, bool]:
-        """
-        Extrae y formatea las fechas de un evento de Google.
-        
-        Args:
-            google_event: Evento de Google Calendar
-            
-        Returns:
-            Tuple (start_time, end_time, is_all_day)
-        """
-        start_info = google_event.get('start', {})
-        end_info = google_event.get('end', {})
-        
-        # Determinar si es un evento de todo el día
-        is_all_day = 'date' in start_info and 'date' in end_info
-        
-        if is_all_day:
-            # Para eventos de todo el día, Google usa 'date'
-            start_str = start_info.get('date')
-            end_str = end_info.get('date')
-            
-            # Convertir a datetime (el fin es exclusivo en Google, así que restamos 1 día)
-            start_time = datetime.fromisoformat(start_str)
-            end_time = datetime.fromisoformat(end_str) - timedelta(days=1)
-            
-            # Establecer a final del día para mantener consistencia
-            end_time = end_time.replace(hour=23, minute=59, second=59)
-        else:
-            # Para eventos con hora, Google usa 'dateTime'
-            start_str = start_info.get('dateTime')
-            end_str = end_info.get('dateTime')
-            
-            # Convertir a datetime
-            start_time = datetime.fromisoformat(start_str.replace('Z', '+00:00'))
-            end_time = datetime.fromisoformat(end_str.replace('Z', '+00:00'))
-        
-        return start_time, end_time, is_all_day
-    
-    def _map_google_color_id(self, color_id: Optional[str]) -> Optional[str]:
-        """
-        Mapea un ID de color de Google Calendar a un color en nuestro sistema.
-        
-        Args:
-            color_id: ID de color de Google
-            
-        Returns:
-            Color en formato que usamos en nuestra aplicación
-        """
-        if not color_id:
-            return None
-            
-        # Mapeo de IDs de Google a colores
-        color_mapping = {
-            '1': 'blue',
-            '2': 'green',
-            '3': 'purple',
-            '4': 'red',
-            '5': 'yellow',
-            '6': 'orange',
-            '7': 'turquoise',
-            '8': 'gray',
-            '9': 'bold blue',
-            '10': 'bold green',
-            '11': 'bold red'
-        }
-        
-        return color_mapping.get(color_id, 'blue')
-    
-    async def _update_sync_timestamp(self, start_date: datetime, end_date: datetime) -> None:
-        """
-        Actualiza el timestamp de última sincronización para los eventos.
-        
-        Args:
-            start_date: Fecha de inicio para los eventos
-            end_date: Fecha de fin para los eventos
-        """
-        now = datetime.utcnow()
-        
-        # Actualizar todos los eventos en el rango que tengan estado synced
-        stmt = update(CalendarEvent).where(
-            CalendarEvent.user_id == self.user_id,
-            CalendarEvent.start_time >= start_date,
-            CalendarEvent.end_time <= end_date,
-            CalendarEvent.sync_status == "synced"
-        ).values(last_synced_at=now)
-        
-        await self.db.execute(stmt)
-        await self.db.commit() 
\ No newline at end of file
@@ -0,0 +1,281 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.calendar import CalendarEvent
+from app.services.calendar.cache import invalidate_user_calendar
+from app.services.calendar.free_busy import build_interval_index
+from app.services.calendar.recurrence import load_events_in_window, to_naive_utc
+
+logger = logging.getLogger(__name__)
+
+TASK_RELATED_TYPE = "task"
+
+PRIORITY_WEIGHTS = {"high": 3, "medium": 2, "low": 1}
+
+Interval = Tuple[datetime, datetime]
+
+
+@dataclass
+class SchedulableTask:
+    """Tarea pendiente con lo necesario para planificarla."""
+
+    id: str
+    title: str
+    duration: timedelta
+    due: Optional[datetime] = None
+    priority: str = "medium"
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "SchedulableTask":
+        """
+        Crea la tarea a partir de una fila de la tabla `tasks`
+        """
+        due = row.get("due_date")
+        if isinstance(due, str):
+            due = datetime.fromisoformat(due.replace("Z", "+00:00"))
+        hours = row.get("estimated_hours")
+        minutes = float(hours) * 60 if hours else settings.SCHEDULER_DEFAULT_TASK_MINUTES
+        return cls(
+            id=str(row["id"]),
+            title=row.get("title") or "",
+            duration=timedelta(minutes=minutes),
+            due=to_naive_utc(due) if due else None,
+            priority=row.get("priority") or "medium",
+        )
+
+
+@dataclass
+class ScheduledBlock:
+    task_id: str
+    title: str
+    start: datetime
+    end: datetime
+    late: bool = False
+
+
+def working_intervals(window_start: datetime, window_end: datetime, workday_start_hour: int,
+                      workday_end_hour: int, include_weekends: bool = False,
+                      utc_offset_minutes: int = 0) -> List[Interval]:
+    """
+    Franjas laborables (en UTC) dentro de la ventana, a partir del horario
+    local del usuario
+    """
+    offset = timedelta(minutes=utc_offset_minutes)
+    local_day = (window_start + offset).replace(hour=0, minute=0, second=0, microsecond=0)
+    intervals = []
+    while local_day - offset < window_end:
+        if include_weekends or local_day.weekday() < 5:
+            start = local_day + timedelta(hours=workday_start_hour) - offset
+            end = local_day + timedelta(hours=workday_end_hour) - offset
+            start, end = max(start, window_start), min(end, window_end)
+            if end > start:
+                intervals.append((start, end))
+        local_day += timedelta(days=1)
+    return intervals
+
+
+def intersect_intervals(first: List[Interval], second: List[Interval]) -> List[Interval]:
+    """
+    Intersección de dos listas de intervalos ordenadas y disjuntas (merge lineal)
+    """
+    result = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if end > start:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _ordering_key(task: SchedulableTask, horizon: datetime) -> Tuple[datetime, int, timedelta]:
+    # Earliest deadline first; la prioridad adelanta la fecha límite efectiva
+    slack = timedelta(hours=settings.SCHEDULER_PRIORITY_SLACK_HOURS * PRIORITY_WEIGHTS.get(task.priority, 2))
+    deadline = task.due if task.due is not None else horizon
+    return deadline - slack, -PRIORITY_WEIGHTS.get(task.priority, 2), task.duration
+
+
+def _fit(slots: List[List[datetime]], duration: timedelta, deadline: Optional[datetime],
+         min_block: timedelta) -> Optional[List[Tuple[int, datetime, datetime]]]:
+    """
+    Busca dónde colocar `duration`: primero en un único hueco (first fit) y, si no
+    cabe, repartida en bloques de al menos `min_block` en los primeros huecos.
+    No modifica `slots`; devuelve las piezas (índice de hueco, inicio, fin).
+    """
+    for index, (start, end) in enumerate(slots):
+        if deadline is not None and start + duration > deadline:
+            break
+        if end - start >= duration:
+            return [(index, start, start + duration)]
+
+    pieces = []
+    remaining = duration
+    for index, (start, end) in enumerate(slots):
+        limit = min(end, deadline) if deadline is not None else end
+        available = limit - start
+        if available < min_block:
+            if deadline is not None and start >= deadline:
+                break
+            continue
+        take = min(available, remaining)
+        # No dejar un resto menor que el bloque mínimo
+        if remaining - take and remaining - take < min_block:
+            take = remaining - min_block
+            if take < min_block:
+                continue
+        pieces.append((index, start, start + take))
+        remaining -= take
+        if not remaining:
+            return pieces
+    return None
+
+
+def plan_tasks(tasks: Iterable[SchedulableTask], free_slots: List[Interval],
+               time_budget_ms: Optional[float] = None,
+               min_block: Optional[timedelta] = None) -> Tuple[List[ScheduledBlock], List[Dict[str, str]]]:
+    """
+    Reparte las tareas en los huecos libres con una heurística voraz: earliest
+    deadline first ponderado por prioridad, colocando cada tarea en el primer
+    hueco donde cabe antes de su fecha límite (o en varios bloques si no cabe
+    entera). Las que no caben antes de su fecha límite se colocan después,
+    marcadas como tardías.
+
+    Args:
+        tasks: Tareas a planificar
+        free_slots: Huecos libres ordenados y disjuntos
+        time_budget_ms: Tiempo máximo de cálculo; las tareas restantes quedan sin planificar
+        min_block: Duración mínima de cada bloque al partir una tarea
+
+    Returns:
+        Tuple con (bloques planificados, tareas sin planificar con el motivo)
+    """
+    budget = (time_budget_ms if time_budget_ms is not None else settings.SCHEDULER_TIME_BUDGET_MS) / 1000.0
+    min_block = min_block or timedelta(minutes=settings.SCHEDULER_MIN_BLOCK_MINUTES)
+    started = time.perf_counter()
+
+    slots = [[start, end] for start, end in free_slots if end > start]
+    horizon = slots[-1][1] if slots else datetime.max
+    ordered = sorted(tasks, key=lambda task: _ordering_key(task, horizon))
+
+    blocks: List[ScheduledBlock] = []
+    unscheduled: List[Dict[str, str]] = []
+    for position, task in enumerate(ordered):
+        if time.perf_counter() - started > budget:
+            unscheduled.extend({"task_id": t.id, "title": t.title, "reason": "time_budget"} for t in ordered[position:])
+            metrics.inc("task_scheduler_budget_exhausted_total")
+            break
+
+        late = False
+        pieces = _fit(slots, task.duration, task.due, min_block)
+        if pieces is None and task.due is not None:
+            pieces = _fit(slots, task.duration, None, min_block)
+            late = pieces is not None
+        if pieces is None:
+            unscheduled.append({"task_id": task.id, "title": task.title, "reason": "no_free_slot"})
+            continue
+
+        for index, start, end in pieces:
+            blocks.append(ScheduledBlock(task.id, task.title, start, end, late))
+            slots[index][0] = end
+        # Quitar los huecos agotados o inservibles
+        slots = [slot for slot in slots if slot[1] - slot[0] >= min_block]
+
+    metrics.observe("task_scheduler_plan_seconds", time.perf_counter() - started)
+    blocks.sort(key=lambda block: block.start)
+    return blocks, unscheduled
+
+
+async def schedule_tasks(
+    db: AsyncSession,
+    user_id: Any,
+    task_rows: List[Dict[str, Any]],
+    window_start: datetime,
+    window_end: datetime,
+    workday_start_hour: Optional[int] = None,
+    workday_end_hour: Optional[int] = None,
+    include_weekends: bool = False,
+    utc_offset_minutes: int = 0,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """
+    Planifica las tareas abiertas del usuario en sus huecos libres y guarda el
+    plan como eventos de calendario (related_type="task") en una sola inserción.
+    Los bloques futuros de esas mismas tareas se sustituyen.
+
+    Returns:
+        Diccionario con "scheduled", "unscheduled" y "elapsed_ms"
+    """
+    started = time.perf_counter()
+    window_start, window_end = to_naive_utc(window_start), to_naive_utc(window_end)
+    tasks = [SchedulableTask.from_row(row) for row in task_rows if row.get("status") != "completed"]
+    task_ids = {UUID(task.id) for task in tasks}
+
+    # Los bloques locales ya planificados de estas tareas se recalculan: no cuentan como ocupados
+    events = [
+        event for event in await load_events_in_window(db, user_id, window_start, window_end)
+        if not (event.related_type == TASK_RELATED_TYPE and event.related_id in task_ids
+                and event.start_time >= window_start and event.sync_status == "local")
+    ]
+    index = build_interval_index(events, window_start, window_end)
+    free_slots = intersect_intervals(
+        index.free_slots(window_start, window_end),
+        working_intervals(
+            window_start,
+            window_end,
+            workday_start_hour if workday_start_hour is not None else settings.SCHEDULER_WORKDAY_START_HOUR,
+            workday_end_hour if workday_end_hour is not None else settings.SCHEDULER_WORKDAY_END_HOUR,
+            include_weekends,
+            utc_offset_minutes
+        )
+    )
+
+    blocks, unscheduled = plan_tasks(tasks, free_slots)
+
+    if not dry_run and task_ids:
+        await db.execute(delete(CalendarEvent).where(
+            CalendarEvent.user_id == user_id,
+            CalendarEvent.related_type == TASK_RELATED_TYPE,
+            CalendarEvent.related_id.in_(task_ids),
+            CalendarEvent.start_time >= window_start,
+            CalendarEvent.sync_status == "local"
+        ))
+        if blocks:
+            now = datetime.utcnow()
+            await db.execute(insert(CalendarEvent), [
+                {
+                    "id": uuid4(),
+                    "user_id": user_id,
+                    "title": block.title,
+                    "start_time": block.start,
+                    "end_time": block.end,
+                    "is_all_day": False,
+                    "is_recurring": False,
+                    "related_id": UUID(block.task_id),
+                    "related_type": TASK_RELATED_TYPE,
+                    "sync_status": "local",
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for block in blocks
+            ])
+        await db.commit()
+        invalidate_user_calendar(user_id)
+
+    return {
+        "scheduled": [block.__dict__ for block in blocks],
+        "unscheduled": unscheduled,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import logging
+import signal
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set
+
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.calendar import GoogleWatchChannel
+from app.models.users import User
+from app.services.jobs import job_queue
+from app.services.jobs.handlers import CALENDAR_SYNC_JOB, calendar_sync_dedupe_key
+
+logger = logging.getLogger(__name__)
+
+# Estado de la notificación inicial que Google envía al abrir el canal
+RESOURCE_STATE_SYNC = "sync"
+
+
+def channel_token(channel_id: str, user_id: Any) -> str:
+    """
+    Token del canal: el ID del usuario firmado con SECRET_KEY. Google lo reenvía
+    en cada notificación, así que validarla no requiere consultar la base de datos.
+    """
+    signature = hmac.new(
+        settings.SECRET_KEY.encode(), f"{channel_id}:{user_id}".encode(), hashlib.sha256
+    ).hexdigest()
+    return f"{user_id}.{signature}"
+
+
+def verify_channel_token(channel_id: Optional[str], token: Optional[str]) -> Optional[str]:
+    """
+    Comprueba el token de una notificación
+
+    Returns:
+        ID del usuario, o None si el token no es válido
+    """
+    if not channel_id or not token or "." not in token:
+        return None
+    user_id = token.split(".", 1)[0]
+    if not hmac.compare_digest(channel_token(channel_id, user_id), token):
+        return None
+    return user_id
+
+
+@dataclass
+class ChannelNotification:
+    """Notificación push de Google (cabeceras X-Goog-*)."""
+
+    channel_id: Optional[str]
+    token: Optional[str]
+    resource_id: Optional[str]
+    resource_state: Optional[str]
+    message_number: Optional[int] = None
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> "ChannelNotification":
+        message_number = headers.get("x-goog-message-number")
+        return cls(
+            channel_id=headers.get("x-goog-channel-id"),
+            token=headers.get("x-goog-channel-token"),
+            resource_id=headers.get("x-goog-resource-id"),
+            resource_state=headers.get("x-goog-resource-state"),
+            message_number=int(message_number) if message_number and message_number.isdigit() else None,
+        )
+
+
+class NotificationDebouncer:
+    """
+    Agrupa las notificaciones de cada usuario: la primera abre una ventana de
+    `window` segundos y las que llegan durante ella se suman a la misma
+    sincronización, que se lanza al cerrarse la ventana.
+    """
+
+    def __init__(self, on_flush: Callable[[str, int], Awaitable[None]], window: Optional[float] = None):
+        self.on_flush = on_flush
+        self.window = window if window is not None else settings.GOOGLE_WATCH_DEBOUNCE_SECONDS
+        self._pending: Dict[str, int] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def pending(self) -> Dict[str, int]:
+        return dict(self._pending)
+
+    def notify(self, user_id: str) -> bool:
+        """
+        Registra una notificación del usuario
+
+        Returns:
+            True si abre una ventana nueva, False si se agrupa con una pendiente
+        """
+        if user_id in self._pending:
+            self._pending[user_id] += 1
+            metrics.inc("calendar_push_notifications_coalesced_total")
+            return False
+        self._pending[user_id] = 1
+        self._tasks[user_id] = asyncio.create_task(self._flush_later(user_id))
+        return True
+
+    async def _flush_later(self, user_id: str) -> None:
+        await asyncio.sleep(self.window)
+        count = self._pending.pop(user_id, 0)
+        self._tasks.pop(user_id, None)
+        try:
+            await self.on_flush(user_id, count)
+        except Exception as e:
+            logger.error(f"Error encolando la sincronización push del usuario {user_id}: {str(e)}")
+
+    async def flush_all(self) -> None:
+        """
+        Lanza ya las sincronizaciones pendientes (al parar el proceso)
+        """
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        self._tasks.clear()
+        pending, self._pending = self._pending, {}
+        for user_id, count in pending.items():
+            try:
+                await self.on_flush(user_id, count)
+            except Exception as e:
+                logger.error(f"Error encolando la sincronización push del usuario {user_id}: {str(e)}")
+
+
+async def enqueue_push_sync(user_id: str, notifications: int) -> None:
+    """
+    Encola una sincronización pull incremental para el usuario: solo se listan
+    los cambios desde el último syncToken de Google (la ventana de auto-sync
+    solo se recorre entera si no hay token o ha caducado). La deduplicación de
+    la cola absorbe las que lleguen de otros procesos web.
+    """
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = today - timedelta(days=settings.AUTO_SYNC_WINDOW_PAST_DAYS)
+    end_date = today + timedelta(days=settings.AUTO_SYNC_WINDOW_FUTURE_DAYS)
+    await job_queue.enqueue(
+        CALENDAR_SYNC_JOB,
+        {
+            "user_id": user_id,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "direction": "pull",
+            "incremental": True
+        },
+        user_id=user_id,
+        dedupe_key=calendar_sync_dedupe_key(user_id, start_date, end_date, "pull")
+    )
+    metrics.inc("calendar_push_syncs_enqueued_total")
+    logger.info(f"Sincronización push encolada para el usuario {user_id} ({notifications} notificaciones)")
+
+
+# Instancia global del agrupador de notificaciones
+notification_debouncer = NotificationDebouncer(enqueue_push_sync)
+
+
+def handle_notification(notification: ChannelNotification,
+                        debouncer: Optional[NotificationDebouncer] = None) -> str:
+    """
+    Procesa una notificación del webhook
+
+    Returns:
+        "invalid" (token no válido), "ignored" (handshake inicial),
+        "queued" (abre ventana) o "coalesced" (agrupada con una pendiente)
+    """
+    metrics.inc("calendar_push_notifications_total")
+    user_id = verify_channel_token(notification.channel_id, notification.token)
+    if user_id is None:
+        metrics.inc("calendar_push_notifications_rejected_total")
+        return "invalid"
+    if notification.resource_state == RESOURCE_STATE_SYNC:
+        return "ignored"
+    debouncer = debouncer or notification_debouncer
+    return "queued" if debouncer.notify(user_id) else "coalesced"
+
+
+def _expiration_from_google(channel: Dict[str, Any], fallback_ttl: int) -> datetime:
+    # Google devuelve la expiración en milisegundos desde epoch
+    expiration = channel.get("expiration")
+    if expiration:
+        return datetime.utcfromtimestamp(int(expiration) / 1000)
+    return datetime.utcnow() + timedelta(seconds=fallback_ttl)
+
+
+class WatchChannelManager:
+    """Abre, cierra y renueva los canales de notificaciones de los usuarios."""
+
+    def __init__(self, session_factory=None, google_service_factory: Optional[Callable[[User], Any]] = None,
+                 address: Optional[str] = None, ttl_seconds: Optional[int] = None):
+        self._session_factory = session_factory
+        self.google_service_factory = google_service_factory or self._default_google_service
+        self.address = address or settings.GOOGLE_CALENDAR_WEBHOOK_URL \
+            or f"{settings.BACKEND_URL}/api/v1/calendar/webhook/google"
+        self.ttl_seconds = ttl_seconds or settings.GOOGLE_WATCH_CHANNEL_TTL_SECONDS
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.db.database import get_async_session_factory
+            self._session_factory = get_async_session_factory()
+        return self._session_factory
+
+    @staticmethod
+    def _default_google_service(user: User):
+        from app.services.calendar.google_calendar import GoogleCalendarService
+        return GoogleCalendarService(user.google_credentials)
+
+    async def open_channel(self, user: User) -> GoogleWatchChannel:
+        """
+        Abre un canal para el usuario; los canales anteriores se cierran
+        después, para no perder notificaciones durante el cambio.
+
+        Returns:
+            Canal abierto
+        """
+        google_service = self.google_service_factory(user)
+        channel_id = uuid.uuid4().hex
+        response = await asyncio.to_thread(
+            google_service.watch_events, channel_id, channel_token(channel_id, user.id), self.address,
+            self.ttl_seconds
+        )
+
+        async with self.session_factory() as db:
+            result = await db.execute(select(GoogleWatchChannel).where(GoogleWatchChannel.user_id == user.id))
+            previous = list(result.scalars().all())
+            channel = GoogleWatchChannel(
+                id=channel_id,
+                user_id=user.id,
+                calendar_id=getattr(google_service, "calendar_id", "primary"),
+                resource_id=response.get("resourceId"),
+                expiration=_expiration_from_google(response, self.ttl_seconds),
+            )
+            db.add(channel)
+            await db.commit()
+
+        for old_channel in previous:
+            await self._stop(google_service, old_channel)
+        metrics.inc("calendar_watch_channels_opened_total")
+        return channel
+
+    async def close_user_channels(self, user: User) -> int:
+        """
+        Cierra todos los canales del usuario
+
+        Returns:
+            Número de canales cerrados
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(select(GoogleWatchChannel).where(GoogleWatchChannel.user_id == user.id))
+            channels = list(result.scalars().all())
+        if not channels:
+            return 0
+        google_service = self.google_service_factory(user)
+        for channel in channels:
+            await self._stop(google_service, channel)
+        return len(channels)
+
+    async def _stop(self, google_service: Any, channel: GoogleWatchChannel) -> None:
+        try:
+            if channel.resource_id:
+                await asyncio.to_thread(google_service.stop_channel, channel.id, channel.resource_id)
+        except Exception as e:
+            # Si no se puede cerrar, caducará solo; sus notificaciones siguen siendo válidas
+            logger.warning(f"No se pudo cerrar el canal {channel.id}: {str(e)}")
+        async with self.session_factory() as db:
+            await db.execute(delete(GoogleWatchChannel).where(GoogleWatchChannel.id == channel.id))
+            await db.commit()
+
+    async def renew_expiring(self, renew_before: Optional[timedelta] = None) -> int:
+        """
+        Renueva los canales que caducan antes de `renew_before`
+
+        Returns:
+            Número de canales renovados
+        """
+        renew_before = renew_before or timedelta(hours=settings.GOOGLE_WATCH_RENEW_BEFORE_HOURS)
+        deadline = datetime.utcnow() + renew_before
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(User).join(GoogleWatchChannel, GoogleWatchChannel.user_id == User.id)
+                .where(GoogleWatchChannel.expiration <= deadline)
+                .distinct()
+            )
+            users = list(result.scalars().all())
+
+        renewed = 0
+        for user in users:
+            if not user.google_credentials:
+                await self.close_user_channels(user)
+                continue
+            try:
+                await self.open_channel(user)
+                renewed += 1
+            except Exception as e:
+                metrics.inc("calendar_watch_channel_renew_errors_total")
+                logger.error(f"Error renovando el canal de notificaciones del usuario {user.id}: {str(e)}")
+        metrics.inc("calendar_watch_channels_renewed_total", renewed)
+        return renewed
+
+    async def run_renewal_loop(self, interval: Optional[float] = None,
+                               stop_event: Optional[asyncio.Event] = None) -> None:
+        """
+        Renueva periódicamente los canales próximos a caducar
+        """
+        interval = interval or settings.GOOGLE_WATCH_RENEW_INTERVAL_SECONDS
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            try:
+                await self.renew_expiring()
+            except Exception as e:
+                logger.error(f"Error en la renovación de canales de notificaciones: {str(e)}")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def users_with_active_channel(session_factory, user_ids: List[str]) -> Set[str]:
+    """
+    Usuarios (de `user_ids`) con un canal de notificaciones vigente
+    """
+    async with session_factory() as db:
+        result = await db.execute(
+            select(GoogleWatchChannel.user_id).where(
+                GoogleWatchChannel.user_id.in_([uuid.UUID(user_id) for user_id in user_ids]),
+                GoogleWatchChannel.expiration > datetime.utcnow()
+            ).distinct()
+        )
+        return {str(user_id) for user_id in result.scalars().all()}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Renovación de canales de notificaciones de Google Calendar")
+    parser.add_argument("--once", action="store_true", help="Renovar una vez y salir")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    manager = WatchChannelManager()
+    if args.once:
+        renewed = await manager.renew_expiring()
+        print(f"Canales renovados: {renewed}")
+        return
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    await manager.run_renewal_loop(stop_event=stop_event)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
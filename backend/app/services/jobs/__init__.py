@@ -0,0 +1,6 @@
+# Cola de trabajos en segundo plano
+
+from app.services.jobs.queue import JobDeferred, JobQueue, PermanentJobError, job_queue
+from app.services.jobs.registry import job_handler, get_job_handler
+
+__all__ = ["JobDeferred", "JobQueue", "PermanentJobError", "job_queue", "job_handler", "get_job_handler"]
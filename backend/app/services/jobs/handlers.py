@@ -0,0 +1,144 @@
+import logging
+from datetime import datetime
+from typing import Dict, Any
+from uuid import UUID
+
+from app.db.database import get_async_session_factory
+from app.core.config import settings
+from app.models.users import User
+from app.schemas.calendar import CalendarSyncResponse
+from app.services.ai.conversations import AI_CONVERSATION_SUMMARY_JOB, ConversationStore, summarize_overflow
+from app.services.calendar.google_calendar import GoogleCalendarService
+from app.services.calendar.progress import SyncProgressReporter
+from app.services.calendar.sync_guard import SyncInProgressError, job_quota_limiter, user_sync_lock
+from app.services.calendar.sync_service import CalendarSyncService
+from app.services.jobs.queue import JobDeferred, PermanentJobError, job_queue
+from app.services.jobs.registry import job_handler
+
+logger = logging.getLogger(__name__)
+
+# Tipos de trabajo
+CALENDAR_SYNC_JOB = "calendar_sync"
+AI_SUGGESTION_JOB = "ai_suggestion"
+
+
+def calendar_sync_dedupe_key(user_id: Any, start_date: datetime, end_date: datetime, direction: str) -> str:
+    """
+    Clave de deduplicación: una sola sincronización pendiente idéntica por usuario
+    """
+    return f"{CALENDAR_SYNC_JOB}:{user_id}:{direction}:{start_date.isoformat()}:{end_date.isoformat()}"
+
+
+@job_handler(CALENDAR_SYNC_JOB)
+async def run_calendar_sync(payload: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+    """
+    Ejecuta una sincronización de calendario encolada
+
+    Args:
+        payload: {"user_id", "start_date", "end_date", "direction", "sync_log_id" (opcional),
+            "incremental" (opcional: listar solo los cambios desde el último syncToken)}
+        job_id: ID del trabajo
+
+    Returns:
+        Resumen de la sincronización
+    """
+    # Una sola sincronización por usuario entre todos los procesos; si está
+    # ocupado, el trabajo vuelve a la cola sin gastar un intento
+    try:
+        async with user_sync_lock(payload["user_id"]):
+            return await _run_calendar_sync(payload, job_id)
+    except SyncInProgressError as e:
+        raise JobDeferred(str(e), settings.CALENDAR_SYNC_BUSY_RETRY_SECONDS)
+
+
+async def _run_calendar_sync(payload: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+    session_factory = get_async_session_factory()
+    async with session_factory() as db:
+        user = await db.get(User, UUID(str(payload["user_id"])))
+        if not user or not user.google_credentials:
+            raise PermanentJobError("El usuario no tiene credenciales de Google Calendar")
+
+        # Progreso en vivo para el stream SSE si la petición creó un registro de sincronización
+        progress = None
+        if payload.get("sync_log_id"):
+            progress = SyncProgressReporter(payload["sync_log_id"], user.id)
+            await progress.start()
+
+        try:
+            google_service = GoogleCalendarService(user.google_credentials)
+            sync_service = CalendarSyncService(
+                db, google_service, user.id, rate_limiter=job_quota_limiter(),
+                session_factory=session_factory, progress=progress
+            )
+
+            result = await sync_service.sync_events(
+                datetime.fromisoformat(payload["start_date"]),
+                datetime.fromisoformat(payload["end_date"]),
+                payload.get("direction", "bidirectional"),
+                incremental=payload.get("incremental", False)
+            )
+        except Exception as e:
+            result = CalendarSyncResponse(success=False, message=f"Error en la sincronización: {str(e)}", errors=[str(e)])
+
+        if not result.success:
+            # Los fallos globales (red, cuota) se reintentan con backoff; el
+            # cliente solo ve el fallo tras el último intento
+            if progress is not None:
+                job = await job_queue.get_job(job_id)
+                if job is None or job["attempts"] >= job["max_attempts"]:
+                    await progress.finish(result)
+                else:
+                    await progress.retrying(result)
+            raise RuntimeError(result.message)
+
+        if progress is not None:
+            await progress.finish(result)
+
+        logger.info(f"Sincronización {job_id} completada para el usuario {payload['user_id']}")
+        return result.dict()
+
+
+@job_handler(AI_SUGGESTION_JOB)
+async def run_ai_suggestion(payload: Dict[str, Any], job_id: str) -> None:
+    """
+    Genera una sugerencia de IA encolada. Los errores transitorios se propagan
+    para que la cola reintente; con el último intento la sugerencia queda en "failed".
+    """
+    # Import diferido: el módulo de sugerencias carga el cliente de OpenAI
+    from app.services.ai.suggestions import generate_suggestion_background, mark_suggestion_failed
+
+    try:
+        await generate_suggestion_background(
+            payload["suggestion_id"],
+            payload["entity_type"],
+            payload["entity_id"],
+            payload["suggestion_type"],
+            payload.get("additional_context"),
+            payload["user_id"]
+        )
+    except PermanentJobError:
+        raise
+    except Exception as e:
+        job = await job_queue.get_job(job_id)
+        if job is None or job["attempts"] >= job["max_attempts"]:
+            try:
+                await mark_suggestion_failed(payload["suggestion_id"], e)
+            except Exception as mark_error:
+                logger.error(f"No se pudo marcar la sugerencia {payload['suggestion_id']} como fallida: {str(mark_error)}")
+        raise
+
+
+@job_handler(AI_CONVERSATION_SUMMARY_JOB)
+async def run_conversation_summary(payload: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+    """
+    Incorpora al resumen de una conversación los mensajes que salieron de la ventana del prompt
+    """
+    from app.services.ai.ai_service import openrouter_service
+
+    async with get_async_session_factory()() as db:
+        store = ConversationStore(db)
+        conversation = await store.get_conversation(payload["user_id"], payload["conversation_id"])
+        if conversation is None:
+            raise PermanentJobError("La conversación ya no existe")
+        updated = await summarize_overflow(store, conversation, openrouter_service, user_id=payload["user_id"])
+    return {"updated": updated}
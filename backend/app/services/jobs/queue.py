@@ -0,0 +1,415 @@
+import json
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
+
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import get_async_session_factory, get_async_engine
+from app.models.job import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Estados posibles de un trabajo
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class PermanentJobError(Exception):
+    """Error que no debe reintentarse (datos inválidos, credenciales ausentes, etc.)."""
+
+
+class JobDeferred(Exception):
+    """El trabajo aún no puede ejecutarse: vuelve a la cola sin gastar un intento."""
+
+    def __init__(self, message: str, delay: float):
+        super().__init__(message)
+        self.delay = delay
+
+
+class JobQueue:
+    """
+    Cola de trabajos durable respaldada por una tabla SQL (Postgres o SQLite).
+
+    Los procesos web solo encolan; los workers reclaman trabajos con
+    SELECT ... FOR UPDATE SKIP LOCKED (en Postgres) más una actualización
+    condicional, de modo que un trabajo nunca se ejecuta dos veces a la vez.
+    """
+
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None, database_url: Optional[str] = None):
+        """
+        Inicializa la cola.
+
+        Args:
+            session_factory: Fábrica de sesiones async (opcional, se crea bajo demanda)
+            database_url: URL de la base de datos de la cola (por defecto JOB_QUEUE_DATABASE_URL o DATABASE_URL)
+        """
+        self._session_factory = session_factory
+        self._database_url = database_url
+        self._known_job_types = set()
+
+    @property
+    def database_url(self) -> Optional[str]:
+        return self._database_url or settings.JOB_QUEUE_DATABASE_URL or settings.DATABASE_URL
+
+    @property
+    def session_factory(self) -> async_sessionmaker:
+        # Se crea bajo demanda para no abrir conexiones al importar el módulo
+        if self._session_factory is None:
+            self._session_factory = get_async_session_factory(self.database_url)
+        return self._session_factory
+
+    async def ensure_schema(self) -> None:
+        """
+        Crea la tabla de trabajos si no existe (útil con SQLite local)
+        """
+        engine = get_async_engine(self.database_url)
+        async with engine.begin() as conn:
+            await conn.run_sync(BackgroundJob.__table__.create, checkfirst=True)
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        user_id: Optional[str] = None,
+        dedupe_key: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        run_at: Optional[datetime] = None
+    ) -> str:
+        """
+        Encola un trabajo. Si ya existe uno pendiente con la misma clave de
+        deduplicación, devuelve el ID del existente en lugar de crear otro.
+
+        Args:
+            job_type: Tipo de trabajo (debe tener un handler registrado)
+            payload: Datos serializables en JSON para el handler
+            user_id: ID del usuario propietario (opcional)
+            dedupe_key: Clave de deduplicación para trabajos pendientes idénticos
+            max_attempts: Número máximo de intentos (por defecto JOB_MAX_ATTEMPTS)
+            run_at: Momento a partir del cual puede ejecutarse (por defecto ahora)
+
+        Returns:
+            ID del trabajo encolado (o del pendiente equivalente)
+        """
+        async with self.session_factory() as db:
+            if dedupe_key:
+                existing_id = await self._find_pending(db, dedupe_key)
+                if existing_id:
+                    metrics.inc("jobs_deduplicated_total", labels={"job_type": job_type})
+                    return existing_id
+
+            job = BackgroundJob(
+                job_type=job_type,
+                user_id=str(user_id) if user_id else None,
+                payload=json.dumps(payload, default=str),
+                dedupe_key=dedupe_key,
+                status=JOB_PENDING,
+                attempts=0,
+                max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+                run_at=run_at or datetime.utcnow(),
+                created_at=datetime.utcnow()
+            )
+            db.add(job)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Otro proceso encoló el mismo trabajo entre la consulta y el insert
+                await db.rollback()
+                existing_id = await self._find_pending(db, dedupe_key)
+                if existing_id:
+                    metrics.inc("jobs_deduplicated_total", labels={"job_type": job_type})
+                    return existing_id
+                raise
+
+            metrics.inc("jobs_enqueued_total", labels={"job_type": job_type})
+            return job.id
+
+    async def _find_pending(self, db, dedupe_key: str) -> Optional[str]:
+        stmt = select(BackgroundJob.id).where(
+            BackgroundJob.dedupe_key == dedupe_key,
+            BackgroundJob.status == JOB_PENDING
+        ).limit(1)
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def claim(self, worker_id: str, job_types: Optional[List[str]] = None) -> Optional[BackgroundJob]:
+        """
+        Reclama el siguiente trabajo listo para ejecutarse.
+
+        Args:
+            worker_id: Identificador del worker que reclama
+            job_types: Restringir a estos tipos de trabajo (opcional)
+
+        Returns:
+            El trabajo reclamado (ya marcado como "running") o None si no hay
+        """
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            stmt = select(BackgroundJob.id).where(
+                BackgroundJob.status == JOB_PENDING,
+                BackgroundJob.run_at <= now
+            )
+            if job_types:
+                stmt = stmt.where(BackgroundJob.job_type.in_(job_types))
+            stmt = stmt.order_by(BackgroundJob.run_at).limit(1).with_for_update(skip_locked=True)
+
+            result = await db.execute(stmt)
+            job_id = result.scalar_one_or_none()
+            if not job_id:
+                await db.rollback()
+                return None
+
+            # Actualización condicional: si otro worker lo tomó primero, rowcount es 0
+            claim_stmt = update(BackgroundJob).where(
+                BackgroundJob.id == job_id,
+                BackgroundJob.status == JOB_PENDING
+            ).values(
+                status=JOB_RUNNING,
+                locked_at=now,
+                locked_by=worker_id,
+                started_at=now,
+                attempts=BackgroundJob.attempts + 1
+            )
+            claim_result = await db.execute(claim_stmt)
+            await db.commit()
+            if claim_result.rowcount != 1:
+                return None
+
+            job = await db.get(BackgroundJob, job_id)
+            metrics.observe(
+                "jobs_queue_wait_seconds",
+                max(0.0, (now - max(job.run_at, job.created_at)).total_seconds()),
+                labels={"job_type": job.job_type}
+            )
+            return job
+
+    async def heartbeat(self, job: BackgroundJob) -> bool:
+        """
+        Renueva el bloqueo de un trabajo en ejecución (locked_at = ahora) para
+        que requeue_stale no lo dé por abandonado
+
+        Returns:
+            False si el trabajo ya no está bloqueado por este worker
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(BackgroundJob).where(
+                    BackgroundJob.id == job.id,
+                    BackgroundJob.status == JOB_RUNNING,
+                    BackgroundJob.locked_by == job.locked_by
+                ).values(locked_at=datetime.utcnow())
+            )
+            await db.commit()
+        return result.rowcount == 1
+
+    async def complete(self, job: BackgroundJob) -> None:
+        """
+        Marca un trabajo como completado
+        """
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            await db.execute(
+                update(BackgroundJob).where(BackgroundJob.id == job.id).values(
+                    status=JOB_COMPLETED,
+                    completed_at=now,
+                    locked_at=None,
+                    locked_by=None,
+                    last_error=None
+                )
+            )
+            await db.commit()
+
+        metrics.inc("jobs_completed_total", labels={"job_type": job.job_type})
+        if job.created_at:
+            metrics.observe(
+                "jobs_end_to_end_seconds",
+                (now - job.created_at).total_seconds(),
+                labels={"job_type": job.job_type}
+            )
+
+    async def fail(self, job: BackgroundJob, error: Exception) -> None:
+        """
+        Registra el fallo de un trabajo y lo reprograma con backoff exponencial
+        si le quedan intentos y el error no es permanente.
+        """
+        error_message = f"{type(error).__name__}: {str(error)}"
+        retry = not isinstance(error, PermanentJobError) and job.attempts < job.max_attempts
+
+        async with self.session_factory() as db:
+            if retry:
+                delay = self.retry_delay(job.attempts)
+                values = {
+                    "status": JOB_PENDING,
+                    "run_at": datetime.utcnow() + timedelta(seconds=delay),
+                    "locked_at": None,
+                    "locked_by": None,
+                    "last_error": error_message
+                }
+            else:
+                values = {
+                    "status": JOB_FAILED,
+                    "completed_at": datetime.utcnow(),
+                    "locked_at": None,
+                    "locked_by": None,
+                    "last_error": error_message
+                }
+
+            try:
+                await db.execute(update(BackgroundJob).where(BackgroundJob.id == job.id).values(**values))
+                await db.commit()
+            except IntegrityError:
+                # Ya hay un trabajo pendiente idéntico encolado: este queda reemplazado
+                await db.rollback()
+                retry = False
+                await db.execute(
+                    update(BackgroundJob).where(BackgroundJob.id == job.id).values(
+                        status=JOB_FAILED,
+                        completed_at=datetime.utcnow(),
+                        locked_at=None,
+                        locked_by=None,
+                        last_error=f"{error_message} (reemplazado por un trabajo pendiente equivalente)"
+                    )
+                )
+                await db.commit()
+
+        if retry:
+            metrics.inc("jobs_retried_total", labels={"job_type": job.job_type})
+            logger.warning(f"Trabajo {job.id} ({job.job_type}) falló, reintento {job.attempts}/{job.max_attempts}: {error_message}")
+        else:
+            metrics.inc("jobs_failed_total", labels={"job_type": job.job_type})
+            logger.error(f"Trabajo {job.id} ({job.job_type}) falló definitivamente: {error_message}")
+
+    async def defer(self, job: BackgroundJob, delay: float) -> None:
+        """
+        Devuelve a la cola un trabajo que no pudo empezar (p. ej. el recurso está
+        ocupado por otro worker) sin contar el intento
+        """
+        async with self.session_factory() as db:
+            try:
+                await db.execute(
+                    update(BackgroundJob).where(BackgroundJob.id == job.id).values(
+                        status=JOB_PENDING,
+                        run_at=datetime.utcnow() + timedelta(seconds=delay),
+                        attempts=BackgroundJob.attempts - 1,
+                        locked_at=None,
+                        locked_by=None
+                    )
+                )
+                await db.commit()
+            except IntegrityError:
+                # Ya hay un trabajo pendiente idéntico encolado: ese hará el trabajo
+                await db.rollback()
+                await db.execute(
+                    update(BackgroundJob).where(BackgroundJob.id == job.id).values(
+                        status=JOB_COMPLETED,
+                        completed_at=datetime.utcnow(),
+                        locked_at=None,
+                        locked_by=None,
+                        last_error="Aplazado y reemplazado por un trabajo pendiente equivalente"
+                    )
+                )
+                await db.commit()
+
+        metrics.inc("jobs_deferred_total", labels={"job_type": job.job_type})
+        logger.info(f"Trabajo {job.id} ({job.job_type}) aplazado {delay:.0f}s")
+
+    @staticmethod
+    def retry_delay(attempts: int) -> float:
+        """
+        Calcula el retardo de reintento con backoff exponencial y jitter
+        """
+        base = settings.JOB_RETRY_BASE_DELAY_SECONDS * (2 ** max(0, attempts - 1))
+        delay = min(settings.JOB_RETRY_MAX_DELAY_SECONDS, base)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def requeue_stale(self) -> int:
+        """
+        Devuelve a "pending" los trabajos bloqueados por workers que murieron:
+        los que llevan más de JOB_LOCK_TIMEOUT_SECONDS sin latido (los workers
+        renuevan locked_at cada JOB_HEARTBEAT_INTERVAL_SECONDS mientras ejecutan)
+
+        Returns:
+            Número de trabajos recuperados
+        """
+        threshold = datetime.utcnow() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS)
+        async with self.session_factory() as db:
+            try:
+                result = await db.execute(
+                    update(BackgroundJob).where(
+                        BackgroundJob.status == JOB_RUNNING,
+                        BackgroundJob.locked_at < threshold
+                    ).values(status=JOB_PENDING, locked_at=None, locked_by=None, run_at=datetime.utcnow())
+                )
+                await db.commit()
+            except IntegrityError:
+                # Existe ya un pendiente equivalente; se recuperarán en la siguiente pasada
+                await db.rollback()
+                return 0
+            if result.rowcount:
+                logger.warning(f"Recuperados {result.rowcount} trabajos abandonados")
+            return result.rowcount or 0
+
+    async def get_job(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el estado de un trabajo
+
+        Args:
+            job_id: ID del trabajo
+            user_id: Si se indica, solo devuelve el trabajo si pertenece al usuario
+
+        Returns:
+            Diccionario con el estado del trabajo o None
+        """
+        async with self.session_factory() as db:
+            stmt = select(BackgroundJob).where(BackgroundJob.id == job_id)
+            if user_id:
+                stmt = stmt.where(BackgroundJob.user_id == str(user_id))
+            result = await db.execute(stmt)
+            job = result.scalar_one_or_none()
+            if not job:
+                return None
+            return {
+                "id": job.id,
+                "job_type": job.job_type,
+                "status": job.status,
+                "attempts": job.attempts,
+                "max_attempts": job.max_attempts,
+                "last_error": job.last_error,
+                "run_at": job.run_at,
+                "created_at": job.created_at,
+                "started_at": job.started_at,
+                "completed_at": job.completed_at
+            }
+
+    async def queue_depth(self) -> Dict[str, int]:
+        """
+        Cuenta los trabajos pendientes por tipo y actualiza los gauges de métricas
+
+        Returns:
+            Diccionario {job_type: pendientes}
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(BackgroundJob.job_type, func.count()).where(
+                    BackgroundJob.status == JOB_PENDING
+                ).group_by(BackgroundJob.job_type)
+            )
+            depth = {job_type: count for job_type, count in result.all()}
+
+        # Los tipos que ya no tienen pendientes deben volver a 0
+        self._known_job_types.update(depth)
+        for job_type in self._known_job_types:
+            metrics.set_gauge("jobs_queue_depth", depth.get(job_type, 0), labels={"job_type": job_type})
+        metrics.set_gauge("jobs_queue_depth_total", sum(depth.values()))
+        return depth
+
+
+# Instancia global de la cola
+job_queue = JobQueue()
@@ -0,0 +1,33 @@
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+# Un handler recibe el payload deserializado y el ID del trabajo
+JobHandler = Callable[[Dict[str, Any], str], Awaitable[Any]]
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(job_type: str) -> Callable[[JobHandler], JobHandler]:
+    """
+    Decorador para registrar el handler de un tipo de trabajo
+
+    Args:
+        job_type: Tipo de trabajo que atiende el handler
+    """
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+def get_job_handler(job_type: str) -> Optional[JobHandler]:
+    """
+    Obtiene el handler registrado para un tipo de trabajo
+    """
+    return _handlers.get(job_type)
+
+
+def registered_job_types() -> list:
+    """
+    Lista los tipos de trabajo con handler registrado
+    """
+    return list(_handlers.keys())
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.jobs.queue import JobDeferred, JobQueue, job_queue
+from app.services.jobs.registry import get_job_handler, registered_job_types
+
+# Registrar los handlers disponibles
+import app.services.jobs.handlers  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorkerPool:
+    """
+    Pool de workers asíncronos que consume la cola durable con
+    concurrencia configurable.
+    """
+
+    def __init__(
+        self,
+        queue: Optional[JobQueue] = None,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        job_types: Optional[List[str]] = None
+    ):
+        """
+        Inicializa el pool.
+
+        Args:
+            queue: Cola de la que consumir (por defecto la global)
+            concurrency: Número de workers concurrentes (por defecto JOB_WORKER_CONCURRENCY)
+            poll_interval: Segundos de espera cuando la cola está vacía
+            job_types: Tipos de trabajo a procesar (por defecto todos los registrados)
+        """
+        self.queue = queue or job_queue
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.poll_interval = poll_interval or settings.JOB_WORKER_POLL_INTERVAL_SECONDS
+        self.job_types = job_types or registered_job_types()
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+
+    async def start(self) -> None:
+        """
+        Arranca los workers y el monitor de la cola
+        """
+        self._stopping.clear()
+        for index in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._worker_loop(f"{self.worker_prefix}:{index}")))
+        self._tasks.append(asyncio.create_task(self._monitor_loop()))
+        logger.info(f"Pool de workers iniciado ({self.concurrency} workers, tipos: {self.job_types})")
+
+    async def stop(self) -> None:
+        """
+        Detiene el pool esperando a que terminen los trabajos en curso
+        """
+        self._stopping.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Pool de workers detenido")
+
+    async def run_forever(self) -> None:
+        await self.start()
+        await self._stopping.wait()
+        await self.stop()
+
+    def request_stop(self) -> None:
+        self._stopping.set()
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker_loop(self, worker_id: str) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(worker_id, self.job_types)
+            except Exception as e:
+                logger.error(f"Error reclamando trabajo en {worker_id}: {str(e)}")
+                await self._sleep(self.poll_interval)
+                continue
+
+            if job is None:
+                await self._sleep(self.poll_interval)
+                continue
+
+            await self._execute(job)
+
+    async def _execute(self, job) -> None:
+        handler = get_job_handler(job.job_type)
+        labels = {"job_type": job.job_type}
+        self._busy += 1
+        metrics.set_gauge("jobs_workers_busy", self._busy)
+        start = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"No hay handler registrado para '{job.job_type}'")
+            heartbeat = asyncio.create_task(self._heartbeat_loop(job))
+            try:
+                await handler(json.loads(job.payload or "{}"), job.id)
+            finally:
+                heartbeat.cancel()
+            await self.queue.complete(job)
+        except JobDeferred as e:
+            try:
+                await self.queue.defer(job, e.delay)
+            except Exception as defer_error:
+                logger.error(f"No se pudo aplazar el trabajo {job.id}: {str(defer_error)}")
+        except Exception as e:
+            try:
+                await self.queue.fail(job, e)
+            except Exception as fail_error:
+                logger.error(f"No se pudo registrar el fallo del trabajo {job.id}: {str(fail_error)}")
+        finally:
+            metrics.observe("jobs_run_seconds", time.perf_counter() - start, labels=labels)
+            self._busy -= 1
+            metrics.set_gauge("jobs_workers_busy", self._busy)
+
+    async def _heartbeat_loop(self, job) -> None:
+        # Mantiene el bloqueo mientras el handler se ejecuta (sincronizaciones largas, esperas de cuota)
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL_SECONDS)
+            try:
+                if not await self.queue.heartbeat(job):
+                    logger.warning(f"El trabajo {job.id} ya no está bloqueado por {job.locked_by}")
+                    return
+            except Exception as e:
+                logger.error(f"Error renovando el bloqueo del trabajo {job.id}: {str(e)}")
+
+    async def _monitor_loop(self) -> None:
+        # Publica la profundidad de la cola y recupera trabajos abandonados
+        while not self._stopping.is_set():
+            try:
+                await self.queue.requeue_stale()
+                await self.queue.queue_depth()
+            except Exception as e:
+                logger.error(f"Error en el monitor de la cola: {str(e)}")
+            await self._sleep(max(5.0, self.poll_interval * 5))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Pool de workers de la cola de trabajos")
+    parser.add_argument("--job-types", help="Tipos de trabajo separados por comas (por defecto todos), "
+                                            "p. ej. ai_suggestion para un worker dedicado a sugerencias")
+    parser.add_argument("--concurrency", type=int, help="Workers concurrentes (por defecto JOB_WORKER_CONCURRENCY)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    await job_queue.ensure_schema()
+
+    job_types = [job_type.strip() for job_type in args.job_types.split(",")] if args.job_types else None
+    pool = JobWorkerPool(concurrency=args.concurrency, job_types=job_types)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, pool.request_stop)
+        except NotImplementedError:
+            # Windows no soporta add_signal_handler
+            pass
+
+    await pool.run_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
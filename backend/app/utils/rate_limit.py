@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket asíncrono: permite ráfagas de hasta `capacity` operaciones
+    y un ritmo sostenido de `rate` operaciones por segundo.
+    Las esperas se atienden en orden de llegada.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens repuestos por segundo
+            capacity: Tamaño máximo del bucket (ráfaga); por defecto igual a rate
+        """
+        if rate <= 0:
+            raise ValueError("rate debe ser mayor que 0")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: Optional[float] = None) -> "AsyncTokenBucket":
+        return cls(requests_per_minute / 60.0, burst)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Intenta consumir tokens sin esperar
+
+        Returns:
+            True si se consumieron
+        """
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """
+        Segundos que faltan para disponer de `tokens` (0 si ya están disponibles)
+        """
+        self._refill()
+        missing = tokens - self._tokens
+        return max(0.0, missing / self.rate)
+
+    async def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Espera hasta poder consumir `tokens`
+
+        Returns:
+            Segundos esperados
+        """
+        if tokens > self.capacity:
+            raise ValueError("No se pueden pedir más tokens que la capacidad del bucket")
+
+        start = time.monotonic()
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.time_until_available(tokens))
+        return time.monotonic() - start
@@ -0,0 +1,40 @@
+"""ai_conversations
+
+Revision ID: ai_conversations
+Revises: ai_response_cache
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'ai_conversations'
+down_revision = 'ai_response_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las tablas conversations y messages ya existen (migraciones de Supabase):
+    # se agregan las columnas del resumen incremental
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('conversations', sa.Column('summary_until_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('conversations', sa.Column('summary_until_id', postgresql.UUID(as_uuid=True), nullable=True))
+
+    # Crear índices para la paginación por clave
+    op.create_index('ix_conversations_user_updated', 'conversations', ['user_id', 'updated_at', 'id'])
+    op.create_index('ix_messages_conversation_created', 'messages', ['conversation_id', 'created_at', 'id'])
+
+
+def downgrade():
+    # Eliminar índices
+    op.drop_index('ix_messages_conversation_created')
+    op.drop_index('ix_conversations_user_updated')
+
+    # Eliminar columnas
+    op.drop_column('conversations', 'summary_until_id')
+    op.drop_column('conversations', 'summary_until_at')
+    op.drop_column('conversations', 'summary')
@@ -0,0 +1,39 @@
+"""ai_response_cache
+
+Revision ID: ai_response_cache
+Revises: calendar_ical_uid
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ai_response_cache'
+down_revision = 'calendar_ical_uid'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Crear tabla ai_response_cache (caché compartida de respuestas de OpenRouter)
+    op.create_table(
+        'ai_response_cache',
+        sa.Column('key', sa.String(64), primary_key=True),
+        sa.Column('feature', sa.String(50), nullable=False),
+        sa.Column('response', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    )
+
+    # Crear índices
+    op.create_index('ix_ai_response_cache_expires_at', 'ai_response_cache', ['expires_at'])
+
+
+def downgrade():
+    # Eliminar índices
+    op.drop_index('ix_ai_response_cache_expires_at')
+
+    # Eliminar tablas
+    op.drop_table('ai_response_cache')
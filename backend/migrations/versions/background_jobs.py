@@ -0,0 +1,61 @@
+"""background_jobs
+
+Revision ID: background_jobs
+Revises: calendar_integration
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'background_jobs'
+down_revision = 'calendar_integration'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Crear tabla background_jobs (cola durable de trabajos)
+    op.create_table(
+        'background_jobs',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('job_type', sa.String(100), nullable=False),
+        sa.Column('user_id', sa.String(36), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False, server_default='{}'),
+        sa.Column('dedupe_key', sa.String(255), nullable=True),
+        sa.Column('status', sa.String(20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('run_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_by', sa.String(100), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+    )
+
+    # Crear índices
+    op.create_index('ix_background_jobs_status_run_at', 'background_jobs', ['status', 'run_at'])
+    op.create_index('ix_background_jobs_user_id', 'background_jobs', ['user_id'])
+    # Solo un trabajo pendiente por clave de deduplicación
+    op.create_index(
+        'uq_background_jobs_pending_dedupe',
+        'background_jobs',
+        ['dedupe_key'],
+        unique=True,
+        postgresql_where=sa.text("status = 'pending'"),
+        sqlite_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade():
+    # Eliminar índices
+    op.drop_index('uq_background_jobs_pending_dedupe')
+    op.drop_index('ix_background_jobs_user_id')
+    op.drop_index('ix_background_jobs_status_run_at')
+
+    # Eliminar tablas
+    op.drop_table('background_jobs')
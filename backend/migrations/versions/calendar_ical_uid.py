@@ -0,0 +1,32 @@
+"""calendar_ical_uid
+
+Revision ID: calendar_ical_uid
+Revises: google_watch_channels
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'calendar_ical_uid'
+down_revision = 'google_watch_channels'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # UID de origen de los eventos importados desde archivos ICS
+    op.add_column('calendar_events', sa.Column('ical_uid', sa.String(255), nullable=True))
+
+    # Crear índices
+    op.create_index('ix_calendar_events_user_ical_uid', 'calendar_events', ['user_id', 'ical_uid'])
+
+
+def downgrade():
+    # Eliminar índices
+    op.drop_index('ix_calendar_events_user_ical_uid')
+
+    # Eliminar columnas
+    op.drop_column('calendar_events', 'ical_uid')
@@ -0,0 +1,34 @@
+"""calendar_recurrence_rule_text
+
+Revision ID: calendar_recurrence_rule_text
+Revises: google_sync_tokens
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'calendar_recurrence_rule_text'
+down_revision = 'google_sync_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las RRULE importadas (listas largas de UNTIL/BYDAY en exportaciones de
+    # Outlook) superan 255 caracteres y abortaban la inserción del lote entero
+    op.alter_column(
+        'calendar_events', 'recurrence_rule',
+        existing_type=sa.String(255), type_=sa.Text(), existing_nullable=True,
+    )
+
+
+def downgrade():
+    # Las reglas más largas se recortan para caber de nuevo en VARCHAR(255)
+    op.alter_column(
+        'calendar_events', 'recurrence_rule',
+        existing_type=sa.Text(), type_=sa.String(255), existing_nullable=True,
+        postgresql_using='left(recurrence_rule, 255)',
+    )
@@ -0,0 +1,34 @@
+"""google_sync_tokens
+
+Revision ID: google_sync_tokens
+Revises: ai_conversations
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'google_sync_tokens'
+down_revision = 'ai_conversations'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Crear tabla google_sync_tokens (nextSyncToken de Google Calendar por usuario)
+    op.create_table(
+        'google_sync_tokens',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('calendar_id', sa.String(255), nullable=False, server_default='primary'),
+        sa.Column('sync_token', sa.Text(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    )
+
+
+def downgrade():
+    # Eliminar tablas
+    op.drop_table('google_sync_tokens')
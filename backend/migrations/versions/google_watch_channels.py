@@ -0,0 +1,44 @@
+"""google_watch_channels
+
+Revision ID: google_watch_channels
+Revises: background_jobs
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'google_watch_channels'
+down_revision = 'background_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Crear tabla google_watch_channels (canales de notificaciones push de Google Calendar)
+    op.create_table(
+        'google_watch_channels',
+        sa.Column('id', sa.String(64), primary_key=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('calendar_id', sa.String(255), nullable=False, server_default='primary'),
+        sa.Column('resource_id', sa.String(255), nullable=True),
+        sa.Column('expiration', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    )
+
+    # Crear índices
+    op.create_index('ix_google_watch_channels_user_id', 'google_watch_channels', ['user_id'])
+    op.create_index('ix_google_watch_channels_expiration', 'google_watch_channels', ['expiration'])
+
+
+def downgrade():
+    # Eliminar índices
+    op.drop_index('ix_google_watch_channels_expiration')
+    op.drop_index('ix_google_watch_channels_user_id')
+
+    # Eliminar tablas
+    op.drop_table('google_watch_channels')
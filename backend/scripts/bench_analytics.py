@@ -0,0 +1,92 @@
+"""
+Micro-benchmark de los análisis de patrones (app/services/ai/analytics.py).
+
+Mide el tiempo de los análisis de completitud de tareas, consistencia de
+hábitos y éxito de metas sobre datos sintéticos, con NumPy y con la
+implementación en Python puro, y el de la evaluación por lotes de muchos
+usuarios frente a una llamada por usuario.
+
+Uso (desde backend/):
+    python scripts/bench_analytics.py [--rows 1000000] [--users 20000] [--rounds 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.ai import analytics  # noqa: E402
+
+
+def synthetic_data(rows: int, seed: int = 42):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    tasks = []
+    for _ in range(rows):
+        task = {"completed": rng.random() < 0.6}
+        if rng.random() < 0.8:
+            task["due_date"] = (start + timedelta(minutes=rng.randint(0, 525600))).isoformat() + "Z"
+        tasks.append(task)
+    habits = [
+        {"habit_id": f"h{rng.randint(0, 199)}", "habit_name": "Hábito", "completed": rng.random() < 0.5}
+        for _ in range(rows)
+    ]
+    goals = [
+        {"status": rng.choice(["completed", "active", "abandoned"]), "type": rng.choice(["health", "finance", "learning"])}
+        for _ in range(rows)
+    ]
+    return tasks, habits, goals
+
+
+def bench(name, func, data, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {name:<32} {best * 1000:9.1f} ms  ({len(data) / best / 1e6:.2f} M filas/s)")
+
+
+def split_by_user(rows, users):
+    size = max(1, len(rows) // users)
+    return {f"user-{i}": rows[i * size:(i + 1) * size] for i in range(users)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20000, help="Usuarios en la prueba por lotes")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    tasks, habits, goals = synthetic_data(args.rows)
+    numpy_module = analytics.np
+    backends = [("NumPy", numpy_module), ("Python", None)] if numpy_module is not None else [("Python", None)]
+    for label, module in backends:
+        analytics.np = module
+        print(f"{label}: {args.rows} filas")
+        bench("completitud de tareas", analytics.completion_patterns, tasks, args.rounds)
+        bench("consistencia de hábitos", analytics.habit_consistency, habits, args.rounds)
+        bench("éxito de metas", analytics.goal_success_factors, goals, args.rounds)
+    analytics.np = numpy_module
+
+    by_user = split_by_user(tasks, args.users)
+    print(f"Completitud de {args.users} usuarios ({'NumPy' if numpy_module is not None else 'Python'}):")
+    best_batch = best_loop = float("inf")
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        analytics.completion_patterns_batch(by_user)
+        best_batch = min(best_batch, time.perf_counter() - start)
+        start = time.perf_counter()
+        for history in by_user.values():
+            analytics.completion_patterns(history)
+        best_loop = min(best_loop, time.perf_counter() - start)
+    print(f"  {'por lotes':<32} {best_batch * 1000:9.1f} ms")
+    print(f"  {'una llamada por usuario':<32} {best_loop * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
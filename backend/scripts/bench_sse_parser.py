@@ -0,0 +1,108 @@
+"""
+Micro-benchmark del parser SSE de OpenRouter (app/services/ai/sse.py).
+
+Mide el rendimiento en MB/s al procesar streams grabados, troceados como
+llegarían de la red, y lo compara con el método anterior (una línea a la vez,
+decode + json.loads por línea).
+
+Uso (desde backend/):
+    python scripts/bench_sse_parser.py [stream1.sse stream2.sse ...] [--chunk 1024] [--rounds 20]
+
+Sin ficheros se genera un stream sintético de chat completions con
+comentarios de keep-alive y texto con caracteres multibyte.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.ai.sse import DONE, SSEParser, delta_content, parse_json  # noqa: E402
+
+
+def synthetic_stream(tokens: int = 20000) -> bytes:
+    rng = random.Random(42)
+    words = ["meta", "hábito", "correr", "semana", "día", "objetivo", "plan", "ñandú", "🏃", "lectura"]
+    frames = [b": OPENROUTER PROCESSING\n\n"]
+    for i in range(tokens):
+        chunk = {
+            "id": "gen-bench",
+            "object": "chat.completion.chunk",
+            "model": "bench/model",
+            "choices": [{"index": 0, "delta": {"content": rng.choice(words) + " "}, "finish_reason": None}],
+        }
+        frames.append(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+        if i % 500 == 0:
+            frames.append(b": OPENROUTER PROCESSING\n\n")
+    frames.append(b"data: [DONE]\n\n")
+    return b"".join(frames)
+
+
+def split(stream: bytes, chunk_size: int):
+    return [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+def run_parser(chunks) -> int:
+    parser = SSEParser()
+    chars = 0
+    for raw in chunks:
+        for data in parser.feed(raw):
+            if data == DONE:
+                return chars
+            content = delta_content(parse_json(data))
+            if content:
+                chars += len(content)
+    return chars
+
+
+def run_line_based(chunks) -> int:
+    # Método anterior: cada lectura se trata como si fueran líneas completas
+    chars = 0
+    for raw in chunks:
+        for line in raw.split(b"\n"):
+            line = line.decode("utf-8", errors="replace")
+            if not line.startswith("data: "):
+                continue
+            line = line[6:]
+            if line.strip() == "[DONE]":
+                return chars
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            content = data["choices"][0].get("delta", {}).get("content")
+            if content:
+                chars += len(content)
+    return chars
+
+
+def bench(name, func, chunks, size, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(chunks)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {name:<12} {size / best / 1e6:8.1f} MB/s  ({result} caracteres)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Streams SSE grabados (bytes tal cual de la respuesta)")
+    parser.add_argument("--chunk", type=int, default=1024, help="Tamaño de cada lectura simulada en bytes")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    streams = [(path, open(path, "rb").read()) for path in args.files] or [("sintético", synthetic_stream())]
+    for name, stream in streams:
+        chunks = split(stream, args.chunk)
+        print(f"{name}: {len(stream) / 1e6:.2f} MB en lecturas de {args.chunk} bytes")
+        bench("SSEParser", run_parser, chunks, len(stream), args.rounds)
+        # El método anterior pierde los eventos partidos entre lecturas
+        bench("por líneas", run_line_based, chunks, len(stream), args.rounds)
+
+
+if __name__ == "__main__":
+    main()
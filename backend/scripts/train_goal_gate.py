@@ -0,0 +1,92 @@
+"""
+Entrena el filtro local de detección de metas (app/services/ai/goal_gate.py).
+
+Los ejemplos son las detecciones del LLM guardadas en `ai_interactions` (o un
+fichero JSONL con filas {"query": ..., "response": ...}). Muestra la precisión,
+el recall y la fracción de llamadas ahorradas de los pesos por defecto y de los
+entrenados, y guarda estos últimos para usarlos con AI_GOAL_GATE_MODEL_PATH.
+
+Con --check solo evalúa los pesos por defecto sobre los ejemplos etiquetados
+de goal_gate.REFERENCE_EXAMPLES, sin leer datos ni entrenar.
+
+Uso (desde backend/):
+    python scripts/train_goal_gate.py --output goal_gate.json [--input filas.jsonl] [--target-recall 0.98]
+    python scripts/train_goal_gate.py --check
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.ai_config import get_ai_settings  # noqa: E402
+from app.services.ai import goal_gate  # noqa: E402
+
+PAGE_SIZE = 1000
+
+
+def load_interactions(limit: int):
+    from app.db.database import get_supabase_admin_client
+    client = get_supabase_admin_client()
+    rows = []
+    while len(rows) < limit:
+        page = (
+            client.table("ai_interactions").select("query,response")
+            .in_("context", ["goals", "general"]).order("created_at", desc=True)
+            .range(len(rows), min(len(rows) + PAGE_SIZE, limit) - 1).execute().data or []
+        )
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+    return rows
+
+
+def load_file(path: str):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def report(label, metrics):
+    def fmt(value):
+        return f"{value:.3f}" if value is not None else "-"
+    print(f"  {label:<22} precisión {fmt(metrics['precision'])}  recall {fmt(metrics['recall'])}  "
+          f"llamadas ahorradas {fmt(metrics['skip_rate'])}  ({metrics['examples']} ejemplos)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="Fichero JSON con los pesos entrenados")
+    parser.add_argument("--check", action="store_true", help="Solo evaluar los pesos por defecto")
+    parser.add_argument("--input", help="Filas en JSONL en lugar de leer ai_interactions")
+    parser.add_argument("--limit", type=int, default=50000, help="Interacciones más recientes que se leen")
+    parser.add_argument("--target-recall", type=float, default=0.98)
+    parser.add_argument("--epochs", type=int, default=20)
+    args = parser.parse_args()
+    if not args.check and not args.output:
+        parser.error("--output es obligatorio salvo con --check")
+
+    baseline = goal_gate.GoalGateModel(threshold=get_ai_settings().AI_GOAL_GATE_THRESHOLD)
+    print("Ejemplos de referencia:")
+    report("pesos por defecto", goal_gate.evaluate(baseline, goal_gate.REFERENCE_EXAMPLES))
+    if args.check:
+        return
+
+    rows = load_file(args.input) if args.input else load_interactions(args.limit)
+    examples = goal_gate.labelled_interactions(rows)
+    goals = sum(1 for _, has_goal in examples if has_goal)
+    print(f"{len(examples)} detecciones ({goals} con meta)")
+    if not examples:
+        sys.exit("No hay ejemplos de detección de metas")
+
+    training, validation = goal_gate.split_examples(examples)
+    model = goal_gate.train(training, validation, target_recall=args.target_recall, epochs=args.epochs)
+    print("Validación:")
+    report("pesos por defecto", goal_gate.evaluate(baseline, validation))
+    report("entrenado", goal_gate.evaluate(model, validation))
+    model.save(args.output)
+    print(f"Umbral {model.threshold:.4f}, {len(model.weights)} pesos guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+-- Progreso de las sincronizaciones en segundo plano (stream SSE del backend)
+-- El worker actualiza la fila mientras la sincronización está en curso
+-- (status = 'running') con un número limitado de escrituras.
+
+ALTER TABLE calendar_sync_logs
+    ADD COLUMN IF NOT EXISTS events_processed INTEGER DEFAULT 0;
+
+COMMENT ON COLUMN calendar_sync_logs.status IS 'running, success, partial, failed';